@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""BalanceParamのセンサー値の取得の仕方(1msごと / 制御周期ごとに1回)で、1周期あたりのCPU時間を比べる
+
+balance_sensor_other_thread.Robotをそれぞれの方式で動かす。EV3の実機ではそのまま、PCでは
+$ EV3_BACKEND=sim EV3_SIM_REALTIME=1 python3 acquisition_time.py --loops=250
+"""
+import contextlib
+import io
+from optparse import OptionParser
+
+from balance_sensor_other_thread import ACQUISITION_MODES, Robot
+
+LOOPS = 250  # EXEC_PERIODが40msなので1方式あたり10秒
+
+
+def test(acquisition, loops):
+    u"""1つの方式でRobotを動かす
+
+    Returns:
+        (Robot): 動かし終わったRobot(cpu_per_tick_us, sample_ageを見る)
+    """
+    robot = Robot(acquisition=acquisition)
+    robot.LOOP_COUNT = loops
+    robot.REPORT_INTERVAL = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        robot.run()
+    return robot
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-l', '--loops', action='store', type='int', dest='loops', default=LOOPS,
+                      help="メインループの回数")
+    options, _ = parser.parse_args()
+    for acquisition in ACQUISITION_MODES:
+        robot = test(acquisition, options.loops)
+        print('{}: cpu {:.0f}us per tick, sample age p50 {p50}us p99 {p99}us max {max}us'.format(
+            acquisition, robot.cpu_per_tick_us(), **robot.sample_age.summary()))
@@ -0,0 +1,57 @@
+# -*- coding: UTF-8 -*-
+u"""全モーターへの書き込みを1つのスレッドでまとめて行うサービス
+
+モーターごとにスレッドを立てると、1周期ごとにスレッドの数だけGILの受け渡しとコンテキストスイッチが起きる。
+ActuatorServiceは1つのスレッドで全モーターのデバイスを持ち、メインループからの合図1回で
+各モーターの最新の指示をまとめて書き込む。
+
+    service = ActuatorService([left_motor, right_motor, tail_motor])
+    threading.Thread(target=service.loop).start()
+    left_motor.run(speed=left_pwm)
+    right_motor.run(speed=right_pwm)
+    service.notify()  # 1周期分の指示を出し終えたら合図する
+
+モーターはsetup(), apply_pending(), shutdown()を持つこと(balance_test.pyのMotorなど)。
+"""
+from command_mailbox import WakeSignal
+
+ACTUATOR_THREADS = 'threads'  # モーターごとにスレッドを立てる(従来の方式)
+ACTUATOR_SERVICE = 'service'  # ActuatorServiceの1スレッドで全モーターを動かす
+ACTUATOR_MODES = (ACTUATOR_THREADS, ACTUATOR_SERVICE)
+
+
+class ActuatorService(object):
+    u"""複数のモーターへの指示を1スレッドで書き込む"""
+
+    def __init__(self, motors):
+        u"""
+        Args:
+            motors (list): 書き込むモーター。この順に書き込む
+        """
+        self.motors = tuple(motors)
+        self.passes = 0  # 書き込みを行った回数
+        self._wake = WakeSignal()
+        self._is_loop = True
+
+    def notify(self):
+        u"""指示を出し終えたことをサービスのスレッドに知らせる"""
+        self._wake.set()
+
+    def end_thread(self):
+        self._is_loop = False
+        self._wake.set()
+
+    def loop(self):
+        u"""合図を受けるたびに全モーターの未処理の指示を書き込むループ"""
+        motors = self.motors
+        for motor in motors:
+            motor.setup()
+        while self._is_loop:
+            self._wake.wait()
+            for motor in motors:
+                motor.apply_pending()
+            self.passes += 1
+        # end_threadの直前に出された停止指示も書き込んでから止める
+        for motor in motors:
+            motor.apply_pending()
+            motor.shutdown()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""モーターごとのスレッドとActuatorService(1スレッド)で、コンテキストスイッチ回数と周期のずれを比べる
+
+balance_sensor_other_thread.Robotをそれぞれの方式で動かす。EV3の実機ではそのまま、PCでは
+$ EV3_BACKEND=sim EV3_SIM_REALTIME=1 python3 actuator_mode_time.py --loops=250
+"""
+from optparse import OptionParser
+
+from actuator import ACTUATOR_MODES
+from balance_sensor_other_thread import Robot
+
+LOOPS = 250  # EXEC_PERIODが40msなので1方式あたり10秒
+
+
+def test(actuator_mode, loops):
+    u"""1つの方式でRobotを動かす
+
+    Returns:
+        (tuple): (コンテキストスイッチ回数(自発的, 非自発的), LoopProfile)
+    """
+    robot = Robot(actuator_mode=actuator_mode)
+    robot.LOOP_COUNT = loops
+    robot.REPORT_INTERVAL = 0
+    robot.report = lambda: None  # 途中経過は表示しない
+    switches = []
+
+    main_loop = robot._main_loop
+
+    def measured_main_loop():
+        main_loop()
+        # スレッドが終了する前に数える
+        switches.append(robot.context_switches())
+    robot._main_loop = measured_main_loop
+    robot.run()
+    return switches[0], robot.profile
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-l', '--loops', action='store', type='int', dest='loops', default=LOOPS,
+                      help="メインループの回数")
+    options, _ = parser.parse_args()
+    for actuator_mode in ACTUATOR_MODES:
+        switches, profile = test(actuator_mode, options.loops)
+        jitter = profile.jitter.summary()
+        print('{}: context switches {} per tick {:.2f}, jitter p50 {p50}us p99 {p99}us max {max}us'.format(
+            actuator_mode,
+            switches,
+            sum(switches) / options.loops if switches else float('nan'),
+            **jitter))
@@ -1,3 +1,5 @@
+from collections import namedtuple
+
 CMD_MAX = 100.0  # 前進/旋回命令絶対最大値
 DEG2RAD = 0.01745329238  # 角度単位変換係数(=pi/180)
 # EXEC_PERIOD = 0.00400000019  # バランス制御実行周期(秒)
@@ -20,11 +22,10 @@ K_THETADOT = 7.5  # モータ目標回転角速度係数
 BATTERY_GAIN = 0.001089  # PWM出力算出用バッテリ電圧補正係数
 BATTERY_OFFSET = 0.625  # PWM出力算出用バッテリ電圧補正オフセット
 
-ud_err_theta = 0.0  # 左右車輪の平均回転角度(θ)目標誤差状態値
-ud_psi = 0.0  # 車体ピッチ角度(ψ)状態値
-ud_theta_lpf = 0.0  # 左右車輪の平均回転角度(θ)状態値
-ud_theta_ref = 0.0  # 左右車輪の目標平均回転角度(θ)状態値
-ud_thetadot_cmd_lpf = 0.0  # 左右車輪の目標平均回転角速度(dθ/dt)状態値
+# BalanceController.constantsの値(balance.batchなど、制御器の外で同じ計算をするときに使う)
+ControllerConstants = namedtuple('ControllerConstants', (
+    'exec_period', 'half_deg2rad', 'forward_gain', 'a_r', 'one_minus_a_d', 'a_d', 'inv_exec_period',
+    'k_f0', 'k_f1', 'k_f2', 'k_f3', 'k_i', 'turn_gain', 'battery_scale', 'battery_offset'))
 
 
 def rt_saturate(sig, ll, ul):
@@ -36,6 +37,131 @@ def rt_saturate(sig, ll, ul):
         return sig
 
 
+class BalanceController(object):
+    u"""NXTway-GSバランス制御器。
+
+    balance_control()の状態をインスタンスに持たせたもの。
+    1プロセスで複数の制御器を動かせるように、状態はモジュール変数ではなく__slots__に保持する。
+    定数の積はコンストラクタで計算しておき、control()の呼び出しごとにリストなどを生成しない。
+
+    なお、定数の積を事前に計算しているため、旧実装とは浮動小数点の丸め誤差の範囲で値が異なる場合がある。
+    """
+    __slots__ = (
+        # 状態値
+        'ud_err_theta',  # 左右車輪の平均回転角度(θ)目標誤差状態値
+        'ud_psi',  # 車体ピッチ角度(ψ)状態値
+        'ud_theta_lpf',  # 左右車輪の平均回転角度(θ)状態値
+        'ud_theta_ref',  # 左右車輪の目標平均回転角度(θ)状態値
+        'ud_thetadot_cmd_lpf',  # 左右車輪の目標平均回転角速度(dθ/dt)状態値
+        # 事前計算した定数
+        '_exec_period',
+        '_half_deg2rad',
+        '_forward_gain',
+        '_a_r',
+        '_one_minus_a_d',
+        '_a_d',
+        '_inv_exec_period',
+        '_k_f0',
+        '_k_f1',
+        '_k_f2',
+        '_k_f3',
+        '_k_i',
+        '_turn_gain',
+        '_battery_scale',
+        '_battery_offset',
+    )
+
+    def __init__(self, k_f=None, k_i=K_I, k_thetadot=K_THETADOT, k_phidot=K_PHIDOT, exec_period=EXEC_PERIOD):
+        u"""
+        Args:
+            k_f (list): 状態フィードバック係数。省略時はK_F
+            k_i (float): サーボ制御用積分フィードバック係数
+            k_thetadot (float): モータ目標回転角速度係数
+            k_phidot (float): 車体目標旋回角速度係数
+            exec_period (float): バランス制御実行周期(秒)
+        """
+        if k_f is None:
+            k_f = K_F
+        self._exec_period = exec_period
+        self._half_deg2rad = DEG2RAD * 0.5
+        self._forward_gain = (1.0 - A_R) * k_thetadot / CMD_MAX
+        self._a_r = A_R
+        self._one_minus_a_d = 1.0 - A_D
+        self._a_d = A_D
+        self._inv_exec_period = 1.0 / exec_period
+        self._k_f0, self._k_f1, self._k_f2, self._k_f3 = k_f
+        self._k_i = k_i
+        self._turn_gain = k_phidot / CMD_MAX
+        # PWM = 100 * u / (BATTERY_GAIN * battery - BATTERY_OFFSET)
+        #     = u * (100 / BATTERY_GAIN) / (battery - BATTERY_OFFSET / BATTERY_GAIN)
+        self._battery_scale = 100.0 / BATTERY_GAIN
+        self._battery_offset = BATTERY_OFFSET / BATTERY_GAIN
+        self.reset()
+
+    @property
+    def constants(self):
+        u"""コンストラクタで事前計算した定数(ControllerConstants、読み取り専用)"""
+        return ControllerConstants(
+            self._exec_period, self._half_deg2rad, self._forward_gain, self._a_r, self._one_minus_a_d, self._a_d,
+            self._inv_exec_period, self._k_f0, self._k_f1, self._k_f2, self._k_f3, self._k_i, self._turn_gain,
+            self._battery_scale, self._battery_offset)
+
+    def reset(self):
+        u"""状態値を初期化する(balance_initに相当)"""
+        self.ud_err_theta = 0.0
+        self.ud_theta_ref = 0.0
+        self.ud_thetadot_cmd_lpf = 0.0
+        self.ud_psi = 0.0
+        self.ud_theta_lpf = 0.0
+
+    def control(self, args_cmd_forward, args_cmd_turn, args_gyro, args_gyro_offset, args_theta_m_l, args_theta_m_r,
+                args_battery):
+        u"""バランス制御を1周期分実行する。引数と戻り値はbalance_controlと同じ"""
+        ud_psi = self.ud_psi
+        ud_theta_ref = self.ud_theta_ref
+        exec_period = self._exec_period
+
+        tmp_thetadot_cmd_lpf = (args_cmd_forward * self._forward_gain) + (self._a_r * self.ud_thetadot_cmd_lpf)
+        tmp_theta = ((args_theta_m_l + args_theta_m_r) * self._half_deg2rad) + ud_psi
+        tmp_theta_lpf = (self._one_minus_a_d * tmp_theta) + (self._a_d * self.ud_theta_lpf)
+        tmp_psidot = (args_gyro - args_gyro_offset) * DEG2RAD
+
+        # 状態フィードバック(K_Fのループを展開したもの)
+        tmp_pwm_r_limiter = ((ud_theta_ref - tmp_theta) * self._k_f0
+                             - ud_psi * self._k_f1
+                             + (tmp_thetadot_cmd_lpf - (tmp_theta_lpf - self.ud_theta_lpf) * self._inv_exec_period)
+                             * self._k_f2
+                             - tmp_psidot * self._k_f3)
+        tmp_pwm_r_limiter = (((self._k_i * self.ud_err_theta) + tmp_pwm_r_limiter) * self._battery_scale /
+                             (args_battery - self._battery_offset))
+
+        tmp_pwm_turn = args_cmd_turn * self._turn_gain
+
+        ret_pwm_l = tmp_pwm_r_limiter + tmp_pwm_turn
+        if ret_pwm_l >= 100:
+            ret_pwm_l = 100
+        elif ret_pwm_l <= -100:
+            ret_pwm_l = -100
+
+        ret_pwm_r = tmp_pwm_r_limiter - tmp_pwm_turn
+        if ret_pwm_r >= 100:
+            ret_pwm_r = 100
+        elif ret_pwm_r <= -100:
+            ret_pwm_r = -100
+
+        self.ud_err_theta = ((ud_theta_ref - tmp_theta) * exec_period) + self.ud_err_theta
+        self.ud_theta_ref = (exec_period * tmp_thetadot_cmd_lpf) + ud_theta_ref
+        self.ud_thetadot_cmd_lpf = tmp_thetadot_cmd_lpf
+        self.ud_psi = (exec_period * tmp_psidot) + ud_psi
+        self.ud_theta_lpf = tmp_theta_lpf
+
+        return ret_pwm_l, ret_pwm_r
+
+
+# balance_control/balance_initが使う既定の制御器
+_default_controller = BalanceController()
+
+
 def balance_control(args_cmd_forward, args_cmd_turn, args_gyro, args_gyro_offset, args_theta_m_l, args_theta_m_r,
                     args_battery):
     u"""NXTway-GSバランス制御関数。
@@ -45,6 +171,9 @@ def balance_control(args_cmd_forward, args_cmd_turn, args_gyro, args_gyro_offset
         モータは個体差により、同じPWM出力を与えても回転数が異なる場合が
         あります。その場合は別途補正機能を追加する必要があります。
 
+        状態はモジュール既定のBalanceControllerに保持されます。
+        複数の制御器が必要な場合はBalanceControllerを直接使ってください。
+
     Args:
         args_cmd_forward : 前進/後進命令。100(前進最大値)～-100(後進最大値)
         args_cmd_turn    : 旋回命令。100(右旋回最大値)～-100(左旋回最大値)
@@ -57,57 +186,9 @@ def balance_control(args_cmd_forward, args_cmd_turn, args_gyro, args_gyro_offset
     Returns:
         (tuple): (左モータPWM出力値, 右モータPWM出力値)
     """
-    global ud_err_theta, ud_psi, ud_theta_lpf, ud_theta_ref, ud_thetadot_cmd_lpf
-    # print(ud_err_theta, ud_psi, ud_theta_lpf, ud_theta_ref, ud_thetadot_cmd_lpf)
-    tmp = [0, 0, 0, 0]
-    tmp_theta_0 = [0, 0, 0, 0]
-
-    tmp_thetadot_cmd_lpf = (((args_cmd_forward / CMD_MAX) * K_THETADOT) * (1.0 - A_R)) + (A_R * ud_thetadot_cmd_lpf)
-    tmp_theta = (((DEG2RAD * args_theta_m_l) + ud_psi) + ((DEG2RAD * args_theta_m_r) + ud_psi)) * 0.5
-    tmp_theta_lpf = ((1.0 - A_D) * tmp_theta) + (A_D * ud_theta_lpf)
-    tmp_psidot = (args_gyro - args_gyro_offset) * DEG2RAD
-    tmp[0] = ud_theta_ref
-    tmp[1] = 0.0
-    tmp[2] = tmp_thetadot_cmd_lpf
-    tmp[3] = 0.0
-    tmp_theta_0[0] = tmp_theta
-    tmp_theta_0[1] = ud_psi
-    tmp_theta_0[2] = (tmp_theta_lpf - ud_theta_lpf) / EXEC_PERIOD
-    tmp_theta_0[3] = tmp_psidot
-    tmp_pwm_r_limiter = 0.0
-    for tmp_0 in range(4):
-        tmp_pwm_r_limiter += (tmp[tmp_0] - tmp_theta_0[tmp_0]) * K_F[tmp_0]
-
-    tmp_pwm_r_limiter = (((K_I * ud_err_theta) + tmp_pwm_r_limiter) /
-                         ((BATTERY_GAIN * args_battery) - BATTERY_OFFSET)) * 100
-
-    tmp_pwm_turn = (args_cmd_turn / CMD_MAX) * K_PHIDOT
-
-    tmp_pwm_l_limiter = tmp_pwm_r_limiter + tmp_pwm_turn
-    tmp_pwm_l_limiter = rt_saturate(tmp_pwm_l_limiter, -100, 100)
-    ret_pwm_l = tmp_pwm_l_limiter
-
-    tmp_pwm_r_limiter -= tmp_pwm_turn
-    tmp_pwm_r_limiter = rt_saturate(tmp_pwm_r_limiter, -100, 100)
-    ret_pwm_r = tmp_pwm_r_limiter
-
-    tmp_pwm_l_limiter = (EXEC_PERIOD * tmp_thetadot_cmd_lpf) + ud_theta_ref
-    tmp_pwm_turn = (EXEC_PERIOD * tmp_psidot) + ud_psi
-    tmp_pwm_r_limiter = ((ud_theta_ref - tmp_theta) * EXEC_PERIOD) + ud_err_theta
-
-    ud_err_theta = tmp_pwm_r_limiter
-    ud_theta_ref = tmp_pwm_l_limiter
-    ud_thetadot_cmd_lpf = tmp_thetadot_cmd_lpf
-    ud_psi = tmp_pwm_turn
-    ud_theta_lpf = tmp_theta_lpf
-
-    return ret_pwm_l, ret_pwm_r
+    return _default_controller.control(args_cmd_forward, args_cmd_turn, args_gyro, args_gyro_offset,
+                                       args_theta_m_l, args_theta_m_r, args_battery)
 
 
 def balance_init():
-    global ud_err_theta, ud_psi, ud_theta_lpf, ud_theta_ref, ud_thetadot_cmd_lpf
-    ud_err_theta = 0.0
-    ud_theta_ref = 0.0
-    ud_thetadot_cmd_lpf = 0.0
-    ud_psi = 0.0
-    ud_theta_lpf = 0.0
+    _default_controller.reset()
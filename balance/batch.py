@@ -0,0 +1,93 @@
+# -*- coding: UTF-8 -*-
+u"""balance_controlをNumPyでN個の状態ベクトルに対して一括で計算する
+
+オフラインでのゲイン調整やログの再生用。EV3本体では使わないのでNumPyが必要。
+計算の順序はBalanceController.controlと同じにしてあるので、スカラー版と同じ値を返す。
+"""
+import numpy as np
+
+from balance.balance import DEG2RAD, BalanceController
+
+# 状態配列(shape=(N, STATE_SIZE))の列
+STATE_ERR_THETA = 0  # 左右車輪の平均回転角度(θ)目標誤差状態値
+STATE_PSI = 1  # 車体ピッチ角度(ψ)状態値
+STATE_THETA_LPF = 2  # 左右車輪の平均回転角度(θ)状態値
+STATE_THETA_REF = 3  # 左右車輪の目標平均回転角度(θ)状態値
+STATE_THETADOT_CMD_LPF = 4  # 左右車輪の目標平均回転角速度(dθ/dt)状態値
+STATE_SIZE = 5
+
+# controller省略時に使う既定のゲイン
+_default_gains = BalanceController()
+
+
+def make_state(count):
+    u"""balance_initした状態の状態配列を作る
+
+    Args:
+        count (int): 状態ベクトルの数
+
+    Returns:
+        (numpy.ndarray): shape=(count, STATE_SIZE)の0で初期化された配列
+    """
+    return np.zeros((count, STATE_SIZE), dtype=np.float64)
+
+
+def balance_control_batch(args_cmd_forward, args_cmd_turn, args_gyro, args_gyro_offset, args_theta_m_l,
+                          args_theta_m_r, args_battery, state, controller=None):
+    u"""balance_controlのバッチ版
+
+    各引数はスカラーまたは長さNの配列を受け付ける(ブロードキャストされる)。
+    stateは呼び出しの中で更新される。
+
+    Args:
+        args_cmd_forward : 前進/後進命令。100(前進最大値)～-100(後進最大値)
+        args_cmd_turn    : 旋回命令。100(右旋回最大値)～-100(左旋回最大値)
+        args_gyro        : ジャイロセンサ値
+        args_gyro_offset : ジャイロセンサオフセット値
+        args_theta_m_l   : 左モータエンコーダ値
+        args_theta_m_r   : 右モータエンコーダ値
+        args_battery     : バッテリ電圧値(mV)
+        state (numpy.ndarray): make_stateで作った状態配列
+        controller (BalanceController): ゲインを取り出す制御器。省略時は既定のゲイン
+
+    Returns:
+        (tuple): (左モータPWM出力値の配列, 右モータPWM出力値の配列)
+    """
+    if controller is None:
+        controller = _default_gains
+    ud_err_theta = state[:, STATE_ERR_THETA]
+    ud_psi = state[:, STATE_PSI]
+    ud_theta_lpf = state[:, STATE_THETA_LPF]
+    ud_theta_ref = state[:, STATE_THETA_REF]
+    ud_thetadot_cmd_lpf = state[:, STATE_THETADOT_CMD_LPF]
+    constants = controller.constants
+    exec_period = constants.exec_period
+
+    tmp_thetadot_cmd_lpf = (np.multiply(args_cmd_forward, constants.forward_gain) +
+                            (constants.a_r * ud_thetadot_cmd_lpf))
+    tmp_theta = (np.add(args_theta_m_l, args_theta_m_r) * constants.half_deg2rad) + ud_psi
+    tmp_theta_lpf = (constants.one_minus_a_d * tmp_theta) + (constants.a_d * ud_theta_lpf)
+    tmp_psidot = np.subtract(args_gyro, args_gyro_offset) * DEG2RAD
+
+    tmp_pwm_r_limiter = ((ud_theta_ref - tmp_theta) * constants.k_f0
+                         - ud_psi * constants.k_f1
+                         + (tmp_thetadot_cmd_lpf - (tmp_theta_lpf - ud_theta_lpf) * constants.inv_exec_period)
+                         * constants.k_f2
+                         - tmp_psidot * constants.k_f3)
+    tmp_pwm_r_limiter = (((constants.k_i * ud_err_theta) + tmp_pwm_r_limiter) * constants.battery_scale /
+                         (np.subtract(args_battery, constants.battery_offset)))
+
+    tmp_pwm_turn = np.multiply(args_cmd_turn, constants.turn_gain)
+
+    # rt_saturate
+    ret_pwm_l = np.clip(tmp_pwm_r_limiter + tmp_pwm_turn, -100, 100)
+    ret_pwm_r = np.clip(tmp_pwm_r_limiter - tmp_pwm_turn, -100, 100)
+
+    # 状態の更新(stateの列ビューに書き込む)
+    ud_err_theta += (ud_theta_ref - tmp_theta) * exec_period
+    ud_theta_ref += exec_period * tmp_thetadot_cmd_lpf
+    ud_thetadot_cmd_lpf[:] = tmp_thetadot_cmd_lpf
+    ud_psi += exec_period * tmp_psidot
+    ud_theta_lpf[:] = tmp_theta_lpf
+
+    return ret_pwm_l, ret_pwm_r
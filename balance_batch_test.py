@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""balance.batch(バッチ版のbalance_control)のテスト
+
+$ python3 balance_batch_test.py
+"""
+import numpy as np
+
+import balance.balance as balance
+import balance.batch as batch
+
+BATCH_SIZE = 32
+TICKS = 500
+STATE_ATTRIBUTES = (
+    (batch.STATE_ERR_THETA, 'ud_err_theta'),
+    (batch.STATE_PSI, 'ud_psi'),
+    (batch.STATE_THETA_LPF, 'ud_theta_lpf'),
+    (batch.STATE_THETA_REF, 'ud_theta_ref'),
+    (batch.STATE_THETADOT_CMD_LPF, 'ud_thetadot_cmd_lpf'),
+)
+
+
+def _inputs(rand, count):
+    return (
+        rand.uniform(-100, 100, count),
+        rand.uniform(-100, 100, count),
+        rand.randint(-60, 61, count).astype(np.float64),
+        rand.uniform(-2, 2, count),
+        rand.randint(-720, 721, count).astype(np.float64),
+        rand.randint(-720, 721, count).astype(np.float64),
+        rand.uniform(7000, 8500, count),
+    )
+
+
+def _run_against_scalar(controller_args):
+    rand = np.random.RandomState(0)
+    controllers = [balance.BalanceController(**controller_args) for _ in range(BATCH_SIZE)]
+    state = batch.make_state(BATCH_SIZE)
+    for tick in range(TICKS):
+        inputs = _inputs(rand, BATCH_SIZE)
+        left_pwm, right_pwm = batch.balance_control_batch(*inputs, state, controller=controllers[0])
+        for index, controller in enumerate(controllers):
+            expected = controller.control(*(value[index].item() for value in inputs))
+            assert (left_pwm[index], right_pwm[index]) == expected, (tick, index)
+            for column, name in STATE_ATTRIBUTES:
+                assert state[index, column] == getattr(controller, name), (tick, index, name)
+
+
+def test_matches_scalar_controllers():
+    _run_against_scalar({})
+
+
+def test_matches_scalar_controllers_with_gains():
+    _run_against_scalar({'k_f': [-0.8, -30.0, -1.0, -2.5], 'k_i': -0.5, 'k_thetadot': 6.0, 'k_phidot': 50.0,
+                         'exec_period': 0.004})
+
+
+def test_constants_are_read_only():
+    controller = balance.BalanceController(exec_period=0.01)
+    constants = controller.constants
+    assert constants.exec_period == 0.01 and constants.inv_exec_period == 100.0
+    assert (constants.k_f0, constants.k_f1, constants.k_f2, constants.k_f3) == tuple(balance.K_F)
+    try:
+        constants.k_i = 0.0
+    except AttributeError:
+        pass
+    else:
+        assert False, 'expected AttributeError'
+    try:
+        controller.constants = constants
+    except AttributeError:
+        pass
+    else:
+        assert False, 'expected AttributeError'
+
+
+if __name__ == '__main__':
+    test_matches_scalar_controllers()
+    test_matches_scalar_controllers_with_gains()
+    test_constants_are_read_only()
+    print('ok')
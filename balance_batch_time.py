@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""balance_controlのスカラー版とバッチ版(balance.batch)の1サンプルあたりの処理時間を比べる
+
+$ python3 balance_batch_time.py --batch-sizes=1,1000,1000000
+"""
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+import balance.balance as balance
+import balance.batch as batch
+
+BATCH_SIZES = '1,1000,1000000'
+TICKS = 20
+SCALAR_SAMPLES = 200000
+
+
+def make_inputs(count, seed=0):
+    u"""バッチ版に渡す入力配列を作る"""
+    rand = np.random.RandomState(seed)
+    return (
+        rand.uniform(-100, 100, count),
+        rand.uniform(-100, 100, count),
+        rand.randint(-60, 61, count),
+        np.zeros(count),
+        rand.randint(-720, 721, count),
+        rand.randint(-720, 721, count),
+        rand.uniform(7000, 8500, count),
+    )
+
+
+def test_scalar(samples):
+    u"""スカラー版を1サンプルずつ呼ぶ
+
+    Returns:
+        (float): 1サンプルあたりの時間(us)
+    """
+    inputs = [tuple(value.item() for value in row) for row in zip(*make_inputs(1000))]
+    controller = balance.BalanceController()
+    control = controller.control
+    count = 0
+    start = time.perf_counter()
+    while count < samples:
+        for args in inputs:
+            control(*args)
+        count += len(inputs)
+    return (time.perf_counter() - start) * 1000000 / count
+
+
+def test_batch(batch_size, ticks):
+    u"""バッチ版をticks回呼ぶ
+
+    Returns:
+        (float): 1サンプルあたりの時間(us)
+    """
+    inputs = make_inputs(batch_size)
+    state = batch.make_state(batch_size)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        batch.balance_control_batch(*inputs, state)
+    return (time.perf_counter() - start) * 1000000 / (batch_size * ticks)
+
+
+def check_same_as_scalar(batch_size=1000, ticks=10):
+    u"""バッチ版とスカラー版が同じ値を返すか確かめる"""
+    inputs = make_inputs(batch_size)
+    rows = [tuple(value.item() for value in row) for row in zip(*inputs)]
+    state = batch.make_state(batch_size)
+    controllers = [balance.BalanceController() for _ in range(batch_size)]
+    for _ in range(ticks):
+        left_pwm, right_pwm = batch.balance_control_batch(*inputs, state)
+        for controller, args, left, right in zip(controllers, rows, left_pwm, right_pwm):
+            if controller.control(*args) != (left, right):
+                return False
+    return True
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-b', '--batch-sizes', action='store', type='string', dest='batch_sizes',
+                      default=BATCH_SIZES, help="計測するバッチサイズ(カンマ区切り)")
+    parser.add_option('-t', '--ticks', action='store', type='int', dest='ticks', default=TICKS,
+                      help="1バッチサイズあたりの呼び出し回数")
+    options, _ = parser.parse_args()
+
+    print('same as scalar: {}'.format(check_same_as_scalar()))
+    scalar_us = test_scalar(SCALAR_SAMPLES)
+    print('scalar: {:.4f}us/sample'.format(scalar_us))
+    for size in [int(value) for value in options.batch_sizes.split(',')]:
+        batch_us = test_batch(size, options.ticks)
+        print('batch {}: {:.4f}us/sample (x{:.1f})'.format(size, batch_us, scalar_us / batch_us))
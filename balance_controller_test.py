@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""BalanceControllerが旧balance_controlと同じ出力を返し、呼び出しごとにメモリ確保しないことを確かめるテスト
+
+$ python3 balance_controller_test.py
+"""
+import random
+import sys
+import tracemalloc
+
+import balance.balance as balance
+
+# 定数の積を事前に計算しているので、旧実装とは丸め誤差の範囲で一致すればよい
+TOLERANCE = 1e-9
+# 呼び出し中に同時に生きていてよい中間値のfloatの数(フリーリストが空のときは確保される)
+ALLOCATION_FLOATS = 6
+
+
+class LegacyBalance(object):
+    u"""モジュール変数に状態を持っていた頃のbalance_controlをそのまま写したもの"""
+
+    def __init__(self):
+        self.ud_err_theta = 0.0
+        self.ud_psi = 0.0
+        self.ud_theta_lpf = 0.0
+        self.ud_theta_ref = 0.0
+        self.ud_thetadot_cmd_lpf = 0.0
+
+    def control(self, args_cmd_forward, args_cmd_turn, args_gyro, args_gyro_offset, args_theta_m_l, args_theta_m_r,
+                args_battery):
+        tmp = [0, 0, 0, 0]
+        tmp_theta_0 = [0, 0, 0, 0]
+
+        tmp_thetadot_cmd_lpf = (((args_cmd_forward / balance.CMD_MAX) * balance.K_THETADOT) * (1.0 - balance.A_R)) + (
+            balance.A_R * self.ud_thetadot_cmd_lpf)
+        tmp_theta = (((balance.DEG2RAD * args_theta_m_l) + self.ud_psi) +
+                     ((balance.DEG2RAD * args_theta_m_r) + self.ud_psi)) * 0.5
+        tmp_theta_lpf = ((1.0 - balance.A_D) * tmp_theta) + (balance.A_D * self.ud_theta_lpf)
+        tmp_psidot = (args_gyro - args_gyro_offset) * balance.DEG2RAD
+        tmp[0] = self.ud_theta_ref
+        tmp[1] = 0.0
+        tmp[2] = tmp_thetadot_cmd_lpf
+        tmp[3] = 0.0
+        tmp_theta_0[0] = tmp_theta
+        tmp_theta_0[1] = self.ud_psi
+        tmp_theta_0[2] = (tmp_theta_lpf - self.ud_theta_lpf) / balance.EXEC_PERIOD
+        tmp_theta_0[3] = tmp_psidot
+        tmp_pwm_r_limiter = 0.0
+        for tmp_0 in range(4):
+            tmp_pwm_r_limiter += (tmp[tmp_0] - tmp_theta_0[tmp_0]) * balance.K_F[tmp_0]
+
+        tmp_pwm_r_limiter = (((balance.K_I * self.ud_err_theta) + tmp_pwm_r_limiter) /
+                             ((balance.BATTERY_GAIN * args_battery) - balance.BATTERY_OFFSET)) * 100
+
+        tmp_pwm_turn = (args_cmd_turn / balance.CMD_MAX) * balance.K_PHIDOT
+
+        tmp_pwm_l_limiter = tmp_pwm_r_limiter + tmp_pwm_turn
+        ret_pwm_l = balance.rt_saturate(tmp_pwm_l_limiter, -100, 100)
+
+        tmp_pwm_r_limiter -= tmp_pwm_turn
+        ret_pwm_r = balance.rt_saturate(tmp_pwm_r_limiter, -100, 100)
+
+        self.ud_err_theta = ((self.ud_theta_ref - tmp_theta) * balance.EXEC_PERIOD) + self.ud_err_theta
+        self.ud_theta_ref = (balance.EXEC_PERIOD * tmp_thetadot_cmd_lpf) + self.ud_theta_ref
+        self.ud_thetadot_cmd_lpf = tmp_thetadot_cmd_lpf
+        self.ud_psi = (balance.EXEC_PERIOD * tmp_psidot) + self.ud_psi
+        self.ud_theta_lpf = tmp_theta_lpf
+
+        return ret_pwm_l, ret_pwm_r
+
+
+def make_inputs(count, seed=0):
+    u"""ランダムな入力列を作る。エンコーダ値は連続した値になるようにする"""
+    rand = random.Random(seed)
+    inputs = []
+    left = right = 0
+    for _ in range(count):
+        left += rand.randint(-5, 5)
+        right += rand.randint(-5, 5)
+        inputs.append((
+            rand.uniform(-100, 100),
+            rand.uniform(-100, 100),
+            rand.randint(-60, 60),
+            rand.choice([0, 0.5, -1.25]),
+            left,
+            right,
+            rand.uniform(7000, 8500),
+        ))
+    return inputs
+
+
+def test_matches_legacy():
+    legacy = LegacyBalance()
+    controller = balance.BalanceController()
+    for args in make_inputs(5000):
+        expected = legacy.control(*args)
+        actual = controller.control(*args)
+        for expected_pwm, actual_pwm in zip(expected, actual):
+            assert abs(expected_pwm - actual_pwm) <= TOLERANCE, (args, expected, actual)
+    for name in ('ud_err_theta', 'ud_psi', 'ud_theta_lpf', 'ud_theta_ref', 'ud_thetadot_cmd_lpf'):
+        assert abs(getattr(legacy, name) - getattr(controller, name)) <= TOLERANCE, name
+
+
+def test_wrapper_uses_default_controller():
+    balance.balance_init()
+    controller = balance.BalanceController()
+    for args in make_inputs(100, seed=1):
+        assert balance.balance_control(*args) == controller.control(*args)
+    balance.balance_init()
+    assert balance.balance_control(0, 0, 0, 0, 0, 0, 8000) == (0.0, 0.0)
+
+
+def test_controllers_are_independent():
+    first = balance.BalanceController()
+    second = balance.BalanceController()
+    first.control(50, 0, 10, 0, 100, 100, 8000)
+    assert second.ud_psi == 0.0
+    assert second.control(0, 0, 0, 0, 0, 0, 8000) == (0.0, 0.0)
+
+
+def _noop_control(args_cmd_forward, args_cmd_turn, args_gyro, args_gyro_offset, args_theta_m_l, args_theta_m_r,
+                  args_battery):
+    return args_cmd_forward, args_cmd_turn
+
+
+def peak_allocation(control, inputs):
+    u"""inputsで1回ずつcontrolを呼ぶ間に、呼ぶ前より増えたメモリ確保量の最大値(バイト)
+
+    正味の確保量は一時的なリストを作っても呼び出しの後で解放されて0に戻るので、ピークで比べる。
+    """
+    # 1回目の呼び出しで確保されるもの(フリーリストなど)を除くために空回ししておく
+    for args in inputs:
+        control(*args)
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for args in inputs:
+            control(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - before
+
+
+def allocates_per_call(control, inputs):
+    u"""何もしない関数を同じように呼んだときより、ピークが中間値のfloat数個分を超えて大きいか
+
+    ループ自体(イテレータなど)の分は何もしない関数で差し引く。
+    旧実装は呼び出しごとにリスト(tmp, tmp_theta_0)を作るのでこれを超える。
+    """
+    budget = peak_allocation(_noop_control, inputs) + ALLOCATION_FLOATS * sys.getsizeof(0.0)
+    return peak_allocation(control, inputs) > budget
+
+
+def test_no_allocation_per_call():
+    inputs = make_inputs(1000, seed=2)
+    assert not allocates_per_call(balance.BalanceController().control, inputs), (
+        peak_allocation(balance.BalanceController().control, inputs))
+
+
+def test_allocation_check_rejects_legacy():
+    assert allocates_per_call(LegacyBalance().control, make_inputs(1000, seed=2))
+
+
+if __name__ == '__main__':
+    test_matches_legacy()
+    test_wrapper_uses_default_controller()
+    test_controllers_are_independent()
+    test_no_allocation_per_call()
+    test_allocation_check_rejects_legacy()
+    print('ok')
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""neural_control/balance_test.pyのロボットをN台まとめてシミュレーションする学習用の環境
+
+sim.plantと同じ運動方程式をNumPyの[N]配列でN台分同時に解く。観測・行動・報酬はneural_control/balance_test.pyと同じ
+    状態 : make_inputs(左モータのエンコーダ値, ジャイロ角度, ジャイロ角速度) = (position/100, 0, angle/100, rate/100)
+           センサー値はsim.ev3と同じく整数に丸め、エンコーダ値とジャイロ角度はエピソードの開始時を0とする
+    行動 : 0(ACTION1)なら左右モータにPWM値-100、1(ACTION2)なら+100
+    報酬 : get_reward(次の状態)
+で、Robot._main_loopと同じくBASE_SLEEP_TIME(0.02秒)ごとに1ステップ進める。
+abs(ジャイロ角度) > 45(倒れた)か、EPISODE_STEPS(500)ステップたったら、その環境だけ新しいエピソードに戻す。
+
+    env = VectorBalanceEnv(1024, seed=0)          # ProcessVectorEnv(4096, workers=4)なら4プロセスに分ける
+    states = env.reset().copy()                   # env.statesはstepで上書きされるのでコピーを持つ
+    next_states, rewards, dones, truncated = env.step(actions)
+    replay.add_batch(states, actions, rewards, next_states, dones)
+    states[:] = env.states                        # 終わった環境は新しいエピソードの最初の状態になっている
+
+reset/stepが返す配列とenv.statesは環境のバッファで、次のstepで上書きされる(1ステップごとに確保しないため)。
+前の状態として持っておくときはコピーすること。
+
+左右のPWM値は常に同じなのでヨー角は0のままとして解かない。バッテリ電圧はエピソードごとにVOLTAGE_RANGEから選んで一定とする。
+
+学習(ExperienceReplayとAgent.update_minibatch)
+$ python3 balance_env.py --envs=1024 --steps=3000 --output=./log/network_trained.model
+"""
+import math
+import multiprocessing
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+from sim.plant import (BODY_HEIGHT, BODY_MASS, GRAVITY, MOTOR_BACK_EMF, MOTOR_FRICTION, MOTOR_INERTIA,
+                       MOTOR_RESISTANCE, MOTOR_TORQUE, WHEEL_FRICTION, WHEEL_MASS, WHEEL_RADIUS)
+
+PERIOD = 0.02  # 1ステップの時間(秒)。Robot.BASE_SLEEP_TIME
+MAX_STEP = 0.002  # 積分の最大刻み幅(秒)。Plantの既定値
+EPISODE_STEPS = 500  # Robot._main_loopの周期数
+FALL_ANGLE = 45  # abs(ジャイロ角度)がこれ(deg)を超えたら倒れた
+INITIAL_TILT = 3.0  # エピソード開始時の傾きの範囲(±deg)
+VOLTAGE_RANGE = (7.4, 8.3)  # バッテリ電圧の範囲(V)
+STATE_SIZE = 4
+PWM = 100  # action_pwmの大きさ
+LEARNING_RATE = 1e-4  # 学習の既定の学習率
+
+# 運動方程式の定数(sim.plant.Plantと同じ)
+_MASS_L = BODY_MASS * BODY_HEIGHT / 2.0
+_WHEEL_INERTIA = WHEEL_MASS * WHEEL_RADIUS ** 2 / 2.0
+_BODY_PITCH_INERTIA = BODY_MASS * (BODY_HEIGHT / 2.0) ** 2 / 3.0
+_ALPHA = MOTOR_TORQUE / MOTOR_RESISTANCE
+_BETA = MOTOR_TORQUE * MOTOR_BACK_EMF / MOTOR_RESISTANCE + MOTOR_FRICTION
+_E11 = (2 * WHEEL_MASS + BODY_MASS) * WHEEL_RADIUS ** 2 + 2 * _WHEEL_INERTIA + 2 * MOTOR_INERTIA
+_MLR = _MASS_L * WHEEL_RADIUS
+_E22 = _MASS_L * BODY_HEIGHT / 2.0 + _BODY_PITCH_INERTIA + 2 * MOTOR_INERTIA
+_MGL = _MASS_L * GRAVITY
+
+
+class VectorBalanceEnv(object):
+    u"""N台のロボットを同時に進める環境"""
+
+    def __init__(self, count, seed=None, period=PERIOD, max_step=MAX_STEP, episode_steps=EPISODE_STEPS,
+                 initial_tilt=INITIAL_TILT, voltage_range=VOLTAGE_RANGE):
+        u"""
+        Args:
+            count (int): 環境の数N
+            seed: 初期状態の乱数の種(numpy.random.default_rngに渡す)
+            period (float): 1ステップの時間(秒)
+            max_step (float): 積分の最大刻み幅(秒)
+            episode_steps (int): エピソードの最大ステップ数
+            initial_tilt (float): エピソード開始時の傾きの範囲(±deg)
+            voltage_range (tuple): バッテリ電圧の範囲(V)
+        """
+        self.count = count
+        self.substeps = max(int(math.ceil(period / max_step)), 1)
+        self.dt = period / self.substeps
+        self.episode_steps = episode_steps
+        self.initial_tilt = initial_tilt
+        self.voltage_range = voltage_range
+        self._random = np.random.default_rng(seed)
+
+        self.theta = np.zeros(count)
+        self.psi = np.zeros(count)
+        self.theta_dot = np.zeros(count)
+        self.psi_dot = np.zeros(count)
+        self.max_voltage = np.zeros(count)  # PWM値100のときのモータ電圧(V)
+        self.position_offset = np.zeros(count)  # エピソード開始時のエンコーダ値(deg)
+        self.gyro_offset = np.zeros(count)  # エピソード開始時のジャイロ角度(deg)
+        self.steps = np.zeros(count, dtype=np.int64)  # エピソードの経過ステップ数
+        self.states = np.zeros((count, STATE_SIZE))
+        self._next_states = np.zeros((count, STATE_SIZE))
+        # 終わったエピソードの統計
+        self.episodes = 0
+        self.falls = 0
+        self.finished_steps = 0
+
+    def reset(self):
+        u"""すべての環境を新しいエピソードにする
+
+        Returns:
+            (numpy.ndarray): [N, 4]の状態(self.statesそのもの。stepで上書きされる)
+        """
+        self._reset(np.ones(self.count, dtype=np.bool_))
+        return self.states
+
+    def step(self, actions):
+        u"""行動actions([N]の0か1)で1ステップ進める
+
+        Returns:
+            (tuple): (next_states[N, 4], rewards[N], dones[N], truncated[N])
+                     next_statesは倒れたり打ち切られたりした環境もその時点の状態。
+                     どの配列も環境のバッファなので次のstepで上書きされる。
+                     dones: 倒れた。truncated: 倒れずにepisode_stepsに達した
+        """
+        voltage = np.where(np.asarray(actions) == 0, -PWM * 0.01, PWM * 0.01) * self.max_voltage
+        drive = 2.0 * _ALPHA * voltage  # alpha * (v_l + v_r)
+        theta = self.theta
+        psi = self.psi
+        theta_dot = self.theta_dot
+        psi_dot = self.psi_dot
+        dt = self.dt
+        for _ in range(self.substeps):
+            sin_psi = np.sin(psi)
+            e12 = _MLR * np.cos(psi) - 2 * MOTOR_INERTIA
+            f_theta = drive - 2.0 * (_BETA + WHEEL_FRICTION) * theta_dot + 2.0 * _BETA * psi_dot
+            f_psi = -drive + 2.0 * _BETA * theta_dot - 2.0 * _BETA * psi_dot
+            rhs_theta = f_theta + _MLR * psi_dot * psi_dot * sin_psi
+            rhs_psi = f_psi + _MGL * sin_psi
+            det = _E11 * _E22 - e12 * e12
+            theta_ddot = (_E22 * rhs_theta - e12 * rhs_psi) / det
+            psi_ddot = (_E11 * rhs_psi - e12 * rhs_theta) / det
+            # 半陰的オイラー法(Plant._stepと同じ順)
+            psi_dot += psi_ddot * dt
+            theta_dot += theta_ddot * dt
+            theta += theta_dot * dt
+            psi += psi_dot * dt
+        self.steps += 1
+
+        next_states = self._next_states
+        angle = self._observe(next_states)
+        rewards = -((next_states[:, 0] + 1) ** 2 + (next_states[:, 2] * 5 + 1) ** 2)  # get_reward
+        dones = np.abs(angle) > FALL_ANGLE
+        truncated = (self.steps >= self.episode_steps) & ~dones
+        finished = dones | truncated
+        self.states[:] = next_states
+        if finished.any():
+            self.episodes += int(finished.sum())
+            self.falls += int(dones.sum())
+            self.finished_steps += int(self.steps[finished].sum())
+            self._reset(finished)
+        return next_states, rewards, dones, truncated
+
+    def _reset(self, mask):
+        u"""maskの環境を新しいエピソードにする"""
+        count = int(mask.sum())
+        random_ = self._random
+        self.theta[mask] = 0.0
+        self.psi[mask] = np.radians(random_.uniform(-self.initial_tilt, self.initial_tilt, count))
+        self.theta_dot[mask] = 0.0
+        self.psi_dot[mask] = 0.0
+        # PWM値からモータ電圧へ。balance_controlのバッテリ補正と同じ式
+        self.max_voltage[mask] = 0.001089 * random_.uniform(*self.voltage_range, size=count) * 1000.0 - 0.625
+        # Robot._main_loopの最初でエンコーダ値を0にして、ジャイロ角度をオフセットとして読む
+        self.position_offset[mask] = np.degrees(self.theta[mask] - self.psi[mask])
+        self.gyro_offset[mask] = np.rint(np.degrees(self.psi[mask]))
+        self.steps[mask] = 0
+        states = np.empty((self.count, STATE_SIZE))
+        self._observe(states)
+        self.states[mask] = states[mask]
+
+    def _observe(self, states):
+        u"""センサー値からstatesにmake_inputsの状態を書き込む
+
+        Returns:
+            (numpy.ndarray): ジャイロ角度(deg)
+        """
+        left_position = np.rint(np.degrees(self.theta - self.psi) - self.position_offset)
+        angle = np.rint(np.degrees(self.psi)) - self.gyro_offset
+        states[:, 0] = left_position / 100
+        states[:, 1] = 0
+        states[:, 2] = angle / 100
+        states[:, 3] = np.rint(np.degrees(self.psi_dot)) / 100
+        return angle
+
+
+def _worker(connection, count, seed, options):
+    u"""ProcessVectorEnvの子プロセス。親から受けた命令でVectorBalanceEnvを進める"""
+    env = VectorBalanceEnv(count, seed=seed, **options)
+    try:
+        while True:
+            command, actions = connection.recv()
+            if command == 'step':
+                next_states, rewards, dones, truncated = env.step(actions)
+                connection.send((next_states, rewards, dones, truncated, env.states,
+                                 (env.episodes, env.falls, env.finished_steps)))
+            elif command == 'reset':
+                connection.send(env.reset())
+            else:
+                break
+    finally:
+        connection.close()
+
+
+class ProcessVectorEnv(object):
+    u"""N台の環境をworkersプロセスに分けて進める(VectorBalanceEnvと同じ使い方)
+
+    子プロセスの乱数の種はnumpy.random.SeedSequence(seed).spawn(workers)で、
+    i番目の子プロセスはVectorBalanceEnv(sizes[i], seed=seeds[i])と同じ結果になる。
+    """
+
+    def __init__(self, count, workers=None, seed=None, **options):
+        u"""
+        Args:
+            count (int): 環境の数N
+            workers (int): プロセス数。Noneならコア数
+            seed: 乱数の種
+            options: VectorBalanceEnvのその他の引数
+        """
+        workers = workers or multiprocessing.cpu_count()
+        self.count = count
+        self.sizes = [len(part) for part in np.array_split(np.arange(count), workers)]
+        self.seeds = np.random.SeedSequence(seed).spawn(workers)
+        self.states = np.zeros((count, STATE_SIZE))
+        self.episodes = 0
+        self.falls = 0
+        self.finished_steps = 0
+        self._bounds = np.cumsum([0] + self.sizes)
+        self._connections = []
+        self._processes = []
+        for size, seed_ in zip(self.sizes, self.seeds):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_worker, args=(child, size, seed_, options), daemon=True)
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._processes.append(process)
+
+    def reset(self):
+        for connection in self._connections:
+            connection.send(('reset', None))
+        for connection, start, end in zip(self._connections, self._bounds, self._bounds[1:]):
+            self.states[start:end] = connection.recv()
+        return self.states
+
+    def step(self, actions):
+        u"""VectorBalanceEnv.stepを参照"""
+        for connection, start, end in zip(self._connections, self._bounds, self._bounds[1:]):
+            connection.send(('step', actions[start:end]))
+        results = [connection.recv() for connection in self._connections]
+        self.episodes = sum(result[5][0] for result in results)
+        self.falls = sum(result[5][1] for result in results)
+        self.finished_steps = sum(result[5][2] for result in results)
+        self.states[:] = np.concatenate([result[4] for result in results])
+        return tuple(np.concatenate([result[index] for result in results]) for index in range(4))
+
+    def close(self):
+        for connection in self._connections:
+            try:
+                connection.send(('close', None))
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        for process in self._processes:
+            process.join()
+        self._connections = []
+        self._processes = []
+
+
+def epsilon_greedy(network, states, epsilon, random_):
+    u"""Agent.decide_actionをN個の状態にまとめて行う
+
+    Returns:
+        (numpy.ndarray): [N]の行動(0か1)
+    """
+    actions = network.forward(states).argmax(axis=1)  # 同じ値なら前の行動(Agent._greedyと同じ)
+    explore = random_.random(len(actions)) < epsilon
+    actions[explore] = random_.integers(0, 2, int(explore.sum()))
+    return actions
+
+
+def train(agent, env, replay, steps, batch_size, updates=1, seed=None, report=None):
+    u"""envのN台で集めた遷移をreplayにためて、ステップごとにupdates回ミニバッチで学習する
+
+    Args:
+        agent: neural_control/balance_test.pyのAgent(NumpyNeuralNetwork)
+        env: VectorBalanceEnvかProcessVectorEnv
+        replay (experience_replay.ExperienceReplay): 遷移をためるバッファ
+        steps (int): envを進めるステップ数(遷移の数はsteps * N)
+        batch_size (int): ミニバッチの大きさ
+        updates (int): 1ステップあたりの更新回数
+        report: 1ステップごとに(ステップ, env)で呼ぶ関数
+    """
+    random_ = np.random.default_rng(seed)
+    states = env.reset().copy()
+    for step in range(steps):
+        actions = epsilon_greedy(agent.network, states, agent.epsilon, random_)
+        next_states, rewards, dones, _ = env.step(actions)
+        # 打ち切られた遷移は倒れていないので次の状態の価値を使う
+        replay.add_batch(states, actions, rewards, next_states, dones)
+        states[:] = env.states
+        for _ in range(updates):
+            agent.update_minibatch(*replay.sample(batch_size))
+        if report is not None:
+            report(step, env)
+
+
+if __name__ == '__main__':
+    from experience_replay import ExperienceReplay
+    from neural_network import save_model
+    from replay import load_neural_control
+
+    parser = OptionParser()
+    parser.add_option('-e', '--envs', action='store', type='int', dest='envs', default=1024, help="環境の数")
+    parser.add_option('-w', '--workers', action='store', type='int', dest='workers', default=0,
+                      help="プロセス数(0ならこのプロセスで進める)")
+    parser.add_option('-s', '--steps', action='store', type='int', dest='steps', default=3000,
+                      help="環境を進めるステップ数")
+    parser.add_option('-b', '--batch', action='store', type='int', dest='batch', default=256,
+                      help="ミニバッチの大きさ")
+    parser.add_option('-u', '--updates', action='store', type='int', dest='updates', default=1,
+                      help="1ステップあたりの更新回数")
+    parser.add_option('-l', '--learning-rate', action='store', type='float', dest='learning_rate',
+                      default=LEARNING_RATE, help="学習率(network.modelの重みはNeuralNetwork.LEARNING_RATEでは発散する)")
+    parser.add_option('-c', '--capacity', action='store', type='int', dest='capacity', default=1000000,
+                      help="ExperienceReplayの大きさ")
+    parser.add_option('-n', '--network', action='store', type='string', dest='network',
+                      default='./neural_control/network.model', help="学習を始めるネットワークのファイル")
+    parser.add_option('-o', '--output', action='store', type='string', dest='output', default=None,
+                      help="学習したネットワークを書き出すファイル(neural_network.save_modelの形式)")
+    parser.add_option('-r', '--seed', action='store', type='int', dest='seed', default=0, help="乱数の種")
+    options, _ = parser.parse_args()
+
+    agent = load_neural_control().Agent(options.network)
+    agent.network.LEARNING_RATE = options.learning_rate
+    if options.workers:
+        env = ProcessVectorEnv(options.envs, options.workers, seed=options.seed)
+    else:
+        env = VectorBalanceEnv(options.envs, seed=options.seed)
+    replay = ExperienceReplay(options.capacity, seed=options.seed)
+    start = time.perf_counter()
+    last = {'episodes': 0, 'finished_steps': 0}
+
+    def report(step, env):
+        if (step + 1) % 100 != 0:
+            return
+        episodes = env.episodes - last['episodes']
+        finished_steps = env.finished_steps - last['finished_steps']
+        last['episodes'] = env.episodes
+        last['finished_steps'] = env.finished_steps
+        elapsed = time.perf_counter() - start
+        print('step {}: {:.0f} transitions/min, {} episodes, mean length {:.1f}'.format(
+            step + 1, (step + 1) * env.count / elapsed * 60, episodes,
+            finished_steps / episodes if episodes else float('nan')))
+
+    try:
+        train(agent, env, replay, options.steps, options.batch, options.updates, seed=options.seed, report=report)
+    finally:
+        if options.workers:
+            env.close()
+    print('{} episodes ({} falls), {} transitions in {:.1f}s'.format(
+        env.episodes, env.falls, options.steps * env.count, time.perf_counter() - start))
+    if options.output is not None:
+        save_model(options.output, agent.network.params)
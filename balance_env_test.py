@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""balance_envのテスト
+
+$ python3 balance_env_test.py
+"""
+import math
+
+import numpy as np
+
+from balance_env import ProcessVectorEnv, VectorBalanceEnv, train
+from experience_replay import ExperienceReplay
+from neural_network_test import NETWORK_PATH
+from replay import load_neural_control
+from sim.plant import Battery, Plant
+
+neural_control = load_neural_control()
+
+
+def _alternate(count, step):
+    return np.full(count, step % 2)
+
+
+def test_matches_plant():
+    u"""1台ならsim.plant.Plantと同じ軌道になる"""
+    env = VectorBalanceEnv(1, voltage_range=(8.0, 8.0), initial_tilt=0.0)
+    env.reset()
+    env.psi[:] = math.radians(2.0)
+    plant = Plant(battery=Battery(full_voltage=8.0, capacity_ah=1e12, internal_resistance=0.0, idle_current=0.0),
+                  initial_psi=math.radians(2.0))
+    for step in range(10):
+        action = _alternate(1, step)
+        env.step(action)
+        plant.pwm_l = plant.pwm_r = neural_control.action_pwm(neural_control.Action(int(action[0])))
+        plant.step(0.02)
+        assert abs(env.psi[0] - plant.psi) < 1e-9, (step, env.psi[0], plant.psi)
+        assert abs(env.theta[0] - plant.theta) < 1e-9, (step, env.theta[0], plant.theta)
+
+
+def test_states_and_rewards_match_robot():
+    env = VectorBalanceEnv(64, seed=0)
+    states = env.reset()
+    assert np.all(states[:, 0] == 0) and np.all(states[:, 2] == 0)
+    for step in range(5):
+        next_states, rewards, _, _ = env.step(_alternate(64, step))
+        left_position = np.rint(np.degrees(env.theta - env.psi) - env.position_offset)
+        angle = np.rint(np.degrees(env.psi)) - env.gyro_offset
+        rate = np.rint(np.degrees(env.psi_dot))
+        for index in range(64):
+            inputs = neural_control.make_inputs(left_position[index], angle[index], rate[index])
+            assert tuple(next_states[index]) == inputs
+            assert rewards[index] == neural_control.get_reward(inputs)
+
+
+def test_docstring_loop_keeps_previous_states():
+    u"""モジュールのdocstringの使い方で、add_batchに渡す状態がstep前の状態になっている"""
+    env = VectorBalanceEnv(16, seed=3)
+    states = env.reset().copy()
+    for step in range(20):
+        previous = env.states.copy()
+        next_states, _, _, _ = env.step(_alternate(16, step))
+        assert np.array_equal(states, previous)
+        assert not np.shares_memory(states, env.states) and not np.shares_memory(states, next_states)
+        states[:] = env.states
+
+
+def test_auto_reset_on_fall():
+    env = VectorBalanceEnv(8, seed=1)
+    env.reset()
+    falls = 0
+    for _ in range(100):
+        next_states, _, dones, truncated = env.step(np.ones(8, dtype=np.int64))
+        assert not truncated.any()
+        if dones.any():
+            # 倒れた時点の状態を返し、環境は新しいエピソードの最初の状態に戻っている
+            assert np.all(np.abs(next_states[dones, 2]) > 0.45)
+            assert np.all(env.states[dones, 0] == 0) and np.all(env.states[dones, 2] == 0)
+            assert np.all(env.steps[dones] == 0)
+            falls += int(dones.sum())
+    assert falls > 8
+    assert env.falls == env.episodes == falls
+
+
+def test_truncate():
+    env = VectorBalanceEnv(4, seed=2, episode_steps=5)
+    env.reset()
+    for step in range(5):
+        _, _, dones, truncated = env.step(_alternate(4, step))
+        assert not dones.any()
+        assert truncated.all() == (step == 4)
+    assert env.episodes == 4 and env.falls == 0 and env.finished_steps == 20
+
+
+def test_process_env_matches_vector_env():
+    env = ProcessVectorEnv(10, workers=2, seed=3)
+    try:
+        expected = [VectorBalanceEnv(size, seed=seed) for size, seed in zip(env.sizes, env.seeds)]
+        assert env.sizes == [5, 5]
+        assert np.array_equal(env.reset(), np.concatenate([part.reset() for part in expected]))
+        for step in range(60):
+            actions = np.array([(step + index) % 3 != 0 for index in range(10)], dtype=np.int64)
+            results = env.step(actions)
+            parts = [part.step(actions[index * 5:index * 5 + 5]) for index, part in enumerate(expected)]
+            for index in range(4):
+                assert np.array_equal(results[index], np.concatenate([part[index] for part in parts]))
+            assert np.array_equal(env.states, np.concatenate([part.states for part in expected]))
+        assert env.episodes == sum(part.episodes for part in expected) > 0
+    finally:
+        env.close()
+
+
+def test_train():
+    agent = neural_control.Agent(NETWORK_PATH)
+    agent.network.LEARNING_RATE = 1e-4
+    env = VectorBalanceEnv(32, seed=4)
+    replay = ExperienceReplay(1000, seed=4)
+    before = agent.network.params['W_INPUT'].copy()
+    train(agent, env, replay, 50, 16, seed=4)
+    assert replay.count == 50 * 32 and len(replay) == 1000
+    assert env.episodes > 0
+    assert np.all(np.isfinite(agent.network.params['W_INPUT']))
+    assert not np.array_equal(agent.network.params['W_INPUT'], before)
+
+
+if __name__ == '__main__':
+    test_matches_plant()
+    test_states_and_rewards_match_robot()
+    test_docstring_loop_keeps_previous_states()
+    test_auto_reset_on_fall()
+    test_truncate()
+    test_process_env_matches_vector_env()
+    test_train()
+    print('ok')
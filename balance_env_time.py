@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""balance_envで1分間に集められる遷移の数を測る
+
+    random  : 行動を一様乱数で選ぶ(環境を進める時間だけ)
+    network : NumpyNeuralNetworkでε-greedyに選ぶ(学習の更新は含まない)
+workersを指定するとProcessVectorEnvで同じ数の環境をプロセスに分けて測る(0ならVectorBalanceEnv)。
+
+$ python3 balance_env_time.py --envs=256,1024,4096 --workers=0,4 --steps=200
+"""
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+from balance_env import ProcessVectorEnv, VectorBalanceEnv, epsilon_greedy
+from neural_network import NumpyNeuralNetwork, load_params
+from neural_network_time import NETWORK_PATH
+
+ENVS = '256,1024,4096'
+WORKERS = '0'
+STEPS = 200
+
+
+def test_env(env, steps, network=None, epsilon=0.15):
+    u"""Returns: 遷移/分"""
+    random_ = np.random.default_rng(0)
+    states = env.reset().copy()
+    start = time.perf_counter()
+    for _ in range(steps):
+        if network is None:
+            actions = random_.integers(0, 2, env.count)
+        else:
+            actions = epsilon_greedy(network, states, epsilon, random_)
+        env.step(actions)
+        states[:] = env.states
+    return steps * env.count / (time.perf_counter() - start) * 60
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-e', '--envs', action='store', type='string', dest='envs', default=ENVS,
+                      help="環境の数(カンマ区切り)")
+    parser.add_option('-w', '--workers', action='store', type='string', dest='workers', default=WORKERS,
+                      help="プロセス数(カンマ区切り。0ならVectorBalanceEnv)")
+    parser.add_option('-s', '--steps', action='store', type='int', dest='steps', default=STEPS,
+                      help="進めるステップ数")
+    options, _ = parser.parse_args()
+    network = NumpyNeuralNetwork(load_params(NETWORK_PATH))
+    for workers in [int(workers) for workers in options.workers.split(',')]:
+        for count in [int(count) for count in options.envs.split(',')]:
+            env = ProcessVectorEnv(count, workers, seed=0) if workers else VectorBalanceEnv(count, seed=0)
+            try:
+                random_policy = test_env(env, options.steps)
+                network_policy = test_env(env, options.steps, network)
+            finally:
+                if workers:
+                    env.close()
+            print('N={} workers={}: random {:.1f}M transitions/min, network {:.1f}M transitions/min'.format(
+                count, workers, random_policy / 1e6, network_policy / 1e6))
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""センサー値の取得とモーターへの書き込みを別プロセスに分けてbalance.cを移植したコードで動かしてみるテスト
+
+balance_sensor_other_thread.pyではセンサー取得とモーターのスレッドが制御ループとGILを取り合うので、
+デバイスの読み書きをforkした子プロセス(SensorProcess)に任せ、共有メモリ(shared_ring.SharedRegion)で値を受け渡す。
+
+    制御プロセス(親)                         センサープロセス(子)
+    ring.latest() でセンサー値を読む  <----  1msごとにring.write
+    command.write でPWM値を書く       ---->  新しい指示があればrun_direct
+    control_heartbeat_ns を更新             sensor_heartbeat_ns を更新
+
+どちらかの生存確認時刻がHEARTBEAT_TIMEOUTより古くなったら、もう一方は異常とみなして止まる。
+センサープロセスは終了時に必ずモーターを止める。
+
+シミュレータではプロセスごとに物理モデルを持つことになるので、EV3_SIM_REALTIME=1で動かすこと
+$ EV3_BACKEND=sim EV3_SIM_REALTIME=1 python3 balance_multiprocess.py
+"""
+import os
+import signal
+import time
+from optparse import OptionParser
+
+from battery_monitor import BatteryMonitor, is_stale
+from command_mailbox import MotorCommand
+from ev3_backend import ev3, clock
+from latency import LatencyHistogram, LoopProfile
+from raw_device import open_gyro, open_motor, open_power_supply
+from scheduler import PeriodicScheduler
+from shared_ring import SharedRegion
+from telemetry import BALANCE_FIELDS, TelemetryWriter, default_path
+
+import balance.balance as balance
+
+HEARTBEAT_TIMEOUT = 0.1  # 相手の生存確認時刻がこれ(秒)より古くなったら異常とみなす
+
+
+class SensorProcess(object):
+    u"""子プロセス側: デバイスの読み書きを行う
+
+    デバイスはfork後に子プロセスで開く(親プロセスではデバイスを開かない)。
+    """
+    SAMPLE_PERIOD = 0.001  # センサー値を取得する周期(秒)
+
+    def __init__(self, region, parent_pid, heartbeat_timeout=HEARTBEAT_TIMEOUT):
+        self.region = region
+        self.parent_pid = parent_pid
+        self.heartbeat_timeout_ns = int(heartbeat_timeout * 1000000000)
+        self.right_motor = open_motor(ev3.LargeMotor('outA'))
+        self.left_motor = open_motor(ev3.LargeMotor('outC'))
+        self.tail_motor = open_motor(ev3.LargeMotor('outB'))
+        self.gyro_sensor = open_gyro(ev3.GyroSensor('in4'))
+        self.battery = open_power_supply(ev3.PowerSupply())
+        self.battery_monitor = BatteryMonitor(self.battery)  # 電圧はBATTERY_PERIODごとにしか読まない
+        self._is_loop = True
+
+    def end_loop(self, *args):
+        u"""ループを終わらせる(SIGTERMのハンドラにも使う)"""
+        self._is_loop = False
+
+    def _control_alive(self, now_ns):
+        u"""制御プロセスが動いているか"""
+        if os.getppid() != self.parent_pid:
+            # 親プロセスが終了した
+            return False
+        control_heartbeat_ns = self.region.control_heartbeat_ns
+        # 制御ループが始まる前(0)は待つ
+        return control_heartbeat_ns == 0 or now_ns - control_heartbeat_ns < self.heartbeat_timeout_ns
+
+    def _apply(self, command, left_pwm, right_pwm, tail_pwm):
+        if command == MotorCommand.RUN:
+            self.left_motor.run_direct(duty_cycle_sp=int(left_pwm))
+            self.right_motor.run_direct(duty_cycle_sp=int(right_pwm))
+            self.tail_motor.run_direct(duty_cycle_sp=int(tail_pwm))
+        elif command == MotorCommand.STOP:
+            self._stop_motors()
+
+    def _stop_motors(self):
+        self.left_motor.stop()
+        self.right_motor.stop()
+        self.tail_motor.stop()
+
+    def loop(self):
+        u"""停止要求が来るか制御プロセスが止まるまで、センサー値の取得と指示の書き込みを繰り返す"""
+        region = self.region
+        ring = region.ring
+        command_slot = region.command
+        applied_index = 0
+        self.left_motor.position = 0  # balance.cのnxt_motor_set_count(NXT_PORT_C, 0)のつもり
+        self.right_motor.position = 0
+        scheduler = PeriodicScheduler(self.SAMPLE_PERIOD, clock=clock)
+        scheduler.start()
+        try:
+            while self._is_loop and not region.stop_requested:
+                now_ns = time.monotonic_ns()
+                region.sensor_heartbeat_ns = now_ns
+                if not self._control_alive(now_ns):
+                    print('control process is not responding')
+                    break
+                sample_ns = clock.monotonic_ns()
+                ring.write(
+                    self.gyro_sensor.rate,
+                    self.left_motor.position,
+                    self.right_motor.position,
+                    self.battery_monitor.update(sample_ns),  # フィルタした電圧(mV)
+                    self.battery_monitor.read_ns,  # 電圧を読んだ時刻。まだ読めていなければNOT_READ
+                    sample_ns)
+                command, left_pwm, right_pwm, tail_pwm, _, index = command_slot.read()
+                if index != applied_index:
+                    applied_index = index
+                    self._apply(command, left_pwm, right_pwm, tail_pwm)
+                scheduler.wait()
+        finally:
+            scheduler.close()
+            self._stop_motors()
+
+
+def start_sensor_process(region, heartbeat_timeout=HEARTBEAT_TIMEOUT):
+    u"""センサープロセスをforkする
+
+    Returns:
+        (int): 子プロセスのPID
+    """
+    parent_pid = os.getpid()
+    pid = os.fork()
+    if pid != 0:
+        return pid
+    # 子プロセス。親のfinallyやatexitを実行しないようos._exitで終わる
+    status = 0
+    try:
+        process = SensorProcess(region, parent_pid, heartbeat_timeout)
+        signal.signal(signal.SIGTERM, process.end_loop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+Cは親プロセスが受けて停止要求を出す
+        process.loop()
+    except BaseException as error:
+        print(error)
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def stop_sensor_process(region, pid, timeout=1.0):
+    u"""センサープロセスに停止を要求して終了を待つ。timeout秒以内に終わらなければSIGTERMを送る
+
+    Returns:
+        (int): 子プロセスの終了コード
+    """
+    region.request_stop()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        finished_pid, status = os.waitpid(pid, os.WNOHANG)
+        if finished_pid == pid:
+            return os.waitstatus_to_exitcode(status)
+        time.sleep(0.01)
+    os.kill(pid, signal.SIGTERM)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status)
+
+
+class Robot(object):
+    u"""ロボット本体(制御プロセス側)"""
+    PERIOD = balance.EXEC_PERIOD  # メインループの周期(秒)
+    LOOP_COUNT = 100  # メインループの回数
+    REPORT_INTERVAL = 5.0  # 処理時間の統計を表示する間隔(秒)。0なら終了時のみ
+    READY_TIMEOUT = 2.0  # センサープロセスの最初のサンプルを待つ最大時間(秒)
+
+    def __init__(self, heartbeat_timeout=HEARTBEAT_TIMEOUT, telemetry_path=None):
+        u"""
+        Args:
+            heartbeat_timeout (float): センサープロセスのハートビートがこれ(秒)より古ければ止める
+            telemetry_path (str): 周期ごとの値を記録するテレメトリのファイル。Noneなら記録しない(センサープロセスは書き込まない)
+        """
+        if not getattr(clock, 'realtime', True):
+            raise RuntimeError('the simulator must run in real time (EV3_SIM_REALTIME=1) with multiple processes')
+        self.heartbeat_timeout = heartbeat_timeout
+        self.region = SharedRegion()
+        self.sensor_pid = None
+        self.exit_code = None  # センサープロセスの終了コード
+        self.profile = LoopProfile(int(self.PERIOD * 1000000))
+        self.sample_age = LatencyHistogram()  # センサー値を取得してから制御に使うまでの時間(μs)
+        self.telemetry = None if telemetry_path is None else TelemetryWriter(telemetry_path, BALANCE_FIELDS)
+
+    def run(self):
+        u"""ロボット稼働"""
+        try:
+            self.sensor_pid = start_sensor_process(self.region, self.heartbeat_timeout)
+            self._wait_ready()
+            self._main_loop()
+        except Exception as error:
+            print(error)
+        finally:
+            self.stop()
+
+    def _wait_ready(self):
+        u"""センサープロセスが最初のサンプルを書き込むまで待つ"""
+        deadline = time.monotonic() + self.READY_TIMEOUT
+        while self.region.ring.head == 0:
+            if time.monotonic() > deadline:
+                raise RuntimeError('sensor process did not start')
+            time.sleep(0.001)
+
+    def stop(self):
+        u"""ロボット停止(モーターはセンサープロセスが終了時に止める)。共有領域はセンサープロセスを回収してから閉じる"""
+        try:
+            if self.sensor_pid is not None:
+                self.region.command.write(MotorCommand.STOP, 0, 0, 0, clock.monotonic_ns())
+                self.exit_code = stop_sensor_process(self.region, self.sensor_pid)
+                self.sensor_pid = None
+        finally:
+            self.region.close()
+            if self.telemetry is not None:
+                self.telemetry.close()
+
+    def report(self):
+        u"""区間ごとの処理時間の統計を表示する"""
+        print(self.profile.report())
+        print('sample age count {count} p50 {p50}us p99 {p99}us max {max}us mean {mean}us'.format(
+            **self.sample_age.summary()))
+
+    def _main_loop(self):
+        u"""ロボットメインループ
+
+        actuationは共有メモリへの指示の書き込みなので記録しない(enqueueに含まれる)。
+        """
+        region = self.region
+        ring = region.ring
+        command_slot = region.command
+        profile = self.profile
+        telemetry = self.telemetry
+        heartbeat_timeout_ns = int(self.heartbeat_timeout * 1000000000)
+        report_ticks = int(self.REPORT_INTERVAL / self.PERIOD)
+        balance.balance_init()
+        print('ready')
+        scheduler = PeriodicScheduler(self.PERIOD, clock=clock)
+        scheduler.start()
+        try:
+            for tick in range(1, self.LOOP_COUNT + 1):
+                start = time.monotonic_ns()
+                region.control_heartbeat_ns = start
+                if start - region.sensor_heartbeat_ns > heartbeat_timeout_ns:
+                    raise RuntimeError('sensor process is not responding')
+                # パラメータ取得
+                rate, lpos, rpos, voltage, voltage_ns, timestamp_ns, _ = ring.latest()
+                self.sample_age.record((clock.monotonic_ns() - timestamp_ns) // 1000)
+                if is_stale(voltage_ns, timestamp_ns):
+                    # 電圧の読み込みに失敗し続けている。モニターはセンサープロセスにあるので読み直せない
+                    raise RuntimeError('battery voltage is stale')
+                sensor_end = time.monotonic_ns()
+
+                left_pwm, right_pwm = balance.balance_control(
+                    0,  # forward -100～100, 0で停止
+                    0,  # turn -100～100, 0で直進
+                    rate,  # balance.cのecrobot_get_gyro_sensor(NXT_PORT_S4)のつもり
+                    0,  # offset（角速度）は0固定（起動時は角速度が変化しないように固定しておくこと）
+                    lpos,  # balance.cのnxt_motor_get_count(NXT_PORT_C)のつもり
+                    rpos,
+                    voltage
+                )
+                control_end = time.monotonic_ns()
+
+                # balance_controlからは-100～100までのPWM値が返ってくる
+                command_slot.write(MotorCommand.RUN, left_pwm, right_pwm, 0, clock.monotonic_ns())
+                enqueue_end = time.monotonic_ns()
+
+                # 処理時間を記録して、次の周期の開始時刻までsleep
+                profile.sensor.record((sensor_end - start) // 1000)
+                profile.control.record((control_end - sensor_end) // 1000)
+                profile.enqueue.record((enqueue_end - control_end) // 1000)
+                profile.work.record((enqueue_end - start) // 1000)
+                slack = scheduler.remaining_ns() // 1000
+                profile.record_slack(slack)
+                if telemetry is not None:
+                    telemetry.write(start, timestamp_ns, rate, lpos, rpos, voltage, left_pwm, right_pwm,
+                                    (enqueue_end - start) // 1000, slack)
+                scheduler.wait()
+                profile.jitter.record(scheduler.last_lateness_ns // 1000)
+                if report_ticks and tick % report_ticks == 0:
+                    self.report()
+            self.report()
+            print(scheduler.stats())
+        finally:
+            scheduler.close()
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-t', '--telemetry', action='store', type='string', dest='telemetry',
+                      default=default_path('balance_multiprocess'),
+                      help="テレメトリのファイル(telemetry.TelemetryReaderで読める)。既定は起動日時の入ったファイル")
+    options, _ = parser.parse_args()
+    robot = Robot(telemetry_path=options.telemetry)
+    robot.run()
@@ -1,33 +1,36 @@
 #!/usr/bin/env python3
 # -*- coding: UTF-8 -*-
 u"""balance.cを移植したコードで動かしてみるテスト"""
-import datetime
-import time
 import threading
-import queue
+import time
+from optparse import OptionParser
 
-import ev3dev.ev3 as ev3
+from actuator import ACTUATOR_MODES, ACTUATOR_SERVICE, ACTUATOR_THREADS, ActuatorService
+from battery_monitor import BatteryMonitor, is_stale
+from command_mailbox import CommandMailbox, MotorCommand
+from ev3_backend import ev3, clock
+from latency import LatencyHistogram, LoopProfile, context_switches
+from raw_device import open_gyro, open_motor, open_power_supply
+from scheduler import PeriodicScheduler
+from snapshot import SensorSnapshot
+from telemetry import BALANCE_FIELDS, TelemetryWriter, default_path
 
 import balance.balance as balance
 
-
-class MotorCommand(object):
-    u"""モーターのコマンド"""
-    RUN = 1
-    STOP = 2
-
-    def __init__(self, command, speed=0):
-        self.command = command
-        self.speed = speed
+ACQUIRE_SLEEP = 'sleep'  # 1msごとにセンサー値を取得し続ける(従来の方式)
+ACQUIRE_TICK = 'tick'  # 制御周期の刻みのACQUIRE_LEAD秒手前に1回だけ取得する
+ACQUISITION_MODES = (ACQUIRE_SLEEP, ACQUIRE_TICK)
+ACQUIRE_LEAD = 0.001  # ACQUIRE_TICKで制御周期の何秒手前に取得するか(センサー4つの読み込みにかかる時間より長くする)
 
 
 class Motor(object):
     u"""モーター"""
 
     def __init__(self, address):
-        self.command_queue = queue.Queue()
-        self._motor = ev3.LargeMotor(address)
+        self.mailbox = CommandMailbox()
+        self._motor = open_motor(ev3.LargeMotor(address))
         self._is_loop = True
+        self.actuation = LatencyHistogram()  # run_directにかかった時間(μs)
 
     def run(self, speed):
         u"""モーターを動かす
@@ -35,11 +38,11 @@ class Motor(object):
         Args:
             speed (int): モーターのスピード（1050まで？負の値で逆回転？）
         """
-        self.command_queue.put(MotorCommand(MotorCommand.RUN, speed=speed))
+        self.mailbox.post(MotorCommand.RUN, speed)
 
     def stop(self):
         u"""モーターを停止する"""
-        self.command_queue.put(MotorCommand(MotorCommand.STOP))
+        self.mailbox.post(MotorCommand.STOP)
 
     def get_position(self):
         return self._motor.position
@@ -47,100 +50,193 @@ class Motor(object):
     def end_thread(self):
         self._is_loop = False
 
-    def loop(self):
-        u"""メインループからの指示を受けるループ"""
+    def setup(self):
+        u"""書き込みを始める前の準備(書き込みを行うスレッドから呼ぶ)"""
         self._motor.position = 0  # balance.cのnxt_motor_set_count(NXT_PORT_C, 0)のつもり
-        times = []
-        while self._is_loop:
-            # メインスレッドからの指示を受信
-            command = self.command_queue.get()
-            while not self.command_queue.empty():
-                try:
-                    # 2つ以上queueにあれば古いのを捨てて新しい指示を実行する
-                    command = self.command_queue.get_nowait()
-                except queue.Empty:
-                    # 取れなくても無視する
-                    pass
-
-            if command.command == MotorCommand.RUN:
-                self._motor.run_direct(duty_cycle_sp=command.speed)
-                times.append(datetime.datetime.now())
-            elif command.command == MotorCommand.STOP:
-                self._motor.stop()
-                print('motor_stop')
+
+    def shutdown(self):
+        u"""書き込みを終えてモーターを止める(書き込みを行うスレッドから呼ぶ)"""
         self._motor.stop()
 
+    def apply_pending(self):
+        u"""未処理の指示があれば待たずに書き込む(ActuatorServiceから呼ぶ)"""
+        command = self.mailbox.take(timeout=0)
+        if command is not None:
+            self._apply(command)
+
+    def _apply(self, command):
+        if command.command == MotorCommand.RUN:
+            start = time.monotonic_ns()
+            self._motor.run_direct(duty_cycle_sp=command.speed)
+            self.actuation.record((time.monotonic_ns() - start) // 1000)
+        elif command.command == MotorCommand.STOP:
+            self._motor.stop()
+            print('motor_stop')
+
+    def loop(self):
+        u"""メインループからの指示を受けるループ(モーターごとにスレッドを立てる場合)"""
+        self.setup()
+        while self._is_loop:
+            # メインスレッドからの指示を受信(古い指示は新しい指示で上書きされている)
+            self._apply(self.mailbox.take())
+        self.shutdown()
+
 
 class BalanceParam(object):
     u"""balanceの入力パラメータ取得クラス
     loopにてひたすら最新値を取得しメモリ上に保管
     使用側はget_paramの戻り値にて取得
+
+    最新値はSensorSnapshot(seqlock)に書き込むので、使用側はロックなしで
+    同じ時点に取得した値の組を読める
+
+    取得の仕方(acquisition)
+        ACQUIRE_SLEEP : 1msごとに取得し続ける。値が変わっていなくても読むので、制御スレッドのCPU時間を奪う
+        ACQUIRE_TICK  : alignで渡された制御周期の刻みのlead秒手前に、周期ごとに1回だけ取得する。
+                        待つのはPeriodicScheduler(使えればtimerfd)。ev3devのジャイロ・エンコーダ・電圧の属性は
+                        値が変わってもpollで通知されない(sysfs_notifyされない)ので、属性ファイルのpollでは待たない
     """
-    def __init__(self, rightMortor, leftMortor):
+    def __init__(self, rightMortor, leftMortor, acquisition=ACQUIRE_SLEEP, period=balance.EXEC_PERIOD,
+                 lead=ACQUIRE_LEAD):
+        u"""
+        Args:
+            acquisition (str): 取得の仕方。ACQUIRE_SLEEPかACQUIRE_TICK
+            period (float): ACQUIRE_TICKで取得する周期(秒)。制御周期と同じにする
+            lead (float): ACQUIRE_TICKで制御周期の刻みの何秒手前に取得するか
+        """
+        if acquisition not in ACQUISITION_MODES:
+            raise ValueError('unknown acquisition mode: {}'.format(acquisition))
         self.right_motor = rightMortor
         self.left_motor = leftMortor
-        self.gyro_sensor = ev3.GyroSensor('in4')
-        self.battery = ev3.PowerSupply()
+        self.gyro_sensor = open_gyro(ev3.GyroSensor('in4'))
+        self.battery = open_power_supply(ev3.PowerSupply())
+        self.battery_monitor = BatteryMonitor(self.battery)  # 電圧はBATTERY_PERIODごとにしか読まない
+        self.acquisition = acquisition
+        self.period = period
+        self.lead_ns = int(lead * 1000000000)
         self._is_loop = True
+        self._grid_start_ns = None
+        self._aligned = threading.Event()
         
         # 最新取得値
-        self.gyro_sensor_rate = 0
-        self.left_motor_position = 0
-        self.right_motor_position = 0
-        self.battery_voltage = 0 #mV
+        self.snapshot = SensorSnapshot()
     
     def get_param(self):
         u"""最新入力パラメータ取得"""
-        rate = self.gyro_sensor_rate
-        lpos = self.left_motor_position
-        rpos = self.right_motor_position
-        voltage = self.battery_voltage
-        
+        rate, lpos, rpos, voltage, _, _, _ = self.snapshot.read()
         return rate, lpos, rpos, voltage
+
+    def get_snapshot(self):
+        u"""最新入力パラメータを電圧を読んだ時刻(ns)、取得時刻(ns)、サンプル番号と一緒に取得"""
+        return self.snapshot.read()
     
     def end_thread(self):
         self._is_loop = False
+        self._aligned.set()
+
+    def align(self, start_ns):
+        u"""ACQUIRE_TICKで取得する刻みを、制御ループのスケジューラの開始時刻(ns)に揃える"""
+        self._grid_start_ns = start_ns
+        self._aligned.set()
+
+    def _acquire(self):
+        now_ns = clock.monotonic_ns()
+        self.snapshot.write(
+            self.gyro_sensor.rate,
+            self.left_motor.get_position(),
+            self.right_motor.get_position(),
+            self.battery_monitor.update(now_ns),  # フィルタした電圧(mV)
+            self.battery_monitor.read_ns,  # 電圧を読んだ時刻。まだ読めていなければNOT_READ
+            now_ns)
 
     def loop(self):
         u"""デバイスから現在の値を取得"""
+        if self.acquisition == ACQUIRE_TICK:
+            self._tick_loop()
+            return
         while self._is_loop:
-            self.gyro_sensor_rate = self.gyro_sensor.rate
-            self.left_motor_position = self.left_motor.get_position()
-            self.right_motor_position = self.right_motor.get_position()
-            self.battery_voltage = self.battery.measured_voltage / 1000 #measured_voltageはマイクロボルトなのでミリボルトにする
+            self._acquire()
             # 適当に1ms sleep
-            time.sleep(0.001)
+            clock.sleep(0.001)
+
+    def _tick_loop(self):
+        u"""制御周期の刻みの少し前に1回ずつ取得する"""
+        # 制御ループの最初の周期に間に合うよう、刻みが決まる前に1回取得しておく
+        self._acquire()
+        self._aligned.wait()
+        if not self._is_loop:
+            return
+        scheduler = PeriodicScheduler(self.period, clock=clock)
+        scheduler.start(self._grid_start_ns - self.lead_ns)
+        try:
+            while self._is_loop:
+                scheduler.wait()
+                self._acquire()
+        finally:
+            scheduler.close()
 
 
 class Robot(object):
     u"""ロボット本体"""
-    BASE_SLEEP_TIME_US = balance.EXEC_PERIOD * 1000000
+    PERIOD = balance.EXEC_PERIOD  # メインループの周期(秒)
+    LOOP_COUNT = 100  # メインループの回数
+    REPORT_INTERVAL = 5.0  # 処理時間の統計を表示する間隔(秒)。0なら終了時のみ
+    READY_TIMEOUT = 2.0  # センサー取得スレッドの最初のサンプルを待つ最大時間(秒)
 
-    def __init__(self):
+    def __init__(self, actuator_mode=ACTUATOR_THREADS, acquisition=ACQUIRE_SLEEP, telemetry_path=None):
+        u"""
+        Args:
+            actuator_mode (str): モーターへの書き込み方。ACTUATOR_THREADSならモーターごとのスレッド、
+                ACTUATOR_SERVICEなら全モーターを1スレッド(ActuatorService)で書き込む
+            acquisition (str): センサー値の取得の仕方(BalanceParamを参照)
+            telemetry_path (str): 周期ごとの値を記録するテレメトリのファイル。Noneなら記録しない
+        """
+        if actuator_mode not in ACTUATOR_MODES:
+            raise ValueError('unknown actuator mode: {}'.format(actuator_mode))
+        self.actuator_mode = actuator_mode
         self.right_motor = Motor('outA')
         self.left_motor = Motor('outC')
         self.tail_motor = Motor('outB')
-        self.balance_param = BalanceParam(self.right_motor, self.left_motor)
+        self.actuator = ActuatorService([self.left_motor, self.right_motor, self.tail_motor])
+        self.balance_param = BalanceParam(self.right_motor, self.left_motor, acquisition, self.PERIOD)
         # self.gyro_sensor = ev3.GyroSensor('in4')
         # self.battery = ev3.PowerSupply()
+        self.profile = LoopProfile(int(self.PERIOD * 1000000))
+        self.sample_age = LatencyHistogram()  # センサー値を取得してから制御に使うまでの時間(μs)
+        self.telemetry = None if telemetry_path is None else TelemetryWriter(telemetry_path, BALANCE_FIELDS)
+        self._switches_start = None
+        self._cpu_start_ns = None
 
     def run(self):
         u"""ロボット稼働"""
         try:
-            left_motor_thread = threading.Thread(target=self.left_motor.loop, name='left_motor_thread')
-            right_motor_thread = threading.Thread(target=self.right_motor.loop, name='right_motor_thread')
-            tail_motor_thread = threading.Thread(target=self.tail_motor.loop, name='tail_motor_thread')
+            self._start_actuator_threads()
             balance_param_thread = threading.Thread(target=self.balance_param.loop, name='balance_param_thread')
-            left_motor_thread.start()
-            right_motor_thread.start()
-            tail_motor_thread.start()
             balance_param_thread.start()
+            self._wait_ready()
             self._main_loop()
         except Exception as error:
             print(error)
         finally:
             self.stop()
 
+    def _wait_ready(self):
+        u"""センサー取得スレッドが最初のサンプルを書き込むまで待つ"""
+        deadline = time.monotonic() + self.READY_TIMEOUT
+        while self.balance_param.snapshot.sample_index == 0:
+            if time.monotonic() > deadline:
+                raise RuntimeError('sensor thread did not start')
+            time.sleep(0.001)
+
+    def _start_actuator_threads(self):
+        u"""モーターへの書き込みを行うスレッドを開始する"""
+        if self.actuator_mode == ACTUATOR_SERVICE:
+            threading.Thread(target=self.actuator.loop, name='actuator_thread').start()
+        else:
+            threading.Thread(target=self.left_motor.loop, name='left_motor_thread').start()
+            threading.Thread(target=self.right_motor.loop, name='right_motor_thread').start()
+            threading.Thread(target=self.tail_motor.loop, name='tail_motor_thread').start()
+
     def stop(self):
         u"""ロボット停止"""
         self.left_motor.end_thread()
@@ -150,10 +246,47 @@ class Robot(object):
         self.left_motor.stop()
         self.right_motor.stop()
         self.tail_motor.stop()
+        self.actuator.end_thread()
+        if self.telemetry is not None:
+            self.telemetry.close()
+
+    def report(self):
+        u"""区間ごとの処理時間の統計と、メインループ開始からのコンテキストスイッチ回数を表示する"""
+        self.profile.actuation.reset()
+        for motor in (self.left_motor, self.right_motor, self.tail_motor):
+            self.profile.actuation.merge(motor.actuation)
+        print(self.profile.report())
+        print('sample age count {count} p50 {p50}us p99 {p99}us max {max}us mean {mean}us'.format(
+            **self.sample_age.summary()))
+        print('acquisition {}, cpu {:.0f}us per tick'.format(self.balance_param.acquisition, self.cpu_per_tick_us()))
+        print(self.balance_param.battery_monitor.report(clock.monotonic_ns()))
+        switches = self.context_switches()
+        if switches is not None:
+            print('actuator {}, context switches voluntary {} nonvoluntary {}'.format(
+                self.actuator_mode, *switches))
+
+    def cpu_per_tick_us(self):
+        u"""メインループ開始からの、プロセス全体(全スレッド)のCPU時間の1周期あたりの平均(μs)"""
+        ticks = self.profile.work.count
+        if self._cpu_start_ns is None or ticks == 0:
+            return 0.0
+        return (time.process_time_ns() - self._cpu_start_ns) / ticks / 1000
+
+    def context_switches(self):
+        u"""メインループ開始からのコンテキストスイッチ回数(自発的, 非自発的)。測れなければNone"""
+        switches = context_switches()
+        if switches is None or self._switches_start is None:
+            return None
+        return switches[0] - self._switches_start[0], switches[1] - self._switches_start[1]
 
     def _main_loop(self):
-        u"""ロボットメインループ"""
-        elapsed_times = []
+        u"""ロボットメインループ
+
+        区間ごとの処理時間はself.profileに記録する。
+        処理時間は実時間(time.monotonic_ns)、余り時間はスケジューラの時計で測る。
+        """
+        profile = self.profile
+        report_ticks = int(self.REPORT_INTERVAL / self.PERIOD)
         balance.balance_init()
         print('ready')
         # ジャイロセンサーの値
@@ -163,33 +296,74 @@ class Robot(object):
         # "motor count"（エンコーダ値）
         # XXX: "count" "encode"でAPIドキュメントを探してこれが一番それっぽかったけど合ってるのか、あまり自信なし
         # http://python-ev3dev.readthedocs.io/en/latest/motors.html#ev3dev.core.Motor.position
-        for _ in range(100):
-            start = datetime.datetime.now()
-            # パラメータ取得
-            rate, lpos, rpos, voltage = self.balance_param.get_param()
-            
-            left_pwm, right_pwm = balance.balance_control(
-                0,  # forward -100～100, 0で停止
-                0,  # turn -100～100, 0で直進
-                rate,  # balance.cのecrobot_get_gyro_sensor(NXT_PORT_S4)のつもり
-                0,  # offset（角速度）は0固定（起動時は角速度が変化しないように固定しておくこと）
-                lpos,  # balance.cのnxt_motor_get_count(NXT_PORT_C)のつもり
-                rpos,
-                voltage # 
-            )
-            # balance_controlからは-100～100までのPWM値が返ってくる
-            self.right_motor.run(speed=right_pwm)
-            self.left_motor.run(speed=left_pwm)
-
-            # 余った時間はsleep
-            elapsed_microsecond = (datetime.datetime.now() - start).microseconds
-            elapsed_times.append(elapsed_microsecond)
-            if elapsed_microsecond < self.BASE_SLEEP_TIME_US:
-                sleep_time = (self.BASE_SLEEP_TIME_US - elapsed_microsecond) / 1000000
-                time.sleep(sleep_time)
-        print('\n'.join([str(time_) for time_ in elapsed_times]))
+        actuator = self.actuator if self.actuator_mode == ACTUATOR_SERVICE else None
+        telemetry = self.telemetry
+        scheduler = PeriodicScheduler(self.PERIOD, clock=clock)
+        self._switches_start = context_switches()
+        self._cpu_start_ns = time.process_time_ns()
+        scheduler.start()
+        try:
+            self.balance_param.align(scheduler.start_ns)
+            for tick in range(1, self.LOOP_COUNT + 1):
+                start = time.monotonic_ns()
+                # パラメータ取得
+                rate, lpos, rpos, voltage, voltage_ns, timestamp_ns, _ = self.balance_param.get_snapshot()
+                self.sample_age.record((clock.monotonic_ns() - timestamp_ns) // 1000)
+                if is_stale(voltage_ns, timestamp_ns):
+                    # 電圧の読み込みに失敗し続けている。モニターはセンサー取得のスレッドのものなので読み直さずに止まる
+                    raise RuntimeError('battery voltage is stale')
+                sensor_end = time.monotonic_ns()
+
+                left_pwm, right_pwm = balance.balance_control(
+                    0,  # forward -100～100, 0で停止
+                    0,  # turn -100～100, 0で直進
+                    rate,  # balance.cのecrobot_get_gyro_sensor(NXT_PORT_S4)のつもり
+                    0,  # offset（角速度）は0固定（起動時は角速度が変化しないように固定しておくこと）
+                    lpos,  # balance.cのnxt_motor_get_count(NXT_PORT_C)のつもり
+                    rpos,
+                    voltage # 
+                )
+                control_end = time.monotonic_ns()
+
+                # balance_controlからは-100～100までのPWM値が返ってくる
+                self.right_motor.run(speed=right_pwm)
+                self.left_motor.run(speed=left_pwm)
+                if actuator is not None:
+                    actuator.notify()
+                enqueue_end = time.monotonic_ns()
+
+                # 処理時間を記録して、次の周期の開始時刻までsleep
+                profile.sensor.record((sensor_end - start) // 1000)
+                profile.control.record((control_end - sensor_end) // 1000)
+                profile.enqueue.record((enqueue_end - control_end) // 1000)
+                profile.work.record((enqueue_end - start) // 1000)
+                slack = scheduler.remaining_ns() // 1000
+                profile.record_slack(slack)
+                if telemetry is not None:
+                    telemetry.write(start, timestamp_ns, rate, lpos, rpos, voltage, left_pwm, right_pwm,
+                                    (enqueue_end - start) // 1000, slack)
+                scheduler.wait()
+                profile.jitter.record(scheduler.last_lateness_ns // 1000)
+                if report_ticks and tick % report_ticks == 0:
+                    self.report()
+            self.report()
+            print(scheduler.stats())
+        finally:
+            scheduler.close()
 
 
 if __name__ == '__main__':
-    robot = Robot()
+    parser = OptionParser()
+    parser.add_option('-a', '--actuator', action='store', type='choice', dest='actuator',
+                      choices=ACTUATOR_MODES, default=ACTUATOR_THREADS,
+                      help="モーターへの書き込み方(threads: モーターごとのスレッド, service: 1スレッドでまとめて)")
+    parser.add_option('-q', '--acquisition', action='store', type='choice', dest='acquisition',
+                      choices=ACQUISITION_MODES, default=ACQUIRE_SLEEP,
+                      help="センサー値の取得の仕方(sleep: 1msごと, tick: 制御周期ごとに1回)")
+    parser.add_option('-t', '--telemetry', action='store', type='string', dest='telemetry',
+                      default=default_path('balance_sensor_other_thread'),
+                      help="テレメトリのファイル(telemetry.TelemetryReaderで読める)。既定は起動日時の入ったファイル")
+    options, _ = parser.parse_args()
+    robot = Robot(actuator_mode=options.actuator, acquisition=options.acquisition,
+                  telemetry_path=options.telemetry)
     robot.run()
@@ -1,33 +1,30 @@
 #!/usr/bin/env python3
 # -*- coding: UTF-8 -*-
 u"""balance.cを移植したコードで動かしてみるテスト"""
-import datetime
-import time
 import threading
-import queue
+import time
+from optparse import OptionParser
 
-import ev3dev.ev3 as ev3
+from actuator import ACTUATOR_MODES, ACTUATOR_SERVICE, ACTUATOR_THREADS, ActuatorService
+from battery_monitor import BatteryMonitor
+from command_mailbox import CommandMailbox, MotorCommand
+from ev3_backend import ev3, clock
+from latency import LatencyHistogram, LoopProfile, context_switches
+from raw_device import open_gyro, open_motor, open_power_supply
+from scheduler import PeriodicScheduler
+from telemetry import BALANCE_FIELDS, TelemetryWriter, default_path
 
 import balance.balance as balance
 
 
-class MotorCommand(object):
-    u"""モーターのコマンド"""
-    RUN = 1
-    STOP = 2
-
-    def __init__(self, command, speed=0):
-        self.command = command
-        self.speed = speed
-
-
 class Motor(object):
     u"""モーター"""
 
     def __init__(self, address):
-        self.command_queue = queue.Queue()
-        self._motor = ev3.LargeMotor(address)
+        self.mailbox = CommandMailbox()
+        self._motor = open_motor(ev3.LargeMotor(address))
         self._is_loop = True
+        self.actuation = LatencyHistogram()  # run_directにかかった時間(μs)
 
     def run(self, speed):
         u"""モーターを動かす
@@ -35,11 +32,11 @@ class Motor(object):
         Args:
             speed (int): モーターのスピード（1050まで？負の値で逆回転？）
         """
-        self.command_queue.put(MotorCommand(MotorCommand.RUN, speed=speed))
+        self.mailbox.post(MotorCommand.RUN, speed)
 
     def stop(self):
         u"""モーターを停止する"""
-        self.command_queue.put(MotorCommand(MotorCommand.STOP))
+        self.mailbox.post(MotorCommand.STOP)
 
     def get_position(self):
         return self._motor.position
@@ -47,56 +44,84 @@ class Motor(object):
     def end_thread(self):
         self._is_loop = False
 
-    def loop(self):
-        u"""メインループからの指示を受けるループ"""
+    def setup(self):
+        u"""書き込みを始める前の準備(書き込みを行うスレッドから呼ぶ)"""
         self._motor.position = 0  # balance.cのnxt_motor_set_count(NXT_PORT_C, 0)のつもり
-        times = []
-        while self._is_loop:
-            # メインスレッドからの指示を受信
-            command = self.command_queue.get()
-            while not self.command_queue.empty():
-                try:
-                    # 2つ以上queueにあれば古いのを捨てて新しい指示を実行する
-                    command = self.command_queue.get_nowait()
-                except queue.Empty:
-                    # 取れなくても無視する
-                    pass
-
-            if command.command == MotorCommand.RUN:
-                self._motor.run_direct(duty_cycle_sp=command.speed)
-                times.append(datetime.datetime.now())
-            elif command.command == MotorCommand.STOP:
-                self._motor.stop()
-                print('motor_stop')
+
+    def shutdown(self):
+        u"""書き込みを終えてモーターを止める(書き込みを行うスレッドから呼ぶ)"""
         self._motor.stop()
 
+    def apply_pending(self):
+        u"""未処理の指示があれば待たずに書き込む(ActuatorServiceから呼ぶ)"""
+        command = self.mailbox.take(timeout=0)
+        if command is not None:
+            self._apply(command)
+
+    def _apply(self, command):
+        if command.command == MotorCommand.RUN:
+            start = time.monotonic_ns()
+            self._motor.run_direct(duty_cycle_sp=command.speed)
+            self.actuation.record((time.monotonic_ns() - start) // 1000)
+        elif command.command == MotorCommand.STOP:
+            self._motor.stop()
+            print('motor_stop')
+
+    def loop(self):
+        u"""メインループからの指示を受けるループ(モーターごとにスレッドを立てる場合)"""
+        self.setup()
+        while self._is_loop:
+            # メインスレッドからの指示を受信(古い指示は新しい指示で上書きされている)
+            self._apply(self.mailbox.take())
+        self.shutdown()
+
 
 class Robot(object):
     u"""ロボット本体"""
-    BASE_SLEEP_TIME_US = balance.EXEC_PERIOD * 1000000
+    PERIOD = balance.EXEC_PERIOD  # メインループの周期(秒)
+    LOOP_COUNT = 100  # メインループの回数
+    REPORT_INTERVAL = 5.0  # 処理時間の統計を表示する間隔(秒)。0なら終了時のみ
 
-    def __init__(self):
+    def __init__(self, actuator_mode=ACTUATOR_THREADS, telemetry_path=None):
+        u"""
+        Args:
+            actuator_mode (str): モーターへの書き込み方。ACTUATOR_THREADSならモーターごとのスレッド、
+                ACTUATOR_SERVICEなら全モーターを1スレッド(ActuatorService)で書き込む
+            telemetry_path (str): 周期ごとの値を記録するテレメトリのファイル。Noneなら記録しない
+        """
+        if actuator_mode not in ACTUATOR_MODES:
+            raise ValueError('unknown actuator mode: {}'.format(actuator_mode))
+        self.actuator_mode = actuator_mode
         self.right_motor = Motor('outA')
         self.left_motor = Motor('outC')
         self.tail_motor = Motor('outB')
-        self.gyro_sensor = ev3.GyroSensor('in4')
-        self.battery = ev3.PowerSupply()
+        self.actuator = ActuatorService([self.left_motor, self.right_motor, self.tail_motor])
+        self.gyro_sensor = open_gyro(ev3.GyroSensor('in4'))
+        self.battery = open_power_supply(ev3.PowerSupply())
+        self.battery_monitor = BatteryMonitor(self.battery)  # 電圧はBATTERY_PERIODごとにしか読まない
+        self.profile = LoopProfile(int(self.PERIOD * 1000000))
+        self.telemetry = None if telemetry_path is None else TelemetryWriter(telemetry_path, BALANCE_FIELDS)
+        self._switches_start = None
 
     def run(self):
         u"""ロボット稼働"""
         try:
-            left_motor_thread = threading.Thread(target=self.left_motor.loop, name='left_motor_thread')
-            right_motor_thread = threading.Thread(target=self.right_motor.loop, name='left_motor_thread')
-            tail_motor_thread = threading.Thread(target=self.tail_motor.loop, name='left_motor_thread')
-            left_motor_thread.start()
-            right_motor_thread.start()
-            tail_motor_thread.start()
+            self._start_actuator_threads()
             self._main_loop()
         except Exception as error:
             print(error)
         finally:
             self.stop()
 
+    def _start_actuator_threads(self):
+        u"""モーターへの書き込みを行うスレッドを開始する"""
+        if self.actuator_mode == ACTUATOR_SERVICE:
+            threading.Thread(target=self.actuator.loop, name='actuator_thread').start()
+        else:
+            threading.Thread(target=self.left_motor.loop, name='left_motor_thread').start()
+            threading.Thread(target=self.right_motor.loop, name='right_motor_thread').start()
+            threading.Thread(target=self.tail_motor.loop, name='tail_motor_thread').start()
+
     def stop(self):
         u"""ロボット停止"""
         self.left_motor.end_thread()
@@ -105,10 +130,37 @@ class Robot(object):
         self.left_motor.stop()
         self.right_motor.stop()
         self.tail_motor.stop()
+        self.actuator.end_thread()
+        if self.telemetry is not None:
+            self.telemetry.close()
+
+    def report(self):
+        u"""区間ごとの処理時間の統計と、メインループ開始からのコンテキストスイッチ回数を表示する"""
+        self.profile.actuation.reset()
+        for motor in (self.left_motor, self.right_motor, self.tail_motor):
+            self.profile.actuation.merge(motor.actuation)
+        print(self.profile.report())
+        print(self.battery_monitor.report(clock.monotonic_ns()))
+        switches = self.context_switches()
+        if switches is not None:
+            print('actuator {}, context switches voluntary {} nonvoluntary {}'.format(
+                self.actuator_mode, *switches))
+
+    def context_switches(self):
+        u"""メインループ開始からのコンテキストスイッチ回数(自発的, 非自発的)。測れなければNone"""
+        switches = context_switches()
+        if switches is None or self._switches_start is None:
+            return None
+        return switches[0] - self._switches_start[0], switches[1] - self._switches_start[1]
 
     def _main_loop(self):
-        u"""ロボットメインループ"""
-        elapsed_times = []
+        u"""ロボットメインループ
+
+        区間ごとの処理時間はself.profileに記録する。
+        処理時間は実時間(time.monotonic_ns)、余り時間はスケジューラの時計で測る。
+        """
+        profile = self.profile
+        report_ticks = int(self.REPORT_INTERVAL / self.PERIOD)
         balance.balance_init()
         print('ready')
         # ジャイロセンサーの値
@@ -118,30 +170,67 @@ class Robot(object):
         # "motor count"（エンコーダ値）
         # XXX: "count" "encode"でAPIドキュメントを探してこれが一番それっぽかったけど合ってるのか、あまり自信なし
         # http://python-ev3dev.readthedocs.io/en/latest/motors.html#ev3dev.core.Motor.position
-        for _ in range(100):
-            start = datetime.datetime.now()
+        actuator = self.actuator if self.actuator_mode == ACTUATOR_SERVICE else None
+        telemetry = self.telemetry
+        scheduler = PeriodicScheduler(self.PERIOD, clock=clock)
+        self._switches_start = context_switches()
+        scheduler.start()
+        for tick in range(1, self.LOOP_COUNT + 1):
+            start = time.monotonic_ns()
+            rate = self.gyro_sensor.rate  # balance.cのecrobot_get_gyro_sensor(NXT_PORT_S4)のつもり
+            lpos = self.left_motor.get_position()  # balance.cのnxt_motor_get_count(NXT_PORT_C)のつもり
+            rpos = self.right_motor.get_position()
+            sample_ns = clock.monotonic_ns()
+            voltage = self.battery_monitor.update(sample_ns)  # フィルタした電圧(mV)
+            if self.battery_monitor.is_stale(sample_ns):
+                # 電圧の読み込みに失敗し続けている。読み直して、それでも読めなければ(OSError)止まる
+                voltage = self.battery_monitor.read(sample_ns)
+            sensor_end = time.monotonic_ns()
+
             left_pwm, right_pwm = balance.balance_control(
                 0,  # forward -100～100, 0で停止
                 0,  # turn -100～100, 0で直進
-                self.gyro_sensor.rate,  # balance.cのecrobot_get_gyro_sensor(NXT_PORT_S4)のつもり
+                rate,
                 0,  # offset（角速度）は0固定（起動時は角速度が変化しないように固定しておくこと）
-                self.left_motor.get_position(),  # balance.cのnxt_motor_get_count(NXT_PORT_C)のつもり
-                self.right_motor.get_position(),
-                self.battery.measured_voltage / 1000  # measured_voltageはマイクロボルトなのでミリボルトにする
+                lpos,
+                rpos,
+                voltage
             )
+            control_end = time.monotonic_ns()
+
             # balance_controlからは-100～100までのPWM値が返ってくる
             self.right_motor.run(speed=right_pwm)
             self.left_motor.run(speed=left_pwm)
-
-            # 余った時間はsleep
-            elapsed_microsecond = (datetime.datetime.now() - start).microseconds
-            elapsed_times.append(elapsed_microsecond)
-            if elapsed_microsecond < self.BASE_SLEEP_TIME_US:
-                sleep_time = (self.BASE_SLEEP_TIME_US - elapsed_microsecond) / 1000000
-                time.sleep(sleep_time)
-        print('\n'.join([str(time_) for time_ in elapsed_times]))
+            if actuator is not None:
+                actuator.notify()
+            enqueue_end = time.monotonic_ns()
+
+            # 処理時間を記録して、次の周期の開始時刻までsleep
+            profile.sensor.record((sensor_end - start) // 1000)
+            profile.control.record((control_end - sensor_end) // 1000)
+            profile.enqueue.record((enqueue_end - control_end) // 1000)
+            profile.work.record((enqueue_end - start) // 1000)
+            slack = scheduler.remaining_ns() // 1000
+            profile.record_slack(slack)
+            if telemetry is not None:
+                telemetry.write(start, sample_ns, rate, lpos, rpos, voltage, left_pwm, right_pwm,
+                                (enqueue_end - start) // 1000, slack)
+            scheduler.wait()
+            profile.jitter.record(scheduler.last_lateness_ns // 1000)
+            if report_ticks and tick % report_ticks == 0:
+                self.report()
+        self.report()
+        print(scheduler.stats())
 
 
 if __name__ == '__main__':
-    robot = Robot()
+    parser = OptionParser()
+    parser.add_option('-a', '--actuator', action='store', type='choice', dest='actuator',
+                      choices=ACTUATOR_MODES, default=ACTUATOR_THREADS,
+                      help="モーターへの書き込み方(threads: モーターごとのスレッド, service: 1スレッドでまとめて)")
+    parser.add_option('-t', '--telemetry', action='store', type='string', dest='telemetry',
+                      default=default_path('balance_test'),
+                      help="テレメトリのファイル(telemetry.TelemetryReaderで読める)。既定は起動日時の入ったファイル")
+    options, _ = parser.parse_args()
+    robot = Robot(actuator_mode=options.actuator, telemetry_path=options.telemetry)
     robot.run()
@@ -0,0 +1,109 @@
+# -*- coding: UTF-8 -*-
+u"""バッテリー電圧を低い頻度で読み、フィルタした値を使い回す
+
+電圧は数分単位でしか変わらない(motor_angle_recorder.pyは以前5秒ごとに記録していた)ので、
+ジャイロやエンコーダと同じ頻度で読む必要はない。BatteryMonitorはupdateが呼ばれるたびに
+前回読んでからperiod秒以上たっていれば読み直し、1次遅れのフィルタを通した値(mV)と読んだ時刻を保持する。
+
+    monitor = BatteryMonitor(ev3.PowerSupply())
+    while ...:
+        voltage = monitor.update(time.monotonic_ns())  # 周期ごとに呼ぶ。実際に読むのは4Hz
+
+読み込みに失敗(OSError)したときは前の値を使い続け、読んだ時刻は進めない。そのまま失敗が続くと
+STALE_TIMEOUT後に古すぎる値になるので、使う側は電圧と一緒に読んだ時刻(read_ns)も受け取り、
+is_stale(read_ns, now_ns)なら読み直す(モニターを持っていなければ止まる)。
+"""
+import math
+
+BATTERY_PERIOD = 0.25  # 電圧を読む周期(秒)
+TIME_CONSTANT = 1.0  # フィルタの時定数(秒)。モーターの負荷による一瞬の電圧降下をならす
+STALE_TIMEOUT = 2.0  # 最後に読んでからこれ(秒)より古い値は古すぎるとみなす
+STALE_TIMEOUT_NS = int(STALE_TIMEOUT * 1000000000)
+NOT_READ = (1 << 64) - 1  # スナップショット(uint64)に書く、まだ読んでいないときの時刻(シミュレータの時刻は0から始まる)
+
+
+def is_stale(timestamp_ns, now_ns, stale_timeout_ns=STALE_TIMEOUT_NS):
+    u"""timestamp_ns(ns)に読んだ電圧が古すぎるか
+
+    Args:
+        timestamp_ns (int): 電圧を読んだ時刻(BatteryMonitor.timestamp_ns)。まだ読んでいなければNoneかNOT_READ
+        now_ns (int): 現在時刻(ns)
+        stale_timeout_ns (int): これ(ns)より古い値は古すぎるとみなす
+    """
+    return timestamp_ns is None or timestamp_ns == NOT_READ or now_ns - timestamp_ns > stale_timeout_ns
+
+
+class BatteryMonitor(object):
+    u"""バッテリー電圧のキャッシュ"""
+
+    def __init__(self, power_supply, period=BATTERY_PERIOD, time_constant=TIME_CONSTANT,
+                 stale_timeout=STALE_TIMEOUT):
+        u"""
+        Args:
+            power_supply: measured_voltage(μV)を持つデバイス(ev3.PowerSupply, raw_device.RawPowerSupply)
+            period (float): 電圧を読む周期(秒)
+            time_constant (float): フィルタの時定数(秒)。0ならフィルタしない
+            stale_timeout (float): これ(秒)より古い値はis_staleでTrueになる
+        """
+        self.power_supply = power_supply
+        self.period_ns = int(period * 1000000000)
+        self.time_constant = time_constant
+        self.stale_timeout_ns = int(stale_timeout * 1000000000)
+        self.voltage = 0.0  # フィルタした電圧(mV)
+        self.timestamp_ns = None  # 最後に読んだ時刻
+        self.reads = 0  # 読んだ回数
+        self.errors = 0  # updateで読み込みに失敗した回数
+
+    def update(self, now_ns):
+        u"""前回読んでからperiod秒以上たっていれば読み直す。失敗したら前の値のまま(次の呼び出しで読み直す)
+
+        Args:
+            now_ns (int): 現在時刻(ns)
+
+        Returns:
+            (float): フィルタした電圧(mV)
+        """
+        if self.timestamp_ns is None or now_ns - self.timestamp_ns >= self.period_ns:
+            try:
+                self.read(now_ns)
+            except OSError:
+                self.errors += 1
+        return self.voltage
+
+    def read(self, now_ns):
+        u"""電圧を読んでフィルタに通す(失敗したらOSErrorをそのまま投げる)"""
+        voltage = self.power_supply.measured_voltage / 1000  # measured_voltageはマイクロボルトなのでミリボルトにする
+        if self.timestamp_ns is None or self.time_constant <= 0:
+            self.voltage = voltage
+        else:
+            elapsed = (now_ns - self.timestamp_ns) / 1000000000
+            alpha = 1.0 - math.exp(-elapsed / self.time_constant)
+            self.voltage += alpha * (voltage - self.voltage)
+        self.timestamp_ns = now_ns
+        self.reads += 1
+        return self.voltage
+
+    @property
+    def read_ns(self):
+        u"""スナップショットに書く、最後に読んだ時刻(ns)。まだ読んでいなければNOT_READ"""
+        return NOT_READ if self.timestamp_ns is None else self.timestamp_ns
+
+    def age_ns(self, now_ns):
+        u"""最後に読んでからの時間(ns)。まだ読んでいなければNone"""
+        if self.timestamp_ns is None:
+            return None
+        return now_ns - self.timestamp_ns
+
+    def is_stale(self, now_ns):
+        u"""値が古すぎる(またはまだ読んでいない)か"""
+        return is_stale(self.timestamp_ns, now_ns, self.stale_timeout_ns)
+
+    def report(self, now_ns):
+        u"""電圧と最後に読んでからの時間を文字列にする"""
+        age_ns = self.age_ns(now_ns)
+        return 'battery {:.0f}mV, reads {}, errors {}, age {}{}'.format(
+            self.voltage,
+            self.reads,
+            self.errors,
+            '-' if age_ns is None else '{}ms'.format(age_ns // 1000000),
+            ' (stale)' if self.is_stale(now_ns) else '')
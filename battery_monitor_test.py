@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""BatteryMonitorのテスト
+
+$ python3 battery_monitor_test.py
+"""
+from battery_monitor import NOT_READ, BatteryMonitor, is_stale
+
+MS = 1000000
+
+
+class FakePowerSupply(object):
+    def __init__(self, voltage_uv):
+        self.voltage_uv = voltage_uv
+        self.reads = 0
+
+    @property
+    def measured_voltage(self):
+        self.reads += 1
+        if self.voltage_uv is None:
+            raise OSError('read failed')
+        return self.voltage_uv
+
+
+def test_reads_at_period():
+    power_supply = FakePowerSupply(8000000)
+    monitor = BatteryMonitor(power_supply, period=0.25)
+    # 4ms周期で1秒分
+    for tick in range(250):
+        assert monitor.update(tick * 4 * MS) == 8000.0
+    assert power_supply.reads == 4
+    assert monitor.reads == 4
+
+
+def test_filter_follows_step():
+    power_supply = FakePowerSupply(8000000)
+    monitor = BatteryMonitor(power_supply, period=0.25, time_constant=1.0)
+    monitor.update(0)
+    power_supply.voltage_uv = 7000000
+    # 1秒後は約63%、5秒後はほぼ新しい値
+    monitor.update(250 * MS)
+    monitor.update(500 * MS)
+    monitor.update(750 * MS)
+    voltage = monitor.update(1000 * MS)
+    assert 7300 < voltage < 7400
+    for tick in range(5, 21):
+        voltage = monitor.update(tick * 250 * MS)
+    assert abs(voltage - 7000) < 10
+
+
+def test_staleness():
+    monitor = BatteryMonitor(FakePowerSupply(8000000), stale_timeout=2.0)
+    assert monitor.is_stale(0)
+    monitor.read(0)
+    assert not monitor.is_stale(1000 * MS)
+    assert monitor.age_ns(1000 * MS) == 1000 * MS
+    assert monitor.is_stale(2500 * MS)
+    assert 'stale' in monitor.report(2500 * MS)
+
+
+def test_read_errors_keep_timestamp():
+    power_supply = FakePowerSupply(8000000)
+    monitor = BatteryMonitor(power_supply, period=0.25, stale_timeout=2.0)
+    monitor.update(0)
+    power_supply.voltage_uv = None
+    # 読めない間は前の値のまま、読んだ時刻も進まないので古くなる
+    for tick in range(1, 13):
+        assert monitor.update(tick * 250 * MS) == 8000.0
+    assert monitor.errors == 12 and monitor.read_ns == 0
+    assert is_stale(monitor.read_ns, 3000 * MS) and monitor.is_stale(3000 * MS)
+    assert 'errors 12' in monitor.report(3000 * MS)
+    # 呼び出し側が読み直したときは失敗がそのまま伝わる
+    try:
+        monitor.read(3000 * MS)
+    except OSError:
+        pass
+    else:
+        assert False, 'expected OSError'
+    power_supply.voltage_uv = 7000000
+    monitor.update(3250 * MS)
+    assert monitor.read_ns == 3250 * MS and not is_stale(monitor.read_ns, 3250 * MS)
+
+
+def test_is_stale_without_monitor():
+    u"""スナップショットで受け取った読み取り時刻だけで判定する(まだ読んでいなければNOT_READ)"""
+    monitor = BatteryMonitor(FakePowerSupply(None))
+    monitor.update(0)
+    assert monitor.read_ns == NOT_READ and monitor.voltage == 0.0
+    assert is_stale(monitor.read_ns, 0)
+    assert is_stale(None, 1000 * MS)
+    assert not is_stale(0, 1000 * MS)  # シミュレータの時刻は0から始まる
+    assert not is_stale(1000 * MS, 3000 * MS)
+    assert is_stale(1000 * MS, 3001 * MS)
+    assert not is_stale(1000 * MS, 1500 * MS, stale_timeout_ns=500 * MS)
+
+
+if __name__ == '__main__':
+    test_reads_at_period()
+    test_filter_follows_step()
+    test_staleness()
+    test_read_errors_keep_timestamp()
+    test_is_stale_without_monitor()
+    print('ok')
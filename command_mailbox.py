@@ -0,0 +1,96 @@
+# -*- coding: UTF-8 -*-
+u"""モーターへの指示を渡す1枠だけのメールボックス
+
+queue.Queueと違い、新しい指示は古い指示を上書きする(受け取り側は常に最新の指示だけを実行する)。
+指示のオブジェクトは最初に確保したものを使い回すので、post/takeのたびにオブジェクトを作らない。
+
+受け取り側を起こすのにthreading.Conditionを使うと、waitのたびに内部でロックを1つ作るので、
+最初に確保したロックを1回だけのセマフォとして使う(postで解放、takeで獲得)。
+"""
+import threading
+
+
+class MotorCommand(object):
+    u"""モーターのコマンド"""
+    __slots__ = ('command', 'speed')
+    RUN = 1
+    STOP = 2
+
+    def __init__(self, command=None, speed=0):
+        self.command = command
+        self.speed = speed
+
+
+class CommandMailbox(object):
+    u"""最新の指示だけを保持するメールボックス(受け取り側は1スレッド)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()  # _pendingと_signaledを守る
+        self._signal = threading.Lock()  # 未読の指示がある間だけ解放されている
+        self._signal.acquire()
+        self._signaled = False
+        self._pending = MotorCommand()  # 送り側が書き込む枠
+        self._taken = MotorCommand()  # 受け取り側に返す枠
+
+    def post(self, command, speed=0):
+        u"""指示を送る。未読の指示があれば上書きする"""
+        with self._lock:
+            self._pending.command = command
+            self._pending.speed = speed
+            if not self._signaled:
+                self._signaled = True
+                self._signal.release()
+
+    def take(self, timeout=-1):
+        u"""指示が来るまで待って受け取る
+
+        返すオブジェクトは次のtakeで上書きされるので、保持する場合はコピーすること。
+
+        Args:
+            timeout (float): 待つ最大時間(秒)。負なら無制限
+
+        Returns:
+            (MotorCommand): 最新の指示。タイムアウトした場合はNone
+        """
+        if not self._signal.acquire(timeout=timeout):
+            return None
+        with self._lock:
+            self._taken.command = self._pending.command
+            self._taken.speed = self._pending.speed
+            self._signaled = False
+        return self._taken
+
+
+class WakeSignal(object):
+    u"""待っているスレッドを起こすだけの合図(受け取り側は1スレッド)
+
+    threading.Eventと違い、waitで合図を消費する。合図は何回送っても1回分にまとめられる。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()  # _signaledを守る
+        self._signal = threading.Lock()  # 合図がある間だけ解放されている
+        self._signal.acquire()
+        self._signaled = False
+
+    def set(self):
+        u"""合図を送る"""
+        with self._lock:
+            if not self._signaled:
+                self._signaled = True
+                self._signal.release()
+
+    def wait(self, timeout=-1):
+        u"""合図が来るまで待つ
+
+        Args:
+            timeout (float): 待つ最大時間(秒)。負なら無制限
+
+        Returns:
+            (bool): 合図を受け取ったらTrue、タイムアウトしたらFalse
+        """
+        if not self._signal.acquire(timeout=timeout):
+            return False
+        with self._lock:
+            self._signaled = False
+        return True
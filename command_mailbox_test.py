@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""CommandMailboxのテスト
+
+$ python3 -m pytest command_mailbox_test.py
+"""
+import threading
+import time
+
+from command_mailbox import CommandMailbox, MotorCommand
+
+
+def test_latest_command_wins():
+    mailbox = CommandMailbox()
+    mailbox.post(MotorCommand.RUN, 10)
+    mailbox.post(MotorCommand.RUN, 20)
+    mailbox.post(MotorCommand.STOP)
+    command = mailbox.take()
+    assert command.command == MotorCommand.STOP
+    # 上書きされた指示は残っていない
+    assert mailbox.take(timeout=0.01) is None
+
+
+def test_take_reuses_command_object():
+    mailbox = CommandMailbox()
+    mailbox.post(MotorCommand.RUN, 1)
+    first = mailbox.take()
+    mailbox.post(MotorCommand.RUN, 2)
+    second = mailbox.take()
+    assert first is second
+    assert second.speed == 2
+
+
+def test_take_wakes_on_post():
+    mailbox = CommandMailbox()
+    received = []
+
+    def consumer():
+        received.append(mailbox.take(timeout=5).speed)
+
+    thread = threading.Thread(target=consumer)
+    thread.start()
+    time.sleep(0.01)
+    mailbox.post(MotorCommand.RUN, 42)
+    thread.join(timeout=5)
+    assert received == [42]
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""モーターへの指示を送ってからrun_directが呼ばれるまでの時間を、queue.QueueとCommandMailboxで比べる
+
+メインスレッドが一定周期(250Hz, 1kHz)で指示を送り、モータースレッドが受け取ってrun_directの代わりの関数を呼ぶ
+$ python3 command_mailbox_time.py --seconds=5
+"""
+import queue
+import threading
+import time
+from optparse import OptionParser
+
+from command_mailbox import CommandMailbox, MotorCommand
+from latency import LatencyHistogram
+from scheduler import PeriodicScheduler
+
+RATES = (250, 1000)
+SECONDS = 3.0
+
+
+class QueueMotor(object):
+    u"""従来のMotorと同じく、queue.Queueで指示を受け取って古い指示を捨てる"""
+
+    def __init__(self, run_direct):
+        self.command_queue = queue.Queue()
+        self._run_direct = run_direct
+        self._is_loop = True
+
+    def run(self, speed):
+        self.command_queue.put(QueueMotorCommand(MotorCommand.RUN, speed=speed))
+
+    def stop(self):
+        self.command_queue.put(QueueMotorCommand(MotorCommand.STOP))
+
+    def end_thread(self):
+        self._is_loop = False
+
+    def loop(self):
+        while self._is_loop:
+            command = self.command_queue.get()
+            while not self.command_queue.empty():
+                try:
+                    command = self.command_queue.get_nowait()
+                except queue.Empty:
+                    pass
+            if command.command == MotorCommand.RUN:
+                self._run_direct(command.speed)
+
+
+class QueueMotorCommand(object):
+    u"""従来のMotorCommand(__slots__なし、指示ごとに生成)"""
+
+    def __init__(self, command, speed=0):
+        self.command = command
+        self.speed = speed
+
+
+class MailboxMotor(object):
+    u"""CommandMailboxで指示を受け取るMotor"""
+
+    def __init__(self, run_direct):
+        self.mailbox = CommandMailbox()
+        self._run_direct = run_direct
+        self._is_loop = True
+
+    def run(self, speed):
+        self.mailbox.post(MotorCommand.RUN, speed)
+
+    def stop(self):
+        self.mailbox.post(MotorCommand.STOP)
+
+    def end_thread(self):
+        self._is_loop = False
+
+    def loop(self):
+        while self._is_loop:
+            command = self.mailbox.take()
+            if command.command == MotorCommand.RUN:
+                self._run_direct(command.speed)
+
+
+def test(motor_class, rate, seconds):
+    u"""rate(Hz)で指示を送り、送ってからrun_directが呼ばれるまでの時間を計る
+
+    speedに送った時刻(ns)を入れて、run_directの中で差をとる
+
+    Returns:
+        (tuple): (遅延のLatencyHistogram, 送った指示の数)
+    """
+    histogram = LatencyHistogram()
+
+    def run_direct(speed):
+        histogram.record((time.monotonic_ns() - speed) // 1000)
+
+    motor = motor_class(run_direct)
+    thread = threading.Thread(target=motor.loop)
+    thread.start()
+    scheduler = PeriodicScheduler(1.0 / rate)
+    scheduler.start()
+    count = int(rate * seconds)
+    try:
+        for _ in range(count):
+            motor.run(time.monotonic_ns())
+            scheduler.wait()
+    finally:
+        motor.end_thread()
+        motor.stop()
+        thread.join()
+    return histogram, count
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-s', '--seconds', action='store', type='float', dest='seconds', default=SECONDS,
+                      help="1項目あたりの計測時間(秒)")
+    options, _ = parser.parse_args()
+    for rate in RATES:
+        for name, motor_class in (('queue', QueueMotor), ('mailbox', MailboxMotor)):
+            histogram, count = test(motor_class, rate, options.seconds)
+            print('{} {}Hz: sent {} applied {} p50 {p50}us p99 {p99}us max {max}us mean {mean}us'.format(
+                name, rate, count, histogram.count, **histogram.summary()))
@@ -0,0 +1,18 @@
+# -*- coding: UTF-8 -*-
+u"""ev3dev.ev3とシミュレータ(sim.ev3)の切り替え
+
+環境変数EV3_BACKEND=simで起動するとシミュレータのデバイスを使う
+$ EV3_BACKEND=sim python3 balance_test.py
+
+clockはtime.sleep/time.monotonicの代わりに使う時計。
+シミュレータでは、clock.sleepした分だけ物理モデルが進む(EV3_SIM_REALTIME=1なら実時間に合わせて進む)
+"""
+import os
+import time
+
+if os.environ.get('EV3_BACKEND') == 'sim':
+    import sim.ev3 as ev3
+    clock = ev3.reset(realtime=os.environ.get('EV3_SIM_REALTIME') == '1')
+else:
+    import ev3dev.ev3 as ev3
+    clock = time
@@ -0,0 +1,106 @@
+# -*- coding: UTF-8 -*-
+u"""Q-Learningの経験(遷移)をためて、ランダムに取り出すリングバッファ(Experience Replay)
+
+遷移 (state, action, reward, next_state, done) を最初に確保したNumPyの配列に書き込み、
+いっぱいになったら古いものから上書きするので、学習をどれだけ続けてもメモリは増えない。
+sampleは一様にbatch_size個選び、これも最初に確保したバッチ用の配列に詰めて返す。
+
+    replay = ExperienceReplay(100000)
+    replay.add(state, action.value, reward, next_state, done)  # 複数の環境ならadd_batch
+    agent.update_minibatch(*replay.sample(64))
+
+オフラインの学習用。EV3本体では使わないのでNumPyが必要。
+"""
+import numpy as np
+
+STATE_SIZE = 4  # neural_networkの入力層ニューロン数
+
+
+class ExperienceReplay(object):
+    u"""固定長の遷移のリングバッファ(書き込み側は1スレッドだけとする)"""
+
+    def __init__(self, capacity, state_size=STATE_SIZE, seed=None):
+        u"""
+        Args:
+            capacity (int): 保持する遷移の最大数
+            state_size (int): 状態の次元
+            seed (int): sampleの乱数の種
+        """
+        self.capacity = capacity
+        self.states = np.zeros((capacity, state_size), dtype=np.float64)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float64)
+        self.next_states = np.zeros((capacity, state_size), dtype=np.float64)
+        self.dones = np.zeros(capacity, dtype=np.bool_)
+        self.count = 0  # これまでに追加した遷移の数(上書きしたものも含む)
+        self._random = np.random.default_rng(seed)
+        self._batch = None
+        self._batch_size = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def add(self, state, action, reward, next_state, done=False):
+        u"""遷移を1つ追加する(いっぱいなら一番古い遷移を上書きする)
+
+        Args:
+            state: 状態(state_size個の数値)
+            action (int): 選んだ行動の番号(Action.value)
+            reward (float): 報酬
+            next_state: 次の状態
+            done (bool): エピソードが終わった(倒れた)か。Trueなら次の状態の価値を使わない
+        """
+        index = self.count % self.capacity
+        self.states[index] = state
+        self.actions[index] = action
+        self.rewards[index] = reward
+        self.next_states[index] = next_state
+        self.dones[index] = done
+        self.count += 1
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        u"""B個の遷移をまとめて追加する(balance_envのように複数の環境を同時に進める場合)
+
+        引数はaddのそれぞれを並べた[B, ...]の配列。Bがcapacityより大きければ最後のcapacity個だけ残る。
+        """
+        count = len(actions)
+        indices = np.arange(self.count, self.count + count) % self.capacity
+        if count > self.capacity:
+            indices = indices[-self.capacity:]
+            states, actions, rewards = states[-self.capacity:], actions[-self.capacity:], rewards[-self.capacity:]
+            next_states, dones = next_states[-self.capacity:], dones[-self.capacity:]
+        self.states[indices] = states
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.next_states[indices] = next_states
+        self.dones[indices] = dones
+        self.count += count
+
+    def sample(self, batch_size):
+        u"""一様にbatch_size個(重複あり)取り出す
+
+        返す配列は次のsampleで上書きされるので、保持する場合はコピーすること。
+
+        Returns:
+            (tuple): (states[B, state_size], actions[B], rewards[B], next_states[B, state_size], dones[B])
+        """
+        size = len(self)
+        if size == 0:
+            raise ValueError('no transitions to sample')
+        if batch_size != self._batch_size:
+            self._batch = (
+                np.empty((batch_size, self.states.shape[1]), dtype=np.float64),
+                np.empty(batch_size, dtype=np.int64),
+                np.empty(batch_size, dtype=np.float64),
+                np.empty((batch_size, self.states.shape[1]), dtype=np.float64),
+                np.empty(batch_size, dtype=np.bool_),
+            )
+            self._batch_size = batch_size
+        indices = self._random.integers(0, size, batch_size)
+        states, actions, rewards, next_states, dones = self._batch
+        np.take(self.states, indices, axis=0, out=states)
+        np.take(self.actions, indices, out=actions)
+        np.take(self.rewards, indices, out=rewards)
+        np.take(self.next_states, indices, axis=0, out=next_states)
+        np.take(self.dones, indices, out=dones)
+        return self._batch
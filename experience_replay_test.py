@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""experience_replayとAgent.update_minibatchのテスト
+
+$ python3 experience_replay_test.py
+"""
+import numpy as np
+
+from experience_replay import ExperienceReplay
+from replay import load_neural_control
+from neural_network import ListNeuralNetwork, NumpyNeuralNetwork, load_params
+from neural_network_test import NETWORK_PATH, TOLERANCE, _inputs
+
+neural_control = load_neural_control()
+
+
+def _fill(replay, count, seed=0):
+    inputs = _inputs(count + 1, seed=seed)
+    for index in range(count):
+        replay.add(inputs[index], index % 2, -float(index), inputs[index + 1], index % 7 == 6)
+
+
+def test_ring_keeps_memory_fixed():
+    replay = ExperienceReplay(100, seed=0)
+    arrays = (replay.states, replay.actions, replay.rewards, replay.next_states, replay.dones)
+    _fill(replay, 250)
+    assert len(replay) == 100
+    assert replay.count == 250
+    # 最初に確保した配列のまま、古いものから上書きされている
+    for before, after in zip(arrays, (replay.states, replay.actions, replay.rewards, replay.next_states,
+                                      replay.dones)):
+        assert before is after
+    assert sorted(-replay.rewards) == list(range(150, 250))
+    batch = replay.sample(32)
+    assert replay.sample(32)[0] is batch[0]
+
+
+def test_sample_is_uniform_over_filled_part():
+    replay = ExperienceReplay(1000, seed=1)
+    _fill(replay, 10)
+    _, _, rewards, _, _ = replay.sample(10000)
+    counts = np.bincount((-rewards).astype(np.int64), minlength=10)
+    assert len(counts) == 10  # まだ書いていない部分(報酬0の残り)は取り出さない
+    assert counts.min() > 800 and counts.max() < 1200, counts
+    # 遷移の各列は同じインデックスから取り出す
+    states, actions, rewards, next_states, dones = replay.sample(64)
+    for state, action, reward, next_state, done in zip(states, actions, rewards, next_states, dones):
+        index = int(-reward)
+        assert np.array_equal(state, replay.states[index])
+        assert action == index % 2 and done == (index % 7 == 6)
+        assert np.array_equal(next_state, replay.next_states[index])
+
+
+def test_add_batch_wraps_like_add():
+    expected = ExperienceReplay(50)
+    _fill(expected, 120)
+    source = ExperienceReplay(120)
+    _fill(source, 120)
+    replay = ExperienceReplay(50)
+    for start, end in ((0, 30), (30, 60), (60, 120)):
+        replay.add_batch(source.states[start:end], source.actions[start:end], source.rewards[start:end],
+                         source.next_states[start:end], source.dones[start:end])
+    assert replay.count == expected.count
+    for name in ('states', 'actions', 'rewards', 'next_states', 'dones'):
+        assert np.array_equal(getattr(replay, name), getattr(expected, name)), name
+
+
+def test_sample_empty():
+    try:
+        ExperienceReplay(10).sample(4)
+    except ValueError:
+        pass
+    else:
+        assert False, 'expected ValueError'
+
+
+def test_update_minibatch_matches_update_action_value():
+    u"""バッチ1つの更新は、1遷移ずつ求めた教師信号の平均勾配での更新と同じ"""
+    agent = neural_control.Agent(NETWORK_PATH)
+    replay = ExperienceReplay(64, seed=2)
+    _fill(replay, 64, seed=3)
+    states, actions, rewards, next_states, dones = [array.copy() for array in replay.sample(16)]
+
+    expected = NumpyNeuralNetwork(load_params(NETWORK_PATH))
+    list_network = ListNeuralNetwork(load_params(NETWORK_PATH))
+    targets = []
+    for state, action, reward, next_state, done in zip(states, actions, rewards, next_states, dones):
+        target = list_network.forward(state)
+        target[action] = reward + (0.0 if done else agent.gamma * max(list_network.forward(next_state)))
+        targets.append(target)
+    expected.forward(states, should_save_output=True)
+    expected.back_propagation(states, targets)
+
+    agent.update_minibatch(states, actions, rewards, next_states, dones)
+    for name in ('W_INPUT', 'W_HIDDEN'):
+        assert np.allclose(agent.network.params[name], expected.params[name], rtol=0, atol=TOLERANCE)
+        assert not np.allclose(agent.network.params[name], load_params(NETWORK_PATH)[name])
+
+
+def test_update_minibatch_reduces_td_error():
+    agent = neural_control.Agent(NETWORK_PATH)
+    replay = ExperienceReplay(256, seed=4)
+    inputs = _inputs(257, seed=5)
+    for index in range(256):
+        # 報酬は状態だけで決まり、終端の遷移だけにしておけば教師信号が動かない
+        replay.add(inputs[index], index % 2, neural_control.get_reward(inputs[index]), inputs[index + 1], True)
+
+    def td_error():
+        values = agent.network.forward(replay.states)
+        return np.mean((values[np.arange(256), replay.actions] - replay.rewards) ** 2)
+
+    before = td_error()
+    for _ in range(200):
+        agent.update_minibatch(*replay.sample(64))
+    assert td_error() < before * 0.9, (before, td_error())
+
+
+if __name__ == '__main__':
+    test_ring_keeps_memory_fixed()
+    test_sample_is_uniform_over_filled_part()
+    test_add_batch_wraps_like_add()
+    test_sample_empty()
+    test_update_minibatch_matches_update_action_value()
+    test_update_minibatch_reduces_td_error()
+    print('ok')
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""Agentの学習で1秒あたりに処理できる遷移の数を比べる
+
+    online    : update_action_value(1遷移ごとに順伝搬2回と誤差逆伝搬1回)
+    minibatch : ExperienceReplayからsampleしてupdate_minibatch(Bの遷移を順伝搬2回と誤差逆伝搬1回)
+onlineはNeuralNetwork(NumPyがあればNumPy版)と、NumPyなしの環境と同じListNeuralNetworkの両方を測る。
+
+$ python3 experience_replay_time.py --batch-sizes=32,256 --transitions=20000
+"""
+import random
+import time
+from optparse import OptionParser
+
+from experience_replay import ExperienceReplay
+from neural_network import ListNeuralNetwork, load_params
+from neural_network_time import NETWORK_PATH
+from replay import load_neural_control
+
+BATCH_SIZES = '32,256'
+TRANSITIONS = 20000
+CAPACITY = 100000
+
+
+def make_states(neural_control, count, seed=0):
+    u"""走行中くらいのセンサー値(左モータ±50deg, 傾き±10deg, 角速度±50deg/s)から作った状態"""
+    rand = random.Random(seed)
+    return [neural_control.make_inputs(rand.uniform(-50, 50), rand.uniform(-10, 10), rand.uniform(-50, 50))
+            for _ in range(count)]
+
+
+def test_online(agent, states, rewards, transitions):
+    u"""1遷移ずつ更新する。Returns: 遷移/秒"""
+    start = time.perf_counter()
+    for index in range(transitions):
+        index %= len(states) - 1
+        action = agent.decide_action(states[index], should_save_output=True)
+        agent.update_action_value(states[index], action, rewards[index], states[index + 1])
+    return transitions / (time.perf_counter() - start)
+
+
+def test_minibatch(agent, replay, batch_size, transitions):
+    u"""バッチでまとめて更新する(sampleの時間も含む)。Returns: 遷移/秒"""
+    batches = max(transitions // batch_size, 1)
+    start = time.perf_counter()
+    for _ in range(batches):
+        agent.update_minibatch(*replay.sample(batch_size))
+    return batches * batch_size / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-b', '--batch-sizes', action='store', type='string', dest='batch_sizes', default=BATCH_SIZES,
+                      help="ミニバッチの大きさ(カンマ区切り)")
+    parser.add_option('-n', '--transitions', action='store', type='int', dest='transitions', default=TRANSITIONS,
+                      help="更新する遷移の数")
+    options, _ = parser.parse_args()
+    neural_control = load_neural_control()
+    states = make_states(neural_control, 1001)
+    rewards = [neural_control.get_reward(state) for state in states]
+
+    agent = neural_control.Agent(NETWORK_PATH)
+    online = test_online(agent, states, rewards, options.transitions)
+    print('online ({}): {:.0f} transitions/s'.format(type(agent.network).__name__, online))
+    agent.network = ListNeuralNetwork(load_params(NETWORK_PATH))
+    online_list = test_online(agent, states, rewards, options.transitions // 10)
+    print('online (ListNeuralNetwork): {:.0f} transitions/s'.format(online_list))
+
+    replay = ExperienceReplay(CAPACITY, seed=0)
+    for index in range(CAPACITY):
+        replay.add(states[index % 1000], index % 2, rewards[index % 1000], states[index % 1000 + 1],
+                   index % 100 == 99)
+    for batch_size in [int(size) for size in options.batch_sizes.split(',')]:
+        agent = neural_control.Agent(NETWORK_PATH)
+        minibatch = test_minibatch(agent, replay, batch_size, options.transitions)
+        print('minibatch B={}: {:.0f} transitions/s ({:.1f}x online, {:.1f}x online list)'.format(
+            batch_size, minibatch, minibatch / online, minibatch / online_list))
@@ -1,3 +1,4 @@
+# 共有メモリ(mmap)をforkした子プロセスと共有するサンプル。実際に使う例はbalance_multiprocess.py
 import mmap
 import os
 import sys
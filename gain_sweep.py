@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""balance/balance.pyのゲインをシミュレータ(sim.plant)でまとめて評価する
+
+K_F, K_I, K_THETADOT, K_PHIDOT, EXEC_PERIODの候補をグリッドかランダムに作り、
+候補ごとにBalanceControllerとPlantの閉ループをシナリオ(初期の傾き、前進・旋回命令)の数だけ回して
+    fall_rate   : 倒れたシナリオの割合
+    settle_time : 傾きがSETTLE_ANGLE以内に収まったまま終わるまでの時間の平均(秒。倒れたら・収まらなければシナリオの長さ)
+    saturation  : PWM値が±100に張り付いた周期の割合
+を求める(どれも小さいほど良い)。評価はProcessPoolExecutorで全コアに分け、結果はゲインのハッシュをキーに
+キャッシュ(JSON)に保存するので、同じ候補は2回計算しない。最後にパレートフロント(どの指標でも他に負けない候補)を表示する。
+
+$ python3 gain_sweep.py --mode=random --count=10000 --cache=./log/gain_sweep_cache.json
+$ python3 gain_sweep.py --mode=grid --scales=0.6,1.0,1.4 --periods=0.004,0.01
+"""
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from optparse import OptionParser
+
+import balance.balance as balance
+from sim.plant import Plant
+
+# シナリオ (初期の傾き(deg), 前進命令, 旋回命令)。命令は半分の時間がたってから与える
+SCENARIOS = ((3.0, 0, 0), (-6.0, 0, 0), (2.0, 50, 0), (2.0, 0, 50))
+DURATION = 5.0  # 1シナリオの長さ(秒)
+SETTLE_ANGLE = 1.0  # 傾きがこれ(deg)以内なら収まったとみなす
+PERIODS = (0.004, 0.01, 0.02, 0.04)  # EXEC_PERIODの候補
+SCALE_RANGE = (0.5, 1.5)  # ランダム探索で既定のゲインに掛ける倍率の範囲
+CACHE_VERSION = 1  # 評価の方法を変えたら上げる(キャッシュのキーに含める)
+METRICS = ('fall_rate', 'settle_time', 'saturation')
+
+
+class Gains(object):
+    u"""1つの候補のゲイン"""
+    __slots__ = ('k_f', 'k_i', 'k_thetadot', 'k_phidot', 'exec_period')
+
+    def __init__(self, k_f=None, k_i=balance.K_I, k_thetadot=balance.K_THETADOT, k_phidot=balance.K_PHIDOT,
+                 exec_period=balance.EXEC_PERIOD):
+        self.k_f = tuple(balance.K_F if k_f is None else k_f)
+        self.k_i = k_i
+        self.k_thetadot = k_thetadot
+        self.k_phidot = k_phidot
+        self.exec_period = exec_period
+
+    def as_dict(self):
+        return {'k_f': list(self.k_f), 'k_i': self.k_i, 'k_thetadot': self.k_thetadot, 'k_phidot': self.k_phidot,
+                'exec_period': self.exec_period}
+
+    def key(self, scenarios=SCENARIOS, duration=DURATION):
+        u"""キャッシュのキー(ゲインと評価の条件のハッシュ)"""
+        text = json.dumps([CACHE_VERSION, self.as_dict(), [list(scenario) for scenario in scenarios], duration],
+                          sort_keys=True)
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def controller(self):
+        return balance.BalanceController(k_f=list(self.k_f), k_i=self.k_i, k_thetadot=self.k_thetadot,
+                                         k_phidot=self.k_phidot, exec_period=self.exec_period)
+
+    def scaled(self, k_f_scales, k_i_scale, k_thetadot_scale, k_phidot_scale, exec_period):
+        u"""ゲインに倍率を掛けた候補"""
+        return Gains([k * scale for k, scale in zip(self.k_f, k_f_scales)], self.k_i * k_i_scale,
+                     self.k_thetadot * k_thetadot_scale, self.k_phidot * k_phidot_scale, exec_period)
+
+
+def simulate(gains, initial_tilt, forward, turn, duration=DURATION):
+    u"""1シナリオ分の閉ループシミュレーション
+
+    Returns:
+        (tuple): (倒れたか, 収まるまでの時間(秒), PWM値が張り付いた周期の割合)
+    """
+    controller = gains.controller()
+    period = gains.exec_period
+    plant = Plant(initial_psi=math.radians(initial_tilt))
+    ticks = int(round(duration / period))
+    command_tick = ticks // 2
+    settle_angle = math.radians(SETTLE_ANGLE)
+    settled_at = 0.0
+    saturated = 0
+    degrees = math.degrees
+    for tick in range(ticks):
+        left, right = plant.motor_angles()
+        pwm_l, pwm_r = controller.control(
+            forward if tick >= command_tick else 0,
+            turn if tick >= command_tick else 0,
+            round(degrees(plant.psi_dot)), 0, round(degrees(left)), round(degrees(right)),
+            plant.battery.voltage * 1000)
+        plant.pwm_l = pwm_l
+        plant.pwm_r = pwm_r
+        if abs(pwm_l) >= 100 or abs(pwm_r) >= 100:
+            saturated += 1
+        plant.step(period)
+        if plant.fallen:
+            return True, duration, saturated / (tick + 1)
+        if abs(plant.psi) > settle_angle:
+            settled_at = (tick + 1) * period
+    return False, settled_at if settled_at < duration else duration, saturated / ticks
+
+
+def evaluate(gains, scenarios=SCENARIOS, duration=DURATION):
+    u"""候補をすべてのシナリオで評価する(ProcessPoolExecutorのワーカーで呼ぶ)
+
+    Returns:
+        (dict): METRICSの値
+    """
+    falls = 0
+    settle_time = 0.0
+    saturation = 0.0
+    for initial_tilt, forward, turn in scenarios:
+        fallen, settled_at, saturated = simulate(gains, initial_tilt, forward, turn, duration)
+        falls += fallen
+        settle_time += settled_at
+        saturation += saturated
+    count = len(scenarios)
+    return {'fall_rate': falls / count, 'settle_time': settle_time / count, 'saturation': saturation / count}
+
+
+def grid_candidates(scales, periods=PERIODS, base=None):
+    u"""K_Fの4つ、K_I、K_THETADOT、K_PHIDOTのそれぞれに倍率scalesを掛けた全組み合わせ × periods"""
+    base = base or Gains()
+    for combination in itertools.product(*([scales] * 7 + [periods])):
+        yield base.scaled(combination[:4], combination[4], combination[5], combination[6], combination[7])
+
+
+def random_candidates(count, periods=PERIODS, scale_range=SCALE_RANGE, seed=0, base=None):
+    u"""各ゲインにscale_rangeの一様乱数の倍率を掛けた候補をcount個"""
+    base = base or Gains()
+    rand = random.Random(seed)
+    low, high = scale_range
+    for _ in range(count):
+        scales = [rand.uniform(low, high) for _ in range(7)]
+        yield base.scaled(scales[:4], scales[4], scales[5], scales[6], rand.choice(periods))
+
+
+def pareto_front(results):
+    u"""どの指標でも他の候補に負けない候補
+
+    Args:
+        results (list): (Gains, METRICSの辞書)のリスト
+
+    Returns:
+        (list): パレートフロントの(Gains, 指標)。fall_rate, settle_time, saturationの順に並べる
+    """
+    ordered = sorted(results, key=lambda result: tuple(result[1][name] for name in METRICS))
+    front = []
+    for gains, metrics in ordered:
+        values = tuple(metrics[name] for name in METRICS)
+        # 並べ替えてあるので、後の候補が前の候補を支配することはない
+        dominated = False
+        for _, other in front:
+            other_values = tuple(other[name] for name in METRICS)
+            if all(o <= v for o, v in zip(other_values, values)):
+                dominated = True
+                break
+        if not dominated:
+            front.append((gains, metrics))
+    return front
+
+
+def load_cache(path):
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_cache(path, cache):
+    if path is None:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(cache, file)
+    os.replace(temporary, path)
+
+
+def sweep(candidates, cache=None, workers=None, scenarios=SCENARIOS, duration=DURATION, chunksize=16):
+    u"""候補を評価する(キャッシュにあるものは計算しない)
+
+    Args:
+        candidates (iterable): Gains
+        cache (dict): キー -> 指標。新しく評価した結果を追加する
+        workers (int): プロセス数。Noneなら全コア、0ならこのプロセスで評価する
+
+    Returns:
+        (tuple): ((Gains, 指標)のリスト, 新しく評価した数)
+    """
+    if cache is None:
+        cache = {}
+    candidates = list(candidates)
+    keys = [gains.key(scenarios, duration) for gains in candidates]
+    missing = {}
+    for key, gains in zip(keys, candidates):
+        if key not in cache:
+            missing[key] = gains
+    function = partial(evaluate, scenarios=scenarios, duration=duration)
+    if workers == 0:
+        evaluated = map(function, missing.values())
+        for key, metrics in zip(missing, evaluated):
+            cache[key] = metrics
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            evaluated = executor.map(function, missing.values(), chunksize=chunksize)
+            for key, metrics in zip(missing, evaluated):
+                cache[key] = metrics
+    return [(gains, cache[key]) for key, gains in zip(keys, candidates)], len(missing)
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-m', '--mode', action='store', type='choice', dest='mode', choices=('grid', 'random'),
+                      default='random', help="候補の作り方(grid: 倍率の全組み合わせ, random: 一様乱数)")
+    parser.add_option('-n', '--count', action='store', type='int', dest='count', default=1000,
+                      help="randomの候補の数")
+    parser.add_option('-s', '--scales', action='store', type='string', dest='scales', default='0.7,1.0,1.3',
+                      help="gridで各ゲインに掛ける倍率(カンマ区切り)")
+    parser.add_option('-p', '--periods', action='store', type='string', dest='periods',
+                      default=','.join(str(period) for period in PERIODS), help="EXEC_PERIODの候補(カンマ区切り)")
+    parser.add_option('-r', '--seed', action='store', type='int', dest='seed', default=0, help="randomの乱数の種")
+    parser.add_option('-w', '--workers', action='store', type='int', dest='workers', default=None,
+                      help="プロセス数(省略時は全コア、0なら並列にしない)")
+    parser.add_option('-c', '--cache', action='store', type='string', dest='cache',
+                      default='./log/gain_sweep_cache.json', help="評価結果のキャッシュ")
+    options, _ = parser.parse_args()
+    periods = [float(period) for period in options.periods.split(',')]
+    if options.mode == 'grid':
+        candidates = grid_candidates([float(scale) for scale in options.scales.split(',')], periods)
+    else:
+        candidates = random_candidates(options.count, periods, seed=options.seed)
+
+    cache = load_cache(options.cache)
+    start = time.perf_counter()
+    results, evaluated = sweep(candidates, cache, workers=options.workers)
+    elapsed = time.perf_counter() - start
+    save_cache(options.cache, cache)
+    print('{} candidates ({} evaluated, {} cached) in {:.1f}s'.format(
+        len(results), evaluated, len(results) - evaluated, elapsed))
+    print('default: {}'.format(evaluate(Gains())))
+    print('pareto front:')
+    for gains, metrics in pareto_front(results):
+        print('  fall {fall_rate:.2f} settle {settle_time:.2f}s saturation {saturation:.3f}'.format(**metrics),
+              json.dumps(gains.as_dict()))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""gain_sweepのテスト
+
+$ python3 gain_sweep_test.py
+"""
+import balance.balance as balance
+from gain_sweep import Gains, evaluate, grid_candidates, pareto_front, random_candidates, sweep
+
+SHORT_SCENARIOS = ((3.0, 0, 0), (2.0, 0, 50))
+SHORT_DURATION = 1.0
+
+
+def _nxtway_gains(exec_period=0.004):
+    k_f = list(balance.K_F)
+    k_f[2] = -1.1566
+    return Gains(k_f=k_f, exec_period=exec_period)
+
+
+def test_evaluate_nxtway_gains():
+    metrics = evaluate(_nxtway_gains(), scenarios=((3.0, 0, 0),), duration=5.0)
+    assert metrics['fall_rate'] == 0.0
+    assert 0.0 < metrics['settle_time'] < 5.0
+    assert metrics['saturation'] < 0.1
+
+
+def test_candidates():
+    grid = list(grid_candidates([0.5, 1.0], periods=[0.004, 0.01]))
+    assert len(grid) == 2 ** 7 * 2
+    assert grid[0].k_f == tuple(k * 0.5 for k in balance.K_F)
+    assert grid[-1].k_phidot == balance.K_PHIDOT
+    first = [gains.as_dict() for gains in random_candidates(5, seed=1)]
+    assert first == [gains.as_dict() for gains in random_candidates(5, seed=1)]
+    assert len(set(gains.key() for gains in random_candidates(100))) == 100
+
+
+def test_pareto_front():
+    results = [
+        ('a', {'fall_rate': 0.0, 'settle_time': 2.0, 'saturation': 0.1}),
+        ('b', {'fall_rate': 0.0, 'settle_time': 1.0, 'saturation': 0.3}),
+        ('c', {'fall_rate': 0.0, 'settle_time': 2.5, 'saturation': 0.2}),  # aに負ける
+        ('d', {'fall_rate': 0.5, 'settle_time': 0.5, 'saturation': 0.0}),
+        ('e', {'fall_rate': 1.0, 'settle_time': 5.0, 'saturation': 0.5}),  # すべてに負ける
+    ]
+    assert [name for name, _ in pareto_front(results)] == ['b', 'a', 'd']
+
+
+def test_sweep_uses_cache():
+    candidates = [_nxtway_gains(), _nxtway_gains(0.01), Gains()]
+    cache = {}
+    results, evaluated = sweep(candidates, cache, workers=0, scenarios=SHORT_SCENARIOS, duration=SHORT_DURATION)
+    assert evaluated == 3
+    assert len(cache) == 3
+    again, evaluated = sweep(candidates, cache, workers=0, scenarios=SHORT_SCENARIOS, duration=SHORT_DURATION)
+    assert evaluated == 0
+    assert [metrics for _, metrics in again] == [metrics for _, metrics in results]
+
+
+def test_sweep_in_process_pool():
+    candidates = [_nxtway_gains(), Gains()]
+    serial, _ = sweep(candidates, {}, workers=0, scenarios=SHORT_SCENARIOS, duration=SHORT_DURATION)
+    parallel, evaluated = sweep(candidates, {}, workers=2, scenarios=SHORT_SCENARIOS, duration=SHORT_DURATION)
+    assert evaluated == 2
+    assert [metrics for _, metrics in parallel] == [metrics for _, metrics in serial]
+
+
+if __name__ == '__main__':
+    test_evaluate_nxtway_gains()
+    test_candidates()
+    test_pareto_front()
+    test_sweep_uses_cache()
+    test_sweep_in_process_pool()
+    print('ok')
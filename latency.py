@@ -0,0 +1,197 @@
+# -*- coding: UTF-8 -*-
+u"""制御ループの処理時間を記録するヒストグラム
+
+LatencyHistogramはHDR Histogramと同じ対数+線形のバケットで、バケットは最初に確保しておく。
+recordはバケットの数を1増やすだけなので、サンプルが増えてもメモリは増えない。
+
+LoopProfileはループ1周を区間(センサー読み取り, balance_control, モーターへの指示, sleepの余り)に分けて
+それぞれのヒストグラムを持つ。
+
+    profile = LoopProfile(deadline_us=4000)
+    start = clock.monotonic_ns()
+    ...
+    profile.sensor.record((clock.monotonic_ns() - start) // 1000)
+    ...
+    print(profile.report())
+"""
+import glob
+from array import array
+
+SUB_BUCKET_BITS = 5  # 2倍ごとの区間を2^5=32分割する(誤差は約3%)
+MAX_VALUE_BITS = 27  # 記録できる最大値は2^27-1(μsなら約134秒)。それ以上は最後のバケットに入る
+
+
+def context_switches():
+    u"""このプロセスの全スレッドのコンテキストスイッチ回数の合計
+
+    /proc/self/statusの値はメインスレッドの分だけなので、/proc/self/task/*/statusを足し合わせる。
+    終了したスレッドの分は含まれない。
+
+    Returns:
+        (tuple): (自発的な回数, 非自発的な回数)。/procがなければNone
+    """
+    voluntary = 0
+    nonvoluntary = 0
+    paths = glob.glob('/proc/self/task/*/status')
+    if not paths:
+        return None
+    for path in paths:
+        try:
+            with open(path) as status:
+                for line in status:
+                    if line.startswith('voluntary_ctxt_switches:'):
+                        voluntary += int(line.split()[1])
+                    elif line.startswith('nonvoluntary_ctxt_switches:'):
+                        nonvoluntary += int(line.split()[1])
+        except OSError:
+            # 読んでいる間にスレッドが終了した
+            pass
+    return voluntary, nonvoluntary
+
+
+class LatencyHistogram(object):
+    u"""固定バケットのヒストグラム(単位はμsを想定)"""
+
+    def __init__(self, threshold=None, sub_bucket_bits=SUB_BUCKET_BITS, max_value_bits=MAX_VALUE_BITS):
+        u"""
+        Args:
+            threshold (int): これを超えた値の数をover_thresholdに数える(締め切りなど)。Noneなら数えない
+            sub_bucket_bits (int): 2倍ごとの区間の分割数(2のべき乗の指数)
+            max_value_bits (int): 記録できる最大値のビット数
+        """
+        self.threshold = threshold
+        self._sub_bits = sub_bucket_bits
+        self._sub_count = 1 << sub_bucket_bits
+        self._max_value = (1 << max_value_bits) - 1
+        self.counts = array('Q', bytes(8 * self._index(self._max_value) + 8))
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+        self.over_threshold = 0
+
+    def _index(self, value):
+        u"""valueが入るバケットの番号"""
+        if value < self._sub_count:
+            return value
+        shift = value.bit_length() - self._sub_bits - 1
+        return ((shift + 1) << self._sub_bits) + (value >> shift) - self._sub_count
+
+    def _bucket_upper(self, index):
+        u"""index番のバケットに入る最大の値"""
+        if index < self._sub_count:
+            return index
+        shift = (index >> self._sub_bits) - 1
+        lower = ((index & (self._sub_count - 1)) + self._sub_count) << shift
+        return lower + (1 << shift) - 1
+
+    def record(self, value):
+        u"""値を1つ記録する。負の値は0とみなす"""
+        if value < 0:
+            value = 0
+        elif value > self._max_value:
+            value = self._max_value
+        self.counts[self._index(value)] += 1
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+        if self.threshold is not None and value > self.threshold:
+            self.over_threshold += 1
+
+    def percentile(self, percent):
+        u"""percentパーセンタイルの値(そのバケットの最大値。ただし記録した最大値を超えない)"""
+        if self.count == 0:
+            return 0
+        target = self.count * percent / 100.0
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if bucket_count and cumulative >= target:
+                return min(self._bucket_upper(index), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def reset(self):
+        u"""記録を消す(バケットは確保したまま)"""
+        for index in range(len(self.counts)):
+            self.counts[index] = 0
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+        self.over_threshold = 0
+
+    def merge(self, other):
+        u"""同じバケット構成の別のヒストグラムの記録を足す"""
+        for index, bucket_count in enumerate(other.counts):
+            if bucket_count:
+                self.counts[index] += bucket_count
+        if other.count:
+            if self.count == 0 or other.min < self.min:
+                self.min = other.min
+            self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+        self.over_threshold += other.over_threshold
+
+    def summary(self):
+        u"""p50/p99/maxなどの辞書"""
+        result = {
+            'count': self.count,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'max': self.max,
+            'mean': round(self.mean(), 1),
+        }
+        if self.threshold is not None:
+            result['over'] = self.over_threshold
+        return result
+
+
+class LoopProfile(object):
+    u"""制御ループの区間ごとのヒストグラム
+
+    sensor    : センサー値の取得
+    control   : balance_control
+    enqueue   : モーターへの指示(キューへの投入など)
+    actuation : モーターへの書き込み(Motor.loopで計測する)
+    slack     : 処理が終わってから次の周期までの余り時間。負(締め切り超過)は0として記録してdeadline_missesに数える
+    work      : sensor + control + enqueue。締め切りを超えた数をover_thresholdに数える
+    jitter    : 締め切りから実際に起きるまでの遅れ(PeriodicScheduler.last_lateness_ns)
+    """
+    PHASES = ('sensor', 'control', 'enqueue', 'actuation', 'slack', 'work', 'jitter')
+
+    def __init__(self, deadline_us):
+        u"""
+        Args:
+            deadline_us (int): ループ1周の締め切り(μs)
+        """
+        self.deadline_us = deadline_us
+        self.sensor = LatencyHistogram()
+        self.control = LatencyHistogram()
+        self.enqueue = LatencyHistogram()
+        self.actuation = LatencyHistogram()
+        self.slack = LatencyHistogram()
+        self.work = LatencyHistogram(threshold=deadline_us)
+        self.jitter = LatencyHistogram()
+        self.deadline_misses = 0
+
+    def record_slack(self, slack_us):
+        u"""次の周期までの余り時間を記録する。負なら締め切りに間に合っていない"""
+        if slack_us < 0:
+            self.deadline_misses += 1
+        self.slack.record(slack_us)
+
+    def report(self):
+        u"""区間ごとのp50/p99/maxを文字列にする"""
+        lines = ['deadline {}us, misses {}'.format(self.deadline_us, self.deadline_misses)]
+        for name in self.PHASES:
+            summary = getattr(self, name).summary()
+            lines.append('{:<9} count {count} p50 {p50}us p99 {p99}us max {max}us mean {mean}us'.format(
+                name, **summary))
+        return '\n'.join(lines)
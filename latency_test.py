@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""LatencyHistogram/LoopProfileのテスト
+
+$ python3 latency_test.py
+"""
+import random
+import tracemalloc
+
+from latency import LatencyHistogram, LoopProfile
+
+
+def test_percentiles_within_bucket_precision():
+    rand = random.Random(0)
+    values = sorted(rand.randint(0, 20000) for _ in range(10000))
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+    assert histogram.count == len(values)
+    assert histogram.max == values[-1]
+    assert histogram.min == values[0]
+    for percent in (50, 90, 99):
+        expected = values[int(len(values) * percent / 100) - 1]
+        actual = histogram.percentile(percent)
+        assert expected <= actual <= expected * 1.04 + 1, (percent, expected, actual)
+
+
+def test_small_values_are_exact():
+    histogram = LatencyHistogram(threshold=10)
+    for value in (1, 2, 3, 30, -5):
+        histogram.record(value)
+    assert histogram.percentile(50) == 2
+    assert histogram.over_threshold == 1
+    assert histogram.min == 0
+
+
+def test_merge_and_reset():
+    first = LatencyHistogram()
+    second = LatencyHistogram()
+    first.record(100)
+    second.record(5000)
+    first.merge(second)
+    assert first.count == 2 and first.max == 5000 and first.min == 100
+    first.reset()
+    assert first.count == 0 and first.percentile(99) == 0
+
+
+def test_record_does_not_allocate():
+    histogram = LatencyHistogram()
+    rand = random.Random(1)
+    values = [rand.randint(0, 100000) for _ in range(1000)]
+    for value in values:
+        histogram.record(value)
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        for value in values:
+            histogram.record(value)
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # count/totalの int が開始前に確保したものから置き換わる分(数十バイト)だけは増える。
+    # 1000回記録しても、それ以上は増えないこと
+    assert after - before < 256, after - before
+
+
+def test_loop_profile_counts_deadline_misses():
+    profile = LoopProfile(deadline_us=4000)
+    profile.record_slack(1000)
+    profile.record_slack(-200)
+    profile.work.record(4200)
+    assert profile.deadline_misses == 1
+    assert profile.work.over_threshold == 1
+    assert 'misses 1' in profile.report()
+
+
+if __name__ == '__main__':
+    test_percentiles_within_bucket_precision()
+    test_small_values_are_exact()
+    test_merge_and_reset()
+    test_record_does_not_allocate()
+    test_loop_profile_counts_deadline_misses()
+    print('ok')
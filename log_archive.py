@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""走行ログ(CSV)を列ごとに圧縮して保存するアーカイブ
+
+./log/のlog_odometry_*.csv、log_motor_angle_with_voltage_*.csvはテキストなので大きく、読み直すのにも時間がかかる。
+アーカイブは行をchunk_rows行ずつのチャンクに分け、チャンクの中では列ごとに
+    整数にする : 値 * scale を丸める(scaleは10のべき乗。CSVの小数点以下の桁数から決める。最大MAX_DECIMALS桁)
+    差分       : チャンクの最初の値はそのまま、以降は前の値との差
+    varint     : 差をzigzag符号化して7ビットずつ可変長で書く
+    zlib       : 列ごとにzlibで圧縮する
+として保存する。小数点以下がMAX_DECIMALS桁より多い列(odometry.pyがstr(float)で書く列など)や指数表記を含む列、
+小数を含み整数にすると2**53を超える列は丸めずにfloat64のまま(scaleはFLOAT_SCALE)zlibで圧縮するので、どの列も元の値に戻る。
+チャンクごとに時刻の列(なければ行番号)の最小値・最大値を索引に持つので、
+ArchiveReader.readは指定した時間範囲にかかるチャンクの、指定した列だけを読んで復号する。
+
+ファイルのレイアウト
+    [0:8]       マジック b'EV3LOGA1'
+    [8:]        チャンク。各チャンクは列ごとのzlib圧縮したvarint列(scaleが0の列はfloat64の列)を続けたもの
+    [索引]      JSON {"columns": [{"name", "scale"}], "time_column", "rows",
+                      "chunks": [{"rows", "first_row", "t_min", "t_max", "blocks": [[位置, 長さ], ...]}]}
+    [末尾16]    索引のバイト数(uint64) + マジック
+
+CSVからの変換
+$ python3 log_archive.py ./log/log_motor_angle_with_voltage_20180101000000_*.csv -o ./log/motor_angle.arc
+
+    reader = ArchiveReader('./log/motor_angle.arc')
+    data = reader.read(['buttery_voltage'], start=t0, end=t0 + 60)  # 時刻がt0から60秒間の電圧
+"""
+import json
+import os
+import struct
+import zlib
+from optparse import OptionParser
+
+MAGIC = b'EV3LOGA1'
+CHUNK_ROWS = 4096  # 1チャンクの行数
+MAX_DECIMALS = 6  # 整数にして保存する小数点以下の桁数の上限(log_timeならμs)。これより多い列はfloat64のまま
+FLOAT_SCALE = 0  # float64のまま保存する列のscale
+_EXACT_INTEGER = 1 << 53  # floatで誤差なく表せる整数の上限
+_TRAILER = struct.Struct('<Q8s')
+
+# ヘッダー行がないCSVの列名(ファイル名の先頭で選ぶ)
+KNOWN_COLUMNS = {
+    'log_odometry_': ('left_angle', 'right_angle', 'cur_dis', 'cur_dir', 'pos_x', 'pos_y',
+                      'target_dis', 'target_dir', 'total_distance', 'total_direction'),
+}
+# 時刻の列として使う列名
+TIME_COLUMNS = ('log_time', 'time_ns', 'time')
+
+
+def encode_column(values):
+    u"""整数のリストを差分 + zigzag + varintにする"""
+    out = bytearray()
+    append = out.append
+    previous = 0
+    for value in values:
+        delta = value - previous
+        previous = value
+        zigzag = (delta << 1) if delta >= 0 else ((-delta << 1) - 1)
+        while zigzag >= 0x80:
+            append((zigzag & 0x7f) | 0x80)
+            zigzag >>= 7
+        append(zigzag)
+    return bytes(out)
+
+
+def decode_column(data):
+    u"""encode_columnの逆(リストを返す)"""
+    values = []
+    append = values.append
+    value = 0
+    zigzag = 0
+    shift = 0
+    for byte in data:
+        zigzag |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        value += (zigzag >> 1) ^ -(zigzag & 1)
+        append(value)
+        zigzag = 0
+        shift = 0
+    return values
+
+
+def decode_column_array(data):
+    u"""encode_columnの逆をNumPyでまとめて計算する(値はint64に収まること)"""
+    import numpy as np
+
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if len(raw) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(raw < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    # 各バイトが値の中で何番目か
+    position = np.arange(len(raw)) - np.repeat(starts, ends - starts + 1)
+    payload = (raw & 0x7f).astype(np.uint64) << (np.uint64(7) * position.astype(np.uint64))
+    zigzag = np.add.reduceat(payload, starts)
+    deltas = (zigzag >> np.uint64(1)).astype(np.int64) ^ -(zigzag & np.uint64(1)).astype(np.int64)
+    return np.cumsum(deltas)
+
+
+def encode_floats(values):
+    u"""floatのリストをfloat64(リトルエンディアン)のバイト列にする"""
+    return struct.pack('<{}d'.format(len(values)), *values)
+
+
+def decode_floats(data):
+    u"""encode_floatsの逆(リストを返す)"""
+    return list(struct.unpack('<{}d'.format(len(data) // 8), data))
+
+
+def decode_floats_array(data):
+    u"""encode_floatsの逆(NumPyの配列を返す)"""
+    import numpy as np
+
+    return np.frombuffer(data, dtype='<f8')
+
+
+def _decimals(token):
+    u"""数値の文字列の小数点以下の桁数。指数表記ならNone"""
+    if 'e' in token or 'E' in token:
+        return None
+    point = token.find('.')
+    if point < 0:
+        return 0
+    return len(token) - point - 1
+
+
+def _column_scale(decimals, max_abs):
+    u"""列のscale。値 * scaleを丸めた整数から元のfloatに戻せなければFLOAT_SCALE
+
+    整数だけの列(decimals == 0)はintのままvarintにするので、大きさによらず(time_nsなど)元の値に戻る。
+    """
+    if decimals == 0:
+        return 1
+    if decimals is None or decimals > MAX_DECIMALS or max_abs * 10 ** decimals >= _EXACT_INTEGER:
+        return FLOAT_SCALE
+    return 10 ** decimals
+
+
+def _to_time(value, scale):
+    u"""時刻の値を索引のt_min/t_maxと同じ単位にする"""
+    if scale == FLOAT_SCALE:
+        return value
+    return int(round(value * scale))
+
+
+class ArchiveWriter(object):
+    u"""アーカイブの書き込み"""
+
+    def __init__(self, path, columns, time_column=None, chunk_rows=CHUNK_ROWS):
+        u"""
+        Args:
+            path (str): ファイルのパス
+            columns (list): (列名, scale)のリスト。値はvalue * scaleを丸めた整数で保存する(FLOAT_SCALEならfloat64のまま)
+            time_column (str): 時刻の列名。Noneなら行番号を時刻とみなす
+            chunk_rows (int): 1チャンクの行数
+        """
+        self.columns = [(name, int(scale)) for name, scale in columns]
+        names = [name for name, _ in self.columns]
+        self.time_index = None if time_column is None else names.index(time_column)
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self._chunks = []
+        self._pending = [[] for _ in self.columns]
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+
+    def append(self, row):
+        u"""1行追加する(値は列の順)"""
+        for pending, (_, scale), value in zip(self._pending, self.columns, row):
+            if scale == FLOAT_SCALE:
+                pending.append(float(value))
+            elif scale != 1:
+                pending.append(int(round(value * scale)))
+            else:
+                pending.append(int(value))
+        if len(self._pending[0]) >= self.chunk_rows:
+            self._write_chunk()
+
+    def close(self):
+        u"""残りの行と索引を書き込んで閉じる"""
+        if self._file is None:
+            return
+        self._write_chunk()
+        index = json.dumps({
+            'columns': [{'name': name, 'scale': scale} for name, scale in self.columns],
+            'time_column': None if self.time_index is None else self.columns[self.time_index][0],
+            'rows': self.rows,
+            'chunks': self._chunks,
+        }).encode()
+        self._file.write(index)
+        self._file.write(_TRAILER.pack(len(index), MAGIC))
+        self._file.close()
+        self._file = None
+
+    def _write_chunk(self):
+        count = len(self._pending[0])
+        if count == 0:
+            return
+        if self.time_index is None:
+            t_min, t_max = self.rows, self.rows + count - 1
+        else:
+            times = self._pending[self.time_index]
+            t_min, t_max = min(times), max(times)
+        blocks = []
+        for pending, (_, scale) in zip(self._pending, self.columns):
+            data = zlib.compress(encode_floats(pending) if scale == FLOAT_SCALE else encode_column(pending))
+            blocks.append([self._file.tell(), len(data)])
+            self._file.write(data)
+        self._chunks.append({'rows': count, 'first_row': self.rows, 't_min': t_min, 't_max': t_max,
+                             'blocks': blocks})
+        self.rows += count
+        self._pending = [[] for _ in self.columns]
+
+
+class ArchiveReader(object):
+    u"""アーカイブの読み込み(索引だけを最初に読む)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        if self._file.read(len(MAGIC)) != MAGIC:
+            self._file.close()
+            raise ValueError('{} is not a log archive'.format(path))
+        self._file.seek(-_TRAILER.size, os.SEEK_END)
+        index_size, magic = _TRAILER.unpack(self._file.read(_TRAILER.size))
+        if magic != MAGIC:
+            self._file.close()
+            raise ValueError('{} is truncated'.format(path))
+        self._file.seek(-_TRAILER.size - index_size, os.SEEK_END)
+        index = json.loads(self._file.read(index_size).decode())
+        self.columns = [(column['name'], column['scale']) for column in index['columns']]
+        self.names = [name for name, _ in self.columns]
+        self.time_column = index['time_column']
+        self.rows = index['rows']
+        self.chunks = index['chunks']
+        self.chunks_decoded = 0  # readで復号したチャンクの数(範囲指定の効果の確認用)
+
+    def read(self, columns=None, start=None, end=None):
+        u"""列の値を読む
+
+        Args:
+            columns (list): 読む列名。Noneなら全部
+            start: 時刻(time_columnがなければ行番号)がこれ以上の行を読む。Noneなら最初から
+            end: 時刻がこれ未満の行を読む。Noneなら最後まで
+
+        Returns:
+            (dict): 列名 -> 値のリスト(scaleが1の列はint、それ以外はfloat)
+        """
+        return self._read(columns, start, end, (decode_column, decode_floats), self._select_list, self._to_list)
+
+    def read_arrays(self, columns=None, start=None, end=None):
+        u"""readと同じ(値はNumPyの配列。scaleが1の列はint64、それ以外はfloat64)"""
+        return self._read(columns, start, end, (decode_column_array, decode_floats_array), self._select_array,
+                          self._to_array)
+
+    def close(self):
+        self._file.close()
+
+    def _read(self, columns, start, end, decoders, select, convert):
+        names = self.names if columns is None else list(columns)
+        indices = [self.names.index(name) for name in names]
+        time_index = None if self.time_column is None else self.names.index(self.time_column)
+        time_scale = 1 if time_index is None else self.columns[time_index][1]
+        start = None if start is None else _to_time(start, time_scale)
+        end = None if end is None else _to_time(end, time_scale)
+
+        def decode(chunk, index):
+            return decoders[self.columns[index][1] == FLOAT_SCALE](self._read_block(chunk, index))
+
+        parts = [[] for _ in names]
+        for chunk in self.chunks:
+            if (start is not None and chunk['t_max'] < start) or (end is not None and chunk['t_min'] >= end):
+                continue
+            self.chunks_decoded += 1
+            values = [decode(chunk, index) for index in indices]
+            if time_index is None:
+                times = range(chunk['first_row'], chunk['first_row'] + chunk['rows'])
+            elif time_index in indices:
+                times = values[indices.index(time_index)]
+            else:
+                times = decode(chunk, time_index)
+            if (start is not None and chunk['t_min'] < start) or (end is not None and chunk['t_max'] >= end):
+                # 範囲の境界にかかるチャンクだけ行を選ぶ
+                values = select(values, times, start, end)
+            for part, column in zip(parts, values):
+                part.append(column)
+        return dict((name, convert(part, self.columns[index][1]))
+                    for name, index, part in zip(names, indices, parts))
+
+    def _read_block(self, chunk, column_index):
+        offset, length = chunk['blocks'][column_index]
+        self._file.seek(offset)
+        return zlib.decompress(self._file.read(length))
+
+    @staticmethod
+    def _select_list(values, times, start, end):
+        keep = [(start is None or t >= start) and (end is None or t < end) for t in times]
+        return [[value for value, flag in zip(column, keep) if flag] for column in values]
+
+    @staticmethod
+    def _select_array(values, times, start, end):
+        import numpy as np
+
+        times = np.asarray(times)
+        keep = np.ones(len(times), dtype=bool)
+        if start is not None:
+            keep &= times >= start
+        if end is not None:
+            keep &= times < end
+        return [column[keep] for column in values]
+
+    @staticmethod
+    def _to_list(parts, scale):
+        values = [value for part in parts for value in part]
+        if scale == 1 or scale == FLOAT_SCALE:
+            return values
+        return [value / scale for value in values]
+
+    @staticmethod
+    def _to_array(parts, scale):
+        import numpy as np
+
+        dtype = np.float64 if scale == FLOAT_SCALE else np.int64
+        values = np.concatenate([np.asarray(part, dtype=dtype) for part in parts]) if parts else \
+            np.zeros(0, dtype=dtype)
+        if scale == 1 or scale == FLOAT_SCALE:
+            return values
+        return values / scale
+
+
+def _split(line):
+    return [token.strip() for token in line.split(',')]
+
+
+def _is_number(token):
+    try:
+        float(token)
+    except ValueError:
+        return False
+    return True
+
+
+def convert_csv(csv_paths, archive_path, names=None, chunk_rows=CHUNK_ROWS):
+    u"""CSVのログをアーカイブにする
+
+    複数のファイル(RotatingLogWriterで分割したものなど)は順に1つのアーカイブにまとめる。
+    各ファイルの先頭が数値でない行ならヘッダーとみなして読み飛ばす。
+
+    Args:
+        csv_paths (list): CSVのパス
+        archive_path (str): アーカイブのパス
+        names (list): 列名。Noneならヘッダー行かKNOWN_COLUMNSから決める(なければcol0, col1, ...)
+        chunk_rows (int): 1チャンクの行数
+
+    Returns:
+        (int): 行数
+    """
+    # 1回目: 列名と列ごとの小数点以下の桁数(指数表記ならNone)、絶対値の最大を調べる
+    decimals = None
+    max_abs = None
+    for csv_path in csv_paths:
+        with open(csv_path) as file:
+            for line in file:
+                tokens = _split(line)
+                if not line.strip():
+                    continue
+                if not all(_is_number(token) for token in tokens):
+                    if names is None:
+                        names = tokens
+                    continue
+                if decimals is None:
+                    decimals = [0] * len(tokens)
+                    max_abs = [0.0] * len(tokens)
+                for column, token in enumerate(tokens[:len(decimals)]):
+                    digits = _decimals(token)
+                    if digits is None or decimals[column] is None:
+                        decimals[column] = None
+                    elif digits > decimals[column]:
+                        decimals[column] = digits
+                    max_abs[column] = max(max_abs[column], abs(float(token)))
+    if decimals is None:
+        raise ValueError('no rows in {}'.format(', '.join(csv_paths)))
+    if names is None:
+        base = os.path.basename(csv_paths[0])
+        for prefix, known in KNOWN_COLUMNS.items():
+            if base.startswith(prefix) and len(known) == len(decimals):
+                names = known
+        if names is None:
+            names = ['col{}'.format(index) for index in range(len(decimals))]
+    time_column = None
+    for name in TIME_COLUMNS:
+        if name in names:
+            time_column = name
+            break
+
+    # 2回目: 書き込む
+    scales = [_column_scale(digits, largest) for digits, largest in zip(decimals, max_abs)]
+    writer = ArchiveWriter(archive_path, list(zip(names, scales)), time_column=time_column, chunk_rows=chunk_rows)
+    try:
+        for csv_path in csv_paths:
+            with open(csv_path) as file:
+                for line in file:
+                    tokens = _split(line)
+                    if not line.strip() or not all(_is_number(token) for token in tokens):
+                        continue
+                    writer.append([float(token) if '.' in token or 'e' in token or 'E' in token else int(token)
+                                   for token in tokens])
+    finally:
+        writer.close()
+    return writer.rows
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage='%prog [options] CSV...')
+    parser.add_option('-o', '--output', action='store', type='string', dest='output', default=None,
+                      help="アーカイブのパス。省略時は最初のCSVの拡張子を.arcにしたもの")
+    parser.add_option('-c', '--chunk-rows', action='store', type='int', dest='chunk_rows', default=CHUNK_ROWS,
+                      help="1チャンクの行数")
+    options, args = parser.parse_args()
+    if not args:
+        parser.error('no CSV files')
+    output = options.output or os.path.splitext(args[0])[0] + '.arc'
+    rows = convert_csv(args, output, chunk_rows=options.chunk_rows)
+    csv_size = sum(os.path.getsize(path) for path in args)
+    archive_size = os.path.getsize(output)
+    print('{}: {} rows, {} -> {} bytes ({:.1f}%)'.format(
+        output, rows, csv_size, archive_size, archive_size / csv_size * 100))
+    reader = ArchiveReader(output)
+    float_columns = [name for name, scale in reader.columns if scale == FLOAT_SCALE]
+    reader.close()
+    # 丸めるのは桁数が収まる列だけなので、どの列もCSVの値に戻る
+    print('lossless; kept as float64 (more than {} decimals or too large to scale): {}'.format(
+        MAX_DECIMALS, ', '.join(float_columns) if float_columns else 'none'))
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""log_archiveのテスト
+
+$ python3 log_archive_test.py
+"""
+import os
+import tempfile
+
+import numpy as np
+
+from log_archive import (FLOAT_SCALE, ArchiveReader, convert_csv, decode_column, decode_column_array,
+                         encode_column)
+from odometry import PoseLog
+from testutil import with_directory
+
+HEADER = 'log_time, buttery_voltage, motor_angle_left, motor_angle_right'
+
+
+def _write_recorder_csv(path, first, count):
+    u"""motor_angle_recorder.pyと同じ形式のCSV(0.05秒ごと)"""
+    with open(path, 'w') as file:
+        file.write(HEADER + '\n')
+        for index in range(first, first + count):
+            file.write('{}, {}, {}, {}\n'.format(
+                1500000000.0 + index * 0.05, 8200000 - index * 3, index * 45, index * 44))
+
+
+def test_encode_decode():
+    values = [0, 1, -1, 63, -64, 64, 1 << 40, -(1 << 40), 1500000000000000, 5, 5, 5]
+    data = encode_column(values)
+    assert decode_column(data) == values
+    assert list(decode_column_array(data)) == values
+    assert decode_column(encode_column([])) == []
+    assert len(decode_column_array(b'')) == 0
+    # 変化の小さい列は1値1バイト
+    assert len(encode_column(list(range(1000)))) == 1000
+
+
+@with_directory
+def test_convert_recorder_logs(directory):
+    # RotatingLogWriterで分割した2つのファイル
+    paths = [os.path.join(directory, 'log_motor_angle_with_voltage_000.csv'),
+             os.path.join(directory, 'log_motor_angle_with_voltage_001.csv')]
+    _write_recorder_csv(paths[0], 0, 3000)
+    _write_recorder_csv(paths[1], 3000, 3000)
+    archive = os.path.join(directory, 'motor_angle.arc')
+    assert convert_csv(paths, archive, chunk_rows=1000) == 6000
+    assert os.path.getsize(archive) < sum(os.path.getsize(path) for path in paths) / 4
+
+    reader = ArchiveReader(archive)
+    assert reader.names == ['log_time', 'buttery_voltage', 'motor_angle_left', 'motor_angle_right']
+    assert reader.time_column == 'log_time'
+    assert len(reader.chunks) == 6
+    data = reader.read()
+    assert data['motor_angle_left'] == [index * 45 for index in range(6000)]
+    assert data['buttery_voltage'][-1] == 8200000 - 5999 * 3
+    assert abs(data['log_time'][1234] - (1500000000.0 + 1234 * 0.05)) < 1e-6
+    reader.close()
+
+
+@with_directory
+def test_range_reads_only_overlapping_chunks(directory):
+    path = os.path.join(directory, 'log_motor_angle_with_voltage.csv')
+    _write_recorder_csv(path, 0, 10000)
+    archive = os.path.join(directory, 'motor_angle.arc')
+    convert_csv([path], archive, chunk_rows=1000)
+
+    reader = ArchiveReader(archive)
+    start = 1500000000.0 + 2500 * 0.05
+    end = 1500000000.0 + 3500 * 0.05
+    data = reader.read(['motor_angle_right'], start=start, end=end)
+    assert data['motor_angle_right'] == [index * 44 for index in range(2500, 3500)]
+    assert reader.chunks_decoded == 2
+    arrays = reader.read_arrays(['motor_angle_right', 'log_time'], start=start, end=end)
+    assert list(arrays['motor_angle_right']) == data['motor_angle_right']
+    assert arrays['log_time'][0] == start
+    assert reader.chunks_decoded == 4
+    assert reader.read(['motor_angle_right'], start=0, end=1) == {'motor_angle_right': []}
+    reader.close()
+
+
+@with_directory
+def test_convert_odometry_log(directory):
+    log = PoseLog()
+    for tick in range(500):
+        log.append(tick, tick * 2, 0.35, 0.01, tick * 0.3, tick * 0.01, 500.0 - tick, 45.0, tick * 0.35, tick * 0.01)
+    path = os.path.join(directory, 'log_odometry_20180101000000.csv')
+    with open(path, 'w') as file:
+        log.write_csv(file)
+    archive = os.path.join(directory, 'odometry.arc')
+    convert_csv([path], archive, chunk_rows=128)
+
+    reader = ArchiveReader(archive)
+    assert reader.names == list(PoseLog.FIELDS)
+    assert reader.time_column is None
+    # 時刻の列がなければ行番号で範囲を指定する
+    data = reader.read(['right_angle', 'pos_x'], start=100, end=200)
+    assert data['right_angle'] == [tick * 2 for tick in range(100, 200)]
+    assert data['pos_x'] == [tick * 0.3 for tick in range(100, 200)]  # str(float)で書いた値がそのまま戻る
+    reader.close()
+
+
+@with_directory
+def test_float_columns_round_trip_exactly(directory):
+    u"""str(float)で書いた値(小数点以下がMAX_DECIMALSより多い)や指数表記、大きすぎる値も丸めずに戻る"""
+    path = os.path.join(directory, 'floats.csv')
+    rows = [(tick * 0.1 + 1e9, tick * 0.3, tick * 1e-9, 2.0 ** 60 + tick * 0.5, tick * 0.25) for tick in range(300)]
+    with open(path, 'w') as file:
+        file.write('time, x, tiny, huge, quarter\n')
+        for row in rows:
+            file.write(','.join(str(value) for value in row) + '\n')
+    archive = os.path.join(directory, 'floats.arc')
+    convert_csv([path], archive, chunk_rows=64)
+
+    reader = ArchiveReader(archive)
+    scales = dict(reader.columns)
+    assert scales['quarter'] == 100  # 小数点以下2桁までなので整数にする
+    assert scales['x'] == scales['tiny'] == scales['huge'] == FLOAT_SCALE
+    data = reader.read()
+    for index, name in enumerate(reader.names):
+        assert data[name] == [float(str(row[index])) for row in rows], name
+    arrays = reader.read_arrays(['x'])
+    assert arrays['x'].dtype == np.float64 and arrays['x'].tolist() == data['x']
+    # float64の時刻の列でも範囲を指定して読める
+    assert reader.time_column == 'time'
+    part = reader.read(['x'], start=rows[100][0], end=rows[200][0])
+    assert part['x'] == data['x'][100:200]
+    reader.close()
+
+
+@with_directory
+def test_large_integer_columns_stay_integers(directory):
+    u"""2**53を超える整数の列(time_nsなど)もfloatにせず、そのまま戻る"""
+    path = os.path.join(directory, 'telemetry.csv')
+    times = [1700000000000000001 + tick * 4000001 for tick in range(200)]
+    with open(path, 'w') as file:
+        file.write('time_ns,v\n')
+        for tick, time_ns in enumerate(times):
+            file.write('{},{}\n'.format(time_ns, tick % 7))
+    archive = os.path.join(directory, 'telemetry.arc')
+    convert_csv([path], archive, chunk_rows=64)
+
+    reader = ArchiveReader(archive)
+    assert dict(reader.columns) == {'time_ns': 1, 'v': 1}
+    assert reader.read()['time_ns'] == times
+    assert reader.read_arrays(['time_ns'])['time_ns'].tolist() == times
+    assert reader.read(['v'], start=times[64], end=times[128])['v'] == [tick % 7 for tick in range(64, 128)]
+    reader.close()
+
+
+def test_rejects_other_files():
+    with tempfile.NamedTemporaryFile() as file:
+        file.write(b'log_time, voltage\n' * 4)
+        file.flush()
+        try:
+            ArchiveReader(file.name)
+        except ValueError:
+            pass
+        else:
+            assert False, 'ValueError expected'
+
+
+if __name__ == '__main__':
+    test_encode_decode()
+    test_convert_recorder_logs()
+    test_range_reads_only_overlapping_chunks()
+    test_convert_odometry_log()
+    test_float_columns_round_trip_exactly()
+    test_large_integer_columns_stay_integers()
+    test_rejects_other_files()
+    print('ok')
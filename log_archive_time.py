@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""motor_angle_recorder.pyの長時間のログ(CSV)とアーカイブ(log_archive)の大きさと読み込み時間を比べる
+
+$ python3 log_archive_time.py --hours=4 --interval=0.05 --directory=./log/archive_time
+"""
+import math
+import os
+import random
+import shutil
+import time
+from optparse import OptionParser
+
+from log_archive import FLOAT_SCALE, ArchiveReader, convert_csv
+
+HOURS = 4.0
+INTERVAL = 0.05
+DIRECTORY = './log/archive_time'
+HEADER = 'log_time, buttery_voltage, motor_angle_left, motor_angle_right'
+
+
+def write_recorder_csv(path, hours, interval):
+    u"""電池が減るにつれて速度が落ちるログを作る(値の形式はmotor_angle_recorder.pyと同じ)"""
+    rows = int(hours * 3600 / interval)
+    log_time = time.time()
+    left = right = 0
+    with open(path, 'w') as file:
+        file.write(HEADER + '\n')
+        for index in range(rows):
+            progress = index / rows
+            voltage = int(8300000 - 1500000 * progress - 20000 * random.random())
+            speed = 900 * (1 - 0.4 * progress) + 20 * math.sin(index / 50)
+            left += int(speed * interval)
+            right += int(speed * interval * 0.98)
+            log_time += interval + random.uniform(-0.0002, 0.0002)
+            file.write('{}, {}, {}, {}\n'.format(log_time, voltage, left, right))
+    return rows
+
+
+def load_csv(path):
+    u"""CSVを全部読んで列ごとのリストにする"""
+    columns = None
+    with open(path) as file:
+        file.readline()
+        for line in file:
+            values = [float(token) for token in line.split(',')]
+            if columns is None:
+                columns = [[] for _ in values]
+            for column, value in zip(columns, values):
+                column.append(value)
+    return columns
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-H', '--hours', action='store', type='float', dest='hours', default=HOURS,
+                      help="ログの長さ(時間)")
+    parser.add_option('-i', '--interval', action='store', type='float', dest='interval', default=INTERVAL,
+                      help="記録の間隔(秒)")
+    parser.add_option('-d', '--directory', action='store', type='string', dest='directory', default=DIRECTORY,
+                      help="作業用のディレクトリ(終了時に消す)")
+    options, _ = parser.parse_args()
+    os.makedirs(options.directory, exist_ok=True)
+    try:
+        csv_path = os.path.join(options.directory, 'log_motor_angle_with_voltage.csv')
+        archive_path = os.path.join(options.directory, 'log_motor_angle_with_voltage.arc')
+        rows = write_recorder_csv(csv_path, options.hours, options.interval)
+        _, convert_elapsed = timed(convert_csv, [csv_path], archive_path)
+        csv_size = os.path.getsize(csv_path)
+        archive_size = os.path.getsize(archive_path)
+        print('{} rows: csv {:.1f}MB, archive {:.1f}MB ({:.1f}%), convert {:.2f}s'.format(
+            rows, csv_size / 1e6, archive_size / 1e6, archive_size / csv_size * 100, convert_elapsed))
+
+        _, elapsed = timed(load_csv, csv_path)
+        print('csv load all columns: {:.3f}s'.format(elapsed))
+        reader = ArchiveReader(archive_path)
+        _, elapsed = timed(reader.read)
+        print('archive read all columns: {:.3f}s'.format(elapsed))
+        try:
+            _, elapsed = timed(reader.read_arrays)
+            print('archive read_arrays all columns: {:.3f}s'.format(elapsed))
+        except ImportError:
+            pass
+        first = reader.chunks[0]['t_min']
+        if reader.columns[0][1] != FLOAT_SCALE:
+            first /= reader.columns[0][1]
+        middle = first + options.hours * 3600 / 2
+        reader.chunks_decoded = 0
+        data, elapsed = timed(reader.read, ['buttery_voltage'], start=middle, end=middle + 60)
+        print('archive read 1 minute of buttery_voltage: {:.4f}s ({} rows, {} of {} chunks)'.format(
+            elapsed, len(data['buttery_voltage']), reader.chunks_decoded, len(reader.chunks)))
+        reader.close()
+    finally:
+        shutil.rmtree(options.directory)
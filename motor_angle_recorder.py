@@ -1,7 +1,10 @@
 import os
 import time
 import logging
-from ev3dev.auto import *
+from optparse import OptionParser
+
+from scheduler import PeriodicScheduler
+from stream_log import BATCH_LINES, FSYNC_INTERVAL, RotatingLogWriter
 
 logger = logging.getLogger(__name__)
 
@@ -20,15 +23,26 @@ def write_device(fd, value):
     fd.write(str(int(value)))
     fd.flush()
 
-# ファイルを開いてデータを追記する関数
-
-
-def write_data_to_file_path(data, file_path):
-    fd = open(file_path, 'a')
-    fd.write("{}\n".format(data))
-    fd.close()
+SAMPLE_INTERVAL = 0.05  # 記録する間隔(秒)
+MAX_BYTES = 4 * 1024 * 1024  # ログ(csv)を分割する大きさ(バイト)
 
 if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-i', '--interval', action='store', type='float', dest='interval', default=SAMPLE_INTERVAL,
+                      help="記録する間隔(秒)")
+    parser.add_option('-b', '--batch', action='store', type='int', dest='batch', default=BATCH_LINES,
+                      help="まとめて書き込む行数")
+    parser.add_option('-f', '--fsync-interval', action='store', type='float', dest='fsync_interval',
+                      default=FSYNC_INTERVAL, help="fsyncする間隔(秒)")
+    parser.add_option('-m', '--max-bytes', action='store', type='int', dest='max_bytes', default=MAX_BYTES,
+                      help="ログを分割する大きさ(バイト)")
+    parser.add_option('-s', '--max-seconds', action='store', type='float', dest='max_seconds', default=None,
+                      help="ログを分割する時間(秒)。省略時は時間では分割しない")
+    options, _ = parser.parse_args()
+
+    # read_device/write_deviceは実機がなくても使えるよう、ev3devはここでimportする
+    from ev3dev.auto import *
+
     try:
         # logフォルダの生成
         if not os.path.exists('./log/'):
@@ -39,7 +53,7 @@ if __name__ == '__main__':
         time.tzset()
         log_datetime = time.strftime("%Y%m%d%H%M%S")
 
-        # ログ(csv)のファイルパス
+        # ログ(csv)のファイルパス(分割したファイルは拡張子の前に連番が付く)
         log_file_path = "./log/log_motor_angle_with_voltage_{}.csv".format(log_datetime)
 
         # バッテリーセットアップ
@@ -67,7 +81,9 @@ if __name__ == '__main__':
             "buttery_voltage",
             "motor_angle_left",
             "motor_angle_right")
-        write_data_to_file_path(log_header, log_file_path)
+        log_writer = RotatingLogWriter(log_file_path, header=log_header, batch_lines=options.batch,
+                                       fsync_interval=options.fsync_interval, max_bytes=options.max_bytes,
+                                       max_seconds=options.max_seconds)
 
         # 左右モーターの回転開始
         write_device(motor_duty_cycle_left_devfd, 100)
@@ -76,21 +92,26 @@ if __name__ == '__main__':
         # 試験停止フラグ
         stopped = False
 
-        # 毎秒ログを生成（電池がしぬまで）
-        while not stopped:
-            log_time = time.time() # 現在時刻（秒
-            buttery_voltage = read_device(battery_voltage_devfd) #バッテリー電圧(μV)
-            motor_angle_left = read_device(motor_encoder_left_devfd)
-            motor_angle_right = read_device(motor_encoder_right_devfd)
-
-            log = "{}, {}, {}, {}".format(
-                log_time,
-                buttery_voltage,
-                motor_angle_left,
-                motor_angle_right)
-            write_data_to_file_path(log, log_file_path)
-
-            time.sleep(5)
+        # interval秒ごとにログを生成（電池がしぬまで）
+        scheduler = PeriodicScheduler(options.interval)
+        scheduler.start()
+        try:
+            while not stopped:
+                log_time = time.time() # 現在時刻（秒
+                buttery_voltage = read_device(battery_voltage_devfd) #バッテリー電圧(μV)
+                motor_angle_left = read_device(motor_encoder_left_devfd)
+                motor_angle_right = read_device(motor_encoder_right_devfd)
+
+                log = "{}, {}, {}, {}".format(
+                    log_time,
+                    buttery_voltage,
+                    motor_angle_left,
+                    motor_angle_right)
+                log_writer.write(log)
+
+                scheduler.wait()
+        finally:
+            scheduler.close()
 
     except (Exception, KeyboardInterrupt) as ex:
         logger.exception(ex)
@@ -99,7 +120,8 @@ if __name__ == '__main__':
         left_motor.stop()
         right_motor.stop()
 
-        # ファイルクローズ
+        # ファイルクローズ(ためているログを書き込んでfsyncする)
+        log_writer.close()
         battery_voltage_devfd.close()
         motor_encoder_left_devfd.close()
         motor_encoder_right_devfd.close()
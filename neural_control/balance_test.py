@@ -1,11 +1,24 @@
-u"""OpenAI gymのCarPole-v0をQ-Learning（Neural Network版）で学習する"""
+u"""OpenAI gymのCarPole-v0をQ-Learning（Neural Network版）で学習する
+
+シミュレータで動かす時
+$ EV3_BACKEND=sim python3 balance_test.py
+"""
 import enum
 import gc
-import time
-import pickle
+import os
 import random
+import sys
+from optparse import OptionParser
+
+# リポジトリのルートにあるモジュール(ev3_backend, neural_network, policy_table, raw_device, scheduler, telemetry)を使う
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-import ev3dev.ev3 as ev3
+from ev3_backend import ev3, clock
+from neural_network import NeuralNetwork, load_params
+from policy_table import TablePolicy, load_table
+from raw_device import open_gyro, open_motor
+from scheduler import PeriodicScheduler
+from telemetry import TelemetryWriter, default_path
 
 
 def get_reward(observation):
@@ -15,118 +28,16 @@ def get_reward(observation):
     return -loss
 
 
-class NeuralNetwork(object):
-    """ニューラルネットワークの学習管理クラス"""
-    INPUT_LAYER_NEURONS = 4  # 入力層ニューロン数
-    HIDDEN_LAYER_NEURONS = 16  # 隠れ層ニューロン数
-    OUTPUT_LAYER_NEURONS = 2  # 出力層ニューロン数 = Action数
+def make_inputs(left_motor_position, gyro_angle, gyro_rate):
+    u"""センサー値からネットワークの入力を作る"""
+    return (left_motor_position / 100, 0, gyro_angle / 100, gyro_rate / 100)
 
-    LEARNING_RATE = 1e-3  # 学習率
 
-    def __init__(self, network_file_path):
-        # とりあえずバイアス項はなし
-        with open(network_file_path, 'rb') as file:
-            self.params = pickle.load(file)
-        self.output = None
-
-    def forward(self, x_input, should_save_output=False):
-        """ネットワークを順伝搬させて出力を計算する
-
-        入力層のニューロンは順に1, 2, ..., i, ...
-        隠れ層と出力層も同様にj, kと添字をふることにする
-        ここではuは入力値と重みの総和、φは任意の活性化関数、yはニューロンの出力とする
-        φ_hは隠れ層の活性化関数。ここではReLUを使う
-        φ_oは隠れ層の活性化関数。ここでは恒等関数を使う
-        """
-        # 隠れ層の計算
-        # u_j = Σ_i { x_i * w_ij }
-        u_hidden = self._poor_dot(x_input, self.params['W_INPUT'])
-        # y_j = φ_h(u_j)
-        y_hidden = self.relu(u_hidden)  # 活性化関数はReLU
-
-        # 出力層の計算
-        # u_k = Σ_j { y_j * w_jk }
-        u_output = self._poor_dot(y_hidden, self.params['W_HIDDEN'])
-        # y_k = φ_o(u_k)
-        y_output = u_output  # 活性化関数は恒等関数
-
-        # 誤差逆伝搬で使う出力値
-        if should_save_output:
-            self.output = {
-                'u_hidden': u_hidden,
-                'y_hidden': y_hidden,
-                'y_output': y_output,
-            }
-        return y_output
-
-    def back_propagation(self, x_input, target):
-        """誤差逆伝搬でネットワークの重みを更新する
-
-        誤差関数Eは、出力が連続値であるため自乗平均をとる
-        targetは教師信号の値
-        E = Σ_k{ (target_k - y_k)^2 } / 2
-
-        隠れ層 - 出力層間の重みは次の式で更新する
-        ηは学習率とする
-        w_jk = w_jk - η * Δw_jk
-        Δw_jk = ∂E/∂w_jk
-              = ∂E/∂y_k * ∂y_k/∂u_k * ∂u_k/∂w_jk
-              = (y_k - target_k) * φ_o'(u_k) * y_j
-        ここで
-        δ_output_k = (y_k - target_k) * φ_o'(u_k)
-        とおいておく
-
-        入力層 - 隠れ層間の重みは
-        w_ij = w_ij - η * Δw_ij
-        Δw_ij = ∂E/∂w_ij
-              = Σ_k{ ∂E/∂y_k * ∂y_k/∂u_k * ∂u_k/∂y_j * ∂y_j/∂u_j * ∂u_j/∂x_i }
-              = Σ_k{ (y_k - target_k) * φ_h'(u_k) * w_jk * φ'(u_j) * x_i }
-              = Σ_k{ δ_output_k * w_jk * φ_h'(u_j) * x_i }
-              = Σ_k{ δ_output_k * w_jk } * φ_h'(u_j) * x_i
-        """
-        if self.output is None:
-            return
-        # 誤差逆伝搬では順伝搬で計算したニューロン出力値を使う
-        u_hidden = self.output['u_hidden']
-        y_hidden = self.output['y_hidden']
-        y_output = self.output['y_output']
-
-        # 隠れ層 - 出力層間の重みを更新
-        # 出力層の活性化関数は恒等関数なので、φ_o'(u_k) = 1
-        delta_o = []
-        for y_output_k, target_k in zip(y_output, target):
-            delta_o.append(y_output_k - target_k)
-
-        for j, y_hidden_j in enumerate(y_hidden):
-            for k, delta_o_k in enumerate(delta_o):
-                self.params['W_HIDDEN'][j][k] += -self.LEARNING_RATE * y_hidden_j * delta_o_k
-
-        # 入力層 - 隠れ層間の重みを更新
-        # φ_h'(u_j)はReLUの微分
-        delta_relu = [value > 0 for value in u_hidden]
-        # delta_w1_tmpは　Σ_k{ δ_output_k * w_jk } * φ_h'(u_j) までの計算
-        delta_w1_dot = self._poor_dot(delta_o, self.params['W_HIDDEN'])
-        delta_w1_tmp = []
-        for delta_relu_j, delta_w1_dot_j in zip(delta_relu, delta_w1_dot):
-            delta_w1_tmp.append(delta_relu_j * delta_w1_dot_j)
-
-        for i, x_input_i in enumerate(x_input):
-            for j, delta_w1_j in enumerate(delta_w1_tmp):
-                self.params['W_INPUT'][i][j] += -self.LEARNING_RATE * x_input_i * delta_w1_j
-
-    @staticmethod
-    def relu(inputs):
-        """活性化関数ReLU"""
-        return [value if value > 0 else 0 for value in inputs]
-
-    @staticmethod
-    def _poor_dot(value_1d, value_2d):
-        u"""np.dotの代用。1次元配列と2次元配列のみ受け付ける"""
-        outputs = [0] * len(value_2d[0])
-        for input_, weight_i in zip(value_1d, value_2d):
-            for j, weight in enumerate(weight_i):
-                outputs[j] += input_ * weight
-        return outputs
+def action_pwm(action):
+    u"""行動をモーターのPWM値にする"""
+    if action == Action.ACTION1:
+        return -100
+    return 100
 
 
 class Action(enum.Enum):
@@ -145,7 +56,7 @@ class Agent(object):
         self.action_value = {}  # Q値
         self.gamma = 0.95  # 割引率γ
         self.epsilon = 0.15  # 探索率ε
-        self.network = NeuralNetwork(network_file_path)
+        self.network = NeuralNetwork(load_params(network_file_path))
 
     def decide_action(self, state, greedy=False, should_save_output=False):
         """方策に応じて行動を選択する"""
@@ -180,6 +91,19 @@ class Agent(object):
         # 誤差逆伝搬でネットワークを更新する
         self.network.back_propagation(state, target)
 
+    def update_minibatch(self, states, actions, rewards, next_states, dones):
+        """Q-Learningアルゴリズムでネットワークをミニバッチで更新する(NumpyNeuralNetworkが必要)
+
+        experience_replay.ExperienceReplay.sampleの戻り値をそのまま受け取る。
+        教師信号はupdate_action_valueと同じだが、B個の遷移の次の状態を1回の順伝搬でまとめて計算し、
+        勾配の平均で1回だけ重みを更新する。倒れた(done)遷移は次の状態の価値を使わない。
+        """
+        next_max_action_values = self.network.forward(next_states).max(axis=1)
+        target = self.network.forward(states, should_save_output=True).copy()
+        # 実際に選択した行動だけ報酬から教師信号を計算する
+        target[range(len(actions)), actions] = rewards + self.gamma * next_max_action_values * ~dones
+        self.network.back_propagation(states, target)
+
     @staticmethod
     def _explore():
         """ランダムな行動（探索行動）をとる"""
@@ -205,12 +129,32 @@ class Robot(object):
     u"""ロボット本体"""
 
     BASE_SLEEP_TIME = 0.02
-
-    def __init__(self):
-        self.right_motor = ev3.LargeMotor('outA')
-        self.left_motor = ev3.LargeMotor('outC')
-        self.gyro_sensor = ev3.GyroSensor('in4')
-        self.agent = Agent('network.pickle')
+    # テレメトリのレコード
+    TELEMETRY_FIELDS = (
+        ('time_ns', 'Q'),  # 周期の開始時刻(clock.monotonic_ns)
+        ('left_position', 'd'),  # 左モータのエンコーダ値(deg)
+        ('gyro_angle', 'd'),  # オフセットを引いたジャイロ角度(deg)
+        ('gyro_rate', 'd'),  # ジャイロ角速度(deg/s)
+        ('pwm', 'h'),  # 選択した行動のPWM値
+        ('elapsed_us', 'q'),  # 処理時間(μs)
+    )
+
+    def __init__(self, telemetry_path=None, policy_path=None):
+        u"""
+        Args:
+            telemetry_path (str): 周期ごとの値を記録するテレメトリのファイル。Noneなら記録しない
+            policy_path (str): policy_table.compile_tableで作った表。Noneならネットワークで行動を決める
+        """
+        self.right_motor = open_motor(ev3.LargeMotor('outA'))
+        self.left_motor = open_motor(ev3.LargeMotor('outC'))
+        self.gyro_sensor = open_gyro(ev3.GyroSensor('in4'))
+        if policy_path is None:
+            self.agent = Agent('network.model')
+        else:
+            self.agent = TablePolicy(load_table(policy_path), list(Action))
+        self.telemetry = None
+        if telemetry_path is not None:
+            self.telemetry = TelemetryWriter(telemetry_path, self.TELEMETRY_FIELDS)
 
     def run(self):
         u"""ロボット稼働"""
@@ -221,50 +165,60 @@ class Robot(object):
 
     def _main_loop(self):
         u"""ロボットメインループ"""
-        elapsed_times = []
-        input_list = []
+        telemetry = self.telemetry
         self.left_motor.position = 0
         self.right_motor.position = 0
         self.gyro_sensor.mode = 'GYRO-G&A'
         gyro_offset = self.gyro_sensor.angle
         print('ready')
-        for _ in range(500):
-            start_time = time.time()
-            gyro_angle, gyro_rate = self.gyro_sensor.rate_and_angle
-            gyro_angle -= gyro_offset
-
-            if abs(gyro_angle) > 45:
-                # 倒れた
-                print('taoreta ', gyro_angle, gyro_rate)
-                break
-            left_motor_position = self.left_motor.position
-
-            # Neural Network
-            inputs = (left_motor_position / 100, 0, gyro_angle / 100, gyro_rate / 100)
-            input_list.append(inputs)
-            decided_action = self.agent.decide_action(inputs, greedy=True)
-            if decided_action == Action.ACTION1:
-                pwm = -100
-            else:
-                pwm = 100
-
-            self.right_motor.run_direct(duty_cycle_sp=pwm)
-            self.left_motor.run_direct(duty_cycle_sp=pwm)
-            # 余った時間はsleep
-            elapsed_second = time.time() - start_time
-            elapsed_times.append(elapsed_second)
-            if elapsed_second < self.BASE_SLEEP_TIME:
-                sleep_time = self.BASE_SLEEP_TIME - elapsed_second
-                time.sleep(sleep_time)
-        print('total')
-        for time_, inputs in zip(elapsed_times, input_list):
-            print(time_, inputs)
+        scheduler = PeriodicScheduler(self.BASE_SLEEP_TIME, clock=clock)
+        scheduler.start()
+        try:
+            for _ in range(500):
+                start_time = clock.monotonic_ns()
+                gyro_angle, gyro_rate = self.gyro_sensor.rate_and_angle
+                gyro_angle -= gyro_offset
+
+                if abs(gyro_angle) > 45:
+                    # 倒れた
+                    print('taoreta ', gyro_angle, gyro_rate)
+                    break
+                left_motor_position = self.left_motor.position
+
+                # Neural Network
+                inputs = make_inputs(left_motor_position, gyro_angle, gyro_rate)
+                decided_action = self.agent.decide_action(inputs, greedy=True)
+                pwm = action_pwm(decided_action)
+
+                self.right_motor.run_direct(duty_cycle_sp=pwm)
+                self.left_motor.run_direct(duty_cycle_sp=pwm)
+                # 処理時間を記録して、次の周期の開始時刻までsleep
+                if telemetry is not None:
+                    telemetry.write(start_time, left_motor_position, gyro_angle, gyro_rate, pwm,
+                                    (clock.monotonic_ns() - start_time) // 1000)
+                scheduler.wait()
+            if telemetry is not None:
+                print('total')
+                for _, left_motor_position, gyro_angle, gyro_rate, pwm, elapsed_us in telemetry.rows():
+                    print(elapsed_us, make_inputs(left_motor_position, gyro_angle, gyro_rate), pwm)
+            print(scheduler.stats())
+        finally:
+            scheduler.close()
 
     def _stop(self):
         self.left_motor.stop()
         self.right_motor.stop()
+        if self.telemetry is not None:
+            self.telemetry.close()
 
 if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-t', '--telemetry', action='store', type='string', dest='telemetry',
+                      default=default_path('neural_balance_test'),
+                      help="テレメトリのファイル(telemetry.TelemetryReaderで読める)。既定は起動日時の入ったファイル")
+    parser.add_option('-p', '--policy', action='store', type='string', dest='policy', default=None,
+                      help="行動の表(policy_table.pyで作る)。省略時はネットワークで行動を決める")
+    options, _ = parser.parse_args()
     gc.disable()
-    robot = Robot()
+    robot = Robot(telemetry_path=options.telemetry, policy_path=options.policy)
     robot.run()
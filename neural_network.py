@@ -0,0 +1,402 @@
+# -*- coding: UTF-8 -*-
+u"""neural_controlのニューラルネットワーク(入力層4, 隠れ層16(ReLU), 出力層2(恒等関数), バイアス項なし)
+
+    ListNeuralNetwork  : リストと二重ループで計算する。NumPyがなくても動く
+    NumpyNeuralNetwork : 重みをNumPyの連続したfloat64配列に持ち、入力は[4]か、バッチの[B, 4]を受け付ける
+    NeuralNetwork      : NumPyがあればNumpyNeuralNetwork、なければListNeuralNetwork
+
+どちらもload_modelが返すビューをコピーせずに順伝搬に使い、back_propagationで初めて重みを更新するときにコピーする。
+
+重み(params)は {'W_INPUT': 4x16, 'W_HIDDEN': 16x2} の辞書で、ファイルは次の2つの形式がある。
+    network.model  : save_modelで書く平たいバイナリ(下記)。mmapかarray.frombytesで読むだけなので速く、任意のコードも実行しない
+    network.pickle : 以前の形式。入れ子のリストをpickleしたもの
+
+    network = NeuralNetwork(load_params('network.model'))
+    action_values = network.forward(inputs)
+
+network.modelの形式(リトルエンディアン)
+    ヘッダ(16バイト) : MODEL_MAGIC, バージョン(H), 型('d'=float64か'f'=float32, c), 層の数(B), 重みの開始位置(I)
+    層ごと(24バイト) : 名前(16s, 0埋め), 行数(I), 列数(I)
+    重み             : 16バイト境界から、層の順に行優先で並べた値
+
+pickleから変換して、同じ出力になることを確かめる
+$ python3 neural_network.py ./neural_control/network.pickle -o ./neural_control/network.model
+"""
+import os
+import struct
+import sys
+from array import array
+from optparse import OptionParser
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MODEL_MAGIC = b'EV3NNMDL'
+MODEL_VERSION = 1
+MODEL_LAYERS = ('W_INPUT', 'W_HIDDEN')
+_MODEL_HEADER = struct.Struct('<8sHcBI')
+_MODEL_LAYER = struct.Struct('<16sII')
+_MODEL_ALIGNMENT = 16
+_NUMPY_TYPES = {b'd': '<f8', b'f': '<f4'}
+
+
+def load_params(network_file_path):
+    u"""重みを読む。ファイルの先頭がMODEL_MAGICならload_model、そうでなければ以前のpickle"""
+    with open(network_file_path, 'rb') as file:
+        if file.read(len(MODEL_MAGIC)) != MODEL_MAGIC:
+            import pickle
+
+            file.seek(0)
+            return pickle.load(file)
+    return load_model(network_file_path)
+
+
+def save_model(model_file_path, params, type_code='d'):
+    u"""重みをnetwork.modelの形式で書く
+
+    Args:
+        model_file_path (str): 書き出すファイル
+        params (dict): MODEL_LAYERSの重み(2次元のリストか配列)
+        type_code (str): 'd'ならfloat64、'f'ならfloat32で書く
+    """
+    if type_code not in ('d', 'f'):
+        raise ValueError('unsupported type code: {}'.format(type_code))
+    layers = []
+    weights = array(type_code)
+    for name in MODEL_LAYERS:
+        rows = [[float(weight) for weight in row] for row in params[name]]
+        layers.append(_MODEL_LAYER.pack(name.encode(), len(rows), len(rows[0])))
+        for row in rows:
+            weights.extend(row)
+    if sys.byteorder == 'big':
+        weights.byteswap()
+    header_size = _MODEL_HEADER.size + _MODEL_LAYER.size * len(layers)
+    data_offset = -(-header_size // _MODEL_ALIGNMENT) * _MODEL_ALIGNMENT
+    directory = os.path.dirname(model_file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = model_file_path + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(_MODEL_HEADER.pack(MODEL_MAGIC, MODEL_VERSION, type_code.encode(), len(layers), data_offset))
+        file.write(b''.join(layers))
+        file.write(b'\0' * (data_offset - header_size))
+        weights.tofile(file)
+    os.replace(temporary, model_file_path)
+
+
+def load_model(model_file_path, use_numpy=None):
+    u"""save_modelで書いたファイルを読む
+
+    NumPyがあれば重みの部分をnumpy.memmapでマップした[行, 列]の読み取り専用の配列(コピーしない)、
+    なければarray.frombytesで読んだ配列の各行のmemoryviewのリストを返す。どちらもNeuralNetworkにそのまま渡せる。
+
+    Args:
+        use_numpy (bool): NumPyを使うか。省略時はNumPyがあれば使う
+    """
+    if use_numpy is None:
+        use_numpy = np is not None
+    with open(model_file_path, 'rb') as file:
+        header = file.read(_MODEL_HEADER.size)
+        if len(header) != _MODEL_HEADER.size or not header.startswith(MODEL_MAGIC):
+            raise ValueError('{} is not a network model'.format(model_file_path))
+        _, version, type_code, layer_count, data_offset = _MODEL_HEADER.unpack(header)
+        if version != MODEL_VERSION:
+            raise ValueError('unsupported network model version: {}'.format(version))
+        if type_code not in _NUMPY_TYPES:
+            raise ValueError('unsupported type code: {!r}'.format(type_code))
+        layers = []
+        for _ in range(layer_count):
+            name, rows, columns = _MODEL_LAYER.unpack(file.read(_MODEL_LAYER.size))
+            layers.append((name.rstrip(b'\0').decode(), rows, columns))
+        total = sum(rows * columns for _, rows, columns in layers)
+        if use_numpy:
+            weights = np.memmap(file, dtype=_NUMPY_TYPES[type_code], mode='r', offset=data_offset, shape=(total,))
+        else:
+            weights = array(type_code.decode())
+            file.seek(data_offset)
+            weights.frombytes(file.read(total * weights.itemsize))
+            if len(weights) != total:
+                raise ValueError('{} is truncated'.format(model_file_path))
+            if sys.byteorder == 'big':
+                weights.byteswap()
+            weights = memoryview(weights)
+    params = {}
+    start = 0
+    for name, rows, columns in layers:
+        if use_numpy:
+            params[name] = weights[start:start + rows * columns].reshape(rows, columns)
+        else:
+            params[name] = [weights[start + row * columns:start + (row + 1) * columns] for row in range(rows)]
+        start += rows * columns
+    return params
+
+
+class ListNeuralNetwork(object):
+    """ニューラルネットワークの学習管理クラス(リスト版)"""
+    INPUT_LAYER_NEURONS = 4  # 入力層ニューロン数
+    HIDDEN_LAYER_NEURONS = 16  # 隠れ層ニューロン数
+    OUTPUT_LAYER_NEURONS = 2  # 出力層ニューロン数 = Action数
+
+    LEARNING_RATE = 1e-3  # 学習率
+
+    def __init__(self, params, copy=False):
+        u"""
+        Args:
+            params (dict): 重み。'W_INPUT'(4x16)と'W_HIDDEN'(16x2)の2次元リストか、load_modelが返す行のmemoryview
+            copy (bool): Trueならすぐにコピーする。Falseなら渡された重みをそのまま順伝搬に使い、
+                back_propagationで初めて更新するときにコピーする
+        """
+        # とりあえずバイアス項はなし
+        self.params = {'W_INPUT': params['W_INPUT'], 'W_HIDDEN': params['W_HIDDEN']}
+        self._owns_params = False
+        if copy:
+            self._copy_params()
+        self.output = None
+
+    def _copy_params(self):
+        u"""重みを入れ子のfloatのリストにコピーする。渡された重み(ファイルのビューのこともある)は書き換えない"""
+        if not self._owns_params:
+            self.params = {name: [[float(weight) for weight in row] for row in weights]
+                           for name, weights in self.params.items()}
+            self._owns_params = True
+
+    def forward(self, x_input, should_save_output=False):
+        """ネットワークを順伝搬させて出力を計算する
+
+        入力層のニューロンは順に1, 2, ..., i, ...
+        隠れ層と出力層も同様にj, kと添字をふることにする
+        ここではuは入力値と重みの総和、φは任意の活性化関数、yはニューロンの出力とする
+        φ_hは隠れ層の活性化関数。ここではReLUを使う
+        φ_oは隠れ層の活性化関数。ここでは恒等関数を使う
+        """
+        # 隠れ層の計算
+        # u_j = Σ_i { x_i * w_ij }
+        u_hidden = self._poor_dot(x_input, self.params['W_INPUT'])
+        # y_j = φ_h(u_j)
+        y_hidden = self.relu(u_hidden)  # 活性化関数はReLU
+
+        # 出力層の計算
+        # u_k = Σ_j { y_j * w_jk }
+        u_output = self._poor_dot(y_hidden, self.params['W_HIDDEN'])
+        # y_k = φ_o(u_k)
+        y_output = u_output  # 活性化関数は恒等関数
+
+        # 誤差逆伝搬で使う出力値
+        if should_save_output:
+            self.output = {
+                'u_hidden': u_hidden,
+                'y_hidden': y_hidden,
+                'y_output': y_output,
+            }
+        return y_output
+
+    def back_propagation(self, x_input, target):
+        """誤差逆伝搬でネットワークの重みを更新する
+
+        誤差関数Eは、出力が連続値であるため自乗平均をとる
+        targetは教師信号の値
+        E = Σ_k{ (target_k - y_k)^2 } / 2
+
+        隠れ層 - 出力層間の重みは次の式で更新する
+        ηは学習率とする
+        w_jk = w_jk - η * Δw_jk
+        Δw_jk = ∂E/∂w_jk
+              = ∂E/∂y_k * ∂y_k/∂u_k * ∂u_k/∂w_jk
+              = (y_k - target_k) * φ_o'(u_k) * y_j
+        ここで
+        δ_output_k = (y_k - target_k) * φ_o'(u_k)
+        とおいておく
+
+        入力層 - 隠れ層間の重みは
+        w_ij = w_ij - η * Δw_ij
+        Δw_ij = ∂E/∂w_ij
+              = Σ_k{ ∂E/∂y_k * ∂y_k/∂u_k * ∂u_k/∂y_j * ∂y_j/∂u_j * ∂u_j/∂x_i }
+              = Σ_k{ (y_k - target_k) * φ_h'(u_k) * w_jk * φ'(u_j) * x_i }
+              = Σ_k{ δ_output_k * w_jk * φ_h'(u_j) * x_i }
+              = Σ_k{ δ_output_k * w_jk } * φ_h'(u_j) * x_i
+        w_jkは更新前の値を使う
+        """
+        if self.output is None:
+            return
+        self._copy_params()
+        # 誤差逆伝搬では順伝搬で計算したニューロン出力値を使う
+        u_hidden = self.output['u_hidden']
+        y_hidden = self.output['y_hidden']
+        y_output = self.output['y_output']
+        w_hidden = self.params['W_HIDDEN']
+
+        # 出力層の活性化関数は恒等関数なので、φ_o'(u_k) = 1
+        delta_o = []
+        for y_output_k, target_k in zip(y_output, target):
+            delta_o.append(y_output_k - target_k)
+
+        # φ_h'(u_j)はReLUの微分
+        # delta_w1_tmpは　Σ_k{ δ_output_k * w_jk } * φ_h'(u_j) までの計算
+        delta_w1_tmp = []
+        for u_hidden_j, w_hidden_j in zip(u_hidden, w_hidden):
+            if u_hidden_j > 0:
+                delta_w1_tmp.append(sum(delta_o_k * w_jk for delta_o_k, w_jk in zip(delta_o, w_hidden_j)))
+            else:
+                delta_w1_tmp.append(0.0)
+
+        # 隠れ層 - 出力層間の重みを更新
+        for j, y_hidden_j in enumerate(y_hidden):
+            for k, delta_o_k in enumerate(delta_o):
+                w_hidden[j][k] += -self.LEARNING_RATE * y_hidden_j * delta_o_k
+
+        # 入力層 - 隠れ層間の重みを更新
+        for i, x_input_i in enumerate(x_input):
+            for j, delta_w1_j in enumerate(delta_w1_tmp):
+                self.params['W_INPUT'][i][j] += -self.LEARNING_RATE * x_input_i * delta_w1_j
+
+    @staticmethod
+    def relu(inputs):
+        """活性化関数ReLU"""
+        return [value if value > 0 else 0 for value in inputs]
+
+    @staticmethod
+    def _poor_dot(value_1d, value_2d):
+        u"""np.dotの代用。1次元配列と2次元配列のみ受け付ける"""
+        outputs = [0] * len(value_2d[0])
+        for input_, weight_i in zip(value_1d, value_2d):
+            for j, weight in enumerate(weight_i):
+                outputs[j] += input_ * weight
+        return outputs
+
+
+class NumpyNeuralNetwork(object):
+    """ニューラルネットワークの学習管理クラス(NumPy版)
+
+    計算はListNeuralNetworkと同じ。入力が[B, 4]のバッチなら出力は[B, 2]で、
+    back_propagationはB個のサンプルの勾配の平均で1回だけ重みを更新する(B=1ならListNeuralNetworkと同じ更新)。
+    """
+    INPUT_LAYER_NEURONS = ListNeuralNetwork.INPUT_LAYER_NEURONS
+    HIDDEN_LAYER_NEURONS = ListNeuralNetwork.HIDDEN_LAYER_NEURONS
+    OUTPUT_LAYER_NEURONS = ListNeuralNetwork.OUTPUT_LAYER_NEURONS
+
+    LEARNING_RATE = ListNeuralNetwork.LEARNING_RATE
+
+    def __init__(self, params, copy=False):
+        u"""
+        Args:
+            params (dict): 重み。'W_INPUT'(4x16)と'W_HIDDEN'(16x2)の2次元リストか配列
+            copy (bool): Trueならすぐにコピーする。Falseならfloat64の連続した配列(load_modelのmemmapなど)は
+                そのまま順伝搬に使い、back_propagationで初めて更新するときにコピーする
+        """
+        self.params = {
+            'W_INPUT': np.asarray(params['W_INPUT'], dtype=np.float64, order='C'),
+            'W_HIDDEN': np.asarray(params['W_HIDDEN'], dtype=np.float64, order='C'),
+        }
+        self._owns_params = False
+        if copy:
+            self._copy_params()
+        self.output = None
+
+    def _copy_params(self):
+        u"""重みを書き込める配列にコピーする。渡された重み(読み取り専用のmemmapのこともある)は書き換えない"""
+        if not self._owns_params:
+            self.params = {name: np.array(weights, dtype=np.float64, order='C') for name, weights in self.params.items()}
+            self._owns_params = True
+
+    def forward(self, x_input, should_save_output=False):
+        """ネットワークを順伝搬させて出力を計算する(ListNeuralNetwork.forwardを参照)
+
+        Args:
+            x_input: [4]または[B, 4]の入力
+
+        Returns:
+            (numpy.ndarray): [2]または[B, 2]の出力
+        """
+        x_input = np.asarray(x_input, dtype=np.float64)
+        u_hidden = x_input @ self.params['W_INPUT']
+        y_hidden = self.relu(u_hidden)
+        y_output = y_hidden @ self.params['W_HIDDEN']
+        if should_save_output:
+            self.output = {
+                'u_hidden': u_hidden,
+                'y_hidden': y_hidden,
+                'y_output': y_output,
+            }
+        return y_output
+
+    def back_propagation(self, x_input, target):
+        """誤差逆伝搬でネットワークの重みを更新する(ListNeuralNetwork.back_propagationを参照)
+
+        Args:
+            x_input: forwardに渡した[4]または[B, 4]の入力
+            target: [2]または[B, 2]の教師信号
+        """
+        if self.output is None:
+            return
+        self._copy_params()
+        x_input = np.atleast_2d(np.asarray(x_input, dtype=np.float64))
+        u_hidden = np.atleast_2d(self.output['u_hidden'])
+        y_hidden = np.atleast_2d(self.output['y_hidden'])
+        y_output = np.atleast_2d(self.output['y_output'])
+        w_hidden = self.params['W_HIDDEN']
+        scale = self.LEARNING_RATE / len(x_input)
+
+        delta_o = y_output - np.atleast_2d(np.asarray(target, dtype=np.float64))
+        # Σ_k{ δ_output_k * w_jk } * φ_h'(u_j)。w_jkは更新前の値
+        delta_w1_tmp = (delta_o @ w_hidden.T) * (u_hidden > 0)
+        w_hidden -= scale * (y_hidden.T @ delta_o)
+        self.params['W_INPUT'] -= scale * (x_input.T @ delta_w1_tmp)
+
+    @staticmethod
+    def relu(inputs):
+        """活性化関数ReLU"""
+        return np.maximum(inputs, 0.0)
+
+
+NeuralNetwork = ListNeuralNetwork if np is None else NumpyNeuralNetwork
+
+
+def check_model(pickle_path, model_path, count=1000, seed=0):
+    u"""pickleとnetwork.modelから作ったネットワークの出力を、リスト版とNumPy版のそれぞれで比べる
+
+    Returns:
+        (dict): 実装の名前 -> (出力の差の最大値, 最大の行動(argmax)が違った入力の数)
+    """
+    import random
+
+    rand = random.Random(seed)
+    inputs = [(rand.uniform(-3, 3), 0, rand.uniform(-0.45, 0.45), rand.uniform(-2, 2)) for _ in range(count)]
+    expected = load_params(pickle_path)
+    results = {}
+    implementations = [('list', ListNeuralNetwork, False)]
+    if np is not None:
+        implementations.append(('numpy', NumpyNeuralNetwork, True))
+    for name, network_class, use_numpy in implementations:
+        expected_network = network_class(expected)
+        network = network_class(load_model(model_path, use_numpy=use_numpy))
+        max_error = 0.0
+        mismatches = 0
+        for x_input in inputs:
+            expected_output = list(expected_network.forward(x_input))
+            output = list(network.forward(x_input))
+            max_error = max(max_error, max(abs(a - b) for a, b in zip(output, expected_output)))
+            mismatches += output.index(max(output)) != expected_output.index(max(expected_output))
+        results[name] = (max_error, mismatches)
+    return results
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage='%prog [options] NETWORK_PICKLE')
+    parser.add_option('-o', '--output', action='store', type='string', dest='output', default=None,
+                      help="書き出すnetwork.model(省略時は拡張子を.modelにしたもの)")
+    parser.add_option('-f', '--float32', action='store_true', dest='float32', default=False,
+                      help="重みをfloat32で書く(出力はfloat64と少し違う)")
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('specify a network pickle')
+    output = options.output or os.path.splitext(args[0])[0] + '.model'
+    save_model(output, load_params(args[0]), 'f' if options.float32 else 'd')
+    print('{} -> {} ({} bytes)'.format(args[0], output, os.path.getsize(output)))
+    failed = False
+    for name, (max_error, mismatches) in sorted(check_model(args[0], output).items()):
+        print('{}: max error {:g}, {} action mismatches'.format(name, max_error, mismatches))
+        # float64なら同じ値にならなければならない
+        failed = failed or (not options.float32 and max_error != 0.0)
+    sys.exit(1 if failed else 0)
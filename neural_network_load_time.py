@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""network.pickleとnetwork.modelを読んでNeuralNetworkを作るまでの時間とメモリ(RSS)を比べる
+
+EV3で起動したときと同じになるよう、1回ごとに新しいPythonのプロセスで
+    load   : load_paramsの時間(pickleならimport pickleも含む)
+    total  : import neural_networkからNeuralNetworkを作り終わるまでの時間
+    rss    : その間に増えたRSS(kB)
+を測り、--repeat回の最小値を表示する。listはNumPyがない(EV3と同じ)ものとしてListNeuralNetworkを使う。
+
+$ python3 neural_network_load_time.py --repeat=10
+"""
+import json
+import os
+import subprocess
+import sys
+from optparse import OptionParser
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+PATHS = (os.path.join(DIRECTORY, 'neural_control', 'network.pickle'),
+         os.path.join(DIRECTORY, 'neural_control', 'network.model'))
+REPEAT = 5
+
+# 子プロセスで実行する
+CHILD = u'''
+import json, sys, time
+if sys.argv[2] == 'list':
+    sys.modules['numpy'] = None  # import numpyをImportErrorにする
+
+
+def rss():
+    with open('/proc/self/status') as file:
+        for line in file:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+
+
+rss_before = rss()
+start = time.perf_counter()
+import neural_network
+load_start = time.perf_counter()
+params = neural_network.load_params(sys.argv[1])
+load = time.perf_counter() - load_start
+network = neural_network.NeuralNetwork(params)
+total = time.perf_counter() - start
+print(json.dumps({'load': load, 'total': total, 'rss': rss() - rss_before, 'class': type(network).__name__}))
+'''
+
+
+def measure(path, implementation, repeat):
+    u"""Returns: (dict): load, total, rssのrepeat回の最小値"""
+    results = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', CHILD, path, implementation], cwd=DIRECTORY)
+        results.append(json.loads(output.decode()))
+    best = dict((name, min(result[name] for result in results)) for name in ('load', 'total', 'rss'))
+    best['class'] = results[0]['class']
+    return best
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-r', '--repeat', action='store', type='int', dest='repeat', default=REPEAT,
+                      help="繰り返す回数")
+    options, _ = parser.parse_args()
+    for implementation in ('list', 'numpy'):
+        for path in PATHS:
+            result = measure(path, implementation, options.repeat)
+            print('{} {}: load {:.3f}ms, total {:.2f}ms, rss +{}kB ({})'.format(
+                implementation, os.path.basename(path), result['load'] * 1e3, result['total'] * 1e3,
+                result['rss'], result['class']))
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""neural_network(リスト版とNumPy版)のテスト
+
+$ python3 neural_network_test.py
+"""
+import os
+import random
+
+import numpy as np
+
+from neural_network import (MODEL_MAGIC, ListNeuralNetwork, NumpyNeuralNetwork, check_model, load_model, load_params,
+                            save_model)
+from testutil import with_directory
+
+NETWORK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'neural_control', 'network.pickle')
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'neural_control', 'network.model')
+TOLERANCE = 1e-9
+
+
+def _inputs(count, seed=0):
+    rand = random.Random(seed)
+    return [(rand.uniform(-3, 3), 0, rand.uniform(-0.45, 0.45), rand.uniform(-2, 2)) for _ in range(count)]
+
+
+def _assert_close(actual, expected):
+    assert np.allclose(np.asarray(actual, dtype=np.float64), np.asarray(expected, dtype=np.float64),
+                       rtol=0, atol=TOLERANCE), (actual, expected)
+
+
+def test_forward_matches():
+    params = load_params(NETWORK_PATH)
+    list_network = ListNeuralNetwork(params)
+    numpy_network = NumpyNeuralNetwork(params)
+    inputs = _inputs(64)
+    for x_input in inputs:
+        _assert_close(numpy_network.forward(x_input), list_network.forward(x_input))
+    # バッチ[B, 4] -> [B, 2]
+    batch = numpy_network.forward(np.array(inputs))
+    assert batch.shape == (64, 2)
+    _assert_close(batch, [list_network.forward(x_input) for x_input in inputs])
+
+
+def test_back_propagation_matches():
+    params = load_params(NETWORK_PATH)
+    list_network = ListNeuralNetwork(params)
+    numpy_network = NumpyNeuralNetwork(params)
+    for x_input in _inputs(20, seed=1):
+        list_output = list_network.forward(x_input, should_save_output=True)
+        numpy_network.forward(x_input, should_save_output=True)
+        target = [list_output[0] + 0.5, list_output[1] - 1.0]
+        list_network.back_propagation(x_input, target)
+        numpy_network.back_propagation(x_input, target)
+    _assert_close(numpy_network.params['W_INPUT'], list_network.params['W_INPUT'])
+    _assert_close(numpy_network.params['W_HIDDEN'], list_network.params['W_HIDDEN'])
+    # 重みが実際に変わっている
+    assert not np.allclose(numpy_network.params['W_INPUT'], load_params(NETWORK_PATH)['W_INPUT'])
+
+
+def test_batch_update_is_mean_of_sample_updates():
+    params = load_params(NETWORK_PATH)
+    inputs = _inputs(32, seed=2)
+    targets = [(1.0, -1.0)] * len(inputs)
+    expected = {name: np.zeros_like(np.array(params[name])) for name in ('W_INPUT', 'W_HIDDEN')}
+    for x_input, target in zip(inputs, targets):
+        network = ListNeuralNetwork(params)
+        network.forward(x_input, should_save_output=True)
+        network.back_propagation(x_input, target)
+        for name in expected:
+            expected[name] += (np.array(network.params[name]) - np.array(params[name])) / len(inputs)
+
+    numpy_network = NumpyNeuralNetwork(params)
+    numpy_network.forward(np.array(inputs), should_save_output=True)
+    numpy_network.back_propagation(np.array(inputs), np.array(targets))
+    for name in expected:
+        _assert_close(numpy_network.params[name] - np.array(params[name]), expected[name])
+
+
+def test_params_are_contiguous_copies():
+    params = load_params(NETWORK_PATH)
+    numpy_network = NumpyNeuralNetwork(params, copy=True)
+    for name in ('W_INPUT', 'W_HIDDEN'):
+        assert numpy_network.params[name].flags['C_CONTIGUOUS']
+        assert numpy_network.params[name].dtype == np.float64
+    numpy_network.params['W_INPUT'][0, 0] += 1.0
+    assert params['W_INPUT'][0][0] == load_params(NETWORK_PATH)['W_INPUT'][0][0]
+
+
+def test_model_views_are_kept_until_training():
+    u"""load_modelのビューは順伝搬ではそのまま使い、back_propagationで初めてコピーする"""
+    x_input, target = _inputs(1, seed=4)[0], (0.5, -0.5)
+    params = load_model(MODEL_PATH, use_numpy=True)
+    numpy_network = NumpyNeuralNetwork(params)
+    list_params = load_model(MODEL_PATH, use_numpy=False)
+    list_network = ListNeuralNetwork(list_params)
+    for name in ('W_INPUT', 'W_HIDDEN'):
+        assert np.shares_memory(numpy_network.params[name], params[name])
+        assert list_network.params[name] is list_params[name]
+    for network in (numpy_network, list_network):
+        network.forward(x_input, should_save_output=True)
+        network.back_propagation(x_input, target)
+    expected = load_params(NETWORK_PATH)
+    for name in ('W_INPUT', 'W_HIDDEN'):
+        assert not np.shares_memory(numpy_network.params[name], params[name])
+        assert [list(row) for row in params[name]] == expected[name]
+        assert [list(row) for row in list_params[name]] == expected[name]
+        _assert_close(numpy_network.params[name], list_network.params[name])
+    assert not np.allclose(numpy_network.params['W_INPUT'], expected['W_INPUT'])
+
+
+def test_committed_model_matches_pickle():
+    u"""neural_control/network.modelはnetwork.pickleをfloat64で変換したもの"""
+    expected = load_params(NETWORK_PATH)
+    for use_numpy in (True, False):
+        params = load_model(MODEL_PATH, use_numpy=use_numpy)
+        for name in ('W_INPUT', 'W_HIDDEN'):
+            assert [list(row) for row in params[name]] == expected[name]
+    for max_error, mismatches in check_model(NETWORK_PATH, MODEL_PATH, count=200).values():
+        assert max_error == 0.0 and mismatches == 0
+
+
+@with_directory
+def test_save_and_load_model(directory):
+    path = os.path.join(directory, 'model', 'network.model')  # ディレクトリがなければ作る
+    save_model(path, load_params(NETWORK_PATH))
+    with open(path, 'rb') as file:
+        assert file.read(len(MODEL_MAGIC)) == MODEL_MAGIC
+    # NumPyはファイルをマップした読み取り専用の配列、なければ各行のmemoryview
+    params = load_model(path, use_numpy=True)
+    assert isinstance(params['W_INPUT'].base, np.memmap)
+    assert params['W_INPUT'].shape == (4, 16) and params['W_HIDDEN'].shape == (16, 2)
+    assert not params['W_INPUT'].flags['WRITEABLE']
+    rows = load_model(path, use_numpy=False)['W_HIDDEN']
+    assert len(rows) == 16 and isinstance(rows[0], memoryview) and len(rows[0]) == 2
+    # load_paramsは形式を見分ける。どちらから作ったネットワークも同じ出力
+    pickle_network = NumpyNeuralNetwork(load_params(NETWORK_PATH))
+    model_network = NumpyNeuralNetwork(load_params(path))
+    pickle_list_network = ListNeuralNetwork(load_params(NETWORK_PATH))
+    model_list_network = ListNeuralNetwork(load_params(path))
+    for x_input in _inputs(64, seed=3):
+        assert np.array_equal(model_network.forward(x_input), pickle_network.forward(x_input))
+        assert model_list_network.forward(x_input) == pickle_list_network.forward(x_input)
+
+
+@with_directory
+def test_float32_model(directory):
+    path = os.path.join(directory, 'network.model')
+    save_model(path, load_params(NETWORK_PATH), 'f')
+    assert os.path.getsize(path) == 64 + (4 * 16 + 16 * 2) * 4
+    params = load_model(path)
+    assert params['W_INPUT'].dtype == np.float32
+    _assert_close(np.array(params['W_INPUT'], dtype=np.float64),
+                  np.array(load_params(NETWORK_PATH)['W_INPUT'], dtype=np.float32))
+    for max_error, mismatches in check_model(NETWORK_PATH, path, count=200).values():
+        assert 0.0 < max_error < 1e-3 and mismatches == 0
+
+
+@with_directory
+def test_load_model_errors(directory):
+    path = os.path.join(directory, 'network.model')
+    save_model(path, load_params(NETWORK_PATH))
+    with open(path, 'rb') as file:
+        data = file.read()
+    cases = (
+        (b'NOTMODEL' + data[8:], 'not a network model'),
+        (data[:8] + b'\x09\x00' + data[10:], 'version'),
+        (data[:-8], None),  # 途中で切れている
+    )
+    for broken, message in cases:
+        with open(path, 'wb') as file:
+            file.write(broken)
+        for use_numpy in (True, False):
+            try:
+                load_model(path, use_numpy=use_numpy)
+            except ValueError as error:
+                assert message is None or message in str(error), error
+            else:
+                assert False, 'expected ValueError'
+
+
+if __name__ == '__main__':
+    test_forward_matches()
+    test_back_propagation_matches()
+    test_batch_update_is_mean_of_sample_updates()
+    test_params_are_contiguous_copies()
+    test_model_views_are_kept_until_training()
+    test_committed_model_matches_pickle()
+    test_save_and_load_model()
+    test_float32_model()
+    test_load_model_errors()
+    print('ok')
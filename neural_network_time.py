@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""ニューラルネットワークのリスト版とNumPy版の順伝搬・誤差逆伝搬の時間を比べる
+
+リスト版はバッチを1サンプルずつ計算する。
+$ python3 neural_network_time.py --batch-sizes=1,1024 --repeat=200
+"""
+import os
+import random
+import time
+from optparse import OptionParser
+
+from neural_network import ListNeuralNetwork, NumpyNeuralNetwork, load_params, np
+
+BATCH_SIZES = '1,1024'
+REPEAT = 200
+NETWORK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'neural_control', 'network.pickle')
+
+
+def make_inputs(count, seed=0):
+    rand = random.Random(seed)
+    return [(rand.uniform(-3, 3), 0, rand.uniform(-0.45, 0.45), rand.uniform(-2, 2)) for _ in range(count)]
+
+
+def test_list(params, inputs, repeat):
+    u"""リスト版。1サンプルずつforwardとback_propagation
+
+    Returns:
+        (tuple): (forwardの時間, forward + back_propagationの時間)。どちらもバッチ1回あたり
+    """
+    network = ListNeuralNetwork(params)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for x_input in inputs:
+            network.forward(x_input)
+    forward = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for x_input in inputs:
+            output = network.forward(x_input, should_save_output=True)
+            network.back_propagation(x_input, output)  # 教師信号 = 出力なので重みは変わらない
+    return forward, (time.perf_counter() - start) / repeat
+
+
+def test_numpy(params, inputs, repeat):
+    u"""NumPy版。バッチ1つを[B, 4]で(B=1なら[4]で)まとめて計算する"""
+    network = NumpyNeuralNetwork(params)
+    batch = np.array(inputs) if len(inputs) > 1 else np.array(inputs[0])
+    start = time.perf_counter()
+    for _ in range(repeat):
+        network.forward(batch)
+    forward = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        output = network.forward(batch, should_save_output=True)
+        network.back_propagation(batch, output)
+    return forward, (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-b', '--batch-sizes', action='store', type='string', dest='batch_sizes', default=BATCH_SIZES,
+                      help="バッチの大きさ(カンマ区切り)")
+    parser.add_option('-r', '--repeat', action='store', type='int', dest='repeat', default=REPEAT,
+                      help="繰り返す回数")
+    options, _ = parser.parse_args()
+    params = load_params(NETWORK_PATH)
+    for batch_size in [int(size) for size in options.batch_sizes.split(',')]:
+        inputs = make_inputs(batch_size)
+        for name, test in (('list', test_list), ('numpy', test_numpy)):
+            if name == 'numpy' and np is None:
+                continue
+            forward, train = test(params, inputs, options.repeat)
+            print('B={} {}: forward {:.1f}us ({:.2f}us/sample), forward+backprop {:.1f}us ({:.2f}us/sample)'.format(
+                batch_size, name, forward * 1e6, forward * 1e6 / batch_size, train * 1e6, train * 1e6 / batch_size))
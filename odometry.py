@@ -1,10 +1,83 @@
 # coding:utf-8
 import time
+from array import array
 from math import *
 
+from telemetry import TelemetryWriter
+
+
+# オドメトリのログ(1行 = FIELDS個のfloat)
+# 1つのarray('d')に行を続けて書き込み、いっぱいになったら倍に広げる(max_rowsを指定した場合は古い行から上書きする)
+# 文字列にするのはwrite_csv/save_npyの時だけ
+class PoseLog:
+    FIELDS = ('left_angle', 'right_angle', 'cur_dis', 'cur_dir', 'pos_x', 'pos_y',
+              'target_dis', 'target_dir', 'total_distance', 'total_direction')
+    INT_FIELDS = 2  # 先頭のこの数の列(モータ角度)は整数としてCSVに書く
+
+    def __init__(self, capacity=10000, max_rows=None):
+        # capacity 最初に確保する行数
+        # max_rows 保持する最大行数。Noneなら上限なし
+        if max_rows is not None:
+            capacity = max_rows
+        self.max_rows = max_rows
+        self._width = len(self.FIELDS)
+        self._data = array('d', bytes(8 * self._width * capacity))
+        self._capacity = capacity
+        self.rows = 0  # これまでに書き込んだ行数(上書きした行も含む)
+
+    def __len__(self):
+        return min(self.rows, self._capacity)
+
+    def append(self, left_angle, right_angle, cur_dis, cur_dir, pos_x, pos_y,
+               target_dis, target_dir, total_distance, total_direction):
+        row = self.rows
+        if row >= self._capacity:
+            if self.max_rows is None:
+                # 倍に広げる
+                self._data.extend(array('d', bytes(8 * self._width * self._capacity)))
+                self._capacity *= 2
+            else:
+                row %= self._capacity
+        data = self._data
+        base = row * self._width
+        data[base] = left_angle
+        data[base + 1] = right_angle
+        data[base + 2] = cur_dis
+        data[base + 3] = cur_dir
+        data[base + 4] = pos_x
+        data[base + 5] = pos_y
+        data[base + 6] = target_dis
+        data[base + 7] = target_dir
+        data[base + 8] = total_distance
+        data[base + 9] = total_direction
+        self.rows += 1
+
+    # 古い順に行(タプル)を返す
+    def __iter__(self):
+        count = len(self)
+        first = self.rows - count
+        width = self._width
+        for index in range(first, first + count):
+            base = (index % self._capacity) * width
+            yield tuple(self._data[base:base + width])
+
+    def write_csv(self, file):
+        int_fields = self.INT_FIELDS
+        for row in self:
+            values = [int(value) for value in row[:int_fields]] + list(row[int_fields:])
+            file.write(",".join(str(value) for value in values))
+            file.write("\n")
+
+    # NumPyの.npy(行数 x FIELDS)で保存する
+    def save_npy(self, path):
+        import numpy as np
+        np.save(path, np.array(list(self), dtype=np.float64).reshape(len(self), self._width))
+
+
 class Odometry:
 
-    def __init__(self):
+    def __init__(self, telemetry_path=None):
+        # telemetry_path odmetry_logsと同じ行を書き込むテレメトリのファイル(落ちても残る)。Noneなら書き込まない
         self.distance = 0.0  # 走行距離
         self.distance_periodic_L = 0.0  # 左タイヤの4ms間の距離
         self.distance_periodic_R = 0.0  # 右タイヤの4ms間の距離
@@ -49,8 +122,10 @@ class Odometry:
 
         self.cur_target_index =0
 
-        self.odmetry_logs = ["" for _ in range(10000)]
-        self.odmetry_log_pointer = 0
+        self.odmetry_logs = PoseLog()
+        self.telemetry = None
+        if telemetry_path is not None:
+            self.telemetry = TelemetryWriter(telemetry_path, [(name, 'd') for name in PoseLog.FIELDS])
 
 
         # # 目標座標までの方位，距離を格納
@@ -121,7 +196,7 @@ class Odometry:
 
 
         #log
-        self.odmetry_logs[self.odmetry_log_pointer] = "{},{},{},{},{},{},{},{},{},{}".format(
+        self.odmetry_logs.append(
             left_angle,
             right_angle,
             cur_dis,
@@ -132,7 +207,10 @@ class Odometry:
             target_dir,
             self.total_distance,
             self.total_direction)
-        self.odmetry_log_pointer += 1
+        if self.telemetry is not None:
+            self.telemetry.write(
+                left_angle, right_angle, cur_dis, cur_dir, pos_x, pos_y,
+                target_dis, target_dir, self.total_distance, self.total_direction)
 
         return speed, direction
 
@@ -185,9 +263,102 @@ class Odometry:
         target_dir = target_dir * 180.0 / self.PI
         return target_dir
 
-    def shutdown(self, log_datetime):
+    def shutdown(self, log_datetime, npy=False):
+        # npy Trueなら.npyでも保存する(NumPyが必要)
         log_file = open("./log/log_odometry_{}.csv".format(log_datetime), 'w')
-        for log in self.odmetry_logs:
-            if log != "":
-                log_file.write("{}\n".format(log))
+        self.odmetry_logs.write_csv(log_file)
         log_file.close()
+        if npy:
+            self.odmetry_logs.save_npy("./log/log_odometry_{}.npy".format(log_datetime))
+        if self.telemetry is not None:
+            self.telemetry.close()
+
+
+# 高頻度で呼ぶためのオドメトリ
+# 各周期の移動は、その周期の中間の方位に直進したとみなして積分する(円弧の中間の方位)
+# 方位は開始からの左右の回転角度の差(整数)だけで決まるので、update()では
+# 「中間の方位(回転角度の差の2倍, 整数) -> その方位に進んだ左右の回転角度の合計(整数)」を足すだけにして、
+# cos/sinを使う座標(float)の計算は pose() などで必要になった時にまとめて行う
+class OdometryEngine:
+    __slots__ = (
+        'left_count', 'right_count',  # 最新のエンコーダ値(deg)
+        '_start_left', '_start_right',  # 開始時のエンコーダ値
+        '_turn_counts',  # 開始からの回転角度の差(右 - 左)
+        '_pending',  # 座標に反映していない移動 {中間の方位の回転角度の差の2倍: 左右の回転角度の合計}
+        '_x', '_y',  # _pendingを反映済みの座標(mm)
+        '_half_mm_per_count', '_half_rad_per_count', '_deg_per_count', '_rad_to_deg',
+    )
+
+    TREAD = 132.6  # 車体トレッド幅(132.6mm)
+    PI = 3.14159265358
+    TIRE_DIAMETER = 81.0  # タイヤ直径（81mm）
+
+    def __init__(self, left_count=0, right_count=0, tread=TREAD, tire_diameter=TIRE_DIAMETER):
+        # 1度あたりのタイヤの進行距離(mm)
+        mm_per_count = (self.PI * tire_diameter) / 360.0
+        # 左右の回転角度の合計1度あたりの走行距離
+        self._half_mm_per_count = mm_per_count / 2.0
+        # 回転角度の差(の2倍)1度あたりの方位の変化
+        self._half_rad_per_count = mm_per_count / tread / 2.0
+        self._rad_to_deg = 180.0 / self.PI
+        self._deg_per_count = mm_per_count / tread * self._rad_to_deg
+        self._pending = {}
+        self.reset(left_count, right_count)
+
+    def reset(self, left_count=0, right_count=0):
+        self.left_count = left_count
+        self.right_count = right_count
+        self._start_left = left_count
+        self._start_right = right_count
+        self._turn_counts = 0
+        self._pending.clear()
+        self._x = 0.0
+        self._y = 0.0
+
+    # エンコーダ値を更新する(毎周期呼ぶ)。整数の計算だけを行う
+    def update(self, left_count, right_count):
+        delta_left = left_count - self.left_count
+        delta_right = right_count - self.right_count
+        self.left_count = left_count
+        self.right_count = right_count
+        turn_counts = self._turn_counts
+        self._turn_counts = turn_counts + delta_right - delta_left
+        key = turn_counts + self._turn_counts  # 中間の方位の2倍
+        pending = self._pending
+        pending[key] = pending.get(key, 0) + delta_left + delta_right
+
+    # ためておいた移動を座標に反映する
+    def _integrate(self):
+        half_mm_per_count = self._half_mm_per_count
+        half_rad_per_count = self._half_rad_per_count
+        x = self._x
+        y = self._y
+        for key, counts in self._pending.items():
+            heading = key * half_rad_per_count
+            distance = counts * half_mm_per_count
+            x += distance * cos(heading)
+            y += distance * sin(heading)
+        self._pending.clear()
+        self._x = x
+        self._y = y
+
+    # 現在の座標 (x(mm), y(mm), 方位(度))
+    def pose(self):
+        if self._pending:
+            self._integrate()
+        return self._x, self._y, self.direction
+
+    # 開始からの走行距離(mm)
+    @property
+    def distance(self):
+        return ((self.left_count - self._start_left) + (self.right_count - self._start_right)) * self._half_mm_per_count
+
+    # 開始からの方位(度)。Odometry.total_directionと同じく右 - 左が正
+    @property
+    def direction(self):
+        return self._turn_counts * self._deg_per_count
+
+    # 現在地から目標座標までの距離(mm)と方位(度)
+    def target(self, x, y):
+        pos_x, pos_y, _ = self.pose()
+        return hypot(x - pos_x, y - pos_y), atan2(y - pos_y, x - pos_x) * self._rad_to_deg
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""OdometryEngineのテスト
+
+$ python3 odometry_engine_test.py
+"""
+import math
+
+from odometry import OdometryEngine
+
+
+def test_straight_line():
+    engine = OdometryEngine()
+    for count in range(0, 3601, 10):
+        engine.update(count, count)
+    x, y, heading = engine.pose()
+    # 10回転 = 直径81mmの円周の10倍
+    assert abs(x - OdometryEngine.PI * 81.0 * 10) < 1e-9
+    assert y == 0.0 and heading == 0.0
+    assert abs(engine.distance - x) < 1e-9
+
+
+def test_lazy_pose_matches_per_tick():
+    u"""曲率が変わっても、毎周期pose()を呼んだ場合と同じ座標になる"""
+    lazy = OdometryEngine()
+    per_tick = OdometryEngine()
+    left, right = 0, 0
+    for tick in range(3000):
+        left += 6
+        right += 6 + int(4 * math.sin(tick / 100.0))
+        lazy.update(left, right)
+        per_tick.update(left, right)
+        per_tick.pose()
+    for actual, expected in zip(lazy.pose(), per_tick.pose()):
+        assert abs(actual - expected) < 1e-6
+
+
+def test_circle_matches_closed_form():
+    u"""左右の速度が一定なら半径R = tread * (L + R) / 2(R - L) の円を描く"""
+    engine = OdometryEngine()
+    left, right = 0, 0
+    for _ in range(2000):
+        left += 3
+        right += 5
+        engine.update(left, right)
+    x, y, heading = engine.pose()
+    mm_per_count = OdometryEngine.PI * OdometryEngine.TIRE_DIAMETER / 360.0
+    radius = OdometryEngine.TREAD * (left + right) / (2.0 * (right - left))
+    theta = (right - left) * mm_per_count / OdometryEngine.TREAD
+    # 中間の方位で直進とみなす誤差は1周期あたり(進んだ距離 * 方位の変化^2 / 24)程度
+    assert abs(x - radius * math.sin(theta)) < 1e-2
+    assert abs(y - radius * (1 - math.cos(theta))) < 1e-2
+    assert abs(heading - theta * 180.0 / OdometryEngine.PI) < 1e-9
+
+
+def test_target():
+    engine = OdometryEngine()
+    distance, direction = engine.target(100.0, 100.0)
+    assert abs(distance - math.hypot(100, 100)) < 1e-9
+    assert abs(direction - 45.0) < 1e-6
+
+
+if __name__ == '__main__':
+    test_straight_line()
+    test_lazy_pose_matches_per_tick()
+    test_circle_matches_closed_form()
+    test_target()
+    print('ok')
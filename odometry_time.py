@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""Odometry.target_traceとOdometryEngineの1秒あたりの呼び出し回数を比べる
+
+合成したエンコーダ値の列(左右の速度がゆっくり変わるS字走行)を使う
+$ python3 odometry_time.py --ticks=100000 --pose-every=1,10,100
+"""
+import math
+import time
+from optparse import OptionParser
+
+from odometry import Odometry, OdometryEngine
+
+TICKS = 100000
+POSE_EVERY = '1,10,100'
+TARGET = (400.0, 1000.0)
+
+
+def make_stream(count):
+    u"""(左エンコーダ値, 右エンコーダ値)のリスト"""
+    stream = []
+    left, right = 0, 0
+    for tick in range(count):
+        left += 3
+        right += 3 + int(round(2 * math.sin(tick / 250.0)))
+        stream.append((left, right))
+    return stream
+
+
+def test_target_trace(stream):
+    u"""Odometry.target_traceを毎周期呼ぶ"""
+    odometry = Odometry()
+    start = time.perf_counter()
+    for left, right in stream:
+        odometry.target_trace(left, right)
+    return time.perf_counter() - start
+
+
+def test_engine(stream, pose_every):
+    u"""OdometryEngine.updateを毎周期、pose_every周期ごとに目標までの距離と方位を計算する"""
+    engine = OdometryEngine()
+    target_x, target_y = TARGET
+    start = time.perf_counter()
+    for tick, (left, right) in enumerate(stream):
+        engine.update(left, right)
+        if tick % pose_every == 0:
+            engine.target(target_x, target_y)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-t', '--ticks', action='store', type='int', dest='ticks', default=TICKS,
+                      help="エンコーダ値の数")
+    parser.add_option('-p', '--pose-every', action='store', type='string', dest='pose_every', default=POSE_EVERY,
+                      help="OdometryEngineで座標を計算する間隔(周期, カンマ区切り)")
+    options, _ = parser.parse_args()
+    stream = make_stream(options.ticks)
+    elapsed = test_target_trace(stream)
+    print('Odometry.target_trace: {:.0f} calls/s ({:.2f}us/call)'.format(
+        options.ticks / elapsed, elapsed / options.ticks * 1000000))
+    for pose_every in [int(value) for value in options.pose_every.split(',')]:
+        elapsed = test_engine(stream, pose_every)
+        print('OdometryEngine (pose every {}): {:.0f} calls/s ({:.2f}us/call)'.format(
+            pose_every, options.ticks / elapsed, elapsed / options.ticks * 1000000))
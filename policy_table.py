@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""ニューラルネットワークのgreedyな行動を格子の表にして、表引きだけで行動を決める
+
+ロボットはAgent.decide_action(greedy=True)でQ値の大きい方の行動しか使わないので、
+状態(make_inputsの4つ: position, velocity, angle, rate)の各軸を等間隔に区切った格子の点ごとにネットワークの行動を求め、
+1点1ビット(行動は2つ)のbytearrayにまとめておく。行動を決めるときは各軸の一番近い格子点を求めて1ビット読むだけになる。
+
+    table = compile_table(load_params('network.model'))     # 既定の格子はDEFAULT_GRID
+    save_table('network.policy', table)
+    agent = TablePolicy(load_table('network.policy'), list(Action))
+    action = agent.decide_action(inputs, greedy=True)
+
+格子の範囲の外の値は端の格子点に丸める。センサー値は整数なので、間隔を0.01(センサー値1)にした軸は丸めの誤差がない。
+
+network.policyの形式(リトルエンディアン)
+    ヘッダ(16バイト) : TABLE_MAGIC, バージョン(H), 軸の数(H), ビット列のバイト数(I)
+    軸ごと(32バイト) : 名前(12s, 0埋め), 格子点の数(I), 最小値(d), 最大値(d)
+    ビット列         : 格子点の番号(最後の軸が一番速く変わる)iの行動がバイトi // 8のビットi % 8
+
+$ python3 policy_table.py ./neural_control/network.model -o ./neural_control/network.policy --rate=-5,5,201
+"""
+import itertools
+import os
+import random
+import struct
+import time
+from optparse import OptionParser
+
+from neural_network import ListNeuralNetwork, NumpyNeuralNetwork, load_params, np
+
+# 軸 (名前, 最小値, 最大値, 格子点の数)。値はmake_inputsの後(センサー値 / 100)
+DEFAULT_GRID = (
+    ('position', -5.0, 5.0, 201),  # 左モータのエンコーダ値 ±500deg を5degごと
+    ('velocity', 0.0, 0.0, 1),  # make_inputsでは常に0
+    ('angle', -0.45, 0.45, 91),  # ジャイロ角度 ±45deg(これを超えたら倒れている)を1degごと
+    ('rate', -5.0, 5.0, 201),  # ジャイロ角速度 ±500deg/s を5deg/sごと
+)
+COMPILE_CHUNK = 65536  # NumPyで一度に順伝搬させる格子点の数
+TABLE_MAGIC = b'EV3POLCY'
+TABLE_VERSION = 1
+_TABLE_HEADER = struct.Struct('<8sHHI')
+_TABLE_AXIS = struct.Struct('<12sIdd')
+
+
+class PolicyTable(object):
+    u"""格子点ごとの行動(0か1)のビット列"""
+
+    def __init__(self, grid, bits):
+        u"""
+        Args:
+            grid (tuple): 軸 (名前, 最小値, 最大値, 格子点の数) の並び。格子点が2つ以上なら最大値 > 最小値
+            bits (bytearray): 格子点の行動のビット列
+        """
+        self.grid = _check_grid(grid)
+        self.shape = tuple(count for _, _, _, count in self.grid)
+        self.size = 1
+        for count in self.shape:
+            self.size *= count
+        if len(bits) != (self.size + 7) // 8:
+            raise ValueError('{} bytes for {} cells'.format(len(bits), self.size))
+        self.bits = bits
+        # 軸ごとに (最小値, 1/間隔, 最後の格子点, 番号の刻み)
+        axes = []
+        stride = self.size
+        for _, low, high, count in self.grid:
+            stride //= count
+            axes.append((low, (count - 1) / (high - low) if count > 1 else 0.0, count - 1, stride))
+        self._axes = tuple(axes)
+
+    def centers(self, axis):
+        u"""軸の格子点の値"""
+        _, low, high, count = self.grid[axis]
+        if count == 1:
+            return [low]
+        return [low + (high - low) * index / (count - 1) for index in range(count)]
+
+    def index(self, state):
+        u"""状態に一番近い格子点の番号"""
+        index = 0
+        for value, (low, scale, last, stride) in zip(state, self._axes):
+            cell = int((value - low) * scale + 0.5)
+            if cell < 0:
+                cell = 0
+            elif cell > last:
+                cell = last
+            index += cell * stride
+        return index
+
+    def lookup(self, state):
+        u"""状態の行動(0か1)"""
+        index = self.index(state)
+        return (self.bits[index >> 3] >> (index & 7)) & 1
+
+
+class TablePolicy(object):
+    u"""PolicyTableで行動を決めるエージェント(Agentのdecide_actionと同じ使い方。学習はしない)"""
+
+    def __init__(self, table, actions=(0, 1), epsilon=0.15):
+        u"""
+        Args:
+            table (PolicyTable): 行動の表
+            actions (sequence): 行動の番号 -> 返す行動(neural_controlならlist(Action))
+            epsilon (float): greedyでないときの探索率ε
+        """
+        self.table = table
+        self.actions = tuple(actions)
+        self.epsilon = epsilon
+
+    def decide_action(self, state, greedy=False, should_save_output=False):
+        u"""方策に応じて行動を選択する(should_save_outputは順伝搬しないので使わない)"""
+        if not greedy and random.random() < self.epsilon:
+            return self.actions[random.random() >= 0.5]
+        return self.actions[self.table.lookup(state)]
+
+
+def compile_table(params, grid=DEFAULT_GRID, chunk=COMPILE_CHUNK):
+    u"""ネットワークの重みから格子点ごとのgreedyな行動の表を作る
+
+    NumPyがあればNumpyNeuralNetworkでchunk個ずつまとめて、なければListNeuralNetworkで1点ずつ順伝搬させる。
+    Q値が同じならAgent._greedyと同じく番号の小さい行動にする。
+    """
+    grid = _check_grid(grid)
+    table = PolicyTable(grid, bytearray((_grid_size(grid) + 7) // 8))
+    if ListNeuralNetwork.OUTPUT_LAYER_NEURONS != 2:
+        raise ValueError('a policy table holds 1 bit per cell (2 actions)')
+    bits = table.bits
+    if np is None:
+        network = ListNeuralNetwork(params)
+        for index, state in enumerate(itertools.product(*[table.centers(axis) for axis in range(len(grid))])):
+            action_values = network.forward(state)
+            if action_values[1] > action_values[0]:
+                bits[index >> 3] |= 1 << (index & 7)
+        return table
+    network = NumpyNeuralNetwork(params)
+    centers = [np.array(table.centers(axis)) for axis in range(len(grid))]
+    actions = np.empty(table.size, dtype=np.uint8)
+    states = np.empty((chunk, len(grid)))
+    for start in range(0, table.size, chunk):
+        end = min(start + chunk, table.size)
+        for axis, index in enumerate(np.unravel_index(np.arange(start, end), table.shape)):
+            states[:end - start, axis] = centers[axis][index]
+        actions[start:end] = network.forward(states[:end - start]).argmax(axis=1)
+    bits[:] = np.packbits(actions, bitorder='little').tobytes()
+    return table
+
+
+def _check_grid(grid):
+    u"""軸の値を(名前, float, float, int)にそろえ、格子点の数と範囲を確かめる"""
+    grid = tuple((name, float(low), float(high), int(count)) for name, low, high, count in grid)
+    for name, low, high, count in grid:
+        if count < 1:
+            raise ValueError('axis {}: count must be at least 1, got {}'.format(name, count))
+        if count > 1 and not high > low:
+            raise ValueError('axis {}: {} points need high > low, got {:g},{:g}'.format(name, count, low, high))
+    return grid
+
+
+def _grid_size(grid):
+    size = 1
+    for _, _, _, count in grid:
+        size *= count
+    return size
+
+
+def save_table(path, table):
+    u"""表をnetwork.policyの形式で書く"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(_TABLE_HEADER.pack(TABLE_MAGIC, TABLE_VERSION, len(table.grid), len(table.bits)))
+        for name, low, high, count in table.grid:
+            file.write(_TABLE_AXIS.pack(name.encode(), count, low, high))
+        file.write(table.bits)
+    os.replace(temporary, path)
+
+
+def load_table(path):
+    u"""save_tableで書いた表を読む"""
+    with open(path, 'rb') as file:
+        header = file.read(_TABLE_HEADER.size)
+        if len(header) != _TABLE_HEADER.size or not header.startswith(TABLE_MAGIC):
+            raise ValueError('{} is not a policy table'.format(path))
+        _, version, axis_count, byte_count = _TABLE_HEADER.unpack(header)
+        if version != TABLE_VERSION:
+            raise ValueError('unsupported policy table version: {}'.format(version))
+        grid = []
+        for _ in range(axis_count):
+            name, count, low, high = _TABLE_AXIS.unpack(file.read(_TABLE_AXIS.size))
+            grid.append((name.rstrip(b'\0').decode(), low, high, count))
+        bits = bytearray(byte_count)
+        if file.readinto(bits) != byte_count:
+            raise ValueError('{} is truncated'.format(path))
+    return PolicyTable(grid, bits)
+
+
+def disagreement(table, params, states):
+    u"""状態の並びで、表とネットワークのgreedyな行動が違う割合"""
+    if np is None:
+        network = ListNeuralNetwork(params)
+        expected = [int(values[1] > values[0]) for values in map(network.forward, states)]
+    else:
+        expected = NumpyNeuralNetwork(params).forward(np.asarray(states, dtype=np.float64)).argmax(axis=1).tolist()
+    mismatches = sum(table.lookup(state) != action for state, action in zip(states, expected))
+    return mismatches / len(states)
+
+
+def sensor_states(count, seed=0, position=500, angle=45, rate=500):
+    u"""一様乱数の整数のセンサー値からmake_inputsと同じように作った状態"""
+    rand = random.Random(seed)
+    return [(rand.randint(-position, position) / 100, 0, rand.randint(-angle, angle) / 100,
+             rand.randint(-rate, rate) / 100) for _ in range(count)]
+
+
+def rollout_states(params, envs=256, steps=200, seed=0):
+    u"""balance_envでネットワークのε-greedyな方策で走らせたときの状態(実際に現れる状態の分布)"""
+    from balance_env import VectorBalanceEnv, epsilon_greedy
+
+    network = NumpyNeuralNetwork(params)
+    env = VectorBalanceEnv(envs, seed=seed)
+    random_ = np.random.default_rng(seed)
+    states = [env.reset().copy()]
+    for _ in range(steps - 1):
+        env.step(epsilon_greedy(network, states[-1], 0.15, random_))
+        states.append(env.states.copy())
+    return [tuple(state) for state in np.concatenate(states)]
+
+
+def _parse_axis(text):
+    low, high, count = text.split(',')
+    return float(low), float(high), int(count)
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage='%prog [options] NETWORK')
+    parser.add_option('-o', '--output', action='store', type='string', dest='output', default=None,
+                      help="書き出す表(省略時は拡張子を.policyにしたもの)")
+    for name, low, high, count in DEFAULT_GRID:
+        parser.add_option('--' + name, action='store', type='string', dest=name,
+                          default='{:g},{:g},{}'.format(low, high, count), help="{}の軸(最小値,最大値,格子点の数)".format(name))
+    parser.add_option('-n', '--samples', action='store', type='int', dest='samples', default=100000,
+                      help="一致率を調べる状態の数")
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('specify a network file')
+    params = load_params(args[0])
+    grid = tuple((name,) + _parse_axis(getattr(options, name)) for name, _, _, _ in DEFAULT_GRID)
+    start = time.perf_counter()
+    try:
+        table = compile_table(params, grid)
+    except ValueError as error:
+        parser.error(str(error))
+    elapsed = time.perf_counter() - start
+    output = options.output or os.path.splitext(args[0])[0] + '.policy'
+    save_table(output, table)
+    print('{} cells ({} bytes) in {:.2f}s -> {}'.format(table.size, len(table.bits), elapsed, output))
+    print('disagreement on uniform sensor values: {:.3%}'.format(
+        disagreement(table, params, sensor_states(options.samples))))
+    if np is not None:
+        states = rollout_states(params)
+        print('disagreement on simulated runs: {:.3%} ({} states)'.format(disagreement(table, params, states),
+                                                                         len(states)))
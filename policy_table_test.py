@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""policy_tableのテスト
+
+$ python3 policy_table_test.py
+"""
+import os
+
+import policy_table
+from neural_network import NumpyNeuralNetwork, load_params
+from policy_table import (PolicyTable, TablePolicy, compile_table, disagreement, load_table, rollout_states,
+                          save_table, sensor_states)
+from testutil import with_directory
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'neural_control', 'network.model')
+SMALL_GRID = (('position', -2.0, 2.0, 9), ('velocity', 0.0, 0.0, 1), ('angle', -0.4, 0.4, 9),
+              ('rate', -4.0, 4.0, 17))
+
+
+def test_compile_matches_network_at_cells():
+    params = load_params(MODEL_PATH)
+    network = NumpyNeuralNetwork(params)
+    table = compile_table(params, SMALL_GRID, chunk=100)  # 途中で区切っても同じ
+    assert table.size == 9 * 9 * 17 and len(table.bits) == (table.size + 7) // 8
+    actions = set()
+    for position in table.centers(0):
+        for angle in table.centers(2):
+            for rate in table.centers(3):
+                state = (position, 0.0, angle, rate)
+                action = table.lookup(state)
+                assert action == int(network.forward(state).argmax()), state
+                actions.add(action)
+    assert actions == {0, 1}
+
+
+def test_compile_without_numpy():
+    params = load_params(MODEL_PATH)
+    expected = compile_table(params, SMALL_GRID)
+    numpy = policy_table.np
+    policy_table.np = None
+    try:
+        table = compile_table(params, SMALL_GRID)  # ListNeuralNetworkで1点ずつ
+    finally:
+        policy_table.np = numpy
+    assert table.bits == expected.bits
+
+
+def test_index_rounds_and_clamps():
+    table = PolicyTable(SMALL_GRID, bytearray((9 * 9 * 17 + 7) // 8))
+    assert table.index((-2.0, 0.0, -0.4, -4.0)) == 0
+    assert table.index((2.0, 0.0, 0.4, 4.0)) == table.size - 1
+    # 一番近い格子点。範囲の外は端
+    assert table.index((0.0, 0.0, 0.0, 0.26)) == table.index((0.0, 0.0, 0.0, 0.5))
+    assert table.index((0.0, 0.0, 0.0, 0.24)) == table.index((0.0, 0.0, 0.0, 0.0))
+    assert table.index((-9.0, 3.0, 9.0, -9.0)) == table.index((-2.0, 0.0, 0.4, -4.0))
+    assert table.index((0.5, 0.0, -0.1, 1.0)) == 5 * 9 * 17 + 3 * 17 + 10
+    table.bits[0] = 0b10
+    assert table.lookup((-2.0, 0.0, -0.4, -3.5)) == 1 and table.lookup((-2.0, 0.0, -0.4, -4.0)) == 0
+
+
+def test_rejects_degenerate_axes():
+    for axis, message in ((('velocity', 0.0, 0.0, 3), 'high > low'), (('velocity', 1.0, -1.0, 2), 'high > low'),
+                          (('velocity', 0.0, 0.0, 0), 'at least 1'), (('velocity', -1.0, 1.0, -2), 'at least 1')):
+        grid = SMALL_GRID[:1] + (axis,) + SMALL_GRID[2:]
+        try:
+            compile_table(load_params(MODEL_PATH), grid)
+        except ValueError as error:
+            assert message in str(error) and 'velocity' in str(error), error
+        else:
+            assert False, 'expected ValueError for {}'.format(axis)
+    # 格子点が1つなら最小値と最大値が同じでよい(DEFAULT_GRIDのvelocity)
+    assert PolicyTable(SMALL_GRID, bytearray((9 * 9 * 17 + 7) // 8)).centers(1) == [0.0]
+
+
+def test_agreement_with_network():
+    params = load_params(MODEL_PATH)
+    table = compile_table(params, (('position', -5.0, 5.0, 101), ('velocity', 0.0, 0.0, 1),
+                                   ('angle', -0.45, 0.45, 91), ('rate', -5.0, 5.0, 101)))
+    assert disagreement(table, params, sensor_states(20000)) < 0.01
+    assert disagreement(table, params, rollout_states(params, envs=64, steps=100)) < 0.01
+
+
+@with_directory
+def test_save_and_load(directory):
+    table = compile_table(load_params(MODEL_PATH), SMALL_GRID)
+    path = os.path.join(directory, 'policy', 'network.policy')  # ディレクトリがなければ作る
+    save_table(path, table)
+    loaded = load_table(path)
+    assert loaded.grid == table.grid and loaded.bits == table.bits
+    with open(path, 'rb') as file:
+        data = file.read()
+    for broken, message in ((b'NOTTABLE' + data[8:], 'not a policy table'),
+                            (data[:8] + b'\x09\x00' + data[10:], 'version'),
+                            (data[:-1], 'truncated')):
+        with open(path, 'wb') as file:
+            file.write(broken)
+        try:
+            load_table(path)
+        except ValueError as error:
+            assert message in str(error), error
+        else:
+            assert False, 'expected ValueError'
+
+
+def test_table_policy():
+    params = load_params(MODEL_PATH)
+    table = compile_table(params, SMALL_GRID)
+    policy = TablePolicy(table, ('back', 'forward'))
+    for state in sensor_states(100, position=200, angle=40, rate=400):
+        assert policy.decide_action(state, greedy=True) == ('back', 'forward')[table.lookup(state)]
+    # greedyでなければεの確率で探索する
+    policy.epsilon = 1.0
+    decided = set(policy.decide_action((0.0, 0.0, 0.0, 0.0)) for _ in range(100))
+    assert decided == {'back', 'forward'}
+
+
+if __name__ == '__main__':
+    test_compile_matches_network_at_cells()
+    test_compile_without_numpy()
+    test_index_rounds_and_clamps()
+    test_rejects_degenerate_axes()
+    test_agreement_with_network()
+    test_save_and_load()
+    test_table_policy()
+    print('ok')
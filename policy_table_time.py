@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""Agent.decide_action(greedy=True)の1回あたりの時間を、ネットワークと表(policy_table)で比べる
+
+    list   : ListNeuralNetwork(EV3と同じくNumPyなし)
+    numpy  : NumpyNeuralNetwork
+    table  : TablePolicy(DEFAULT_GRIDの表)
+
+$ python3 policy_table_time.py --count=100000
+"""
+import os
+import time
+from optparse import OptionParser
+
+from neural_network import ListNeuralNetwork, load_model, load_params
+from policy_table import TablePolicy, compile_table, sensor_states
+from replay import load_neural_control
+
+COUNT = 100000
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'neural_control', 'network.model')
+
+
+def test_decide(agent, states):
+    u"""Returns: 1回あたりの時間(秒)"""
+    decide_action = agent.decide_action
+    start = time.perf_counter()
+    for state in states:
+        decide_action(state, greedy=True)
+    return (time.perf_counter() - start) / len(states)
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-n', '--count', action='store', type='int', dest='count', default=COUNT,
+                      help="行動を決める回数")
+    options, _ = parser.parse_args()
+    neural_control = load_neural_control()
+    params = load_params(MODEL_PATH)
+    states = sensor_states(options.count)
+
+    numpy_agent = neural_control.Agent(MODEL_PATH)
+    list_agent = neural_control.Agent(MODEL_PATH)
+    list_agent.network = ListNeuralNetwork(load_model(MODEL_PATH, use_numpy=False))  # EV3と同じく行のmemoryview
+    table_agent = TablePolicy(compile_table(params), list(neural_control.Action))
+    results = [(name, test_decide(agent, states)) for name, agent in (
+        ('list', list_agent), ('numpy', numpy_agent), ('table', table_agent))]
+    table = results[-1][1]
+    for name, elapsed in results:
+        print('{}: {:.2f}us/decision ({:.1f}x table)'.format(name, elapsed * 1e6, elapsed / table))
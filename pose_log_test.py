@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""PoseLog(オドメトリのログ)のテスト
+
+$ python3 pose_log_test.py
+"""
+import io
+
+from odometry import Odometry, PoseLog
+
+
+def make_row(index):
+    return (index, -index, 0.5, 0.25, index * 1.5, 0.0, 10.0, -45.0, index * 0.5, 0.125)
+
+
+def test_grows_without_limit():
+    log = PoseLog(capacity=4)
+    for index in range(1000):
+        log.append(*make_row(index))
+    assert len(log) == 1000
+    rows = list(log)
+    assert rows[0] == make_row(0)
+    assert rows[-1] == make_row(999)
+
+
+def test_rotates_with_max_rows():
+    log = PoseLog(max_rows=3)
+    for index in range(10):
+        log.append(*make_row(index))
+    assert len(log) == 3
+    assert log.rows == 10
+    assert [row[0] for row in log] == [7, 8, 9]
+
+
+def test_csv_matches_previous_format():
+    log = PoseLog()
+    row = make_row(3)
+    log.append(*row)
+    output = io.StringIO()
+    log.write_csv(output)
+    assert output.getvalue() == "{},{},{},{},{},{},{},{},{},{}\n".format(*row)
+
+
+def test_target_trace_past_10000_ticks():
+    u"""以前は10000周期(4ms周期で40秒)でIndexErrorになっていた"""
+    odometry = Odometry()
+    for tick in range(12000):
+        odometry.target_trace(tick * 3, tick * 3)
+    assert len(odometry.odmetry_logs) == 12000
+
+
+if __name__ == '__main__':
+    test_grows_without_limit()
+    test_rotates_with_max_rows()
+    test_csv_matches_previous_format()
+    test_target_trace_past_10000_ticks()
+    print('ok')
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""オドメトリのログ1行あたりの記録時間を、文字列(従来のodmetry_logs)とPoseLogで比べる
+
+$ python3 pose_log_time.py --ticks=100000
+"""
+import io
+import time
+from optparse import OptionParser
+
+from odometry import PoseLog
+
+TICKS = 100000
+
+
+def make_rows(count):
+    return [(tick, tick * 2, 0.35, 0.01, tick * 0.3, tick * 0.01, 500.0 - tick * 0.001, 45.0, tick * 0.35, tick * 0.01)
+            for tick in range(count)]
+
+
+def test_format(rows):
+    u"""従来と同じく、毎周期10項目をstr.formatして文字列のリストに入れる"""
+    logs = ["" for _ in range(len(rows))]
+    pointer = 0
+    start = time.perf_counter()
+    for row in rows:
+        logs[pointer] = "{},{},{},{},{},{},{},{},{},{}".format(*row)
+        pointer += 1
+    return time.perf_counter() - start
+
+
+def test_pose_log(rows):
+    u"""PoseLog.appendで記録する(容量は最初の10000行から倍々で広げる)
+
+    Returns:
+        (tuple): (記録にかかった時間, CSVにするのにかかった時間)
+    """
+    log = PoseLog()
+    start = time.perf_counter()
+    for row in rows:
+        log.append(*row)
+    elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    log.write_csv(io.StringIO())
+    return elapsed, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-t', '--ticks', action='store', type='int', dest='ticks', default=TICKS,
+                      help="記録する行数")
+    options, _ = parser.parse_args()
+    rows = make_rows(options.ticks)
+    elapsed = test_format(rows)
+    print('str.format: {:.2f}us/tick'.format(elapsed / options.ticks * 1000000))
+    elapsed, csv_elapsed = test_pose_log(rows)
+    print('PoseLog.append: {:.2f}us/tick (write_csv at shutdown {:.2f}us/row)'.format(
+        elapsed / options.ticks * 1000000, csv_elapsed / options.ticks * 1000000))
@@ -0,0 +1,239 @@
+# -*- coding: UTF-8 -*-
+u"""sysfsの属性ファイルを開いたままos.pread/os.pwriteで読み書きするデバイス
+
+ev3devのプロパティはアクセスのたびに属性名からファイルを探して文字列を作り、変換する。
+ここでは最初に属性ファイルを開いておき、
+    読み込み : os.preadvで最初に確保したbytearrayに読み、strを作らずにint()で数値にする
+    書き込み : 値をエンコードしたbytesを最初に作っておき(duty_cycle_spは-100～100すべて)、os.pwriteで書く
+とする。
+
+ロボットからは、ev3devのデバイスをopen_motor/open_gyro/open_power_supplyに渡して使う。
+sysfsのディレクトリがなければ(シミュレータなど)渡したデバイスをそのまま返すので、
+ev3devと同じ属性(position, run_direct, stop, rate, measured_voltageなど)だけを使うこと。
+
+    motor = open_motor(ev3.LargeMotor('outA'))
+    motor.position = 0
+    motor.run_direct(duty_cycle_sp=50)
+    print(motor.position)
+
+sim.sysfs.FakeSysfsのツリーはパスを直接渡して RawMotor(fake.motor_path('outA')) のように開く。
+"""
+import os
+
+READ_SIZE = 32  # 1回に読む最大バイト数(sysfsの数値は改行込みで12バイト程度)
+MAX_DUTY_CYCLE = 100
+
+# duty_cycle_spに書き込む値(-100～100)をエンコードしたもの。
+# sysfsは書き込んだ長さだけを値とみなすが、普通のファイル(FakeSysfs)でも前の値が残らないよう改行を付ける
+_DUTY_CYCLE_BYTES = tuple(
+    '{}\n'.format(value).encode() for value in range(-MAX_DUTY_CYCLE, MAX_DUTY_CYCLE + 1))
+
+_preadv = getattr(os, 'preadv', None)
+
+
+class Attribute(object):
+    u"""開いたままの属性ファイル"""
+    __slots__ = ('path', 'fd', '_buffer', '_buffers')
+
+    def __init__(self, path, flags=os.O_RDONLY):
+        self.path = path
+        self.fd = os.open(path, flags | getattr(os, 'O_CLOEXEC', 0))
+        self._buffer = bytearray(READ_SIZE)
+        self._buffers = [self._buffer]
+
+    def read_int(self):
+        u"""先頭の数値を読む"""
+        if _preadv is not None:
+            size = _preadv(self.fd, self._buffers, 0)
+            data = memoryview(self._buffer)[:size]
+        else:
+            data = os.pread(self.fd, READ_SIZE, 0)
+        try:
+            # int()はbytes-likeの前後の空白を無視して直接変換する(strを作らない)
+            return int(data)
+        except ValueError:
+            return _parse_first_int(bytes(data))
+
+    def write(self, data):
+        u"""エンコード済みの値を書く"""
+        os.pwrite(self.fd, data, 0)
+
+    def write_int(self, value):
+        self.write(b'%d\n' % value)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def _parse_first_int(data):
+    u"""先頭の空白区切りのトークンを数値にする(普通のファイルに前の値が残っている場合など)"""
+    tokens = data.replace(b'\0', b' ').split()
+    try:
+        return int(tokens[0])
+    except (IndexError, ValueError):
+        return 0
+
+
+class RawMotor(object):
+    u"""tacho-motor(ev3dev.ev3.LargeMotorのposition/run_direct/stopの代わり)"""
+    COMMAND_RUN_DIRECT = b'run-direct\n'
+    COMMAND_STOP = b'stop\n'
+
+    def __init__(self, path):
+        u"""
+        Args:
+            path (str): tacho-motorのディレクトリ(/sys/class/tacho-motor/motorN)
+        """
+        self.path = path
+        self._position = Attribute(os.path.join(path, 'position'), os.O_RDWR)
+        self._duty_cycle_sp = Attribute(os.path.join(path, 'duty_cycle_sp'), os.O_WRONLY)
+        self._command = Attribute(os.path.join(path, 'command'), os.O_WRONLY)
+        self._running = False  # run-directを書き込み済みか
+
+    @property
+    def position(self):
+        u"""エンコーダ値(deg)"""
+        return self._position.read_int()
+
+    @position.setter
+    def position(self, value):
+        self._position.write_int(int(value))
+
+    def set_duty_cycle(self, duty_cycle):
+        u"""duty_cycle_spを書く(-100～100に丸める)"""
+        duty_cycle = int(duty_cycle)
+        if duty_cycle > MAX_DUTY_CYCLE:
+            duty_cycle = MAX_DUTY_CYCLE
+        elif duty_cycle < -MAX_DUTY_CYCLE:
+            duty_cycle = -MAX_DUTY_CYCLE
+        self._duty_cycle_sp.write(_DUTY_CYCLE_BYTES[duty_cycle + MAX_DUTY_CYCLE])
+
+    duty_cycle_sp = property(fset=set_duty_cycle)
+
+    def run_direct(self, duty_cycle_sp=None):
+        u"""duty_cycle_spで回す。commandは止まっている時だけ書く"""
+        if duty_cycle_sp is not None:
+            self.set_duty_cycle(duty_cycle_sp)
+        if not self._running:
+            self._command.write(self.COMMAND_RUN_DIRECT)
+            self._running = True
+
+    def stop(self):
+        self._command.write(self.COMMAND_STOP)
+        self._running = False
+
+    def close(self):
+        self._position.close()
+        self._duty_cycle_sp.close()
+        self._command.close()
+
+
+class RawGyroSensor(object):
+    u"""lego-sensorのジャイロ(ev3dev.ev3.GyroSensorのrate/angle/rate_and_angleの代わり)"""
+    MODE_GYRO_ANG = 'GYRO-ANG'
+    MODE_GYRO_RATE = 'GYRO-RATE'
+    MODE_GYRO_G_AND_A = 'GYRO-G&A'
+
+    def __init__(self, path, mode=MODE_GYRO_RATE):
+        u"""
+        Args:
+            path (str): lego-sensorのディレクトリ(/sys/class/lego-sensor/sensorN)
+            mode (str): 最初に設定するモード
+        """
+        self.path = path
+        self._mode_file = Attribute(os.path.join(path, 'mode'), os.O_WRONLY)
+        self._value0 = Attribute(os.path.join(path, 'value0'))
+        self._value1 = Attribute(os.path.join(path, 'value1'))
+        self._mode = None
+        self.mode = mode
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode):
+        if mode != self._mode:
+            self._mode_file.write('{}\n'.format(mode).encode())
+            self._mode = mode
+
+    @property
+    def rate(self):
+        u"""角速度(deg/s)。GYRO-G&Aモードでなければ GYRO-RATEモードにする"""
+        if self._mode == self.MODE_GYRO_G_AND_A:
+            return self._value1.read_int()
+        self.mode = self.MODE_GYRO_RATE
+        return self._value0.read_int()
+
+    @property
+    def angle(self):
+        u"""角度(deg)。GYRO-G&Aモードでなければ GYRO-ANGモードにする"""
+        if self._mode != self.MODE_GYRO_G_AND_A:
+            self.mode = self.MODE_GYRO_ANG
+        return self._value0.read_int()
+
+    @property
+    def rate_and_angle(self):
+        u"""GYRO-G&Aモードの値 (角度, 角速度)"""
+        self.mode = self.MODE_GYRO_G_AND_A
+        return self._value0.read_int(), self._value1.read_int()
+
+    def close(self):
+        self._mode_file.close()
+        self._value0.close()
+        self._value1.close()
+
+
+class RawPowerSupply(object):
+    u"""power_supply(ev3dev.ev3.PowerSupplyのmeasured_voltage/measured_currentの代わり)"""
+
+    def __init__(self, path):
+        u"""
+        Args:
+            path (str): power_supplyのディレクトリ(/sys/class/power_supply/lego-ev3-battery)
+        """
+        self.path = path
+        self._voltage = Attribute(os.path.join(path, 'voltage_now'))
+        self._current = Attribute(os.path.join(path, 'current_now'))
+
+    @property
+    def measured_voltage(self):
+        u"""電圧(μV)"""
+        return self._voltage.read_int()
+
+    @property
+    def measured_current(self):
+        u"""電流(μA)"""
+        return self._current.read_int()
+
+    def close(self):
+        self._voltage.close()
+        self._current.close()
+
+
+def _has_attribute(device, name):
+    path = getattr(device, '_path', None)
+    return path is not None and os.path.exists(os.path.join(path, name))
+
+
+def open_motor(motor):
+    u"""ev3devのモーターのsysfsを開いたRawMotor。sysfsがなければmotorをそのまま返す"""
+    if _has_attribute(motor, 'duty_cycle_sp'):
+        return RawMotor(motor._path)
+    return motor
+
+
+def open_gyro(gyro_sensor, mode=RawGyroSensor.MODE_GYRO_RATE):
+    u"""ev3devのジャイロのsysfsを開いたRawGyroSensor。sysfsがなければgyro_sensorをそのまま返す"""
+    if _has_attribute(gyro_sensor, 'value0'):
+        return RawGyroSensor(gyro_sensor._path, mode)
+    return gyro_sensor
+
+
+def open_power_supply(power_supply):
+    u"""ev3devのバッテリーのsysfsを開いたRawPowerSupply。sysfsがなければpower_supplyをそのまま返す"""
+    if _has_attribute(power_supply, 'voltage_now'):
+        return RawPowerSupply(power_supply._path)
+    return power_supply
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""raw_device(開いたままの属性ファイルをpread/pwriteで読み書きするデバイス)を偽のsysfsで動かしてみるテスト
+
+$ python3 raw_device_test.py
+"""
+from testutil import environment
+
+with environment(EV3_BACKEND='sim'):
+    import sim.ev3
+    from raw_device import RawGyroSensor, RawMotor, RawPowerSupply, open_motor
+    from sim.sysfs import FakeSysfs
+
+
+def test_motor_run_direct_and_position():
+    sysfs = FakeSysfs(world=sim.ev3.World(realtime=False))
+    try:
+        motor = RawMotor(sysfs.motor_path('outB'))
+        motor.position = 0
+        motor.run_direct(duty_cycle_sp=100)
+        sysfs._update()
+        sysfs.world.advance(0.2)
+        sysfs._update()
+        assert motor.position > 30
+        # 短い値を書いても前の値が残らない
+        motor.run_direct(duty_cycle_sp=-5)
+        sysfs._update()
+        assert sysfs.world.plant.free_motors['outB'][1] == -5
+        motor.duty_cycle_sp = 1000  # -100～100に丸める
+        sysfs._update()
+        assert sysfs.world.plant.free_motors['outB'][1] == 100
+        motor.stop()
+        sysfs._update()
+        assert sysfs.world.plant.free_motors['outB'][1] == 0
+        motor.position = 7
+        sysfs._update()
+        assert motor.position == 7
+        motor.close()
+    finally:
+        sysfs.cleanup()
+
+
+def test_gyro_and_battery():
+    sysfs = FakeSysfs(world=sim.ev3.World(realtime=False, gyro_offset=3.0))
+    try:
+        gyro = RawGyroSensor(sysfs.gyro_path())
+        battery = RawPowerSupply(sysfs.battery_path())
+        sysfs._update()
+        assert gyro.rate == 3
+        gyro.mode = RawGyroSensor.MODE_GYRO_G_AND_A
+        sysfs._update()
+        assert gyro.rate_and_angle == (0, 3)
+        assert 6000000 < battery.measured_voltage < 9000000
+        gyro.close()
+        battery.close()
+    finally:
+        sysfs.cleanup()
+
+
+def test_open_motor_without_sysfs_returns_device():
+    motor = sim.ev3.LargeMotor('outA')
+    assert open_motor(motor) is motor
+
+
+if __name__ == '__main__':
+    test_motor_run_direct_and_position()
+    test_gyro_and_battery()
+    test_open_motor_without_sysfs_returns_device()
+    print('ok')
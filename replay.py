@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""記録したテレメトリを制御に流し直して、記録した出力と比べる
+
+ロボットが--telemetryで記録したファイル(telemetry.TelemetryWriter)には、周期ごとに制御に渡した入力と出力が残っている。
+    balance  : BALANCE_FIELDS(balance_test.py, balance_sensor_other_thread.py, balance_multiprocess.py)
+               balance_initしてから(rate, lpos, rpos, voltage)をbalance_controlに渡し、(left_pwm, right_pwm)と比べる
+    odometry : Odometry(telemetry_path=...)の記録。(left_angle, right_angle)をtarget_traceに渡し、残りの列と比べる
+    agent    : neural_control/balance_test.pyの記録。センサー値からAgentが選んだ行動のPWM値と比べる
+sleepせずに最大速度で回すので、10分の走行も数秒で流し直せる。制御を変えたときに、実機のデータで出力がどこから変わるかを調べる。
+
+制御の状態は最初の周期から積み上がるので、リングが一周した(最初の周期が上書きされた)記録は流し直せない。
+
+$ python3 replay.py balance ./log/balance_sensor_other_thread_20180101000000.telemetry
+$ python3 replay.py agent ./log/neural_balance_test_20180101000000.telemetry --network=./neural_control/network.model
+$ python3 replay.py agent ./log/neural_balance_test_20180101000000.telemetry --policy=./neural_control/network.policy
+"""
+import os
+import time
+from optparse import OptionParser
+
+from telemetry import TelemetryReader
+
+KINDS = ('balance', 'odometry', 'agent')
+
+
+class ReplayResult(object):
+    u"""流し直した結果"""
+
+    def __init__(self, names, tolerance):
+        self.names = names  # 比べた出力の列名
+        self.tolerance = tolerance
+        self.ticks = 0
+        self.mismatches = 0  # 出力のどれかがtoleranceより大きく違った周期の数
+        self.first_mismatch = None  # 最初に違った周期(0から)
+        self.max_error = 0.0
+        self.elapsed = 0.0  # 流し直しにかかった時間(秒)
+        self.outputs = []  # 周期ごとの出力(タプル)
+
+    def compare(self, tick, outputs, recorded):
+        u"""1周期分の出力を記録と比べる"""
+        self.ticks += 1
+        self.outputs.append(outputs)
+        error = max(abs(output - value) for output, value in zip(outputs, recorded))
+        if error > self.max_error:
+            self.max_error = error
+        if error > self.tolerance:
+            self.mismatches += 1
+            if self.first_mismatch is None:
+                self.first_mismatch = tick
+
+    @property
+    def matched(self):
+        return self.mismatches == 0
+
+    def report(self):
+        return '{} ticks in {:.3f}s ({:.0f} ticks/s): {} mismatches{}, max error {:g} ({})'.format(
+            self.ticks, self.elapsed, self.ticks / self.elapsed if self.elapsed > 0 else 0.0,
+            self.mismatches,
+            '' if self.first_mismatch is None else ' from tick {}'.format(self.first_mismatch),
+            self.max_error, ', '.join(self.names))
+
+
+def load_recording(path):
+    u"""テレメトリを読んで列名 -> 値のリストにする(リングが一周していればValueError)"""
+    reader = TelemetryReader(path)
+    if reader.count > reader.capacity:
+        raise ValueError('{} wrapped around ({} of {} records kept); the first ticks are lost'.format(
+            path, reader.capacity, reader.count))
+    records = reader.to_array()
+    return dict((name, records[name].tolist()) for name, _ in reader.fields)
+
+
+def replay_balance(recording, control=None, init=None, tolerance=0.0):
+    u"""バランス制御の記録を流し直す
+
+    Args:
+        recording (dict): load_recordingの戻り値(BALANCE_FIELDS)
+        control: balance_controlと同じ引数の関数。省略時はbalance.balance.balance_control
+        init: 制御の状態を初期化する関数。省略時はbalance.balance.balance_init
+        tolerance (float): 出力の差がこれ以下なら一致とみなす
+    """
+    if control is None or init is None:
+        import balance.balance as balance
+        control = control or balance.balance_control
+        init = init or balance.balance_init
+    result = ReplayResult(('left_pwm', 'right_pwm'), tolerance)
+    start = time.perf_counter()
+    init()
+    for tick, (rate, lpos, rpos, voltage, left_pwm, right_pwm) in enumerate(zip(
+            recording['rate'], recording['left_position'], recording['right_position'], recording['voltage'],
+            recording['left_pwm'], recording['right_pwm'])):
+        # forward, turn, offsetはどのロボットも0固定
+        result.compare(tick, control(0, 0, rate, 0, lpos, rpos, voltage), (left_pwm, right_pwm))
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+class _LastRow(object):
+    u"""Odometry.telemetryの代わりに、最後に書き込まれた行だけを持つ"""
+
+    def __init__(self):
+        self.row = None
+
+    def write(self, *values):
+        self.row = values
+
+
+def replay_odometry(recording, odometry=None, tolerance=1e-9):
+    u"""オドメトリの記録を流し直す
+
+    Args:
+        recording (dict): load_recordingの戻り値(PoseLog.FIELDS)
+        odometry: target_traceを持つオブジェクト。省略時はodometry.Odometry()
+        tolerance (float): 出力の差がこれ以下なら一致とみなす
+    """
+    from odometry import Odometry, PoseLog
+
+    if odometry is None:
+        odometry = Odometry()
+    names = PoseLog.FIELDS[PoseLog.INT_FIELDS:]
+    result = ReplayResult(names, tolerance)
+    last_row = _LastRow()
+    odometry.telemetry = last_row
+    columns = [recording[name] for name in PoseLog.FIELDS]
+    start = time.perf_counter()
+    for tick, row in enumerate(zip(*columns)):
+        odometry.target_trace(row[0], row[1])
+        result.compare(tick, last_row.row[PoseLog.INT_FIELDS:], row[PoseLog.INT_FIELDS:])
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def replay_agent(recording, agent, make_inputs, action_pwm, tolerance=0.0):
+    u"""ニューラルネットワークの制御の記録を流し直す
+
+    Args:
+        recording (dict): load_recordingの戻り値(neural_control/balance_test.pyのRobot.TELEMETRY_FIELDS)
+        agent: decide_actionを持つエージェント
+        make_inputs: センサー値からネットワークの入力を作る関数
+        action_pwm: 行動をPWM値にする関数
+        tolerance (float): 出力の差がこれ以下なら一致とみなす
+    """
+    result = ReplayResult(('pwm',), tolerance)
+    start = time.perf_counter()
+    for tick, (left_position, gyro_angle, gyro_rate, pwm) in enumerate(zip(
+            recording['left_position'], recording['gyro_angle'], recording['gyro_rate'], recording['pwm'])):
+        action = agent.decide_action(make_inputs(left_position, gyro_angle, gyro_rate), greedy=True)
+        result.compare(tick, (action_pwm(action),), (pwm,))
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def load_neural_control():
+    u"""neural_control/balance_test.pyをモジュールとして読む
+
+    デバイスは使わないので、EV3_BACKENDが設定されていなければ読む間だけシミュレータを選ぶ(呼び出し側の環境変数は残さない)
+    """
+    import importlib.util
+
+    backend = os.environ.get('EV3_BACKEND')
+    if backend is None:
+        os.environ['EV3_BACKEND'] = 'sim'
+    try:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'neural_control', 'balance_test.py')
+        spec = importlib.util.spec_from_file_location('neural_control_balance_test', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        if backend is None:
+            os.environ.pop('EV3_BACKEND', None)
+    return module
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage='%prog [options] {} TELEMETRY'.format('|'.join(KINDS)))
+    parser.add_option('-n', '--network', action='store', type='string', dest='network',
+                      default='./neural_control/network.model', help="agentのネットワークのファイル")
+    parser.add_option('-p', '--policy', action='store', type='string', dest='policy', default=None,
+                      help="agentをpolicy_table.pyで作った表で置き換える")
+    parser.add_option('-e', '--tolerance', action='store', type='float', dest='tolerance', default=None,
+                      help="出力の差がこれ以下なら一致とみなす(省略時はbalance/agentは0、odometryは1e-9)")
+    options, args = parser.parse_args()
+    if len(args) != 2 or args[0] not in KINDS:
+        parser.error('specify {} and a telemetry file'.format('/'.join(KINDS)))
+    kind, path = args
+    recording = load_recording(path)
+    if kind == 'balance':
+        result = replay_balance(recording, tolerance=options.tolerance or 0.0)
+    elif kind == 'odometry':
+        result = replay_odometry(recording, tolerance=1e-9 if options.tolerance is None else options.tolerance)
+    else:
+        neural_control = load_neural_control()
+        if options.policy is None:
+            agent = neural_control.Agent(options.network)
+        else:
+            from policy_table import TablePolicy, load_table
+
+            agent = TablePolicy(load_table(options.policy), list(neural_control.Action))
+        result = replay_agent(recording, agent, neural_control.make_inputs,
+                              neural_control.action_pwm, tolerance=options.tolerance or 0.0)
+    print(result.report())
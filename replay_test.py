@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""replay(記録の流し直し)のテスト
+
+$ python3 replay_test.py
+"""
+import contextlib
+import io
+import os
+
+from testutil import environment, with_directory
+
+with environment(EV3_BACKEND='sim'):
+    import balance.balance as balance
+    import balance_sensor_other_thread
+    import sim.ev3
+    from odometry import Odometry
+    from replay import load_neural_control, load_recording, replay_agent, replay_balance, replay_odometry
+    from telemetry import TelemetryWriter
+
+NETWORK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'neural_control', 'network.pickle')
+
+
+def _record_balance(path, loop_count):
+    sim.ev3.reset(realtime=False)
+
+    class Robot(balance_sensor_other_thread.Robot):
+        LOOP_COUNT = loop_count
+
+    robot = Robot(telemetry_path=path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        robot.run()
+    return robot
+
+
+@with_directory
+def test_balance_replay_matches_recording(directory):
+    path = os.path.join(directory, 'balance.telemetry')
+    _record_balance(path, 500)
+    recording = load_recording(path)
+    assert len(recording['rate']) == 500
+    assert recording['sample_ns'] == sorted(recording['sample_ns'])
+    result = replay_balance(recording)
+    assert result.ticks == 500
+    assert result.matched, result.report()
+    assert result.max_error == 0.0
+
+
+@with_directory
+def test_balance_replay_finds_first_change(directory):
+    path = os.path.join(directory, 'balance.telemetry')
+    _record_balance(path, 200)
+    ticks = []
+
+    def changed_control(*args):
+        # 120周期目から出力が変わる制御
+        left_pwm, right_pwm = balance.balance_control(*args)
+        ticks.append(None)
+        if len(ticks) > 120:
+            left_pwm += 0.5
+        return left_pwm, right_pwm
+
+    result = replay_balance(load_recording(path), control=changed_control)
+    assert result.first_mismatch == 120
+    assert result.mismatches == 80
+    assert result.max_error == 0.5
+
+
+@with_directory
+def test_wrapped_recording_is_rejected(directory):
+    path = os.path.join(directory, 'balance.telemetry')
+    writer = TelemetryWriter(path, (('rate', 'd'),), capacity=4)
+    for index in range(5):
+        writer.write(index)
+    writer.close()
+    try:
+        load_recording(path)
+    except ValueError:
+        pass
+    else:
+        assert False, 'ValueError expected'
+
+
+@with_directory
+def test_odometry_replay(directory):
+    path = os.path.join(directory, 'odometry.telemetry')
+    odometry = Odometry(telemetry_path=path)
+    for tick in range(300):
+        odometry.target_trace(tick * 3, tick * 2)
+    odometry.telemetry.close()
+    result = replay_odometry(load_recording(path))
+    assert result.ticks == 300
+    assert result.matched, result.report()
+
+
+@with_directory
+def test_agent_replay(directory):
+    neural_control = load_neural_control()
+    agent = neural_control.Agent(NETWORK_PATH)
+    path = os.path.join(directory, 'neural.telemetry')
+    writer = TelemetryWriter(path, neural_control.Robot.TELEMETRY_FIELDS)
+    for tick in range(100):
+        left_position, gyro_angle, gyro_rate = tick * 2.0, (tick % 20) - 10.0, (tick % 7) * 15.0 - 45.0
+        action = agent.decide_action(neural_control.make_inputs(left_position, gyro_angle, gyro_rate), greedy=True)
+        pwm = neural_control.action_pwm(action)
+        if tick == 42:
+            pwm = -pwm  # 記録と違う出力
+        writer.write(tick * 20000000, left_position, gyro_angle, gyro_rate, pwm, 100)
+    writer.close()
+    result = replay_agent(load_recording(path), agent, neural_control.make_inputs, neural_control.action_pwm)
+    assert result.ticks == 100
+    assert result.mismatches == 1
+    assert result.first_mismatch == 42
+
+
+def test_load_neural_control_keeps_environment():
+    u"""load_neural_controlは読む間だけシミュレータを選び、呼び出し側の環境変数を残さない"""
+    backend = os.environ.pop('EV3_BACKEND', None)
+    try:
+        load_neural_control()
+        assert 'EV3_BACKEND' not in os.environ
+        with environment(EV3_BACKEND='sim'):
+            load_neural_control()
+            assert os.environ['EV3_BACKEND'] == 'sim'
+    finally:
+        if backend is not None:
+            os.environ['EV3_BACKEND'] = backend
+
+
+if __name__ == '__main__':
+    test_balance_replay_matches_recording()
+    test_balance_replay_finds_first_change()
+    test_wrapped_recording_is_rejected()
+    test_odometry_replay()
+    test_agent_replay()
+    test_load_neural_control_keeps_environment()
+    print('ok')
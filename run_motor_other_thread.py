@@ -9,12 +9,26 @@ u"""モーターへのrun指示を別スレッドで行うテスト
 　メインスレッド：センサーの値を読み取る。モータースレッドに指示を送る
 　モータースレッド：メインスレッドからの指示を受けてモーターを回転・停止させる
 """
-import datetime
-import time
+import os
 import threading
 import queue
+from optparse import OptionParser
 
-import ev3dev.ev3 as ev3
+from ev3_backend import ev3, clock
+from scheduler import PeriodicScheduler
+from telemetry import TelemetryWriter, default_path
+
+# テレメトリのレコード
+MAIN_LOOP_FIELDS = (
+    ('time_ns', 'Q'),  # 周期の開始時刻(clock.monotonic_ns)
+    ('speed', 'i'),  # 右モーターに指示した速度
+    ('elapsed_us', 'q'),  # 処理時間(μs)
+)
+MOTOR_FIELDS = (
+    ('time_ns', 'Q'),  # モーターに書き込んだ時刻(clock.monotonic_ns)
+    ('command', 'B'),  # MotorCommand.RUN / MotorCommand.STOP
+    ('speed', 'i'),
+)
 
 
 class MotorCommand(object):
@@ -30,10 +44,18 @@ class MotorCommand(object):
 class Motor(object):
     u"""モーター"""
 
-    def __init__(self, address):
+    def __init__(self, address, telemetry_path=None):
+        u"""
+        Args:
+            address (str): モーターのポート
+            telemetry_path (str): モーターへの書き込みを記録するテレメトリのファイル。Noneなら記録しない
+        """
         self.command_queue = queue.Queue()
         self._motor = ev3.LargeMotor(address)
         self._is_loop = True
+        self.telemetry = None  # モータースレッドだけが書き込む
+        if telemetry_path is not None:
+            self.telemetry = TelemetryWriter(telemetry_path, MOTOR_FIELDS)
 
     def run(self, speed):
         u"""モーターを動かす
@@ -52,7 +74,7 @@ class Motor(object):
 
     def loop(self):
         u"""メインループからの指示を受けるループ"""
-        times = []
+        telemetry = self.telemetry
         while self._is_loop:
             # メインスレッドからの指示を受信
             command = self.command_queue.get()
@@ -66,22 +88,40 @@ class Motor(object):
 
             if command.command == MotorCommand.RUN:
                 self._motor.run_forever(speed_sp=command.speed)
-                times.append(datetime.datetime.now())
             elif command.command == MotorCommand.STOP:
                 self._motor.stop()
                 print('motor_stop')
+            if telemetry is not None:
+                telemetry.write(clock.monotonic_ns(), command.command, command.speed)
         self._motor.stop()
+        if telemetry is not None:
+            telemetry.close()
 
 
 class Robot(object):
     u"""ロボット本体"""
-    BASE_SLEEP_TIME_US = 20000
+    PERIOD = 0.02  # メインループの周期(秒)
 
-    def __init__(self):
-        self.motor_right = Motor('outA')
-        self.motor_left = Motor('outC')
-        self.motor_tail = Motor('outB')
+    def __init__(self, telemetry_path=None):
+        u"""
+        Args:
+            telemetry_path (str): メインループのテレメトリのファイル。Noneなら記録しない。
+                モーターごとのテレメトリはファイル名にポートを付けたファイルに記録する
+        """
+        self.motor_right = Motor('outA', self._motor_telemetry_path(telemetry_path, 'outA'))
+        self.motor_left = Motor('outC', self._motor_telemetry_path(telemetry_path, 'outC'))
+        self.motor_tail = Motor('outB', self._motor_telemetry_path(telemetry_path, 'outB'))
         self.gyro_sensor = None
+        self.telemetry = None
+        if telemetry_path is not None:
+            self.telemetry = TelemetryWriter(telemetry_path, MAIN_LOOP_FIELDS)
+
+    @staticmethod
+    def _motor_telemetry_path(telemetry_path, address):
+        if telemetry_path is None:
+            return None
+        root, ext = os.path.splitext(telemetry_path)
+        return '{}_{}{}'.format(root, address, ext)
 
     def run(self):
         u"""ロボット稼働"""
@@ -107,30 +147,42 @@ class Robot(object):
         self.motor_left.stop()
         self.motor_right.stop()
         self.motor_tail.stop()
+        if self.telemetry is not None:
+            self.telemetry.close()
 
     def _main_loop(self):
         u"""ロボットメインループ"""
         delta = 100
         current_speed = 0
-        elapsed_times = []
-        for _ in range(100):
-            start = datetime.datetime.now()
-            # TODO: センサーから現在の値を取得
-            # TODO: 値に応じて各Motorに指示
-            if current_speed >= 1000 or current_speed <= -1000:
-                delta *= -1
-            current_speed += delta
-            self.motor_right.run(speed=current_speed)
-            self.motor_left.run(speed=-current_speed)
-            # TODO: 4msから経過時間を引いた時間でsleep
-            elapsed_microsecond = (datetime.datetime.now() - start).microseconds
-            elapsed_times.append(elapsed_microsecond)
-            if elapsed_microsecond < self.BASE_SLEEP_TIME_US:
-                sleep_time = (self.BASE_SLEEP_TIME_US - elapsed_microsecond) / 1000000
-                time.sleep(sleep_time)
-        print('\n'.join([str(time_) for time_ in elapsed_times]))
+        telemetry = self.telemetry
+        scheduler = PeriodicScheduler(self.PERIOD, clock=clock)
+        scheduler.start()
+        try:
+            for _ in range(100):
+                start = clock.monotonic_ns()
+                # TODO: センサーから現在の値を取得
+                # TODO: 値に応じて各Motorに指示
+                if current_speed >= 1000 or current_speed <= -1000:
+                    delta *= -1
+                current_speed += delta
+                self.motor_right.run(speed=current_speed)
+                self.motor_left.run(speed=-current_speed)
+                # 処理時間を記録して、次の周期の開始時刻までsleep
+                if telemetry is not None:
+                    telemetry.write(start, current_speed, (clock.monotonic_ns() - start) // 1000)
+                scheduler.wait()
+            if telemetry is not None:
+                print('\n'.join([str(elapsed_us) for _, _, elapsed_us in telemetry.rows()]))
+            print(scheduler.stats())
+        finally:
+            scheduler.close()
 
 
 if __name__ == '__main__':
-    robot = Robot()
+    parser = OptionParser()
+    parser.add_option('-t', '--telemetry', action='store', type='string', dest='telemetry',
+                      default=default_path('run_motor_other_thread'),
+                      help="テレメトリのファイル(telemetry.TelemetryReaderで読める)。既定は起動日時の入ったファイル")
+    options, _ = parser.parse_args()
+    robot = Robot(telemetry_path=options.telemetry)
     robot.run()
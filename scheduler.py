@@ -0,0 +1,178 @@
+# -*- coding: UTF-8 -*-
+u"""一定周期でループを回すためのスケジューラ
+
+開始時刻からの絶対時刻(開始時刻 + n * 周期)を締め切りにして待つので、sleepの誤差が次の周期に積み重ならない。
+
+    scheduler = PeriodicScheduler(0.004)
+    scheduler.start()
+    for _ in range(1000):
+        # 処理
+        scheduler.wait()
+    print(scheduler.stats())
+
+待ち方(method)
+    'timerfd'         : os.timerfd_create(Python 3.13以降のLinux)の絶対時刻タイマーで待つ
+    'clock_nanosleep' : libcのclock_nanosleep(TIMER_ABSTIME)で待つ(Linux)
+    'sleep'           : clock.sleepで締め切りまでの残り時間を待つ
+    'auto'            : 使えるものを上から順に選ぶ。clockがtimeモジュールでなければ(シミュレータなど)'sleep'
+spin_us を指定すると、締め切りのspin_us手前まで寝て、残りはビジーウェイトする(1ms以下の精度が必要な場合)
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import sys
+import time
+
+CLOCK_MONOTONIC = 1
+TIMER_ABSTIME = 1
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _load_clock_nanosleep():
+    u"""libcのclock_nanosleepを取得する。使えなければNone"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        function = libc.clock_nanosleep
+    except (OSError, AttributeError):
+        return None
+    function.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(_Timespec), ctypes.POINTER(_Timespec)]
+    function.restype = ctypes.c_int
+    return function
+
+
+_clock_nanosleep = _load_clock_nanosleep()
+
+
+class PeriodicScheduler(object):
+    u"""絶対時刻の締め切りで一定周期を刻むスケジューラ"""
+
+    def __init__(self, period, clock=time, method='auto', spin_us=0):
+        u"""
+        Args:
+            period (float): 周期(秒)
+            clock: monotonic_ns()とsleep()を持つ時計。ev3_backend.clockを渡せばシミュレータでも動く
+            method (str): 待ち方。'auto', 'timerfd', 'clock_nanosleep', 'sleep'のいずれか
+            spin_us (int): 締め切りの何μs手前からビジーウェイトするか。0ならビジーウェイトしない
+        """
+        self.period_ns = int(round(period * 1000000000))
+        self.clock = clock
+        self.method = self._choose_method(method)
+        self.spin_ns = int(spin_us * 1000)
+
+        self.start_ns = 0
+        self.deadline_ns = 0  # 次の締め切り
+        self.tick = 0  # 何周期目か(飛ばした周期も数える)
+        self.overruns = 0  # 締め切りを過ぎてからwaitが呼ばれた回数
+        self.skipped = 0  # 処理が間に合わず飛ばした周期の数
+        self.last_lateness_ns = 0  # 直近の締め切りから実際に起きるまでの遅れ
+        self.max_lateness_ns = 0
+        self._timer_fd = None
+
+    def _choose_method(self, method):
+        if method != 'auto':
+            if method == 'timerfd' and not hasattr(os, 'timerfd_create'):
+                raise ValueError('timerfd is not available')
+            if method == 'clock_nanosleep' and _clock_nanosleep is None:
+                raise ValueError('clock_nanosleep is not available')
+            return method
+        if self.clock is not time:
+            return 'sleep'
+        if hasattr(os, 'timerfd_create'):
+            return 'timerfd'
+        if _clock_nanosleep is not None:
+            return 'clock_nanosleep'
+        return 'sleep'
+
+    def start(self, start_ns=None):
+        u"""開始時刻を決める。最初の締め切りは開始時刻 + 周期
+
+        Args:
+            start_ns (int): 開始時刻(ns)。省略時は現在時刻。別のスケジューラと同じ周期の刻みに揃える場合に渡す。
+                過去の時刻なら、最初の締め切りは刻みのうち現在時刻より後のもの
+        """
+        now_ns = self.clock.monotonic_ns()
+        self.start_ns = now_ns if start_ns is None else start_ns
+        self.deadline_ns = self.start_ns + self.period_ns
+        if self.deadline_ns <= now_ns:
+            self.deadline_ns += ((now_ns - self.deadline_ns) // self.period_ns + 1) * self.period_ns
+        self.tick = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.last_lateness_ns = 0
+        self.max_lateness_ns = 0
+        if self.method == 'timerfd':
+            self.close()
+            self._timer_fd = os.timerfd_create(time.CLOCK_MONOTONIC, flags=os.TFD_CLOEXEC)
+
+    def close(self):
+        u"""timerfdを閉じる"""
+        if self._timer_fd is not None:
+            os.close(self._timer_fd)
+            self._timer_fd = None
+
+    def remaining_ns(self):
+        u"""次の締め切りまでの残り時間(ns)。過ぎていれば負"""
+        return self.deadline_ns - self.clock.monotonic_ns()
+
+    def wait(self):
+        u"""次の締め切りまで待つ
+
+        締め切りを過ぎていた場合は待たずに戻り、過ぎてしまった周期は飛ばす(次の締め切りは未来の周期にする)。
+
+        Returns:
+            (int): 飛ばした周期の数
+        """
+        now_ns = self.clock.monotonic_ns()
+        skipped = 0
+        if now_ns >= self.deadline_ns:
+            # 間に合わなかった
+            self.overruns += 1
+            skipped = (now_ns - self.deadline_ns) // self.period_ns
+            self.skipped += skipped
+            self.deadline_ns += skipped * self.period_ns
+            wake_ns = now_ns
+        else:
+            self._sleep_until(self.deadline_ns, now_ns)
+            wake_ns = self.clock.monotonic_ns()
+        self.last_lateness_ns = wake_ns - self.deadline_ns
+        if self.last_lateness_ns > self.max_lateness_ns:
+            self.max_lateness_ns = self.last_lateness_ns
+        self.tick += skipped + 1
+        self.deadline_ns += self.period_ns
+        return skipped
+
+    def _sleep_until(self, deadline_ns, now_ns):
+        sleep_deadline_ns = deadline_ns - self.spin_ns
+        if sleep_deadline_ns > now_ns:
+            if self.method == 'timerfd':
+                os.timerfd_settime_ns(self._timer_fd, flags=os.TFD_TIMER_ABSTIME, initial=sleep_deadline_ns)
+                os.read(self._timer_fd, 8)
+            elif self.method == 'clock_nanosleep':
+                request = _Timespec(sleep_deadline_ns // 1000000000, sleep_deadline_ns % 1000000000)
+                # シグナルで中断された場合(EINTR)は同じ絶対時刻でやり直す
+                result = errno.EINTR
+                while result == errno.EINTR:
+                    result = _clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, ctypes.byref(request), None)
+            else:
+                self.clock.sleep((sleep_deadline_ns - now_ns) / 1000000000)
+        if self.spin_ns:
+            monotonic_ns = self.clock.monotonic_ns
+            while monotonic_ns() < deadline_ns:
+                pass
+
+    def stats(self):
+        u"""これまでの統計"""
+        return {
+            'ticks': self.tick,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'last_lateness_us': self.last_lateness_ns / 1000,
+            'max_lateness_us': self.max_lateness_ns / 1000,
+            'method': self.method,
+        }
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""PeriodicSchedulerのテスト
+
+$ python3 scheduler_test.py
+"""
+import time
+
+from scheduler import PeriodicScheduler
+
+
+class FakeClock(object):
+    u"""sleepした分だけ進む時計"""
+
+    def __init__(self):
+        self.now_ns = 1000000000
+
+    def monotonic_ns(self):
+        return self.now_ns
+
+    def sleep(self, seconds):
+        self.now_ns += int(round(seconds * 1000000000))
+
+    def work(self, seconds):
+        u"""処理にseconds秒かかったことにする"""
+        self.now_ns += int(round(seconds * 1000000000))
+
+
+def test_start_aligned_to_other_scheduler():
+    clock = FakeClock()
+    control = PeriodicScheduler(0.004, clock=clock)
+    control.start()
+    clock.work(0.0105)
+    # 制御の刻みの0.5ms手前に揃える
+    sensor = PeriodicScheduler(0.004, clock=clock)
+    sensor.start(control.start_ns - 500000)
+    sensor.wait()
+    assert clock.now_ns - control.start_ns == 3 * 4000000 - 500000
+    assert sensor.overruns == 0
+
+
+def test_no_drift():
+    clock = FakeClock()
+    scheduler = PeriodicScheduler(0.004, clock=clock)
+    scheduler.start()
+    for _ in range(1000):
+        clock.work(0.0013)
+        scheduler.wait()
+    # 処理時間によらず、開始から1000周期ちょうどで終わる
+    assert clock.now_ns - scheduler.start_ns == 1000 * 4000000
+    assert scheduler.overruns == 0
+
+
+def test_overrun_skips_periods():
+    clock = FakeClock()
+    scheduler = PeriodicScheduler(0.004, clock=clock)
+    scheduler.start()
+    clock.work(0.001)
+    assert scheduler.wait() == 0
+    clock.work(0.0105)  # 8ms, 12msの締め切りを過ぎる。8msの分は遅れて実行し、12msの分は飛ばす
+    assert scheduler.wait() == 1
+    assert scheduler.overruns == 1
+    assert scheduler.skipped == 1
+    clock.work(0.001)
+    scheduler.wait()
+    # 飛ばした後も元の周期の刻みに揃っている
+    assert (clock.now_ns - scheduler.start_ns) % 4000000 == 0
+    assert scheduler.tick == 4
+
+
+def test_realtime_methods():
+    methods = ['sleep']
+    for method in ('clock_nanosleep', 'timerfd'):
+        try:
+            PeriodicScheduler(0.004, method=method)
+            methods.append(method)
+        except ValueError:
+            pass
+    for method in methods:
+        scheduler = PeriodicScheduler(0.002, method=method, spin_us=100)
+        scheduler.start()
+        for _ in range(50):
+            scheduler.wait()
+        scheduler.close()
+        elapsed = time.monotonic_ns() - scheduler.start_ns
+        assert elapsed >= 50 * 2000000, method
+
+
+if __name__ == '__main__':
+    test_start_aligned_to_other_scheduler()
+    test_no_drift()
+    test_overrun_skips_periods()
+    test_realtime_methods()
+    print('ok')
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""センサー値を取得してから制御ループで使うまでの時間を、スレッド(BalanceParam)とプロセス(SensorProcess)で比べる
+
+どちらもメインループでbalance_controlを回しながら、最新のセンサー値の取得時刻との差を記録する
+$ python3 sensor_process_time.py --period=0.004 --ticks=1000
+PCではシミュレータを実時間で動かす
+$ EV3_BACKEND=sim EV3_SIM_REALTIME=1 python3 sensor_process_time.py
+"""
+import threading
+import time
+from optparse import OptionParser
+
+import balance.balance as balance
+from balance_multiprocess import start_sensor_process, stop_sensor_process
+from balance_sensor_other_thread import BalanceParam, Motor
+from ev3_backend import clock
+from latency import LatencyHistogram
+from scheduler import PeriodicScheduler
+from shared_ring import SharedRegion
+
+PERIOD = 0.004
+TICKS = 1000
+
+
+def control_loop(read, period, ticks, before_tick=None):
+    u"""period秒周期でread()の値を使ってbalance_controlを回す
+
+    Args:
+        read: (rate, lpos, rpos, voltage, voltage_ns, timestamp_ns)を返す関数
+        before_tick: 各周期の最初に呼ぶ関数(生存確認の更新など)
+
+    Returns:
+        (LatencyHistogram): センサー値の取得から使うまでの時間(μs)
+    """
+    histogram = LatencyHistogram()
+    balance.balance_init()
+    scheduler = PeriodicScheduler(period, clock=clock)
+    scheduler.start()
+    try:
+        for _ in range(ticks):
+            if before_tick is not None:
+                before_tick()
+            rate, lpos, rpos, voltage, _, timestamp_ns = read()
+            histogram.record((clock.monotonic_ns() - timestamp_ns) // 1000)
+            balance.balance_control(0, 0, rate, 0, lpos, rpos, voltage)
+            scheduler.wait()
+    finally:
+        scheduler.close()
+    return histogram
+
+
+def test_thread(period, ticks):
+    u"""balance_sensor_other_thread.BalanceParamのスレッドで取得する"""
+    right_motor = Motor('outA')
+    left_motor = Motor('outC')
+    balance_param = BalanceParam(right_motor, left_motor)
+    thread = threading.Thread(target=balance_param.loop)
+    thread.start()
+    try:
+        while balance_param.snapshot.sample_index == 0:
+            time.sleep(0.001)
+        return control_loop(lambda: balance_param.get_snapshot()[:6], period, ticks)
+    finally:
+        balance_param.end_thread()
+        thread.join()
+
+
+def test_process(period, ticks):
+    u"""balance_multiprocess.SensorProcessの子プロセスで取得し、共有メモリで受け取る"""
+    region = SharedRegion()
+    ring = region.ring
+    pid = start_sensor_process(region)
+
+    def heartbeat():
+        region.control_heartbeat_ns = time.monotonic_ns()
+
+    try:
+        while ring.head == 0:
+            time.sleep(0.001)
+        return control_loop(lambda: ring.latest()[:6], period, ticks, heartbeat)
+    finally:
+        stop_sensor_process(region, pid)
+        region.close()
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-p', '--period', action='store', type='float', dest='period', default=PERIOD,
+                      help="メインループの周期(秒)")
+    parser.add_option('-t', '--ticks', action='store', type='int', dest='ticks', default=TICKS,
+                      help="メインループの回数")
+    options, _ = parser.parse_args()
+    for name, test in (('thread', test_thread), ('process', test_process)):
+        histogram = test(options.period, options.ticks)
+        print('{}: sample age p50 {p50}us p99 {p99}us max {max}us mean {mean}us'.format(name, **histogram.summary()))
@@ -0,0 +1,163 @@
+# -*- coding: UTF-8 -*-
+u"""プロセス間で共有するメモリ領域(センサー値のリングバッファとモーターへの指示)
+
+センサー値を取得するプロセスと制御を行うプロセスで同じmmapを共有する。
+fork前にSharedRegionを作れば、子プロセスにも同じ領域が引き継がれる。
+
+領域のレイアウト(すべて8バイト境界)
+    [0:32]     制御用の値(uint64 * 4)
+                   センサープロセスの生存確認時刻(ns), 制御プロセスの生存確認時刻(ns), 停止要求, 予備
+    [32:96]    CommandSlot(モーターへの指示。SensorSnapshotと同じseqlockのレイアウト)
+    [96:104]   SensorRingの書き込み済みサンプル数(uint64)
+    [104:]     SensorRingの枠(SNAPSHOT_SIZE * 枠の数)
+
+どちらの向きも書き込み側は1プロセスだけとする(センサー値はセンサープロセス、指示と停止要求は制御プロセス)。
+"""
+import mmap
+
+from snapshot import SNAPSHOT_SIZE, SensorSnapshot
+
+RING_SLOTS = 64
+
+_SENSOR_HEARTBEAT = 0
+_CONTROL_HEARTBEAT = 1
+_STOP = 2
+CONTROL_SIZE = 32
+COMMAND_OFFSET = CONTROL_SIZE
+RING_OFFSET = COMMAND_OFFSET + SNAPSHOT_SIZE
+RING_HEADER_SIZE = 8
+
+
+def region_size(ring_slots=RING_SLOTS):
+    u"""ring_slots個の枠を持つ領域のバイト数"""
+    return RING_OFFSET + RING_HEADER_SIZE + SNAPSHOT_SIZE * ring_slots
+
+
+class SensorRing(object):
+    u"""センサー値のリングバッファ
+
+    枠ごとにSensorSnapshotのseqlockで保護するので、読み込み側は書き込み中の枠を読んでも値の組が崩れない。
+    読み込みが遅れて枠が上書きされた場合は、read(index)がNoneを返す。
+    """
+
+    def __init__(self, buffer, offset, slots):
+        self.slots = slots
+        self._head = memoryview(buffer)[offset:offset + RING_HEADER_SIZE].cast('Q')
+        self._snapshots = [
+            SensorSnapshot(buffer, offset + RING_HEADER_SIZE + SNAPSHOT_SIZE * slot) for slot in range(slots)]
+
+    @property
+    def head(self):
+        u"""これまでに書き込まれたサンプル数(最新のサンプル番号)"""
+        return self._head[0]
+
+    def write(self, rate, left_position, right_position, voltage, voltage_ns, timestamp_ns):
+        u"""次の枠にセンサー値を書き込む(書き込み側のプロセスからのみ呼ぶこと)"""
+        index = self._head[0] + 1
+        self._snapshots[index % self.slots].write(
+            rate, left_position, right_position, voltage, voltage_ns, timestamp_ns, index)
+        self._head[0] = index
+
+    def latest(self):
+        u"""最新のセンサー値
+
+        Returns:
+            (tuple): SensorSnapshot.readと同じ。まだ書き込まれていなければNone
+        """
+        index = self._head[0]
+        if index == 0:
+            return None
+        return self._snapshots[index % self.slots].read()
+
+    def read(self, index):
+        u"""index番のセンサー値。まだ書き込まれていないか、上書きされていればNone"""
+        if index <= 0 or index > self._head[0]:
+            return None
+        values = self._snapshots[index % self.slots].read()
+        if values[6] != index:
+            return None
+        return values
+
+    def release(self):
+        self._head.release()
+        for snapshot in self._snapshots:
+            snapshot.release()
+
+
+class CommandSlot(object):
+    u"""モーターへの最新の指示(制御プロセスが書き、センサープロセスが読む)"""
+
+    def __init__(self, buffer, offset):
+        self._snapshot = SensorSnapshot(buffer, offset)
+
+    def write(self, command, left_pwm, right_pwm, tail_pwm, timestamp_ns):
+        u"""指示を書き込む
+
+        Args:
+            command (int): MotorCommand.RUNまたはMotorCommand.STOP
+        """
+        self._snapshot.write(command, left_pwm, right_pwm, tail_pwm, 0, timestamp_ns)
+
+    def read(self):
+        u"""最新の指示
+
+        Returns:
+            (tuple): (command, left_pwm, right_pwm, tail_pwm, 書き込み時刻ns, 指示の番号)。
+                指示の番号は書き込むごとに1増える(0ならまだ指示がない)
+        """
+        command, left_pwm, right_pwm, tail_pwm, _, timestamp_ns, index = self._snapshot.read()
+        return int(command), left_pwm, right_pwm, tail_pwm, timestamp_ns, index
+
+    def release(self):
+        self._snapshot.release()
+
+
+class SharedRegion(object):
+    u"""センサープロセスと制御プロセスで共有する領域"""
+
+    def __init__(self, ring_slots=RING_SLOTS, buffer=None):
+        u"""
+        Args:
+            ring_slots (int): センサー値のリングバッファの枠の数
+            buffer: region_size(ring_slots)バイト以上の共有バッファ。省略時は匿名mmapを確保する(fork前に作ること)
+        """
+        if buffer is None:
+            buffer = mmap.mmap(-1, region_size(ring_slots))
+        self.buffer = buffer
+        self._control = memoryview(buffer)[:CONTROL_SIZE].cast('Q')
+        self.command = CommandSlot(buffer, COMMAND_OFFSET)
+        self.ring = SensorRing(buffer, RING_OFFSET, ring_slots)
+
+    @property
+    def sensor_heartbeat_ns(self):
+        u"""センサープロセスが最後に生存を知らせた時刻(time.monotonic_ns)。0ならまだ動いていない"""
+        return self._control[_SENSOR_HEARTBEAT]
+
+    @sensor_heartbeat_ns.setter
+    def sensor_heartbeat_ns(self, value):
+        self._control[_SENSOR_HEARTBEAT] = value
+
+    @property
+    def control_heartbeat_ns(self):
+        u"""制御プロセスが最後に生存を知らせた時刻(time.monotonic_ns)。0ならまだ動いていない"""
+        return self._control[_CONTROL_HEARTBEAT]
+
+    @control_heartbeat_ns.setter
+    def control_heartbeat_ns(self, value):
+        self._control[_CONTROL_HEARTBEAT] = value
+
+    @property
+    def stop_requested(self):
+        return self._control[_STOP] != 0
+
+    def request_stop(self):
+        u"""センサープロセスに停止を要求する"""
+        self._control[_STOP] = 1
+
+    def close(self):
+        u"""ビューを解放してmmapを閉じる"""
+        self._control.release()
+        self.command.release()
+        self.ring.release()
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""SharedRegion/SensorRingとセンサープロセスのテスト
+
+$ python3 -m pytest shared_ring_test.py
+"""
+import contextlib
+import io
+import os
+import signal
+import time
+
+from testutil import environment
+
+with environment(EV3_BACKEND='sim'):
+    import sim.ev3
+    import balance_multiprocess
+    from balance_multiprocess import start_sensor_process, stop_sensor_process
+    from command_mailbox import MotorCommand
+    from shared_ring import SharedRegion
+
+
+def test_ring_keeps_last_slots():
+    region = SharedRegion(ring_slots=4)
+    ring = region.ring
+    assert ring.latest() is None
+    for index in range(1, 7):
+        ring.write(index, index * 2, index * 3, 7000.0, 500, index * 1000)
+    assert ring.head == 6
+    assert ring.latest() == (6, 12, 18, 7000.0, 500, 6000, 6)
+    assert ring.read(3) == (3, 6, 9, 7000.0, 500, 3000, 3)
+    # 4枠なので2番以前は上書きされている
+    assert ring.read(2) is None
+    assert ring.read(7) is None
+    region.close()
+
+
+def test_ring_shared_with_forked_writer():
+    region = SharedRegion(ring_slots=8)
+    count = 20000
+    pid = os.fork()
+    if pid == 0:
+        # 子プロセス。失敗してもpytestのプロセスとして続きを実行しないようos._exitで終わる
+        status = 1
+        try:
+            for index in range(1, count + 1):
+                region.ring.write(index, -index, index * 2, index * 3, index, index)
+            status = 0
+        finally:
+            os._exit(status)
+    torn = 0
+    finished_pid = 0
+    deadline = time.monotonic() + 10
+    # 子プロセスが終わるまで読み続ける。異常があっても期限で抜ける
+    while finished_pid == 0 and time.monotonic() < deadline:
+        values = region.ring.latest()
+        if values is not None and not (values[1] == -values[0] and values[2] == values[0] * 2):
+            torn += 1
+        finished_pid, status = os.waitpid(pid, os.WNOHANG)
+    if finished_pid == 0:
+        # 期限までに書き終わらなかった
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+    assert finished_pid == pid
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert torn == 0
+    assert region.ring.latest()[6] == count
+    region.close()
+
+
+def test_sensor_process_lifecycle():
+    sim.ev3.reset(realtime=True)
+    region = SharedRegion()
+    pid = start_sensor_process(region, heartbeat_timeout=0.05)
+    try:
+        deadline = time.monotonic() + 2
+        while region.ring.head < 10 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        assert region.ring.head >= 10
+        region.command.write(MotorCommand.RUN, 50, 50, 0, 0)
+        region.control_heartbeat_ns = time.monotonic_ns()
+        # 生存確認を止めると、センサープロセスは自分で終了する
+        finished_pid = 0
+        while finished_pid == 0 and time.monotonic() < deadline + 1:
+            finished_pid, status = os.waitpid(pid, os.WNOHANG)
+            time.sleep(0.01)
+        assert finished_pid == pid
+        assert os.waitstatus_to_exitcode(status) == 0
+        pid = None
+    finally:
+        if pid is not None:
+            stop_sensor_process(region, pid)
+        region.close()
+
+
+def test_stop_sensor_process():
+    sim.ev3.reset(realtime=True)
+    region = SharedRegion()
+    pid = start_sensor_process(region)
+    assert stop_sensor_process(region, pid) == 0
+    region.close()
+
+
+def test_robot_stop_closes_region():
+    u"""Robot.stopはセンサープロセスを回収してから共有領域を閉じる。起動に失敗しても閉じる"""
+    sim.ev3.reset(realtime=True)
+
+    class Robot(balance_multiprocess.Robot):
+        LOOP_COUNT = 5
+
+    class BrokenRobot(Robot):
+        def _wait_ready(self):
+            raise RuntimeError('sensor process did not start')
+
+    for robot_class in (Robot, BrokenRobot):
+        robot = robot_class()
+        with contextlib.redirect_stdout(io.StringIO()):
+            robot.run()
+        assert robot.sensor_pid is None
+        assert robot.exit_code == 0
+        assert robot.region.buffer.closed
+
+
+if __name__ == '__main__':
+    test_ring_keeps_last_slots()
+    test_ring_shared_with_forked_writer()
+    test_sensor_process_lifecycle()
+    test_stop_sensor_process()
+    test_robot_stop_closes_region()
+    print('ok')
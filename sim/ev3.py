@@ -0,0 +1,261 @@
+# -*- coding: UTF-8 -*-
+u"""ev3dev.ev3の代わりに使うシミュレータのデバイス
+
+ev3dev.ev3のLargeMotor/GyroSensor/PowerSupplyと同じ名前・属性で、sim.plantの物理モデルを読み書きする。
+デバイスはモジュールのworldに繋がるので、ev3dev.ev3と同じようにポート名だけで生成できる。
+
+worldは時計も兼ねていて、time.sleep/time.monotonicの代わりにworld.sleep/world.monotonicを使う。
+    realtime=True  : 実時間に合わせて物理モデルを進める
+    realtime=False : 実時間とは無関係に、world.sleepした分だけ物理モデルを進める(実時間より速く動く)
+"""
+import math
+import threading
+import time
+
+from sim.plant import Plant
+
+LEFT_WHEEL_PORT = 'outC'  # 左車輪のモータ
+RIGHT_WHEEL_PORT = 'outA'  # 右車輪のモータ
+
+
+class World(object):
+    u"""物理モデルと時計"""
+
+    def __init__(self, plant=None, realtime=False, left_port=LEFT_WHEEL_PORT, right_port=RIGHT_WHEEL_PORT,
+                 gyro_offset=0.0):
+        u"""
+        Args:
+            plant (sim.plant.Plant): 物理モデル。省略時は直立した新しいモデル
+            realtime (bool): 実時間に合わせて動かすか
+            left_port (str): 左車輪のモータのポート
+            right_port (str): 右車輪のモータのポート
+            gyro_offset (float): ジャイロセンサのオフセット(deg/s)
+        """
+        self.plant = plant if plant is not None else Plant()
+        self.realtime = realtime
+        self.left_port = left_port
+        self.right_port = right_port
+        self.gyro_offset = gyro_offset
+        self._now_ns = 0
+        self._real_start_ns = time.monotonic_ns()
+        self._lock = threading.Lock()
+        self._time_advanced = threading.Condition(self._lock)
+        self._master_thread = threading.main_thread()
+
+    def set_master_thread(self, thread=None):
+        u"""sleepで時計を進めるスレッドを設定する(realtime=Falseの時のみ意味がある)
+
+        それ以外のスレッドのsleepは、時計が進むのを待つだけになる。省略時はメインスレッド。
+        """
+        self._master_thread = thread if thread is not None else threading.current_thread()
+
+    def monotonic_ns(self):
+        u"""シミュレーション時刻(ns)"""
+        with self._lock:
+            self._sync()
+            return self._now_ns
+
+    def monotonic(self):
+        u"""シミュレーション時刻(秒)"""
+        return self.monotonic_ns() / 1e9
+
+    def time(self):
+        u"""time.timeの代わり"""
+        return self.monotonic()
+
+    def sleep(self, seconds):
+        u"""time.sleepの代わり"""
+        if seconds <= 0:
+            return
+        if self.realtime:
+            time.sleep(seconds)
+        elif threading.current_thread() is self._master_thread:
+            self.advance(seconds)
+        else:
+            target_ns = self._now_ns + int(seconds * 1e9)
+            with self._time_advanced:
+                # 時計を進めるスレッドがいなくなっても止まらないよう、実時間でseconds以上は待たない
+                self._time_advanced.wait_for(lambda: self._now_ns >= target_ns, timeout=seconds)
+
+    def advance(self, seconds):
+        u"""物理モデルをseconds秒進める(realtime=Falseの時のみ)"""
+        # 他のスレッド(モータへの指示など)に先に実行させる
+        time.sleep(0)
+        with self._time_advanced:
+            self.plant.step(seconds)
+            self._now_ns += int(seconds * 1e9)
+            self._time_advanced.notify_all()
+
+    def _sync(self):
+        u"""realtime=Trueの時、物理モデルを現在時刻まで進める。ロックを取ってから呼ぶこと"""
+        if not self.realtime:
+            return
+        now_ns = time.monotonic_ns() - self._real_start_ns
+        if now_ns > self._now_ns:
+            self.plant.step((now_ns - self._now_ns) / 1e9)
+            self._now_ns = now_ns
+
+    def read(self, getter):
+        u"""物理モデルを現在時刻まで進めてからgetter(plant)を返す"""
+        with self._lock:
+            self._sync()
+            return getter(self.plant)
+
+    def set_pwm(self, port, pwm):
+        u"""portのモータにPWM値を設定する"""
+        pwm = max(-100.0, min(100.0, float(pwm)))
+        with self._lock:
+            self._sync()
+            if port == self.left_port:
+                self.plant.pwm_l = pwm
+            elif port == self.right_port:
+                self.plant.pwm_r = pwm
+            else:
+                self.plant.free_motors.setdefault(port, [0.0, 0.0, 0.0])[1] = pwm
+
+    def motor_angle(self, port):
+        u"""portのモータの角度(rad)"""
+        if port == self.left_port:
+            return self.read(lambda plant: plant.motor_angles()[0])
+        elif port == self.right_port:
+            return self.read(lambda plant: plant.motor_angles()[1])
+        return self.read(lambda plant: plant.free_motors.setdefault(port, [0.0, 0.0, 0.0])[0])
+
+
+world = World()
+
+
+def reset(**kwargs):
+    u"""モジュールのworldを初期状態に戻す。引数はWorldと同じ
+
+    worldのオブジェクトはそのまま使い回すので、既に生成したデバイスや
+    ev3_backend.clockも新しい状態に繋がる。
+    """
+    world.__init__(**kwargs)
+    return world
+
+
+class PowerSupply(object):
+    u"""ev3dev.ev3.PowerSupplyの代わり"""
+
+    def __init__(self, address=None):
+        self._world = world
+        self._path = '/sys/class/power_supply/lego-ev3-battery'
+        self.connected = True
+
+    @property
+    def measured_voltage(self):
+        u"""電圧(μV)"""
+        return int(self._world.read(lambda plant: plant.battery.voltage) * 1000000)
+
+    @property
+    def measured_current(self):
+        u"""電流(μA)"""
+        return int(self._world.read(lambda plant: plant.battery.current) * 1000000)
+
+    @property
+    def measured_volts(self):
+        return self.measured_voltage / 1e6
+
+    @property
+    def measured_amps(self):
+        return self.measured_current / 1e6
+
+
+class GyroSensor(object):
+    u"""ev3dev.ev3.GyroSensorの代わり"""
+
+    def __init__(self, address=None):
+        self._world = world
+        self.address = address
+        self._path = '/sys/class/lego-sensor/sensor0'
+        self.connected = True
+        self.mode = 'GYRO-ANG'
+
+    @property
+    def rate(self):
+        u"""角速度(deg/s)"""
+        world_ = self._world
+        return int(round(world_.read(lambda plant: math.degrees(plant.psi_dot)) + world_.gyro_offset))
+
+    @property
+    def angle(self):
+        u"""角度(deg)"""
+        return int(round(self._world.read(lambda plant: math.degrees(plant.psi))))
+
+    @property
+    def rate_and_angle(self):
+        u"""GYRO-G&Aモードの値 (角度, 角速度)"""
+        return self.angle, self.rate
+
+    def value(self, n=0):
+        if self.mode == 'GYRO-RATE':
+            return self.rate
+        elif self.mode == 'GYRO-G&A':
+            return self.rate_and_angle[n]
+        return self.angle
+
+
+class LargeMotor(object):
+    u"""ev3dev.ev3.LargeMotorの代わり"""
+    COUNT_PER_ROT = 360
+    MAX_SPEED = 1050  # speed_spの最大値(deg/s)
+
+    def __init__(self, address=None):
+        self._world = world
+        self.address = address
+        self._path = '/sys/class/tacho-motor/motor{}'.format('ABCD'.find(address[-1]) if address else 0)
+        self.connected = True
+        self._position_offset = 0.0
+        self._duty_cycle_sp = 0
+        self.speed_sp = 0
+        self.command = 'stop'
+        self.stop_action = 'coast'
+
+    @property
+    def position(self):
+        u"""エンコーダ値(deg)"""
+        return int(round(math.degrees(self._world.motor_angle(self.address)) - self._position_offset))
+
+    @position.setter
+    def position(self, value):
+        self._position_offset = math.degrees(self._world.motor_angle(self.address)) - value
+
+    @property
+    def duty_cycle_sp(self):
+        return self._duty_cycle_sp
+
+    @duty_cycle_sp.setter
+    def duty_cycle_sp(self, value):
+        self._duty_cycle_sp = int(value)
+        if self.command == 'run-direct':
+            self._world.set_pwm(self.address, self._duty_cycle_sp)
+
+    @property
+    def duty_cycle(self):
+        return self._duty_cycle_sp if self.command != 'stop' else 0
+
+    def reset(self):
+        self.stop()
+        self.position = 0
+        self._duty_cycle_sp = 0
+        self.speed_sp = 0
+
+    def run_direct(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+        self.command = 'run-direct'
+        self._world.set_pwm(self.address, self._duty_cycle_sp)
+
+    def run_forever(self, **kwargs):
+        u"""速度制御はせず、speed_spに比例したPWM値で回す"""
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+        self.command = 'run-forever'
+        self._world.set_pwm(self.address, self.speed_sp * 100.0 / self.MAX_SPEED)
+
+    def stop(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+        self.command = 'stop'
+        self._world.set_pwm(self.address, 0)
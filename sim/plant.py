@@ -0,0 +1,189 @@
+# -*- coding: UTF-8 -*-
+u"""二輪倒立振子(NXTway-GS型)の物理モデル
+
+NXTway-GSのモデル(Yorihisa Yamamoto, "NXTway-GS Model-Based Design")の非線形運動方程式を
+EV3の寸法に合わせたパラメータで解く。
+
+状態:
+    theta : 左右車輪の平均回転角度(rad, 地面基準)
+    psi   : 車体ピッチ角度(rad, 鉛直上向きが0、前傾が正)
+    phi   : 車体ヨー角度(rad)
+モータのエンコーダ値は車体基準なので theta_l - psi, theta_r - psi になる。
+"""
+import math
+
+GRAVITY = 9.81  # 重力加速度(m/s^2)
+WHEEL_MASS = 0.03  # 車輪質量(kg)
+WHEEL_RADIUS = 0.0405  # 車輪半径(m)
+BODY_MASS = 0.6  # 車体質量(kg)
+BODY_WIDTH = 0.1326  # 車体トレッド幅(m)
+BODY_DEPTH = 0.04  # 車体奥行き(m)
+BODY_HEIGHT = 0.144  # 車体高さ(m)
+MOTOR_INERTIA = 1e-5  # モータ慣性モーメント(kgm^2)
+MOTOR_RESISTANCE = 6.69  # モータ抵抗(Ω)
+MOTOR_BACK_EMF = 0.468  # 逆起電力定数(Vsec/rad)
+MOTOR_TORQUE = 0.317  # トルク定数(Nm/A)
+MOTOR_FRICTION = 0.0022  # 車体とモータ間の摩擦係数
+WHEEL_FRICTION = 0.0  # 車輪と路面間の摩擦係数
+
+FALL_ANGLE = math.radians(80.0)  # これ以上傾いたら倒れたとみなす角度
+
+
+class Battery(object):
+    u"""電圧降下と消耗のあるバッテリのモデル"""
+
+    def __init__(self, full_voltage=8.3, empty_voltage=6.5, capacity_ah=2.05, internal_resistance=0.3,
+                 idle_current=0.12):
+        u"""
+        Args:
+            full_voltage (float): 満充電時の開放電圧(V)
+            empty_voltage (float): 空の時の開放電圧(V)
+            capacity_ah (float): 容量(Ah)
+            internal_resistance (float): 内部抵抗(Ω)
+            idle_current (float): モータ以外の消費電流(A)
+        """
+        self.full_voltage = full_voltage
+        self.empty_voltage = empty_voltage
+        self.capacity_coulomb = capacity_ah * 3600.0
+        self.internal_resistance = internal_resistance
+        self.idle_current = idle_current
+        self.used_coulomb = 0.0
+        self.current = idle_current  # 直近の消費電流(A)
+
+    @property
+    def open_voltage(self):
+        u"""開放電圧(V)。消費した電荷に比例して下がる"""
+        ratio = min(self.used_coulomb / self.capacity_coulomb, 1.0)
+        return self.full_voltage - (self.full_voltage - self.empty_voltage) * ratio
+
+    @property
+    def voltage(self):
+        u"""端子電圧(V)。内部抵抗による電圧降下を含む"""
+        return self.open_voltage - self.current * self.internal_resistance
+
+    def drain(self, motor_current, dt):
+        u"""dt秒間にmotor_current(A)流れたものとして消耗させる"""
+        self.current = self.idle_current + motor_current
+        self.used_coulomb += self.current * dt
+
+
+class Plant(object):
+    u"""二輪倒立振子の車体と左右車輪、それ以外のモータ(尻尾など)
+
+    左右モータとバッテリに与えたPWM値(-100～100)で状態を時間発展させる。
+    """
+
+    def __init__(self, battery=None, max_step=0.002, initial_psi=0.0):
+        u"""
+        Args:
+            battery (Battery): バッテリ。省略時は新品のバッテリ
+            max_step (float): 積分の最大刻み幅(秒)
+            initial_psi (float): 初期の車体ピッチ角度(rad)
+        """
+        self.battery = battery if battery is not None else Battery()
+        self.max_step = max_step
+
+        self.theta = 0.0
+        self.psi = initial_psi
+        self.phi = 0.0
+        self.theta_dot = 0.0
+        self.psi_dot = 0.0
+        self.phi_dot = 0.0
+        self.fallen = False
+        self.pwm_l = 0.0
+        self.pwm_r = 0.0
+        # 左右車輪以外のモータ。ポート名 -> [角度(rad), PWM値, 角速度(rad/s)]
+        self.free_motors = {}
+
+        # 運動方程式の定数
+        mass_l = BODY_MASS * BODY_HEIGHT / 2.0  # M * L
+        wheel_inertia = WHEEL_MASS * WHEEL_RADIUS ** 2 / 2.0
+        body_pitch_inertia = BODY_MASS * (BODY_HEIGHT / 2.0) ** 2 / 3.0
+        body_yaw_inertia = BODY_MASS * (BODY_WIDTH ** 2 + BODY_DEPTH ** 2) / 12.0
+        self._alpha = MOTOR_TORQUE / MOTOR_RESISTANCE
+        self._beta = MOTOR_TORQUE * MOTOR_BACK_EMF / MOTOR_RESISTANCE + MOTOR_FRICTION
+        self._e11 = (2 * WHEEL_MASS + BODY_MASS) * WHEEL_RADIUS ** 2 + 2 * wheel_inertia + 2 * MOTOR_INERTIA
+        self._mlr = mass_l * WHEEL_RADIUS
+        self._e22 = mass_l * BODY_HEIGHT / 2.0 + body_pitch_inertia + 2 * MOTOR_INERTIA
+        self._mgl = mass_l * GRAVITY
+        self._mll = mass_l * BODY_HEIGHT / 2.0
+        self._yaw_inertia = (WHEEL_MASS * BODY_WIDTH ** 2 / 2.0 + body_yaw_inertia +
+                             BODY_WIDTH ** 2 / (2.0 * WHEEL_RADIUS ** 2) * (wheel_inertia + MOTOR_INERTIA))
+        self._yaw_drive = BODY_WIDTH / (2.0 * WHEEL_RADIUS)
+        self._yaw_damping = BODY_WIDTH ** 2 / (2.0 * WHEEL_RADIUS ** 2) * (self._beta + WHEEL_FRICTION)
+        self._free_motor_rate = MOTOR_TORQUE * MOTOR_BACK_EMF / (MOTOR_INERTIA * MOTOR_RESISTANCE)
+
+    def motor_angles(self):
+        u"""左右モータのエンコーダ値(rad, 車体基準)"""
+        half_yaw = self._yaw_drive * self.phi
+        return self.theta - half_yaw - self.psi, self.theta + half_yaw - self.psi
+
+    def step(self, seconds):
+        u"""seconds秒だけ状態を進める(max_step以下の刻みに分割する)"""
+        steps = int(math.ceil(seconds / self.max_step))
+        if steps <= 0:
+            return
+        dt = seconds / steps
+        for _ in range(steps):
+            self._step(dt)
+
+    def _step(self, dt):
+        battery = self.battery
+        # PWM値からモータ電圧へ。balance_controlのバッテリ補正と同じ式
+        max_voltage = 0.001089 * battery.voltage * 1000.0 - 0.625
+        v_l = self.pwm_l * 0.01 * max_voltage
+        v_r = self.pwm_r * 0.01 * max_voltage
+
+        theta_dot = self.theta_dot
+        psi_dot = self.psi_dot
+        phi_dot = self.phi_dot
+        sin_psi = math.sin(self.psi)
+        cos_psi = math.cos(self.psi)
+
+        alpha = self._alpha
+        beta = self._beta
+        f_theta = alpha * (v_l + v_r) - 2.0 * (beta + WHEEL_FRICTION) * theta_dot + 2.0 * beta * psi_dot
+        f_psi = -alpha * (v_l + v_r) + 2.0 * beta * theta_dot - 2.0 * beta * psi_dot
+        f_phi = self._yaw_drive * alpha * (v_r - v_l) - self._yaw_damping * phi_dot
+
+        # [e11 e12][θ''] = [f_theta + MLR ψ'^2 sinψ]
+        # [e12 e22][ψ''] = [f_psi + MgL sinψ + ML^2 φ'^2 sinψ cosψ]
+        e12 = self._mlr * cos_psi - 2 * MOTOR_INERTIA
+        rhs_theta = f_theta + self._mlr * psi_dot * psi_dot * sin_psi
+        rhs_psi = f_psi + self._mgl * sin_psi + self._mll * phi_dot * phi_dot * sin_psi * cos_psi
+        det = self._e11 * self._e22 - e12 * e12
+        theta_ddot = (self._e22 * rhs_theta - e12 * rhs_psi) / det
+        psi_ddot = (self._e11 * rhs_psi - e12 * rhs_theta) / det
+        phi_ddot = ((f_phi - 2.0 * self._mll * psi_dot * phi_dot * sin_psi * cos_psi) /
+                    (self._yaw_inertia + self._mll * sin_psi * sin_psi))
+
+        if self.fallen:
+            # 倒れた後は車体は床に着いたまま
+            psi_ddot = 0.0
+            self.psi_dot = 0.0
+        else:
+            self.psi_dot = psi_dot + psi_ddot * dt
+        # 半陰的オイラー法
+        self.theta_dot = theta_dot + theta_ddot * dt
+        self.phi_dot = phi_dot + phi_ddot * dt
+        self.theta += self.theta_dot * dt
+        self.psi += self.psi_dot * dt
+        self.phi += self.phi_dot * dt
+        if not self.fallen and abs(self.psi) > FALL_ANGLE:
+            self.fallen = True
+            self.psi = math.copysign(FALL_ANGLE, self.psi)
+            self.psi_dot = 0.0
+
+        # モータ電流 = (電圧 - 逆起電力) / 抵抗
+        motor_dot = self.theta_dot - self.psi_dot
+        yaw_dot = self._yaw_drive * self.phi_dot
+        current = (abs(v_l - MOTOR_BACK_EMF * (motor_dot - yaw_dot)) +
+                   abs(v_r - MOTOR_BACK_EMF * (motor_dot + yaw_dot))) / MOTOR_RESISTANCE
+
+        # 尻尾などの負荷のないモータは1次遅れで無負荷回転数に近づける
+        for state in self.free_motors.values():
+            target_speed = state[1] * 0.01 * max_voltage / MOTOR_BACK_EMF
+            state[2] += (target_speed - state[2]) * min(self._free_motor_rate * dt, 1.0)
+            state[0] += state[2] * dt
+            current += abs(state[1] * 0.01 * max_voltage - MOTOR_BACK_EMF * state[2]) / MOTOR_RESISTANCE
+        battery.drain(current, dt)
@@ -0,0 +1,361 @@
+# -*- coding: UTF-8 -*-
+u"""ev3devのsysfs(/sys/class/...)を真似たディレクトリツリー
+
+一時ディレクトリ(あれば/dev/shmのtmpfs)に、tacho-motor/lego-sensor/power_supplyの属性ファイルを作る。
+startするとバックグラウンドの「デバイス」スレッドがsim.ev3.Worldを実時間で動かし、
+duty_cycle_spやcommandへの書き込みを読み取ってposition/value0/voltage_nowを書き換える。
+
+    fake = FakeSysfs()
+    fake.start()
+    fd = open(fake.motor_path('outC') + '/position', 'rb')
+    ...
+    fake.cleanup()
+
+ev3dev.ev3のデバイスをこのツリーに向ける時は ev3dev.core.Device.DEVICE_ROOT_PATH = fake.class_path とする。
+
+普通のファイルは実際のsysfsと違い、seek(0)してから短い値を書くと古い値の後ろが残り、
+truncate(0)してから書くとファイル位置までNUL文字で埋まる。そのためデバイス側は
+    数値 : 先頭の空白区切りのトークンを値とみなす。デバイスが書く値は右寄せにして、上書きされても先頭が新しい値になるようにする
+    文字列 : 取りうる値のうち、先頭が一致するものを値とみなす
+として読む。
+
+実機のsysfsは読み書きに時間がかかるので、open_attributeで開いたファイルには
+LatencyModelに従った遅延を入れられる(os.preadなどファイルディスクリプタを直接使う場合はread_delay/write_delayを呼ぶ)。
+"""
+import io
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from sim.ev3 import World
+
+MOTOR_PORTS = ('outA', 'outB', 'outC', 'outD')
+GYRO_PORT = 'in4'
+BATTERY_NAME = 'lego-ev3-battery'
+VALUE_WIDTH = 12  # デバイスが書き込む値の桁数(改行を除く)。読み手が途中の値を読まないよう、常に同じ長さで上書きする
+MOTOR_COMMANDS = ('run-forever', 'run-to-abs-pos', 'run-to-rel-pos', 'run-timed', 'run-direct', 'stop', 'reset')
+GYRO_MODES = ('GYRO-ANG', 'GYRO-RATE', 'GYRO-FAS', 'GYRO-G&A', 'GYRO-CAL')
+
+
+class LatencyModel(object):
+    u"""sysfsの読み書き1回あたりの遅延の分布
+
+    samplesを渡すと実測値からそのまま抽出する。渡さない場合は中央値と99パーセンタイルから決めた対数正規分布。
+    """
+
+    def __init__(self, median_us, p99_us, samples=None, seed=None):
+        u"""
+        Args:
+            median_us (float): 遅延の中央値(μs)
+            p99_us (float): 遅延の99パーセンタイル(μs)
+            samples (list): 実測した遅延(μs)のリスト
+            seed (int): 乱数のシード
+        """
+        self.median_us = median_us
+        self.p99_us = p99_us
+        self.samples = list(samples) if samples else None
+        self._random = random.Random(seed)
+        self._mu = math.log(median_us)
+        # 99パーセンタイルは平均から2.326σ
+        self._sigma = max(math.log(p99_us / median_us) / 2.326, 0.0)
+
+    @classmethod
+    def from_samples(cls, samples, seed=None):
+        u"""実測した遅延(μs)のリストから作る(file_write_time.pyなどで測ったもの)"""
+        ordered = sorted(samples)
+        median = ordered[len(ordered) // 2]
+        p99 = ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)]
+        return cls(median, p99, samples=ordered, seed=seed)
+
+    @classmethod
+    def from_file(cls, path, seed=None):
+        u"""実測した遅延(μs)を1行に1つ書いたファイルから作る(空行と#で始まる行は飛ばす)"""
+        with open(path) as file:
+            samples = [float(line) for line in (line.strip() for line in file) if line and not line.startswith('#')]
+        if not samples:
+            raise ValueError('{} has no latency samples'.format(path))
+        return cls.from_samples(samples, seed=seed)
+
+    def sample(self):
+        u"""遅延を1つ取り出す(秒)"""
+        if self.samples:
+            return self._random.choice(self.samples) / 1000000
+        return self._random.lognormvariate(self._mu, self._sigma) / 1000000
+
+
+# sysfsの遅延の仮の値(中央値μs, 99パーセンタイルμs)。EV3実機で測った値ではなく、桁を合わせただけの目安。
+# 実機の遅延を再現するときは、実機で測った値をLatencyModel.from_samples/from_fileで使う
+PLACEHOLDER_READ_LATENCY = (70, 400)
+PLACEHOLDER_WRITE_LATENCY = (200, 1200)
+
+
+def placeholder_latency(seed=None):
+    u"""仮の値(PLACEHOLDER_READ_LATENCY, PLACEHOLDER_WRITE_LATENCY)で(読み込み, 書き込み)のLatencyModelを作る
+
+    実測値ではないので、これを入れて測った時間を実機の時間として扱わないこと。
+    """
+    return (LatencyModel(*PLACEHOLDER_READ_LATENCY, seed=seed),
+            LatencyModel(*PLACEHOLDER_WRITE_LATENCY, seed=None if seed is None else seed + 1))
+
+
+def spin(seconds):
+    u"""secondsだけビジーウェイトする。sleepでは100μs以下の遅延を再現できないため"""
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class LatentFile(object):
+    u"""読み書きのたびに遅延を入れるファイルのラッパー"""
+
+    def __init__(self, file, sysfs):
+        self._file = file
+        self._sysfs = sysfs
+
+    def read(self, *args):
+        self._sysfs.read_delay()
+        return self._file.read(*args)
+
+    def write(self, data):
+        # バッファリングしないファイルではwriteがそのままシステムコールになる
+        if isinstance(self._file, io.RawIOBase):
+            self._sysfs.write_delay()
+        return self._file.write(data)
+
+    def flush(self):
+        self._sysfs.write_delay()
+        return self._file.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+
+class FakeSysfs(object):
+    u"""ev3devのsysfsを真似たディレクトリツリーと、それを更新するデバイス"""
+
+    def __init__(self, root=None, world=None, read_latency=None, write_latency=None, update_period=0.001):
+        u"""
+        Args:
+            root (str): ツリーを作るディレクトリ。省略時は一時ディレクトリ(/dev/shmがあればその下)
+            world (sim.ev3.World): デバイスの中身。省略時は実時間で動く新しいWorld
+            read_latency (LatencyModel): 読み込みの遅延。省略時は遅延なし
+            write_latency (LatencyModel): 書き込みの遅延。省略時は遅延なし
+            update_period (float): デバイスが値を更新する周期(秒)
+        """
+        if root is None:
+            self._temp_dir = tempfile.mkdtemp(prefix='ev3sysfs', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+            root = self._temp_dir
+        else:
+            self._temp_dir = None
+        self.root = root
+        self.class_path = os.path.join(root, 'class')
+        self.world = world if world is not None else World(realtime=True)
+        self.read_latency = read_latency
+        self.write_latency = write_latency
+        self.update_period = update_period
+        self._is_loop = False
+        self._thread = None
+        # ポート名 -> [書き込んだ位置, 位置のオフセット(deg)]
+        self._motor_positions = {port: [0, 0.0] for port in MOTOR_PORTS}
+        self._build()
+
+    def motor_path(self, port):
+        u"""portのtacho-motorのディレクトリ"""
+        return os.path.join(self.class_path, 'tacho-motor', 'motor{}'.format(MOTOR_PORTS.index(port)))
+
+    def gyro_path(self):
+        return os.path.join(self.class_path, 'lego-sensor', 'sensor0')
+
+    def battery_path(self):
+        return os.path.join(self.class_path, 'power_supply', BATTERY_NAME)
+
+    def _build(self):
+        for port in MOTOR_PORTS:
+            self._make_device(self.motor_path(port), {
+                'address': port,
+                'driver_name': 'lego-ev3-l-motor',
+                'command': '',
+                'commands': ' '.join(MOTOR_COMMANDS),
+                'count_per_rot': '360',
+                'duty_cycle': _fixed(0),
+                'duty_cycle_sp': _fixed(0),
+                'position': _fixed(0),
+                'speed': _fixed(0),
+                'speed_sp': _fixed(0),
+                'state': '',
+                'stop_action': 'coast',
+            })
+        self._make_device(self.gyro_path(), {
+            'address': GYRO_PORT,
+            'driver_name': 'lego-ev3-gyro',
+            'mode': 'GYRO-ANG',
+            'modes': ' '.join(GYRO_MODES),
+            'num_values': '1',
+            'value0': _fixed(0),
+            'value1': _fixed(0),
+        })
+        self._make_device(self.battery_path(), {
+            'type': 'Battery',
+            'technology': 'Unknown',
+            'current_now': _fixed(0),
+            'voltage_now': _fixed(0),
+            'voltage_max_design': '9000000',
+            'voltage_min_design': '6000000',
+        })
+        self._update()
+
+    @staticmethod
+    def _make_device(path, attributes):
+        os.makedirs(path, exist_ok=True)
+        for name, value in attributes.items():
+            with open(os.path.join(path, name), 'w') as file:
+                file.write('{}\n'.format(value))
+
+    def open_attribute(self, path, mode='rb', buffering=-1):
+        u"""属性ファイルを開く。遅延が設定されていれば読み書きのたびに遅延を入れる"""
+        file = open(path, mode, buffering=buffering)
+        if self.read_latency is None and self.write_latency is None:
+            return file
+        return LatentFile(file, self)
+
+    def read_delay(self):
+        if self.read_latency is not None:
+            spin(self.read_latency.sample())
+
+    def write_delay(self):
+        if self.write_latency is not None:
+            spin(self.write_latency.sample())
+
+    def start(self):
+        u"""デバイスのスレッドを開始する"""
+        self._is_loop = True
+        self._thread = threading.Thread(target=self.loop, name='fake_sysfs_thread', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        u"""デバイスのスレッドを停止する"""
+        self._is_loop = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def cleanup(self):
+        u"""デバイスを停止して一時ディレクトリを消す"""
+        self.stop()
+        if self._temp_dir is not None:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
+
+    def loop(self):
+        u"""書き込まれた指示を読み取り、センサー値を更新し続ける"""
+        while self._is_loop:
+            self._update()
+            time.sleep(self.update_period)
+
+    def _update(self):
+        world = self.world
+        for port in MOTOR_PORTS:
+            path = self.motor_path(port)
+            command_file = os.path.join(path, 'command')
+            command = _read_choice(command_file, MOTOR_COMMANDS)
+            position_state = self._motor_positions[port]
+            if command == 'reset':
+                position_state[1] = math.degrees(world.motor_angle(port))
+                _write_text(command_file, '')
+                _write_fixed(os.path.join(path, 'duty_cycle_sp'), 0)
+                command = 'stop'
+            if command == 'run-direct':
+                duty_file = os.path.join(path, 'duty_cycle_sp')
+                duty = _read_int(duty_file)
+                world.set_pwm(port, duty)
+                _write_fixed(duty_file, duty)
+                _write_fixed(os.path.join(path, 'duty_cycle'), duty)
+                _write_text(os.path.join(path, 'state'), 'running')
+            else:
+                world.set_pwm(port, 0)
+                _write_fixed(os.path.join(path, 'duty_cycle'), 0)
+                _write_text(os.path.join(path, 'state'), '')
+
+            # 利用側がpositionに書き込んでいたら、その値を基準にする
+            position_file = os.path.join(path, 'position')
+            written = _read_int(position_file)
+            angle = math.degrees(world.motor_angle(port))
+            if written != position_state[0]:
+                position_state[1] = angle - written
+            position = int(round(angle - position_state[1]))
+            position_state[0] = position
+            _write_fixed(position_file, position)
+
+        gyro_path = self.gyro_path()
+        mode = _read_choice(os.path.join(gyro_path, 'mode'), GYRO_MODES)
+        rate = int(round(world.read(lambda plant: math.degrees(plant.psi_dot)) + world.gyro_offset))
+        angle = int(round(world.read(lambda plant: math.degrees(plant.psi))))
+        if mode == 'GYRO-RATE':
+            _write_fixed(os.path.join(gyro_path, 'value0'), rate)
+        elif mode == 'GYRO-G&A':
+            _write_fixed(os.path.join(gyro_path, 'value0'), angle)
+            _write_fixed(os.path.join(gyro_path, 'value1'), rate)
+        else:
+            _write_fixed(os.path.join(gyro_path, 'value0'), angle)
+
+        battery_path = self.battery_path()
+        voltage, current = world.read(lambda plant: (plant.battery.voltage, plant.battery.current))
+        _write_fixed(os.path.join(battery_path, 'voltage_now'), int(voltage * 1000000))
+        _write_fixed(os.path.join(battery_path, 'current_now'), int(current * 1000000))
+
+
+def _fixed(value):
+    u"""VALUE_WIDTH桁に右寄せした値の文字列"""
+    return '{:>{}d}'.format(value, VALUE_WIDTH)
+
+
+def _write_fixed(path, value):
+    u"""値を同じ長さで上書きする。truncateしないので、読み手が空のファイルを読むことはない"""
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        os.pwrite(fd, '{}\n'.format(_fixed(value)).encode(), 0)
+    finally:
+        os.close(fd)
+
+
+def _write_text(path, value):
+    u"""文字列を空白で埋めて同じ長さで上書きする"""
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        os.pwrite(fd, '{:<{}}\n'.format(value, VALUE_WIDTH + 8).encode(), 0)
+    finally:
+        os.close(fd)
+
+
+def _read_text(path):
+    u"""属性ファイルを読む。truncateしてから書き込まれた場合のNUL文字は空白とみなす"""
+    with open(path, 'rb') as file:
+        return file.read().replace(b'\0', b' ').decode().strip()
+
+
+def _read_int(path):
+    u"""先頭のトークンを数値として読む"""
+    tokens = _read_text(path).split()
+    try:
+        return int(tokens[0])
+    except (IndexError, ValueError):
+        return 0
+
+
+def _read_choice(path, choices):
+    u"""choicesのうち、先頭が一致するものを返す。どれにも一致しなければ空文字"""
+    text = _read_text(path)
+    for choice in choices:
+        if text.startswith(choice):
+            return choice
+    return ''
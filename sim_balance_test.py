@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""シミュレータ(sim)でバランス制御を動かしてみるテスト
+
+実機なしで、Robot._main_loopを実時間より速く回せることを確かめる
+$ python3 sim_balance_test.py
+"""
+import contextlib
+import io
+import math
+import time
+
+from testutil import environment
+
+with environment(EV3_BACKEND='sim'):
+    import balance.balance as balance
+    from actuator import ACTUATOR_SERVICE
+    import balance_sensor_other_thread
+    import sim.ev3
+    from sim.plant import Plant
+
+SIMULATION_SECONDS = 60
+MAX_ELAPSED = 5.0  # SIMULATION_SECONDS分を回すのにかかってよい実時間(秒)。手元では0.4秒ほど。負荷のあるマシン用に余裕を持たせる
+
+
+def test_main_loop_faster_than_realtime():
+    world = sim.ev3.reset(realtime=False)
+
+    class Robot(balance_sensor_other_thread.Robot):
+        LOOP_COUNT = int(SIMULATION_SECONDS / balance.EXEC_PERIOD)
+
+    robot = Robot()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        robot.run()
+    elapsed = time.perf_counter() - start
+    print('{}s simulated in {:.3f}s'.format(world.monotonic(), elapsed))
+    # シミュレーション時刻と周期の数で確かめる。実時間はマシンの負荷で変わるので、上限は余裕を持たせたMAX_ELAPSED
+    assert world.monotonic() >= SIMULATION_SECONDS * 0.99
+    assert robot.profile.work.count == Robot.LOOP_COUNT
+    assert robot.profile.jitter.count == Robot.LOOP_COUNT
+    assert elapsed < MAX_ELAPSED
+
+
+def test_actuator_service_drives_wheels():
+    sim.ev3.reset(realtime=False)
+
+    class Robot(balance_sensor_other_thread.Robot):
+        LOOP_COUNT = 50
+
+    robot = Robot(actuator_mode=ACTUATOR_SERVICE)
+    with contextlib.redirect_stdout(io.StringIO()):
+        robot.run()
+    # 書き込みが間に合わなかった周期の指示は次の指示で上書きされるので、全周期分とは限らない
+    for motor in (robot.left_motor, robot.right_motor):
+        assert Robot.LOOP_COUNT // 2 < motor.actuation.count <= Robot.LOOP_COUNT
+    assert robot.actuator.passes > Robot.LOOP_COUNT // 2
+    assert robot.profile.jitter.count == Robot.LOOP_COUNT
+
+
+def test_tick_acquisition_reads_once_per_tick():
+    sim.ev3.reset(realtime=False)
+
+    class Robot(balance_sensor_other_thread.Robot):
+        LOOP_COUNT = 50
+
+    robot = Robot(acquisition=balance_sensor_other_thread.ACQUIRE_TICK)
+    with contextlib.redirect_stdout(io.StringIO()):
+        robot.run()
+    # 刻みが決まる前の1回 + 周期ごとに1回(終了時に1周期分ずれることがある)
+    assert Robot.LOOP_COUNT - 1 <= robot.balance_param.snapshot.sample_index <= Robot.LOOP_COUNT + 1
+
+
+def test_plant_balances_with_nxtway_gains():
+    u"""NXTway-GSの元のゲインと4ms周期なら、3度傾いた状態から立ち直る"""
+    period = 0.004
+    k_f = list(balance.K_F)
+    k_f[2] = -1.1566
+    controller = balance.BalanceController(k_f=k_f, exec_period=period)
+    plant = Plant(initial_psi=math.radians(3))
+    for _ in range(int(10 / period)):
+        left, right = plant.motor_angles()
+        plant.pwm_l, plant.pwm_r = controller.control(
+            0, 0, round(math.degrees(plant.psi_dot)), 0, round(math.degrees(left)), round(math.degrees(right)),
+            plant.battery.voltage * 1000)
+        plant.step(period)
+    assert not plant.fallen
+    assert abs(math.degrees(plant.psi)) < 1.0
+
+
+def test_battery_sags_under_load():
+    world = sim.ev3.reset(realtime=False)
+    battery = sim.ev3.PowerSupply()
+    left_motor = sim.ev3.LargeMotor(sim.ev3.LEFT_WHEEL_PORT)
+    right_motor = sim.ev3.LargeMotor(sim.ev3.RIGHT_WHEEL_PORT)
+    idle_voltage = battery.measured_voltage
+    left_motor.run_direct(duty_cycle_sp=100)
+    right_motor.run_direct(duty_cycle_sp=100)
+    world.sleep(0.1)
+    assert left_motor.position > 0 and right_motor.position > 0
+    assert battery.measured_voltage < idle_voltage
+    assert world.plant.battery.used_coulomb > 0
+
+
+if __name__ == '__main__':
+    test_main_loop_faster_than_realtime()
+    test_actuator_service_drives_wheels()
+    test_tick_acquisition_reads_once_per_tick()
+    test_plant_balances_with_nxtway_gains()
+    test_battery_sags_under_load()
+    print('ok')
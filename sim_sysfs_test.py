@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""偽のsysfs(sim.sysfs)をmotor_angle_recorder.pyの読み書き関数で動かしてみるテスト
+
+$ python3 sim_sysfs_test.py
+"""
+import os
+import tempfile
+import time
+
+from motor_angle_recorder import read_device, write_device
+from sim.sysfs import FakeSysfs, LatencyModel
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def test_duty_cycle_moves_position():
+    sysfs = FakeSysfs()
+    sysfs.start()
+    try:
+        motor_path = sysfs.motor_path('outC')
+        with open(motor_path + '/command', 'w') as command_file:
+            command_file.write('run-direct')
+        position_file = open(motor_path + '/position', 'rb')
+        duty_file = open(motor_path + '/duty_cycle_sp', 'w')
+        voltage_file = open(sysfs.battery_path() + '/voltage_now', 'rb')
+        # truncateしてから書くwrite_deviceを何度呼んでも値が読み取れること
+        for duty in (30, 100, 100):
+            write_device(duty_file, duty)
+        assert wait_for(lambda: read_device(position_file) > 30)
+        assert 6000000 < read_device(voltage_file) < 9000000
+
+        write_device(duty_file, -100)
+        assert wait_for(lambda: read_device(position_file) < 0, timeout=5.0)
+        for file in (position_file, duty_file, voltage_file):
+            file.close()
+    finally:
+        sysfs.cleanup()
+    assert not os.path.exists(sysfs.root)
+
+
+def test_overwritten_attributes():
+    u"""seek(0)して短い値を書いても、新しい値として読まれること"""
+    sysfs = FakeSysfs()
+    try:
+        motor_path = sysfs.motor_path('outA')
+        for command in ('run-direct', 'stop'):
+            with open(motor_path + '/command', 'r+') as command_file:
+                command_file.write(command)
+        sysfs._update()
+        with open(motor_path + '/state') as state_file:
+            assert state_file.read().strip() == ''
+
+        with open(motor_path + '/position', 'r+') as position_file:
+            position_file.write('0')
+        sysfs._update()
+        with open(motor_path + '/position', 'rb') as position_file:
+            assert read_device(position_file) == 0
+    finally:
+        sysfs.cleanup()
+
+
+def test_latency_model():
+    latency = LatencyModel(100, 500, seed=0)
+    samples = sorted(latency.sample() for _ in range(10000))
+    assert 80e-6 < samples[5000] < 120e-6
+    assert 300e-6 < samples[9900] < 800e-6
+    measured = LatencyModel.from_samples([10, 20, 30], seed=0)
+    assert measured.sample() in (10e-6, 20e-6, 30e-6)
+
+
+def test_latency_model_from_file():
+    with tempfile.NamedTemporaryFile('w', suffix='.txt') as file:
+        file.write('# read latency (us)\n30\n\n10\n20.5\n')
+        file.flush()
+        measured = LatencyModel.from_file(file.name, seed=0)
+    assert (measured.median_us, measured.p99_us) == (20.5, 30.0)
+    assert measured.sample() in (10e-6, 20.5e-6, 30e-6)
+
+
+if __name__ == '__main__':
+    test_duty_cycle_moves_position()
+    test_overwritten_attributes()
+    test_latency_model()
+    test_latency_model_from_file()
+    print('ok')
@@ -0,0 +1,99 @@
+# -*- coding: UTF-8 -*-
+u"""センサー値の最新スナップショットをロックなしで受け渡すための構造(seqlock)
+
+書き込み側は1スレッド(または1プロセス)だけとする。
+書き込み側は書き込みの前後でシーケンス番号を1ずつ増やすので、書き込み中は奇数になる。
+読み込み側は読む前後でシーケンス番号が同じ偶数なら、途中で書き換えられていない値を読めたとみなし、違えば読み直す。
+
+値は64バイトのバッファに置く。bytearrayの代わりにmmapを渡せばプロセス間でも共有できる。
+    [0:8]   シーケンス番号(uint64)
+    [8:16]  取得時刻(ns, uint64)
+    [16:24] サンプル番号(uint64)。1回書き込むごとに1増える
+    [24:32] 電圧を読んだ時刻(ns, uint64)。電圧はBatteryMonitorが低い頻度でしか読まないので取得時刻とは別に持つ。
+            まだ読んでいなければbattery_monitor.NOT_READ
+    [32:64] 値(double * VALUE_COUNT)
+"""
+import time
+
+from battery_monitor import NOT_READ
+
+VALUE_COUNT = 4  # ジャイロ角速度, 左モータ位置, 右モータ位置, バッテリ電圧(mV)
+HEADER_SIZE = 32
+SNAPSHOT_SIZE = HEADER_SIZE + 8 * VALUE_COUNT
+
+_SEQUENCE = 0
+_TIMESTAMP = 1
+_INDEX = 2
+_VOLTAGE_TIMESTAMP = 3
+
+
+class SensorSnapshot(object):
+    u"""単一書き込みのseqlockで保護したセンサー値"""
+
+    def __init__(self, buffer=None, offset=0):
+        u"""
+        Args:
+            buffer: SNAPSHOT_SIZEバイト以上の書き込み可能なバッファ(bytearray, mmapなど)。
+                省略時は新しく確保し、電圧を読んだ時刻をNOT_READにしておく(最初の書き込みの前に読んでも古い値とわかる)
+            offset (int): バッファ内の位置(8の倍数)
+        """
+        allocated = buffer is None
+        if allocated:
+            buffer = bytearray(SNAPSHOT_SIZE)
+        self._buffer = buffer
+        view = memoryview(buffer)[offset:offset + SNAPSHOT_SIZE]
+        self._header = view[:HEADER_SIZE].cast('Q')
+        self._values = view[HEADER_SIZE:].cast('d')
+        if allocated:
+            self._header[_VOLTAGE_TIMESTAMP] = NOT_READ
+
+    def write(self, rate, left_position, right_position, voltage, voltage_ns, timestamp_ns, index=None):
+        u"""最新値を書き込む(書き込み側のスレッドからのみ呼ぶこと)
+
+        Args:
+            voltage_ns (int): 電圧を読んだ時刻(BatteryMonitor.read_ns)
+            index (int): サンプル番号。省略時は前回の番号 + 1(SensorRingのように複数の枠を使い回す場合に指定する)
+        """
+        header = self._header
+        values = self._values
+        header[_SEQUENCE] += 1
+        values[0] = rate
+        values[1] = left_position
+        values[2] = right_position
+        values[3] = voltage
+        header[_VOLTAGE_TIMESTAMP] = voltage_ns
+        header[_TIMESTAMP] = timestamp_ns
+        if index is None:
+            header[_INDEX] += 1
+        else:
+            header[_INDEX] = index
+        header[_SEQUENCE] += 1
+
+    def read(self):
+        u"""一貫した最新値を読む
+
+        Returns:
+            (tuple): (ジャイロ角速度, 左モータ位置, 右モータ位置, バッテリ電圧, 電圧を読んだ時刻ns, 取得時刻ns, サンプル番号)
+        """
+        header = self._header
+        values = self._values
+        while True:
+            sequence = header[_SEQUENCE]
+            if sequence & 1:
+                # 書き込み中。GILを手放して書き込み側に進んでもらう
+                time.sleep(0)
+                continue
+            result = (values[0], values[1], values[2], values[3], header[_VOLTAGE_TIMESTAMP], header[_TIMESTAMP],
+                      header[_INDEX])
+            if header[_SEQUENCE] == sequence:
+                return result
+
+    @property
+    def sample_index(self):
+        u"""これまでに書き込まれた回数"""
+        return self._header[_INDEX]
+
+    def release(self):
+        u"""バッファへのビューを解放する(mmapを閉じる前に呼ぶ)"""
+        self._header.release()
+        self._values.release()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""SensorSnapshotのテスト
+
+書き込み側のスレッドを全速で回しながら読み、値の組が崩れないことを確かめる。
+__main__で実行するとロックを使った場合との読み込み時間の比較も表示する
+$ python3 snapshot_test.py
+"""
+import mmap
+import threading
+import time
+
+from battery_monitor import NOT_READ, is_stale
+from snapshot import SNAPSHOT_SIZE, SensorSnapshot
+
+READ_COUNT = 200000
+
+
+class LockedSnapshot(object):
+    u"""比較用: ロックで保護した最新値"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = (0, 0, 0, 0, 0, 0, 0)
+
+    def write(self, rate, left_position, right_position, voltage, voltage_ns, timestamp_ns):
+        with self._lock:
+            self._values = (rate, left_position, right_position, voltage, voltage_ns, timestamp_ns,
+                            self._values[6] + 1)
+
+    def read(self):
+        with self._lock:
+            return self._values
+
+
+def stress(snapshot, read_count=READ_COUNT):
+    u"""全速の書き込みスレッドと並行してread_count回読む
+
+    書き込み側は(i, i, -i, i / 2, i, i)を書くので、読んだ値の組がこの関係を満たさなければ崩れている
+
+    Returns:
+        (tuple): (崩れていた回数, 読み込み1回あたりの平均時間ns, 最大時間ns, 書き込み回数)
+    """
+    is_loop = [True]
+
+    def writer():
+        i = 0
+        while is_loop[0]:
+            i += 1
+            snapshot.write(i, i, -i, i / 2, i, i)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    torn = 0
+    max_ns = 0
+    last_index = 0
+    total_start = time.perf_counter_ns()
+    try:
+        for _ in range(read_count):
+            start = time.perf_counter_ns()
+            rate, left, right, voltage, voltage_ns, timestamp, index = snapshot.read()
+            elapsed = time.perf_counter_ns() - start
+            if elapsed > max_ns:
+                max_ns = elapsed
+            if index == 0:
+                continue  # まだ書き込まれていない
+            if not (rate == left == -right == voltage * 2 == voltage_ns == timestamp == index) or index < last_index:
+                torn += 1
+            last_index = index
+    finally:
+        is_loop[0] = False
+        thread.join()
+    mean_ns = (time.perf_counter_ns() - total_start) / read_count
+    return torn, mean_ns, max_ns, snapshot.read()[6]
+
+
+def test_no_torn_reads():
+    torn, _, _, writes = stress(SensorSnapshot())
+    assert torn == 0
+    assert writes > 0
+
+
+def test_unwritten_voltage_is_stale():
+    u"""書き込む前に読んでも、電圧を読んだ時刻はNOT_READなので古い値とわかる"""
+    snapshot = SensorSnapshot()
+    _, _, _, voltage, voltage_ns, timestamp_ns, index = snapshot.read()
+    assert (voltage, voltage_ns, index) == (0.0, NOT_READ, 0)
+    assert is_stale(voltage_ns, timestamp_ns)
+
+
+def test_shared_buffer():
+    u"""mmapを渡した場合も、同じバッファを見る別のインスタンスから読める"""
+    buffer = mmap.mmap(-1, SNAPSHOT_SIZE)
+    writer = SensorSnapshot(buffer)
+    reader = SensorSnapshot(buffer)
+    writer.write(3, 100, 101, 8000.5, 12000, 12345)
+    assert reader.read() == (3.0, 100.0, 101.0, 8000.5, 12000, 12345, 1)
+    assert reader.sample_index == 1
+    writer.release()
+    reader.release()
+    buffer.close()
+
+
+if __name__ == '__main__':
+    test_no_torn_reads()
+    test_unwritten_voltage_is_stale()
+    test_shared_buffer()
+    for name, snapshot in (('seqlock', SensorSnapshot()), ('lock', LockedSnapshot())):
+        torn, mean_ns, max_ns, writes = stress(snapshot)
+        print('{}: torn {}, read mean {:.0f}ns, max {}ns, writes {}'.format(name, torn, mean_ns, max_ns, writes))
+    print('ok')
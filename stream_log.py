@@ -0,0 +1,123 @@
+# -*- coding: UTF-8 -*-
+u"""長時間の記録用に、ファイルを開いたまま行をまとめて書き込むログ
+
+1行ごとにファイルを開いて追記して閉じると、SDカードへのopen/write/closeが毎回起きる。
+RotatingLogWriterは
+    書き込み : 行をリストにためて、batch_lines行たまったらまとめてwriteする
+    同期     : 最後のfsyncからfsync_interval秒たったら、またはcloseの時にfsyncする(電源断で失うのはそれ以降の行だけ)
+    分割     : ファイルがmax_bytesを超えるか、開いてからmax_seconds秒たったら次のファイルに切り替える
+とする。ファイル名は base_path の拡張子の前に連番を付けたもの(log.csv → log_000.csv, log_001.csv, ...)で、
+各ファイルの先頭にheaderを書く。
+
+    writer = RotatingLogWriter('./log/log.csv', header='log_time, voltage', max_bytes=1024 * 1024)
+    while ...:
+        writer.write('{}, {}'.format(time.time(), voltage))
+    writer.close()
+"""
+import os
+import time
+
+BATCH_LINES = 100  # これだけ行がたまったらwriteする
+FSYNC_INTERVAL = 5.0  # fsyncする間隔(秒)
+
+
+class RotatingLogWriter(object):
+    u"""まとめて書き込み、一定間隔でfsyncし、大きさか時間で分割するログ(書き込み側は1スレッドだけとする)"""
+
+    def __init__(self, base_path, header=None, batch_lines=BATCH_LINES, fsync_interval=FSYNC_INTERVAL,
+                 max_bytes=None, max_seconds=None, clock=time.monotonic):
+        u"""
+        Args:
+            base_path (str): ファイル名の元。実際のファイル名は拡張子の前に連番を付ける
+            header (str): 各ファイルの先頭に書く行(改行なし)。Noneなら書かない
+            batch_lines (int): これだけ行がたまったらwriteする
+            fsync_interval (float): fsyncする間隔(秒)。0なら書き込むたびにfsyncする
+            max_bytes (int): ファイルがこれ(バイト)以上になったら次のファイルにする。Noneなら分割しない
+            max_seconds (float): ファイルを開いてからこれ(秒)たったら次のファイルにする。Noneなら分割しない
+            clock: 秒を返す時計(テスト用)
+        """
+        self.base_path = base_path
+        self.header = header
+        self.batch_lines = batch_lines
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.clock = clock
+        self.paths = []  # 開いたファイルのパス(古い順)
+        self.lines = 0  # これまでに受け取った行数
+        self.writes = 0  # writeした回数
+        self.fsyncs = 0  # fsyncした回数
+        self._pending = []
+        self._file = None
+        self._size = 0  # 今のファイルにwriteしたバイト数
+        self._opened_at = 0.0
+        self._synced_at = 0.0
+        directory = os.path.dirname(base_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._open_next()
+
+    @property
+    def path(self):
+        u"""今書き込んでいるファイルのパス"""
+        return self.paths[-1]
+
+    def write(self, line):
+        u"""1行追加する(改行は付けなくてよい)"""
+        self._pending.append(line)
+        self.lines += 1
+        if len(self._pending) >= self.batch_lines:
+            self.flush()
+        if self.clock() - self._synced_at >= self.fsync_interval:
+            self.sync()
+
+    def flush(self):
+        u"""ためている行をファイルに書き込む(fsyncはしない)。分割の条件を満たしていれば次のファイルに書き込む"""
+        if not self._pending:
+            return
+        if self._should_rotate():
+            self._sync_file()
+            self._file.close()
+            self._open_next()
+        data = '\n'.join(self._pending) + '\n'
+        self._pending = []
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data.encode())
+        self.writes += 1
+
+    def sync(self):
+        u"""ためている行を書き込んでfsyncする"""
+        self.flush()
+        self._sync_file()
+
+    def close(self):
+        u"""ためている行を書き込み、fsyncして閉じる"""
+        if self._file is None:
+            return
+        self.flush()
+        self._sync_file()
+        self._file.close()
+        self._file = None
+
+    def _should_rotate(self):
+        if self.max_bytes is not None and self._size >= self.max_bytes:
+            return True
+        return self.max_seconds is not None and self.clock() - self._opened_at >= self.max_seconds
+
+    def _sync_file(self):
+        os.fsync(self._file.fileno())
+        self.fsyncs += 1
+        self._synced_at = self.clock()
+
+    def _open_next(self):
+        root, ext = os.path.splitext(self.base_path)
+        path = '{}_{:03d}{}'.format(root, len(self.paths), ext)
+        self._file = open(path, 'w')
+        self.paths.append(path)
+        self._size = 0
+        self._opened_at = self._synced_at = self.clock()
+        if self.header is not None:
+            data = self.header + '\n'
+            self._file.write(data)
+            self._size += len(data.encode())
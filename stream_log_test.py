@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""RotatingLogWriterのテスト
+
+$ python3 stream_log_test.py
+"""
+import os
+
+from stream_log import RotatingLogWriter
+from testutil import with_directory
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _read(path):
+    with open(path) as file:
+        return file.read().splitlines()
+
+
+@with_directory
+def test_batches_writes(directory):
+    clock = FakeClock()
+    writer = RotatingLogWriter(os.path.join(directory, 'log', 'test.csv'), header='a, b', batch_lines=10,
+                               fsync_interval=60.0, clock=clock)
+    assert writer.path == os.path.join(directory, 'log', 'test_000.csv')
+    for index in range(25):
+        writer.write('{}, {}'.format(index, index * 2))
+    assert writer.writes == 2
+    assert writer.fsyncs == 0
+    assert len(_read(writer.path)) == 1 + 20  # 残りの5行はまだ書いていない
+    writer.close()
+    assert writer.fsyncs == 1
+    lines = _read(writer.path)
+    assert lines[0] == 'a, b'
+    assert lines[1:] == ['{}, {}'.format(index, index * 2) for index in range(25)]
+
+
+@with_directory
+def test_fsync_interval(directory):
+    clock = FakeClock()
+    writer = RotatingLogWriter(os.path.join(directory, 'test.csv'), batch_lines=1000, fsync_interval=5.0,
+                               clock=clock)
+    # 0.05秒ごとに20秒分
+    for index in range(400):
+        clock.now = index * 0.05
+        writer.write(str(index))
+    assert writer.fsyncs == 3
+    # fsyncした時点までの行はファイルにある
+    assert len(_read(writer.path)) == 301
+    writer.close()
+    assert len(_read(writer.path)) == 400
+
+
+@with_directory
+def test_rotate_by_size(directory):
+    writer = RotatingLogWriter(os.path.join(directory, 'test.csv'), header='h', batch_lines=10, max_bytes=100,
+                               clock=FakeClock())
+    for index in range(100):
+        writer.write('{:09d}'.format(index))  # 改行込みで10バイト
+    writer.close()
+    assert len(writer.paths) == 10
+    rows = []
+    for path in writer.paths:
+        lines = _read(path)
+        assert lines[0] == 'h'
+        rows.extend(lines[1:])
+    assert rows == ['{:09d}'.format(index) for index in range(100)]
+
+
+@with_directory
+def test_rotate_by_time(directory):
+    clock = FakeClock()
+    writer = RotatingLogWriter(os.path.join(directory, 'test.csv'), batch_lines=1, max_seconds=60.0, clock=clock)
+    for index in range(300):
+        clock.now = float(index)
+        writer.write(str(index))
+    writer.close()
+    assert [os.path.basename(path) for path in writer.paths] == [
+        'test_000.csv', 'test_001.csv', 'test_002.csv', 'test_003.csv', 'test_004.csv']
+    assert _read(writer.paths[1])[0] == '60'
+
+
+if __name__ == '__main__':
+    test_batches_writes()
+    test_fsync_interval()
+    test_rotate_by_size()
+    test_rotate_by_time()
+    print('ok')
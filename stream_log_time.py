@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""1行あたりのログの記録時間を、1行ごとに開いて追記して閉じる(従来のmotor_angle_recorder.py)場合と
+RotatingLogWriterで比べる
+
+$ python3 stream_log_time.py --lines=10000 --path=./log/stream_log_time.csv
+"""
+import os
+import time
+from optparse import OptionParser
+
+from stream_log import RotatingLogWriter
+
+LINES = 10000
+PATH = './log/stream_log_time.csv'
+
+
+def make_line(index):
+    return '{}, {}, {}, {}'.format(1500000000.0 + index * 0.05, 8000000 - index, index * 30, index * 30)
+
+
+def test_open_append_close(lines, path):
+    u"""1行ごとにファイルを開いて追記して閉じる"""
+    start = time.perf_counter()
+    for index in range(lines):
+        fd = open(path, 'a')
+        fd.write("{}\n".format(make_line(index)))
+        fd.close()
+    elapsed = time.perf_counter() - start
+    os.remove(path)
+    return elapsed
+
+
+def test_rotating_writer(lines, path, fsync_interval):
+    u"""RotatingLogWriterで書き込む(closeまで含める)"""
+    start = time.perf_counter()
+    writer = RotatingLogWriter(path, fsync_interval=fsync_interval)
+    for index in range(lines):
+        writer.write(make_line(index))
+    writer.close()
+    elapsed = time.perf_counter() - start
+    for written in writer.paths:
+        os.remove(written)
+    return elapsed, writer.fsyncs
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-l', '--lines', action='store', type='int', dest='lines', default=LINES,
+                      help="記録する行数")
+    parser.add_option('-p', '--path', action='store', type='string', dest='path', default=PATH,
+                      help="ログのファイル")
+    parser.add_option('-f', '--fsync-interval', action='store', type='float', dest='fsync_interval', default=5.0,
+                      help="RotatingLogWriterがfsyncする間隔(秒)")
+    options, _ = parser.parse_args()
+    if os.path.dirname(options.path):
+        os.makedirs(os.path.dirname(options.path), exist_ok=True)
+    elapsed = test_open_append_close(options.lines, options.path)
+    print('open/write/close: {:.2f}us/line'.format(elapsed / options.lines * 1000000))
+    elapsed, fsyncs = test_rotating_writer(options.lines, options.path, options.fsync_interval)
+    print('RotatingLogWriter: {:.2f}us/line ({} fsyncs)'.format(elapsed / options.lines * 1000000, fsyncs))
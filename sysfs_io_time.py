@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""偽のsysfs(sim.sysfs)でデバイスファイルの読み書きの時間を計る
+
+motor_angle_recorder.pyのread_device/write_device、raw_device(pread/pwrite)と、
+(インストールされていれば)ev3devのプロパティを比べる
+$ python3 sysfs_io_time.py --count=10000 --latency
+
+--latencyで入れる遅延はsim.sysfs.placeholder_latencyの仮の値で、EV3実機で測った値ではない。
+実機の遅延で比べるときは、実機で測った遅延(μs)を1行に1つ書いたファイルを--read-samples/--write-samplesで渡す
+$ python3 sysfs_io_time.py --read-samples=read_us.txt --write-samples=write_us.txt
+"""
+import time
+from optparse import OptionParser
+
+from motor_angle_recorder import read_device, write_device
+from raw_device import RawMotor, RawPowerSupply
+from sim.sysfs import FakeSysfs, LatencyModel, placeholder_latency
+
+TEST_COUNT = 10000
+
+
+def summarize(name, elapsed_list):
+    u"""計測結果を表示する"""
+    elapsed_list.sort()
+    count = len(elapsed_list)
+    print('{}: mean {:.2f}us, p50 {:.2f}us, p99 {:.2f}us, max {:.2f}us'.format(
+        name,
+        sum(elapsed_list) / count * 1000000,
+        elapsed_list[count // 2] * 1000000,
+        elapsed_list[int(count * 0.99)] * 1000000,
+        elapsed_list[-1] * 1000000))
+
+
+def measure(function, test_count):
+    u"""functionをtest_count回呼んでそれぞれの時間を返す"""
+    elapsed_list = []
+    for _ in range(test_count):
+        start = time.perf_counter()
+        function()
+        elapsed_list.append(time.perf_counter() - start)
+    return elapsed_list
+
+
+def test_raw_fd(sysfs, test_count):
+    u"""motor_angle_recorder.pyと同じく、開いたままのファイルをread_device/write_deviceで読み書きする"""
+    position_file = sysfs.open_attribute(sysfs.motor_path('outC') + '/position', 'rb')
+    voltage_file = sysfs.open_attribute(sysfs.battery_path() + '/voltage_now', 'rb')
+    duty_file = sysfs.open_attribute(sysfs.motor_path('outC') + '/duty_cycle_sp', 'w')
+    try:
+        summarize('read_device position', measure(lambda: read_device(position_file), test_count))
+        summarize('read_device voltage_now', measure(lambda: read_device(voltage_file), test_count))
+        summarize('write_device duty_cycle_sp', measure(lambda: write_device(duty_file, 50), test_count))
+    finally:
+        position_file.close()
+        voltage_file.close()
+        duty_file.close()
+
+
+def test_raw_device(sysfs, test_count):
+    u"""raw_deviceのRawMotor/RawPowerSupplyで読み書きする
+
+    ファイルディスクリプタを直接使うので、遅延はsysfs.read_delay/write_delayで入れる
+    """
+    motor = RawMotor(sysfs.motor_path('outC'))
+    battery = RawPowerSupply(sysfs.battery_path())
+    read_delay = sysfs.read_delay
+    write_delay = sysfs.write_delay
+
+    def read_position():
+        read_delay()
+        return motor.position
+
+    def read_voltage():
+        read_delay()
+        return battery.measured_voltage
+
+    def write_duty():
+        write_delay()
+        motor.set_duty_cycle(50)
+    try:
+        summarize('raw_device position', measure(read_position, test_count))
+        summarize('raw_device measured_voltage', measure(read_voltage, test_count))
+        summarize('raw_device duty_cycle_sp', measure(write_duty, test_count))
+    finally:
+        motor.close()
+        battery.close()
+
+
+def test_ev3dev(sysfs, test_count):
+    u"""ev3devのプロパティで読み書きする(ev3devがなければ飛ばす)"""
+    try:
+        import ev3dev.core
+        import ev3dev.ev3 as ev3
+    except ImportError:
+        print('ev3dev is not installed. skip ev3dev properties')
+        return
+    ev3dev.core.Device.DEVICE_ROOT_PATH = sysfs.class_path
+    motor = ev3.LargeMotor('outC')
+    battery = ev3.PowerSupply()
+    summarize('ev3dev position', measure(lambda: motor.position, test_count))
+    summarize('ev3dev measured_voltage', measure(lambda: battery.measured_voltage, test_count))
+
+    def write_duty():
+        motor.duty_cycle_sp = 50
+    summarize('ev3dev duty_cycle_sp', measure(write_duty, test_count))
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-c', '--count', action='store', type='int', dest='test_count', default=TEST_COUNT,
+                      help="1項目あたりの読み書き回数")
+    parser.add_option('-l', '--latency', action='store_true', dest='latency', default=False,
+                      help="仮の遅延(実測値ではない)を入れる")
+    parser.add_option('--read-samples', action='store', type='string', dest='read_samples', default=None,
+                      help="読み込みの遅延に使う、実機で測った遅延(μs)のファイル")
+    parser.add_option('--write-samples', action='store', type='string', dest='write_samples', default=None,
+                      help="書き込みの遅延に使う、実機で測った遅延(μs)のファイル")
+    options, _ = parser.parse_args()
+
+    read_latency, write_latency = placeholder_latency(seed=0) if options.latency else (None, None)
+    if options.read_samples:
+        read_latency = LatencyModel.from_file(options.read_samples, seed=0)
+    if options.write_samples:
+        write_latency = LatencyModel.from_file(options.write_samples, seed=1)
+    sysfs = FakeSysfs(read_latency=read_latency, write_latency=write_latency)
+    sysfs.start()
+    try:
+        print('sysfs: {}'.format(sysfs.class_path))
+        for name, path, latency in (('read', options.read_samples, read_latency),
+                                    ('write', options.write_samples, write_latency)):
+            if latency is None:
+                print('{} latency: none'.format(name))
+            elif path:
+                print('{} latency: measured samples from {} (p50 {}us, p99 {}us)'.format(
+                    name, path, latency.median_us, latency.p99_us))
+            else:
+                print('{} latency: placeholder p50 {}us, p99 {}us (not measured on EV3)'.format(
+                    name, latency.median_us, latency.p99_us))
+        test_raw_fd(sysfs, options.test_count)
+        test_raw_device(sysfs, options.test_count)
+        test_ev3dev(sysfs, options.test_count)
+    finally:
+        sysfs.cleanup()
@@ -0,0 +1,176 @@
+# -*- coding: UTF-8 -*-
+u"""メモリマップしたファイルにリングバッファで記録するテレメトリ
+
+ロボットのスクリプトは処理時間などをリストにためて終了時に表示していたので、途中で落ちると何も残らず、
+リストも増え続ける。TelemetryWriterは固定長のレコードをmmapしたファイルに書き込む。
+    書き込み : struct.pack_intoでmmapに書くだけなので、1レコードあたりのシステムコールはない
+    永続化   : ページキャッシュに任せる(プロセスが落ちても書いた分はファイルに残る。電源断は対象外)
+    読み込み : TelemetryReaderでNumPyのmemmap(コピーなし)として読める。書き込み中・クラッシュ後のファイルも読める
+
+ファイルのレイアウト(リトルエンディアン)
+    [0:8]       マジック b'EV3TELEM'
+    [8:16]      バージョン(uint64)
+    [16:24]     ヘッダーのサイズ(uint64)。レコードはここから始まる
+    [24:32]     レコードのサイズ(uint64)
+    [32:40]     レコード数の上限(uint64)
+    [40:48]     これまでに書き込んだレコード数(uint64)。レコードを書き終えてから増やす
+    [48:56]     作成時刻(time.time_ns, uint64)
+    [56:64]     スキーマ(JSON)のバイト数(uint64)
+    [64:]       スキーマ {"fields": [[名前, structの型文字], ...]}
+    [ヘッダーのサイズ:] レコード * レコード数の上限。(書き込んだ数 % 上限)番目の枠に書く
+
+    path = default_path('balance')  # ./log/balance_20180101000000.telemetry
+    telemetry = TelemetryWriter(path, BALANCE_FIELDS)
+    telemetry.write(time.monotonic_ns(), sample_ns, rate, lpos, rpos, voltage, left_pwm, right_pwm, work_us, slack_us)
+    telemetry.close()
+
+    reader = TelemetryReader(path)
+    print(reader.to_array()['work_us'].max())
+
+TelemetryWriterは既にあるファイルを上書きするので、ロボットのスクリプトの既定のパス(default_path)には
+起動した日時を入れる(odometry.shutdown、motor_angle_recorder.pyのlog_datetimeと同じ)。
+落ちた後に起動し直しても、前の走行の記録は残る。
+"""
+import json
+import mmap
+import os
+import struct
+import time
+
+MAGIC = b'EV3TELEM'
+VERSION = 1
+HEADER_SIZE = 4096
+CAPACITY = 65536  # 4ms周期で約4分
+_HEADER = struct.Struct('<8sQQQQQQQ')
+_HEAD_OFFSET = 40
+
+# バランス制御のロボット(balance_test.py, balance_sensor_other_thread.py, balance_multiprocess.py)のレコード
+BALANCE_FIELDS = (
+    ('time_ns', 'Q'),  # 周期の開始時刻(time.monotonic_ns)
+    ('sample_ns', 'Q'),  # balance_controlに渡したセンサー値の取得時刻(clock.monotonic_ns)
+    ('rate', 'd'),  # ジャイロ角速度(deg/s)
+    ('left_position', 'd'),  # 左モータのエンコーダ値(deg)
+    ('right_position', 'd'),
+    ('voltage', 'd'),  # バッテリー電圧(mV)
+    ('left_pwm', 'd'),  # balance_controlの出力
+    ('right_pwm', 'd'),
+    ('work_us', 'q'),  # センサー取得からモーターへの指示までの処理時間(μs)
+    ('slack_us', 'q'),  # 次の周期までの余り時間(μs)
+)
+
+
+def default_path(name, log_datetime=None):
+    u"""ロボットのスクリプトのテレメトリの既定のパス ./log/{name}_{log_datetime}.telemetry
+
+    Args:
+        name (str): スクリプトの名前
+        log_datetime (str): ファイル名に入れる日時。省略時は現在時刻(time.strftime("%Y%m%d%H%M%S"))
+    """
+    if log_datetime is None:
+        log_datetime = time.strftime("%Y%m%d%H%M%S")
+    return './log/{}_{}.telemetry'.format(name, log_datetime)
+
+
+class TelemetryWriter(object):
+    u"""テレメトリの書き込み(書き込み側は1スレッドだけとする)"""
+
+    def __init__(self, path, fields, capacity=CAPACITY):
+        u"""
+        Args:
+            path (str): ファイルのパス。既にあれば上書きする(残したい記録を上書きしないようdefault_pathを使う)
+            fields (list): (名前, structの型文字)のリスト。型文字はd, f, q, Q, i, I, h, H, b, B
+            capacity (int): レコード数の上限。超えたら古いものから上書きする
+        """
+        self.path = path
+        self.fields = tuple((name, code) for name, code in fields)
+        self._record = struct.Struct('<' + ''.join(code for _, code in self.fields))
+        self.record_size = self._record.size
+        self.capacity = capacity
+        schema = json.dumps({'fields': [list(field) for field in self.fields]}).encode()
+        if _HEADER.size + len(schema) > HEADER_SIZE:
+            raise ValueError('too many fields for the telemetry header')
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        size = HEADER_SIZE + self.record_size * capacity
+        with open(path, 'w+b') as file:
+            file.truncate(size)
+            self._mmap = mmap.mmap(file.fileno(), size)
+        _HEADER.pack_into(self._mmap, 0, MAGIC, VERSION, HEADER_SIZE, self.record_size, capacity, 0,
+                          time.time_ns(), len(schema))
+        self._mmap[_HEADER.size:_HEADER.size + len(schema)] = schema
+        self._head = memoryview(self._mmap)[_HEAD_OFFSET:_HEAD_OFFSET + 8].cast('Q')
+        self._pack_into = self._record.pack_into
+        self.count = 0  # これまでに書き込んだレコード数
+        self._offset = HEADER_SIZE  # 次に書き込む位置
+        self._end = size
+
+    def write(self, *values):
+        u"""レコードを1つ書き込む(値はfieldsの順)"""
+        self._pack_into(self._mmap, self._offset, *values)
+        self.count += 1
+        self._head[0] = self.count
+        self._offset += self.record_size
+        if self._offset >= self._end:
+            self._offset = HEADER_SIZE
+
+    def rows(self):
+        u"""残っているレコードを古い順にタプルで返す(終了時の表示用。NumPyを使わない)"""
+        count = min(self.count, self.capacity)
+        unpack_from = self._record.unpack_from
+        for index in range(self.count - count, self.count):
+            yield unpack_from(self._mmap, HEADER_SIZE + (index % self.capacity) * self.record_size)
+
+    def flush(self):
+        u"""ファイルに書き出す(msync)。周期ごとに呼ぶ必要はない"""
+        self._mmap.flush()
+
+    def close(self):
+        if self._mmap.closed:
+            return
+        self._head.release()
+        self._mmap.close()
+
+
+class TelemetryReader(object):
+    u"""テレメトリのファイルをNumPyのmemmapで読む"""
+
+    def __init__(self, path):
+        import numpy as np
+
+        self.path = path
+        with open(path, 'rb') as file:
+            header = file.read(HEADER_SIZE)
+        magic, version, header_size, record_size, capacity, count, created_ns, schema_size = \
+            _HEADER.unpack_from(header)
+        if magic != MAGIC:
+            raise ValueError('{} is not a telemetry file'.format(path))
+        if version != VERSION:
+            raise ValueError('unsupported telemetry version: {}'.format(version))
+        schema = json.loads(header[_HEADER.size:_HEADER.size + schema_size].decode())
+        self.fields = tuple((name, code) for name, code in schema['fields'])
+        self.dtype = np.dtype([(name, '<' + code) for name, code in self.fields])
+        if self.dtype.itemsize != record_size:
+            raise ValueError('record size mismatch: {} != {}'.format(self.dtype.itemsize, record_size))
+        self.capacity = capacity
+        self.count = count  # 開いた時点で書き込まれていたレコード数
+        self.created_ns = created_ns
+        # 枠の順(書き込み順ではない)のレコード。コピーしない
+        self.records = np.memmap(path, dtype=self.dtype, mode='r', offset=header_size, shape=(capacity,))
+
+    def chunks(self):
+        u"""残っているレコードを古い順に並べたビューのリスト(リングが一周していれば2つ。コピーしない)"""
+        if self.count <= self.capacity:
+            return [self.records[:self.count]]
+        start = self.count % self.capacity
+        return [self.records[start:], self.records[:start]]
+
+    def to_array(self):
+        u"""残っているレコードを古い順に並べた配列(リングが一周していればコピーする)"""
+        import numpy as np
+
+        chunks = self.chunks()
+        if len(chunks) == 1:
+            return chunks[0]
+        return np.concatenate(chunks)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""TelemetryWriter/TelemetryReaderのテスト
+
+$ python3 telemetry_test.py
+"""
+import os
+import tempfile
+
+from telemetry import BALANCE_FIELDS, HEADER_SIZE, TelemetryReader, TelemetryWriter, default_path
+from testutil import with_directory
+
+FIELDS = (('time_ns', 'Q'), ('value', 'd'), ('count', 'h'))
+
+
+@with_directory
+def test_write_and_read(directory):
+    path = os.path.join(directory, 'log', 'test.telemetry')  # ディレクトリがなければ作る
+    writer = TelemetryWriter(path, FIELDS, capacity=16)
+    for index in range(10):
+        writer.write(index * 1000, index * 0.5, -index)
+    assert os.path.getsize(path) == HEADER_SIZE + 18 * 16
+    assert [row[2] for row in writer.rows()] == [-index for index in range(10)]
+    writer.close()
+
+    reader = TelemetryReader(path)
+    assert reader.fields == FIELDS
+    assert reader.count == 10
+    records = reader.to_array()
+    assert len(records) == 10
+    assert list(records['time_ns']) == [index * 1000 for index in range(10)]
+    assert records['value'][3] == 1.5
+    assert records['count'][9] == -9
+
+
+@with_directory
+def test_wrap_keeps_latest(directory):
+    path = os.path.join(directory, 'test.telemetry')
+    writer = TelemetryWriter(path, FIELDS, capacity=8)
+    for index in range(20):
+        writer.write(index, 0.0, index)
+    assert [row[0] for row in writer.rows()] == list(range(12, 20))
+    writer.close()
+
+    reader = TelemetryReader(path)
+    assert reader.count == 20
+    chunks = reader.chunks()
+    assert [len(chunk) for chunk in chunks] == [4, 4]
+    assert list(reader.to_array()['time_ns']) == list(range(12, 20))
+
+
+@with_directory
+def test_views_do_not_copy(directory):
+    import numpy as np
+
+    path = os.path.join(directory, 'test.telemetry')
+    writer = TelemetryWriter(path, BALANCE_FIELDS, capacity=32)
+    for index in range(5):
+        writer.write(index, index, 1.0, 2.0, 3.0, 8000.0, 10.0, -10.0, 100, 3900)
+
+    reader = TelemetryReader(path)
+    view = reader.to_array()
+    assert np.shares_memory(view, reader.records)
+    assert list(view['slack_us']) == [3900] * 5
+    # 書き込み中のファイルも読める(開いた時点のレコード数まで)
+    writer.write(5, 5, 1.0, 2.0, 3.0, 8000.0, 10.0, -10.0, 100, 3900)
+    assert reader.count == 5
+    assert TelemetryReader(path).count == 6
+    writer.close()
+
+
+@with_directory
+def test_readable_after_crash(directory):
+    path = os.path.join(directory, 'test.telemetry')
+    pid = os.fork()
+    if pid == 0:
+        # closeもflushもしないで終了する
+        writer = TelemetryWriter(path, FIELDS, capacity=64)
+        for index in range(100):
+            writer.write(index, index * 0.25, index)
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    reader = TelemetryReader(path)
+    assert reader.count == 100
+    records = reader.to_array()
+    assert list(records['time_ns']) == list(range(36, 100))
+    assert records['value'][-1] == 99 * 0.25
+
+
+def test_rejects_other_files():
+    with tempfile.NamedTemporaryFile() as file:
+        file.write(b'\0' * HEADER_SIZE)
+        file.flush()
+        try:
+            TelemetryReader(file.name)
+        except ValueError:
+            pass
+        else:
+            assert False, 'ValueError expected'
+
+
+def test_default_path_has_datetime():
+    u"""起動し直しても前の記録を上書きしないよう、既定のパスは起動日時ごとに変わる"""
+    assert default_path('balance_test', '20180101000000') == './log/balance_test_20180101000000.telemetry'
+    path = default_path('balance_test')
+    assert path.startswith('./log/balance_test_') and len(os.path.basename(path)) == len('balance_test_') + 14 + 10
+
+
+if __name__ == '__main__':
+    test_write_and_read()
+    test_wrap_keeps_latest()
+    test_views_do_not_copy()
+    test_readable_after_crash()
+    test_rejects_other_files()
+    test_default_path_has_datetime()
+    print('ok')
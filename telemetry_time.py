@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+u"""1周期分のテレメトリの記録時間を、リスト(従来)、1レコードごとのos.write、TelemetryWriterで比べる
+
+$ python3 telemetry_time.py --ticks=100000 --path=./log/telemetry_time.telemetry
+"""
+import os
+import struct
+import time
+from optparse import OptionParser
+
+from telemetry import BALANCE_FIELDS, TelemetryWriter
+
+TICKS = 100000
+PATH = './log/telemetry_time.telemetry'
+
+
+def make_row(tick):
+    return (tick * 4000000, tick * 4000000, 1.0, tick * 0.5, tick * 0.5, 8000.0, 10.0, -10.0, 350, 3600)
+
+
+def test_list(ticks):
+    u"""従来と同じく、タプルをリストに追加する"""
+    rows = []
+    start = time.perf_counter()
+    for tick in range(ticks):
+        rows.append(make_row(tick))
+    return time.perf_counter() - start
+
+
+def test_os_write(ticks, path):
+    u"""同じレコードを1レコードごとにos.writeで書く(1周期に1回システムコール)"""
+    record = struct.Struct('<' + ''.join(code for _, code in BALANCE_FIELDS))
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        start = time.perf_counter()
+        for tick in range(ticks):
+            os.write(fd, record.pack(*make_row(tick)))
+        return time.perf_counter() - start
+    finally:
+        os.close(fd)
+        os.remove(path)
+
+
+def test_telemetry(ticks, path):
+    u"""TelemetryWriter.writeでmmapに書く(リングは一周させる)"""
+    writer = TelemetryWriter(path, BALANCE_FIELDS, capacity=max(ticks // 2, 1))
+    try:
+        start = time.perf_counter()
+        for tick in range(ticks):
+            writer.write(*make_row(tick))
+        return time.perf_counter() - start
+    finally:
+        writer.close()
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-t', '--ticks', action='store', type='int', dest='ticks', default=TICKS,
+                      help="記録するレコード数")
+    parser.add_option('-p', '--path', action='store', type='string', dest='path', default=PATH,
+                      help="テレメトリのファイル")
+    options, _ = parser.parse_args()
+    if os.path.dirname(options.path):
+        os.makedirs(os.path.dirname(options.path), exist_ok=True)
+    for name, elapsed in (
+            ('list.append', test_list(options.ticks)),
+            ('os.write', test_os_write(options.ticks, options.path + '.raw')),
+            ('TelemetryWriter.write', test_telemetry(options.ticks, options.path))):
+        print('{}: {:.2f}us/tick'.format(name, elapsed / options.ticks * 1000000))
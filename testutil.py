@@ -0,0 +1,37 @@
+# -*- coding: UTF-8 -*-
+u"""テスト(*_test.py)で共通に使う補助関数"""
+import contextlib
+import os
+import tempfile
+
+
+def with_directory(test):
+    u"""一時ディレクトリを作ってtest(directory)を呼び、終わったら消すデコレータ
+
+    pytestからも__main__からも引数なしで呼べるように、ディレクトリは呼び出しのたびに作る。
+    """
+    def wrapper():
+        with tempfile.TemporaryDirectory() as directory:
+            test(directory)
+    wrapper.__name__ = test.__name__
+    wrapper.__doc__ = test.__doc__
+    return wrapper
+
+
+@contextlib.contextmanager
+def environment(**values):
+    u"""withの間だけ環境変数を設定し、抜けるときに元に戻す(後のテストに漏らさない)
+
+        with environment(EV3_BACKEND='sim'):
+            import balance_sensor_other_thread  # ev3_backendは最初のimportのときに環境変数を見る
+    """
+    saved = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value